@@ -0,0 +1,157 @@
+# MeQuest/EmbeddingService/bench_db.py
+# ------------------------------------------------------------
+# /search · 삽입 쿼리 1건당 지연 시간: 기존 방식 vs database.py (바이너리 코덱 + prepared statement)
+# Run:
+#   PG_PASS=... python bench_db.py
+#   BENCH_ROWS=20000 BENCH_QUERIES=1000 python bench_db.py
+# 별도 테이블(bench_embeddings)에 BENCH_ROWS 개 무작위 벡터 + HNSW 인덱스를 만들고 (끝나면 삭제)
+#   text      기존 /search: 벡터를 '[...]' 문자열로 만들어 ::vector 캐스팅 (asyncpg 자동 statement 캐시 사용)
+#   text/nc   위와 같지만 PG_STATEMENT_CACHE_SIZE=0 (pgbouncer transaction 모드처럼 매번 parse)
+#   binary    database.py: pgvector 바이너리 코덱 + 연결별 prepared statement (statement 캐시)
+# 측정값은 클라이언트 기준 (문자열 포맷 포함) 쿼리 1건 p50 / p99 / 평균 (ms)
+# - 작은 테이블에서는 플래너가 seq scan 을 고르므로 enable_seqscan=off 로 운영 규모처럼 HNSW 인덱스를 씁니다.
+# - 쿼리마다 세 방식을 번갈아 실행합니다. (삽입으로 테이블 / 인덱스가 커지는 영향을 고르게 나눔)
+# ------------------------------------------------------------
+
+import asyncio
+import os
+import statistics
+import time
+from contextlib import AsyncExitStack
+
+import asyncpg
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import Database, connect_kwargs, search_sql  # noqa: E402  (.env 먼저 로드)
+
+DIM = int(os.getenv("BENCH_DIM", os.getenv("EMBED_DIM", "1024")))
+ROWS = int(os.getenv("BENCH_ROWS", "5000"))
+QUERIES = int(os.getenv("BENCH_QUERIES", "500"))
+LIMIT = int(os.getenv("BENCH_LIMIT", "5"))
+TABLE = "bench_embeddings"
+
+TEXT_SEARCH = f"""
+    SELECT content, ref_id, embedding <-> $1::vector AS distance
+    FROM {TABLE}
+    WHERE model_name = $3
+    ORDER BY distance
+    LIMIT $2;
+"""
+TEXT_INSERT = f"INSERT INTO {TABLE} (model_name, source, ref_id, content, embedding) VALUES ($1, $2, $3, $4, $5::vector)"
+BINARY_INSERT = f"INSERT INTO {TABLE} (model_name, source, ref_id, content, embedding) VALUES ($1, $2, $3, $4, $5)"
+
+
+def vectors(n: int, seed: int) -> np.ndarray:
+    v = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def to_text(vector) -> str:
+    return f"[{', '.join(map(str, vector))}]"   # main.py 기존 /search 와 같은 포맷
+
+
+async def setup(db: Database):
+    print(f"creating {TABLE}: {ROWS} rows x {DIM} dims + hnsw index ...", flush=True)
+    async with db.acquire() as conn:
+        await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.execute(
+            f"""
+            CREATE TABLE {TABLE} (
+                id BIGSERIAL PRIMARY KEY, model_name TEXT NOT NULL, source TEXT, ref_id BIGINT,
+                content TEXT, embedding vector({DIM}) NOT NULL
+            )
+            """
+        )
+        await conn.copy_records_to_table(
+            TABLE,
+            records=[("BGE-m3", "bench", i, f"row {i}", v) for i, v in enumerate(vectors(ROWS, 0))],
+            columns=["model_name", "source", "ref_id", "content", "embedding"],
+        )
+        await conn.execute(f"CREATE INDEX ON {TABLE} USING hnsw (embedding vector_l2_ops)")
+        await conn.execute(f"ANALYZE {TABLE}")
+
+
+async def text_client(stack: AsyncExitStack, statement_cache_size: int) -> dict:
+    conn = await asyncpg.connect(
+        **connect_kwargs(), statement_cache_size=statement_cache_size, server_settings={"enable_seqscan": "off"}
+    )
+    stack.push_async_callback(conn.close)
+
+    async def search(q):
+        return await conn.fetch(TEXT_SEARCH, to_text(q.tolist()), LIMIT, "BGE-m3")
+
+    async def insert(q):
+        await conn.execute(TEXT_INSERT, "BGE-m3", "bench", None, "bench insert", to_text(q.tolist()))
+
+    return {"search": search, "insert": insert}
+
+
+async def binary_client(stack: AsyncExitStack, db: Database) -> dict:
+    conn = await stack.enter_async_context(db.acquire())
+    await conn.execute("SET enable_seqscan = off")
+    stack.push_async_callback(conn.execute, "RESET enable_seqscan")
+
+    async def search(q):
+        return await conn.fetch(search_sql(TABLE), q, LIMIT, "BGE-m3")
+
+    async def insert(q):
+        await conn.execute(BINARY_INSERT, "BGE-m3", "bench", None, "bench insert", q)
+
+    return {"search": search, "insert": insert}
+
+
+async def measure(clients: dict, kind: str, queries) -> dict:
+    """
+    쿼리마다 세 방식을 번갈아 (순서도 돌려가며) 실행해 캐시 / 테이블 크기 변화가 한쪽에 몰리지 않게 합니다.
+    """
+    names = list(clients)
+    for q in queries[:20]:      # 워밍업 (연결별 prepare / 캐시)
+        for name in names:
+            await clients[name][kind](q)
+    samples = {name: [] for name in names}
+    for i, q in enumerate(queries):
+        for name in names[i % len(names):] + names[:i % len(names)]:
+            start = time.perf_counter()
+            await clients[name][kind](q)
+            samples[name].append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def row(name: str, samples: list, base: float = None) -> str:
+    ordered = sorted(samples)
+    p50 = statistics.median(ordered)
+    p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+    speedup = f"{base / p50:5.2f}x" if base else "     -"
+    return f"  {name:<10} p50 {p50:7.3f}   p99 {p99:7.3f}   mean {statistics.fmean(ordered):7.3f}   {speedup}"
+
+
+async def main():
+    db = await Database(min_size=1, max_size=2).open()
+    try:
+        await setup(db)
+        queries = list(vectors(QUERIES, 1))
+        async with AsyncExitStack() as stack:
+            clients = {
+                "text": await text_client(stack, 100),
+                "text/nc": await text_client(stack, 0),
+                "binary": await binary_client(stack, db),
+            }
+            print(f"\ndim={DIM} rows={ROWS} queries={QUERIES} limit={LIMIT}  (ms per query, speedup vs text p50)")
+            for kind in ("search", "insert"):
+                results = await measure(clients, kind, queries)
+                print(f"[{kind}]")
+                base = statistics.median(results["text"])
+                for name in ("text", "text/nc", "binary"):
+                    print(row(name, results[name], None if name == "text" else base), flush=True)
+        print(f"\npool: {db.stats()['acquire']}")
+    finally:
+        async with db.acquire() as conn:
+            await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
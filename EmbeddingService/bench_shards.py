@@ -0,0 +1,190 @@
+# MeQuest/EmbeddingService/bench_shards.py
+# ------------------------------------------------------------
+# 샤드 fan-out 검색 확인 / 측정 (sharding.py)
+# Run:
+#   python bench_shards.py                                   메모리 샤드 (PostgreSQL 불필요)
+#   BENCH_PG=1 PG_PASS=... python bench_shards.py            같은 서버에 bench_shard0..N DB 를 만들어 실제 풀로 측정 (끝나면 삭제)
+#   BENCH_SHARDS=4 BENCH_ROWS=20000 BENCH_QUERIES=300 python bench_shards.py
+# 1) 분산: BENCH_ROWS 개를 ShardedStore.insert 로 넣었을 때 샤드별 행 수
+# 2) 정확도: fan-out + 병합 top-k 가 전체 행 정확 검색(numpy) top-k 와 같은 비율 (recall@k)
+# 3) 지연: 샤드 1개에 모두 넣은 경우 vs N 샤드 fan-out 의 쿼리 1건 p50 / p99 (ms)
+# 4) 느린 샤드: 한 샤드를 타임아웃보다 늦게 만들고 부분 결과 / 응답 시간 확인
+# 5) rebalance: 샤드 하나를 추가하고 옮겨진 행 비율 (기대값 1/(N+1)) 과 이후 recall
+# ------------------------------------------------------------
+
+import asyncio
+import logging
+import os
+import statistics
+import time
+from urllib.parse import quote
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import connect_kwargs  # noqa: E402  (.env 먼저 로드)
+from sharding import MemoryShard, PostgresShard, ShardedStore, rebalance  # noqa: E402
+
+USE_PG = os.getenv("BENCH_PG", "0") == "1"
+SHARDS = int(os.getenv("BENCH_SHARDS", "3"))
+DIM = int(os.getenv("BENCH_DIM", "256"))
+ROWS = int(os.getenv("BENCH_ROWS", "6000"))
+QUERIES = int(os.getenv("BENCH_QUERIES", "200"))
+LIMIT = int(os.getenv("BENCH_LIMIT", "5"))
+TIMEOUT_MS = float(os.getenv("BENCH_TIMEOUT_MS", "200"))
+MODEL = "BGE-m3"
+
+
+def vectors(n: int, seed: int) -> np.ndarray:
+    v = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+class SlowShard:
+    """검색만 delay_ms 만큼 늦게 응답하는 샤드 래퍼"""
+
+    def __init__(self, shard, delay_ms: float):
+        self._shard = shard
+        self.delay_ms = delay_ms
+
+    def __getattr__(self, name):
+        return getattr(self._shard, name)
+
+    async def search(self, *args, **kwargs):
+        await asyncio.sleep(self.delay_ms / 1000)
+        return await self._shard.search(*args, **kwargs)
+
+
+# ---------------------- PostgreSQL 샤드 -----------------------
+async def create_pg_shards(names):
+    import asyncpg
+
+    admin = await asyncpg.connect(**connect_kwargs())
+    kw = connect_kwargs()
+    shards = []
+    try:
+        for name in names:
+            await admin.execute(f"DROP DATABASE IF EXISTS bench_{name}")
+            await admin.execute(f"CREATE DATABASE bench_{name}")
+            auth = quote(kw["user"]) + (f":{quote(kw['password'])}" if kw["password"] else "")
+            host = kw["host"]
+            dsn = (f"postgresql://{auth}@/bench_{name}?host={quote(host)}&port={kw['port']}" if host.startswith("/")
+                   else f"postgresql://{auth}@{host}:{kw['port']}/bench_{name}")
+            conn = await asyncpg.connect(dsn)
+            await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            await conn.execute(
+                f"""
+                CREATE TABLE embeddings (
+                    id BIGSERIAL PRIMARY KEY, model_name TEXT NOT NULL, source TEXT, ref_id BIGINT,
+                    content TEXT, embedding vector({DIM}) NOT NULL
+                )
+                """
+            )
+            await conn.execute("CREATE INDEX ON embeddings USING hnsw (embedding vector_l2_ops)")
+            await conn.close()
+            shards.append(PostgresShard(name, dsn))
+    finally:
+        await admin.close()
+    return shards
+
+
+async def drop_pg_shards(names):
+    import asyncpg
+
+    admin = await asyncpg.connect(**connect_kwargs())
+    try:
+        for name in names:
+            await admin.execute(f"DROP DATABASE IF EXISTS bench_{name}")
+    finally:
+        await admin.close()
+
+
+async def make_shards(names):
+    shards = await create_pg_shards(names) if USE_PG else [MemoryShard(name) for name in names]
+    for shard in shards:
+        await shard.open()
+    return shards
+
+
+# ---------------------- 측정 -------------------------------
+async def load(store: ShardedStore, data: np.ndarray):
+    for start in range(0, len(data), 500):
+        rows = [(f"row {i}", data[i], i) for i in range(start, min(start + 500, len(data)))]
+        await store.insert(rows, model_name=MODEL, source="bench")
+
+
+def exact_top_k(data: np.ndarray, q: np.ndarray) -> set:
+    return set(np.argsort(np.linalg.norm(data - q, axis=1))[:LIMIT].tolist())
+
+
+async def measure(store: ShardedStore, data: np.ndarray, queries) -> dict:
+    latencies, hits, partial = [], 0, 0
+    for q in queries:
+        start = time.perf_counter()
+        result = await store.search(q, LIMIT, MODEL)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len({row["ref_id"] for row in result.rows} & exact_top_k(data, q))
+        partial += result.partial
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        "recall": hits / (LIMIT * len(queries)),
+        "partial": partial,
+    }
+
+
+def line(name: str, m: dict) -> str:
+    return (f"  {name:<22} p50 {m['p50']:7.2f}   p99 {m['p99']:7.2f}   recall@{LIMIT} {m['recall']:6.1%}"
+            f"   partial {m['partial']}/{QUERIES}")
+
+
+async def counts(store: ShardedStore) -> str:
+    return "  ".join([f"{s.name}={await s.count()}" for s in store.shards])
+
+
+async def main():
+    names = [f"shard{i}" for i in range(SHARDS)]
+    all_names = ["single", *names, f"shard{SHARDS}"]
+    print(f"{'postgres' if USE_PG else 'memory'} shards={SHARDS} rows={ROWS} dim={DIM} queries={QUERIES} "
+          f"limit={LIMIT} timeout={TIMEOUT_MS}ms  (ms per query)")
+    data, queries = vectors(ROWS, 0), list(vectors(QUERIES, 1))
+    stores = []
+    try:
+        single = ShardedStore(await make_shards(["single"]), timeout_ms=TIMEOUT_MS)
+        sharded = ShardedStore(await make_shards(names), timeout_ms=TIMEOUT_MS)
+        stores += [single, sharded]
+        await load(single, data)
+        await load(sharded, data)
+        print(f"\n[distribution] {await counts(sharded)}")
+
+        print("\n[search]")
+        print(line("single", await measure(single, data, queries)))
+        print(line(f"fan-out x{SHARDS}", await measure(sharded, data, queries)))
+
+        slow = ShardedStore([SlowShard(sharded.shards[0], TIMEOUT_MS * 3), *sharded.shards[1:]], timeout_ms=TIMEOUT_MS)
+        print(line(f"{names[0]} slow ({TIMEOUT_MS * 3:.0f}ms)", await measure(slow, data, queries)))
+
+        grown = ShardedStore([*sharded.shards, *(await make_shards([f"shard{SHARDS}"]))], timeout_ms=TIMEOUT_MS)
+        stores.append(grown)
+        start = time.perf_counter()
+        result = await rebalance(grown, batch=500)
+        elapsed = time.perf_counter() - start
+        print(f"\n[rebalance +1 shard] moved {result['moved']}/{ROWS} rows "
+              f"({result['moved'] / ROWS:.1%}, expected {1 / (SHARDS + 1):.1%}) in {elapsed:.2f}s")
+        print(f"  {await counts(grown)}")
+        again = await rebalance(grown, dry_run=True)
+        print(f"  second pass would move {again['moved']} rows")
+        print(line(f"fan-out x{SHARDS + 1}", await measure(grown, data, queries)))
+    finally:
+        for store in stores:
+            await store.close()
+        if USE_PG:
+            await drop_pg_shards(all_names)
+
+
+if __name__ == "__main__":
+    logging.getLogger("sharding").setLevel(logging.ERROR) # 느린 샤드 구간의 타임아웃 경고 생략
+    asyncio.run(main())
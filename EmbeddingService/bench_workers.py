@@ -0,0 +1,143 @@
+# MeQuest/EmbeddingService/bench_workers.py
+# ------------------------------------------------------------
+# 워커 수별 /embed 처리량 + 메모리 벤치마크 (serve.py pre-fork vs uvicorn --workers)
+# Run:
+#   MODEL_PATH=/mnt/d/MeQuest/models/bge-m3 PG_PASS=... python bench_workers.py
+#   BENCH_MODES=prefork BENCH_WORKERS=1,2,4 python bench_workers.py
+# 워커 수마다 서버를 새로 띄워
+#   - BENCH_SECONDS 동안 BENCH_CONCURRENCY 개 클라이언트가 BENCH_BATCH 문장씩 /embed (BGE-m3 고정)
+#   - 부모 + 워커 프로세스의 RSS / PSS / USS 합 (smaps_rollup)
+# 출력: 워커 수별 texts/s, 1 워커 대비 배율, 전체 PSS, 워커 하나를 늘릴 때 늘어난 PSS
+# (서버는 main.py 와 같은 .env / PG_* 설정으로 뜹니다. startup 에서 DB 연결이 필요합니다)
+# ------------------------------------------------------------
+
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from serve import memory_mb
+
+MODES = [m for m in os.getenv("BENCH_MODES", "prefork,uvicorn").split(",") if m]
+WORKERS = [int(w) for w in os.getenv("BENCH_WORKERS", "1,2,4").split(",")]
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "16"))
+BATCH = int(os.getenv("BENCH_BATCH", "8"))
+SECONDS = float(os.getenv("BENCH_SECONDS", "15"))
+PORT = int(os.getenv("BENCH_PORT", "18300"))
+BGE_MODEL_NAME = os.getenv("BGE_MODEL_NAME", "BGE-m3")
+STARTUP_TIMEOUT_S = float(os.getenv("BENCH_STARTUP_TIMEOUT_S", "600"))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TEXTS = [
+    "피타고라스 정리는 직각삼각형의 세 변 사이의 관계를 나타낸다.",
+    "광합성은 빛 에너지를 이용해 이산화탄소와 물로 포도당을 만드는 과정이다.",
+    "조선 시대 과거 제도는 문과, 무과, 잡과로 나뉘었다.",
+    "Python list comprehensions build a new list from an iterable in one expression.",
+]
+
+
+def launch(mode: str, workers: int) -> subprocess.Popen:
+    if mode == "prefork":
+        cmd = [sys.executable, "serve.py"]
+        env = {"EMBED_WORKERS": str(workers), "EMBED_HOST": "127.0.0.1", "EMBED_PORT": str(PORT)}
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(PORT),
+               "--workers", str(workers), "--log-level", "warning"]
+        env = {}
+    # 워커마다 startup 이 끝나면 STARTUP.done() 이 "... ready in ..." 한 줄을 출력합니다. (wait_ready 에서 셈)
+    log = tempfile.TemporaryFile(mode="w+")
+    proc = subprocess.Popen(
+        cmd, cwd=HERE, env={**os.environ, **env, "PYTHONUNBUFFERED": "1"}, stdout=log, stderr=subprocess.STDOUT
+    )
+    proc.log = log
+    return proc
+
+
+def process_tree(pid: int) -> list:
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                stack.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+async def wait_ready(proc: subprocess.Popen, workers: int):
+    """모든 워커의 startup 이 끝날 때까지 대기 (공유 소켓이라 /health 로는 워커를 골라 확인할 수 없음)"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            proc.log.seek(0)
+            raise RuntimeError(f"server exited with code {proc.returncode}:\n{proc.log.read()[-2000:]}")
+        proc.log.seek(0)
+        if proc.log.read().count(" ready in ") >= workers:
+            return
+        await asyncio.sleep(0.5)
+    raise RuntimeError("server did not become ready")
+
+
+async def load(client: httpx.AsyncClient, seconds: float) -> tuple:
+    body = {"texts": (TEXTS * (BATCH // len(TEXTS) + 1))[:BATCH], "model_name": BGE_MODEL_NAME}
+    latencies = []
+    stop = time.monotonic() + seconds
+
+    async def worker():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            r = await client.post(f"http://127.0.0.1:{PORT}/embed", json=body)
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    return len(latencies) * BATCH / elapsed, statistics.median(latencies) * 1000
+
+
+async def measure(mode: str, workers: int) -> dict:
+    proc = launch(mode, workers)
+    try:
+        async with httpx.AsyncClient(timeout=120) as client:
+            await wait_ready(proc, workers)
+            await load(client, 2)                       # 워밍업 (워커별 첫 encode)
+            texts_per_s, p50_ms = await load(client, SECONDS)
+        memory = [memory_mb(pid) for pid in process_tree(proc.pid)]
+        total = {key: sum(m[key] or 0 for m in memory) for key in ("rss_mb", "pss_mb", "uss_mb")}
+        return {"texts_per_s": texts_per_s, "p50_ms": p50_ms, **total}
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    print(f"concurrency={CONCURRENCY} batch={BATCH} seconds={SECONDS} cpus={os.cpu_count()}\n")
+    for mode in MODES:
+        print(f"[{mode}]")
+        print(f"{'workers':>7} {'texts/s':>9} {'scale':>6} {'p50 ms':>8} {'RSS MB':>9} {'PSS MB':>9} {'+PSS/worker':>12}")
+        base = None
+        for workers in WORKERS:
+            r = asyncio.run(measure(mode, workers))
+            base = base or (workers, r)
+            added = (r["pss_mb"] - base[1]["pss_mb"]) / (workers - base[0]) if workers > base[0] else 0.0
+            print(
+                f"{workers:>7} {r['texts_per_s']:>9.1f} {r['texts_per_s'] / base[1]['texts_per_s']:>5.2f}x "
+                f"{r['p50_ms']:>8.1f} {r['rss_mb']:>9.1f} {r['pss_mb']:>9.1f} {added:>12.1f}",
+                flush=True,
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# MeQuest/EmbeddingService/database.py
+# ------------------------------------------------------------
+# EmbeddingService 공용 PostgreSQL 접근 계층 (main.py / db_utils.py / embedding_schema.py)
+#
+# 이전에는 main.py 와 db_utils.py 가 각자 풀을 만들고 register_vector 를 풀에서 꺼낸 연결 하나에만
+# 호출했습니다. 나머지 연결에는 vector 코덱이 없어서 /search 가 벡터를 '[0.1, ...]' 문자열로
+# 만들어 ::vector 로 캐스팅했습니다. (1024차원 = 매 요청 수십 KB 문자열 포맷 + 서버 측 파싱)
+# - 풀의 모든 연결을 init 훅에서 초기화: pgvector 바이너리 코덱 + 자주 쓰는 검색 / 삽입 쿼리 prepare
+# - prepared statement 는 asyncpg 의 연결별 statement 캐시에 둡니다. (conn.fetch(sql, ...) 가 재사용)
+#   PreparedStatement 객체는 연결이 풀로 돌아가면 무효가 되므로 직접 들고 있지 않습니다.
+#   파티션 테이블처럼 쿼리가 달라지는 경우도 연결당 한 번만 prepare 됩니다.
+#   (파티션이 PG_STATEMENT_CACHE_SIZE 보다 많으면 오래된 쿼리부터 다시 prepare)
+# - 풀 획득 대기 시간 통계 (/health 의 "db"), on_acquire 콜백으로 Server-Timing 에도 기록
+# Env:
+#   PG_HOST / PG_PORT / PG_USER / PG_PASS / PG_DB
+#   PG_POOL_MIN_SIZE=1  PG_POOL_MAX_SIZE=10         워커(프로세스)마다 이 크기
+#   PG_CONNECT_TIMEOUT=5                             연결 생성 타임아웃 (초)
+#   PG_COMMAND_TIMEOUT=0                             쿼리 타임아웃 (초, 0 = 없음)
+#   PG_STATEMENT_CACHE_SIZE=100                      연결별 prepared statement 캐시 (0 = 끔, pgbouncer transaction 모드)
+#   PG_MAX_CACHED_STATEMENT_LIFETIME=300             캐시된 statement 수명 (초)
+#   PG_PREPARE_HOT_STATEMENTS=1                      0 이면 연결 init 에서 검색 / 삽입 쿼리를 prepare 하지 않음
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+import asyncpg
+from pgvector.asyncpg import register_vector
+
+PG_POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "1"))
+PG_POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+PG_CONNECT_TIMEOUT = float(os.getenv("PG_CONNECT_TIMEOUT", "5"))
+PG_COMMAND_TIMEOUT = float(os.getenv("PG_COMMAND_TIMEOUT", "0")) or None
+PG_STATEMENT_CACHE_SIZE = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "100"))
+PG_MAX_CACHED_STATEMENT_LIFETIME = int(os.getenv("PG_MAX_CACHED_STATEMENT_LIFETIME", "300"))
+PG_PREPARE_HOT_STATEMENTS = os.getenv("PG_PREPARE_HOT_STATEMENTS", "1") == "1"
+
+# ---------------------- 쿼리 -------------------------------
+INSERT_EMBEDDING = """
+    INSERT INTO embeddings (model_name, source, ref_id, content, embedding)
+    VALUES ($1, $2, $3, $4, $5)
+"""
+
+
+def search_sql(table: str = "embeddings", by_source: bool = False) -> str:
+    """
+    유사도 검색 쿼리. $1 = 쿼리 벡터, $2 = limit, $3 = model_name, ($4 = source)
+    table 은 이미 quote 된 이름 (파티션 모드에서는 파티션 테이블)
+    """
+    return f"""
+        SELECT id, content, ref_id, embedding <-> $1 AS distance
+        FROM {table}
+        WHERE model_name = $3{" AND source = $4" if by_source else ""}
+        ORDER BY distance
+        LIMIT $2
+    """
+
+
+# 연결 init 에서 미리 prepare 하는 쿼리 (비파티션 테이블 기준, 파티션 쿼리는 첫 사용 때 prepare)
+HOT_STATEMENTS = (search_sql(), search_sql(by_source=True), INSERT_EMBEDDING)
+
+
+def connect_kwargs() -> Dict[str, Any]:
+    return {
+        "user": os.getenv("PG_USER", "mequest_user"),
+        "password": os.getenv("PG_PASS", ""),
+        "database": os.getenv("PG_DB", "mequest_rag_db"),
+        "host": os.getenv("PG_HOST", "localhost"),
+        "port": int(os.getenv("PG_PORT", 5432)),
+    }
+
+
+async def init_connection(conn: asyncpg.Connection):
+    """풀이 새 연결을 만들 때마다 호출: vector 코덱 등록 + 자주 쓰는 쿼리 prepare"""
+    await register_vector(conn)
+    if not PG_PREPARE_HOT_STATEMENTS or PG_STATEMENT_CACHE_SIZE <= 0:
+        return
+    for query in HOT_STATEMENTS:
+        try:
+            # 빈 인자 executemany: 실행 없이 prepare 만 하고 statement 캐시에 넣습니다.
+            await conn.executemany(query, [])
+        except asyncpg.UndefinedTableError:
+            # 아직 embeddings 가 없음 (partitioned 모드 첫 시작). 첫 사용 때 prepare 합니다.
+            return
+
+
+class AcquireStats:
+    """풀 획득 대기 시간 (최근 window 개 기준 p50 / p99)"""
+
+    def __init__(self, window: int = 1024):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.timeouts = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> Optional[float]:
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3) if ordered else None
+
+        return {
+            "count": self.count,
+            "timeouts": self.timeouts,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "p50_ms": pct(0.50),
+            "p99_ms": pct(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class Database:
+    """
+    asyncpg 풀 래퍼. `async with db.acquire() as conn:` 으로 연결을 빌립니다.
+    (conn.fetch(search_sql(...), ...) 는 연결에 prepare 된 statement 를 재사용)
+    on_acquire(ms) 는 획득할 때마다 호출됩니다. (예: server_timing.record("pool", ms))
+    dsn 을 주면 PG_HOST / PG_* 대신 그 DSN 으로 연결합니다. (샤드별 풀, sharding.py)
+    """
+
+    def __init__(
+        self,
+        min_size: int = PG_POOL_MIN_SIZE,
+        max_size: int = PG_POOL_MAX_SIZE,
+        on_acquire: Optional[Callable[[float], None]] = None,
+        dsn: Optional[str] = None,
+    ):
+        self.dsn = dsn
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.on_acquire = on_acquire
+        self.pool: Optional[asyncpg.Pool] = None
+        self.acquire_stats = AcquireStats()
+
+    async def open(self) -> "Database":
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(
+                **(connect_kwargs() if self.dsn is None else {"dsn": self.dsn}),
+                min_size=self.min_size,
+                max_size=self.max_size,
+                timeout=PG_CONNECT_TIMEOUT,
+                command_timeout=PG_COMMAND_TIMEOUT,
+                statement_cache_size=PG_STATEMENT_CACHE_SIZE,
+                max_cached_statement_lifetime=PG_MAX_CACHED_STATEMENT_LIFETIME,
+                init=init_connection,
+            )
+        return self
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None) -> AsyncIterator[asyncpg.Connection]:
+        if self.pool is None:
+            raise RuntimeError("Database pool is not open")
+        start = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.acquire_stats.timeouts += 1
+            raise
+        waited = (time.perf_counter() - start) * 1000
+        self.acquire_stats.add(waited)
+        if self.on_acquire is not None:
+            self.on_acquire(waited)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.pool
+        return {
+            "open": pool is not None,
+            "size": pool.get_size() if pool else 0,
+            "idle": pool.get_idle_size() if pool else 0,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "statement_cache_size": PG_STATEMENT_CACHE_SIZE,
+            "prepare_hot_statements": PG_PREPARE_HOT_STATEMENTS,
+            "acquire": self.acquire_stats.snapshot(),
+        }
@@ -1,34 +1,27 @@
 # MeQuest/Backend/db_utils.py (예시 위치)
 
 import os
-import asyncpg
 import asyncio
 import aiohttp # get_embedding에서 사용
 import json
 from dotenv import load_dotenv # dotenv 임포트
-from pgvector.asyncpg import register_vector # pgvector 어댑터 임포트
 
 # --- .env 파일 로드 ---
 # 이 유틸리티 파일이 호출될 때 환경 변수를 로드합니다.
 # 이 파일이 FastAPI 앱에 의해 임포트된다면, main.py에서 이미 로드했으므로 중복입니다.
 # 하지만 단독으로 실행될 테스트 스크립트라면 필요합니다.
+# (database.py / embedding_schema.py 가 import 시점에 환경 변수를 읽으므로 그 전에 로드)
 load_dotenv()
 
-# --- 환경 변수에서 DB 설정 로드 ---
-DB_CONFIG = {
-    "user": os.getenv("PG_USER", "mequest_user"),
-    "password": os.getenv("PG_PASS"), # 환경 변수 필수
-    "database": os.getenv("PG_DB", "mequest_rag_db"),
-    "host": os.getenv("PG_HOST", "localhost"),
-    "port": int(os.getenv("PG_PORT", 5432)) # 포트는 int로 변환
-}
+# DB 설정(PG_* / PG_SHARDS)과 풀 / pgvector 코덱 / prepared statement / 파티션은 main.py 와 같은 sharding.py 를 씁니다.
+from sharding import ShardedStore
 
 # --- FastAPI Embedding Service API URL 로드 ---
 # 변수명과 기본값을 FastAPI 서비스에 맞게 수정했습니다.
 EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL", "http://localhost:8000") # FastAPI 서버 URL
 
 # --- 전역 변수 ---
-# FastAPI 앱에서 공유될 DB 연결 풀
+# FastAPI 앱에서 공유될 DB 연결 풀 (sharding.ShardedStore: 샤드마다 database.Database + 파티션 카탈로그)
 _db_pool = None 
 
 # --- DB Pool 관리 함수 (FastAPI 앱의 startup/shutdown에서 사용될 예정) ---
@@ -36,9 +29,7 @@ async def init_db_pool():
     global _db_pool
     if _db_pool is None:
         try:
-            _db_pool = await asyncpg.create_pool(**DB_CONFIG, timeout=5, min_size=1, max_size=10)
-            async with _db_pool.acquire() as conn:
-                await register_vector(conn) # pgvector 어댑터 등록
+            _db_pool = await ShardedStore.from_env().open() # 모든 연결에 pgvector 어댑터 등록 + 파티션 카탈로그
             print("PostgreSQL connection pool and pgvector adapter initialized.")
         except Exception as e:
             print(f"Failed to initialize PostgreSQL pool or register pgvector: {e}")
@@ -79,31 +70,26 @@ async def get_embedding(text_or_list: str | list[str]) -> list[list[float]]:
 
 # --- 임베딩 삽입 함수 ---
 async def insert_embedding(pool, content: str, vector: list[float], model_name="BGE-m3", source="test", ref_id=None):
-    """PostgreSQL에 임베딩 삽입"""
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO embeddings (model_name, source, ref_id, content, embedding)
-            VALUES ($1, $2, $3, $4, $5)
-            """,
-            model_name, source, ref_id, content, vector
-        )
+    """PostgreSQL에 임베딩 삽입 (샤드 라우팅, 파티션 모드면 (model_name, source) 파티션이 없을 때 먼저 만듭니다)"""
+    await insert_embeddings(pool, [(content, vector, ref_id)], model_name=model_name, source=source)
+
+async def insert_embeddings(pool, rows: list[tuple], model_name="BGE-m3", source="test"):
+    """
+    같은 (model_name, source) 의 (content, vector, ref_id) 여러 행을 한 번에 삽입 (색인 / ingest 경로).
+    행마다 샤드를 골라 샤드별로 한 번에 넣습니다. (EMBED_SHARD_KEY)
+    삽입은 부모 테이블로 하고 파티션 라우팅은 PostgreSQL 이 처리합니다.
+    """
+    if not rows:
+        return
+    await pool.insert(rows, model_name=model_name, source=source)
 
 # --- 임베딩 검색 함수 ---
-async def search_embeddings(pool, query_vector: list[float], top_k=3) -> list[dict]:
-    """임베딩 유사도 검색"""
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            """
-            SELECT id, content, embedding <-> $1 AS distance
-            FROM embeddings
-            ORDER BY embedding <-> $1
-            LIMIT $2;
-            """,
-            query_vector, top_k
-        )
-        # 결과는 Record 객체이므로 딕셔너리로 변환하여 반환
-        return [dict(row) for row in rows]
+async def search_embeddings(pool, query_vector: list[float], top_k=3, model_name="BGE-m3") -> list[dict]:
+    """임베딩 유사도 검색 (query_vector 를 만든 모델의 행만, 파티션 모드면 그 모델의 파티션만, 샤드는 모두 조회)"""
+    result = await pool.search(query_vector, top_k, model_name)
+    if result.partial:
+        print(f"Partial search result: shards {result.missing} did not answer in time.")
+    return result.rows
 
 # --- 테스트 실행 ---
 async def main():
@@ -120,9 +106,11 @@ async def main():
         print(f"Generated {len(vectors)} embeddings. First vector dim: {len(vectors[0])}")
         
         print("\n--- 2. 임베딩 삽입 ---")
-        await insert_embedding(pool, texts_to_embed[0], vectors[0], source="FastAPI_test", ref_id=1)
-        if len(vectors) > 1:
-            await insert_embedding(pool, texts_to_embed[1], vectors[1], source="FastAPI_test", ref_id=2)
+        await insert_embeddings(
+            pool,
+            [(text, vector, ref_id) for ref_id, (text, vector) in enumerate(zip(texts_to_embed, vectors), start=1)],
+            source="FastAPI_test"
+        )
         print("Embeddings inserted successfully.")
 
         print("\n--- 3. 임베딩 검색 ---")
@@ -0,0 +1,310 @@
+# MeQuest/EmbeddingService/embedding_schema.py
+# ------------------------------------------------------------
+# embeddings 테이블 파티셔닝 (managed schema 모드)
+#
+# 모든 벡터가 하나의 embeddings 테이블에 있어 인덱스 빌드 / VACUUM / 스캔 비용이 전체 코퍼스에
+# 비례합니다. 검색은 거의 항상 한 모델(+ 한 source)만 보므로
+# - embeddings 를 model_name 으로 LIST 파티셔닝 (EMBED_PARTITION_BY_SOURCE=1 이면 source 로 한 단계 더)
+# - ANN(HNSW) 인덱스는 부모 테이블에 한 번 만들면 PostgreSQL 이 파티션마다 따로 만들어 줍니다.
+#   (새 파티션도 자동으로 인덱스를 받음 → 인덱스 빌드 / VACUUM 은 파티션 크기에 비례)
+# - 파티션 목록은 embedding_partitions 카탈로그에 두고, 새 (model_name, source) 는 첫 삽입 때 만듭니다.
+# - /search 는 카탈로그로 찾은 파티션 테이블을 직접 조회하므로 항상 한 파티션만 스캔합니다.
+#   (삽입은 부모 테이블로: 라우팅은 PostgreSQL 이 처리)
+# - 관리 모드의 source 는 NOT NULL (기존 NULL 은 'default' 로 옮깁니다)
+# Env:
+#   EMBED_SCHEMA_MODE=unmanaged     unmanaged = 기존 단일 테이블 그대로, partitioned = 파티션 테이블 관리
+#   EMBED_PARTITION_BY_SOURCE=0     1 이면 model_name → source 2단계 파티션
+#   EMBED_DIM=1024                  vector 컬럼 차원 (BGE-m3 / hashing 임베더 공통)
+#   EMBED_ANN_INDEX=hnsw            hnsw | none
+#   EMBED_HNSW_M=16  EMBED_HNSW_EF_CONSTRUCTION=64
+# Migration (기존 단일 테이블 → 파티션 테이블. 기존 테이블은 embeddings_unpartitioned 로 보존):
+#   python embedding_schema.py migrate [--drop-old]
+#   python embedding_schema.py status
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv() # CLI 단독 실행 시에도 아래 EMBED_* 가 .env 를 따르도록 import 시점에 로드
+
+logger = logging.getLogger(__name__)
+
+EMBED_SCHEMA_MODE = os.getenv("EMBED_SCHEMA_MODE", "unmanaged").lower()
+EMBED_PARTITION_BY_SOURCE = os.getenv("EMBED_PARTITION_BY_SOURCE", "0") == "1"
+EMBED_DIM = int(os.getenv("EMBED_DIM", "1024"))
+EMBED_ANN_INDEX = os.getenv("EMBED_ANN_INDEX", "hnsw").lower()
+EMBED_HNSW_M = int(os.getenv("EMBED_HNSW_M", "16"))
+EMBED_HNSW_EF_CONSTRUCTION = int(os.getenv("EMBED_HNSW_EF_CONSTRUCTION", "64"))
+
+DEFAULT_SOURCE = "default"
+LEGACY_TABLE = "embeddings_unpartitioned"
+_MODEL_LEVEL = ""   # 카탈로그에서 model_name 단위 파티션을 나타내는 source 값
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value: str) -> str:
+    # 파티션 경계값은 DDL 이라 바인드 파라미터를 쓸 수 없습니다. (standard_conforming_strings=on 기준)
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _slug(value: str) -> str:
+    """식별자용 이름: 소문자/숫자만 16자 + 원래 값의 해시 6자 (충돌 방지, 63바이트 제한 안쪽)"""
+    base = re.sub(r"[^a-z0-9]+", "_", value.lower()).strip("_")[:16] or "x"
+    return f"{base}_{hashlib.md5(value.encode()).hexdigest()[:6]}"
+
+
+def partition_name(model_name: str, source: Optional[str] = None) -> str:
+    name = f"emb_{_slug(model_name)}"
+    return f"{name}__{_slug(source)}" if source is not None else name
+
+
+async def table_kind(conn) -> str:
+    """embeddings 테이블 상태: partitioned | unpartitioned | missing"""
+    kind = await conn.fetchval(
+        """
+        SELECT c.relkind::text FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'embeddings' AND n.nspname = current_schema()
+        """
+    )
+    if kind is None:
+        return "missing"
+    return "partitioned" if kind == "p" else "unpartitioned"
+
+
+async def create_schema(conn, with_index: bool = True):
+    """파티션 부모 테이블 + 카탈로그 생성 (이미 있으면 그대로)"""
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    await conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            id BIGSERIAL,
+            model_name TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT {quote_literal(DEFAULT_SOURCE)},
+            ref_id BIGINT,
+            content TEXT,
+            embedding vector({EMBED_DIM}) NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            CONSTRAINT embeddings_partitioned_pkey PRIMARY KEY (model_name, source, id)
+        ) PARTITION BY LIST (model_name)
+        """
+    )
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS embedding_partitions (
+            model_name TEXT NOT NULL,
+            source TEXT NOT NULL,
+            table_name TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (model_name, source)
+        )
+        """
+    )
+    if with_index:
+        await create_ann_index(conn)
+
+
+async def create_ann_index(conn):
+    """부모 테이블에 만들면 기존 / 이후 파티션마다 로컬 HNSW 인덱스가 생깁니다."""
+    if EMBED_ANN_INDEX == "none":
+        return
+    if EMBED_ANN_INDEX != "hnsw":
+        raise ValueError(f"EMBED_ANN_INDEX must be hnsw or none, got {EMBED_ANN_INDEX!r}")
+    await conn.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS embeddings_embedding_ann ON embeddings
+        USING hnsw (embedding vector_l2_ops)
+        WITH (m = {EMBED_HNSW_M}, ef_construction = {EMBED_HNSW_EF_CONSTRUCTION})
+        """
+    )
+
+
+class PartitionManager:
+    """(model_name, source) → 파티션 테이블 이름. 없는 파티션은 ensure() 가 만듭니다."""
+
+    def __init__(self, by_source: bool = EMBED_PARTITION_BY_SOURCE):
+        self.by_source = by_source
+        self._tables: Dict[Tuple[str, str], str] = {}
+
+    async def refresh(self, conn):
+        rows = await conn.fetch("SELECT model_name, source, table_name FROM embedding_partitions")
+        self._tables = {(r["model_name"], r["source"]): r["table_name"] for r in rows}
+
+    def _cached(self, model_name: str, source: Optional[str]) -> Optional[str]:
+        if source is not None and (model_name, source) in self._tables:
+            return self._tables[(model_name, source)]
+        return self._tables.get((model_name, _MODEL_LEVEL))
+
+    async def lookup(self, conn, model_name: str, source: Optional[str] = None) -> Optional[str]:
+        """
+        검색할 테이블: source 파티션이 있으면 그 리프, 아니면 model_name 파티션.
+        (다른 워커가 새로 만든 파티션일 수 있으므로 캐시에 없으면 카탈로그를 다시 읽음)
+        """
+        table = self._cached(model_name, source)
+        if table is None:
+            await self.refresh(conn)
+            table = self._cached(model_name, source)
+        return table
+
+    async def ensure(self, conn, model_name: str, source: str = DEFAULT_SOURCE) -> str:
+        """삽입 전에 호출: 해당 행이 들어갈 파티션이 없으면 만들고 리프 테이블 이름을 반환"""
+        leaf_key = (model_name, source if self.by_source else _MODEL_LEVEL)
+        if leaf_key in self._tables:
+            return self._tables[leaf_key]
+        async with conn.transaction():
+            # 여러 워커가 같은 파티션을 동시에 만들지 않도록 직렬화
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('embedding_partitions'))")
+            await self.refresh(conn)
+            model_table = self._tables.get((model_name, _MODEL_LEVEL))
+            if model_table is None:
+                model_table = partition_name(model_name)
+                await conn.execute(
+                    f"CREATE TABLE {quote_ident(model_table)} PARTITION OF embeddings "
+                    f"FOR VALUES IN ({quote_literal(model_name)})"
+                    + (" PARTITION BY LIST (source)" if self.by_source else "")
+                )
+                await self._register(conn, model_name, _MODEL_LEVEL, model_table)
+            if self.by_source and leaf_key not in self._tables:
+                is_partitioned = await conn.fetchval(
+                    "SELECT relkind = 'p' FROM pg_class WHERE oid = $1::regclass", quote_ident(model_table)
+                )
+                if not is_partitioned:
+                    # EMBED_PARTITION_BY_SOURCE=0 일 때 만든 모델 파티션: source 로 더 나누지 않고 그대로 사용
+                    logger.warning("partition %s is not split by source; using it for %s", model_table, source)
+                    self._tables[leaf_key] = model_table
+                    return model_table
+                leaf = partition_name(model_name, source)
+                await conn.execute(
+                    f"CREATE TABLE {quote_ident(leaf)} PARTITION OF {quote_ident(model_table)} "
+                    f"FOR VALUES IN ({quote_literal(source)})"
+                )
+                await self._register(conn, model_name, source, leaf)
+        return self._tables.get(leaf_key, model_table)
+
+    async def _register(self, conn, model_name: str, source: str, table: str):
+        await conn.execute(
+            "INSERT INTO embedding_partitions (model_name, source, table_name) VALUES ($1, $2, $3)",
+            model_name, source, table,
+        )
+        self._tables[(model_name, source)] = table
+        logger.info("created embeddings partition %s (model_name=%s, source=%s)", table, model_name, source or "*")
+
+    async def stats(self, conn) -> list:
+        await self.refresh(conn)
+        rows = []
+        for (model_name, source), table in sorted(self._tables.items()):
+            size = await conn.fetchval("SELECT pg_total_relation_size($1::regclass)", quote_ident(table))
+            count = await conn.fetchval(f"SELECT count(*) FROM {quote_ident(table)}")
+            rows.append({"model_name": model_name, "source": source or "*", "table": table,
+                         "rows": count, "total_bytes": size})
+        return rows
+
+
+async def init_partitions(conn) -> Optional[PartitionManager]:
+    """
+    EMBED_SCHEMA_MODE=partitioned 일 때 서비스 시작 시 호출. 테이블이 없으면 만들고,
+    기존 단일 테이블이면 마이그레이션 전까지 기존 방식(None)으로 동작합니다.
+    """
+    if EMBED_SCHEMA_MODE != "partitioned":
+        return None
+    kind = await table_kind(conn)
+    if kind == "unpartitioned":
+        logger.warning("EMBED_SCHEMA_MODE=partitioned but embeddings is a plain table; "
+                       "run `python embedding_schema.py migrate`. Using the unpartitioned table for now.")
+        return None
+    if kind == "missing":
+        await create_schema(conn)
+    manager = PartitionManager()
+    await manager.refresh(conn)
+    return manager
+
+
+async def migrate(conn, drop_old: bool = False):
+    """
+    기존 단일 embeddings 테이블을 파티션 테이블로 옮깁니다. (하나의 트랜잭션, 실행 중 테이블 잠금)
+    데이터를 다 옮긴 뒤에 ANN 인덱스를 만들어 행마다 인덱스를 갱신하는 비용을 피합니다.
+    """
+    kind = await table_kind(conn)
+    if kind == "partitioned":
+        print("embeddings is already partitioned; nothing to do.")
+        return
+    if kind == "missing":
+        await create_schema(conn)
+        print("embeddings did not exist; created the partitioned schema.")
+        return
+
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE embeddings IN ACCESS EXCLUSIVE MODE")
+        dims = await conn.fetch("SELECT DISTINCT vector_dims(embedding) AS dim FROM embeddings")
+        if any(r["dim"] != EMBED_DIM for r in dims):
+            raise RuntimeError(f"existing vectors have dims {[r['dim'] for r in dims]}, EMBED_DIM={EMBED_DIM}")
+        await conn.execute(f"ALTER TABLE embeddings RENAME TO {LEGACY_TABLE}")
+        await create_schema(conn, with_index=False)
+
+        manager = PartitionManager()
+        groups = await conn.fetch(
+            f"""
+            SELECT model_name, COALESCE(source, {quote_literal(DEFAULT_SOURCE)}) AS source, count(*) AS rows
+            FROM {LEGACY_TABLE} GROUP BY 1, 2 ORDER BY 1, 2
+            """
+        )
+        for g in groups:
+            await manager.ensure(conn, g["model_name"], g["source"])
+        await conn.execute(
+            f"""
+            INSERT INTO embeddings (id, model_name, source, ref_id, content, embedding)
+            SELECT id, model_name, COALESCE(source, {quote_literal(DEFAULT_SOURCE)}), ref_id, content, embedding
+            FROM {LEGACY_TABLE}
+            """
+        )
+        await conn.execute(
+            "SELECT setval(pg_get_serial_sequence('embeddings', 'id'), COALESCE(max(id), 0) + 1, false) FROM embeddings"
+        )
+        await create_ann_index(conn)
+        if drop_old:
+            await conn.execute(f"DROP TABLE {LEGACY_TABLE}")
+    await conn.execute("ANALYZE embeddings")
+
+    for g in groups:
+        print(f"  {g['model_name']} / {g['source']}: {g['rows']} rows")
+    print(f"migrated {sum(g['rows'] for g in groups)} rows into {len(groups)} partition(s)"
+          + ("" if drop_old else f"; old table kept as {LEGACY_TABLE}"))
+
+
+async def _main():
+    from database import connect_kwargs
+
+    parser = argparse.ArgumentParser(description="Manage the partitioned embeddings table")
+    parser.add_argument("command", choices=["migrate", "status"])
+    parser.add_argument("--drop-old", action="store_true", help=f"drop {LEGACY_TABLE} after migrating")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(**connect_kwargs())
+    try:
+        if args.command == "migrate":
+            await migrate(conn, drop_old=args.drop_old)
+        else:
+            print(f"embeddings: {await table_kind(conn)}")
+            if await table_kind(conn) == "partitioned":
+                for row in await PartitionManager().stats(conn):
+                    print(f"  {row['table']:<40} {row['model_name']} / {row['source']}: "
+                          f"{row['rows']} rows, {row['total_bytes'] / 1024 ** 2:.1f} MB")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
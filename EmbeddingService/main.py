@@ -1,19 +1,30 @@
 # MeQuest/EmbeddingService/main.py
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
 import os
-import asyncpg # asyncpg 임포트
+import time
+import asyncio
 import logging # 로깅 임포트
 from dotenv import load_dotenv
 
-# pgvector 어댑터 임포트
-from pgvector.asyncpg import register_vector # <-- pgvector 임포트 추가
-
-# .env 파일 로드
+# .env 파일 로드 (아래 모듈들이 import 시점에 환경 변수를 읽으므로 먼저 로드)
 load_dotenv()
 
+# 과부하 시 대체 임베더, 단계별 Server-Timing / 프로파일러, 시작 단계 시간, 변환된 체크포인트 캐시
+# (공용 패키지 mequest_common: pip install -e ../common)
+from mequest_common.hashing_embedder import HashingEmbedder
+from mequest_common.server_timing import install_server_timing, record, stage
+from mequest_common.startup_timing import STARTUP
+from mequest_common.checkpoint_cache import MODEL_CACHE, checkpoint_dir, has_safetensors, is_cached, save_checkpoint
+
+# 프로세스 메모리 (RSS / PSS / USS): fork 된 워커끼리 모델 가중치를 공유하는지 확인용
+from serve import memory_mb
+
+# 공용 DB 계층 (모든 연결에 pgvector 코덱 + prepared statement) / 파티션된 embeddings 테이블 / 샤드 (PG_SHARDS)
+from embedding_schema import EMBED_SCHEMA_MODE
+from sharding import ShardedStore, ShardUnavailable
+
 # 로거 설정
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,62 +35,100 @@ app = FastAPI(
     description="Service for generating embeddings and performing RAG search with PostgreSQL",
     version="0.1.0",
 )
+install_server_timing(app, "embedding")
 
 
 # 모델 및 서비스 설정
 model = None
-pg_pool = None
+# 샤드마다 풀 하나 (PG_SHARDS 가 없으면 PG_* 단일 DB). 풀 대기 시간은 pool, 샤드별 검색 시간은 shard_<이름> 단계로
+store = ShardedStore.from_env(
+    on_acquire=lambda ms: record("pool", ms), on_search=lambda name, ms: record(f"shard_{name}", ms)
+)
 DEVICE = os.getenv("SERVICE_DEVICE", "cpu") # GPU 오류 방지용 기본값 'cpu'
 MODEL_PATH = os.getenv("MODEL_PATH", None) # 모델 경로가 없으면 서비스 시작을 막기 위해 None
+# PostgreSQL 설정 (PG_HOST / PG_PORT / PG_USER / PG_PASS / PG_DB / PG_POOL_*)은 database.py 에서 읽습니다.
+# 풀 크기는 워커 · 샤드마다 적용됩니다. (serve.py 전체 연결 수 = 워커 수 × 샤드 수 × PG_POOL_MAX_SIZE)
 
-# PostgreSQL DB 설정
-PG_HOST = os.getenv("PG_HOST", "localhost")
-PG_PORT = os.getenv("PG_PORT", 5432) # 포트 번호는 정수형으로 사용되므로, 연결 시점에 형 변환이 필요할 수 있음
-PG_USER = os.getenv("PG_USER", "mequest_user")
-PG_PASS = os.getenv("PG_PASS", "") # 비밀번호는 기본값 없이 공백으로 설정하여 설정 누락 시 오류 유도
-PG_DB = os.getenv("PG_DB", "mequest_rag_db")
+# serve.py 로 fork 된 워커 번호 (uvicorn main:app 단독 실행이면 None)
+WORKER_INDEX = None
+
+# 과부하 모드: auto = BGE-m3 대기 요청이 EMBED_OVERLOAD_QUEUE 이상이거나 모델이 없으면 hashing 임베더로 응답
+#             off  = 항상 BGE-m3 (기존 동작), force = 항상 hashing 임베더
+# 두 모델의 벡터는 의미 공간이 다르므로 응답/검색 모두 model_name 으로 구분합니다.
+BGE_MODEL_NAME = os.getenv("BGE_MODEL_NAME", "BGE-m3") # embeddings.model_name 에 저장된 이름
+EMBED_OVERLOAD_MODE = os.getenv("EMBED_OVERLOAD_MODE", "auto").lower()
+EMBED_OVERLOAD_QUEUE = int(os.getenv("EMBED_OVERLOAD_QUEUE", "8"))
+EMBED_BGE_CONCURRENCY = int(os.getenv("EMBED_BGE_CONCURRENCY", "1")) # 동시에 encode 하는 요청 수
+
+fallback_embedder = HashingEmbedder()
+bge_slots = asyncio.Semaphore(EMBED_BGE_CONCURRENCY)
+bge_pending = 0 # encode 중이거나 대기 중인 BGE-m3 요청 수
+embed_stats = {"requests": {}, "texts": {}, "ms": {}}
 
 
 # 요청 본문 모델 정의 (임베딩 생성)
 class EmbeddingRequest(BaseModel):
     texts: list[str]
+    model_name: str | None = None # 지정 시 해당 모델로 고정 (색인 작업이 대체 모델 행을 만들 때 등)
 
 # 요청 본문 모델 정의 (벡터 검색)
 class VectorSearch(BaseModel):
     query_vector: list[float] # Node.js에서 미리 임베딩된 벡터
     limit: int = 5
+    model_name: str = BGE_MODEL_NAME # query_vector 를 만든 모델 (/embed 응답의 model_name)
+    source: str | None = None # 지정 시 해당 source 의 행만 검색
+
+def load_bge_model():
+    """
+    BGE-m3 로드 (sentence_transformers / torch import 는 여기서, 시간은 /health 의 "startup").
+    serve.py 는 fork 전에 부모 프로세스에서 한 번 호출하고, 워커는 그 가중치를 공유합니다.
+    """
+    global model
+    with STARTUP.phase("model_import"):
+        from sentence_transformers import SentenceTransformer
+    # BGE-m3 배포본은 pytorch_model.bin 이라 매번 torch.load 로 전체를 읽습니다.
+    # 처음 한 번 safetensors 로 저장해 두고 다음 시작부터는 mmap 으로 읽습니다.
+    use_cache = MODEL_CACHE and not has_safetensors(MODEL_PATH)
+    cache_path = (
+        checkpoint_dir(MODEL_PATH, "st", packages=("sentence-transformers", "transformers")) if use_cache else None
+    )
+    cached = is_cached(cache_path)
+    STARTUP.note("model_checkpoint", {
+        "source": MODEL_PATH,
+        "cache": ("hit" if cached else "miss") if use_cache else "not_needed",
+        "cache_path": str(cache_path) if cache_path is not None else None,
+    })
+    logger.info(f"Loading BGE-m3 model from {cache_path if cached else MODEL_PATH} on device: {DEVICE}...")
+    with STARTUP.phase("model_weights"):
+        model = SentenceTransformer(str(cache_path) if cached else MODEL_PATH, device=DEVICE)
+    if cache_path is not None and not cached:
+        with STARTUP.phase("model_cache_save"):
+            save_checkpoint(
+                cache_path, lambda d: model.save(d, safe_serialization=True), {"source": MODEL_PATH, "variant": "st"}
+            )
+    logger.info("BGE-m3 model loaded successfully.")
+
 
 @app.on_event("startup")
 async def load_model():
-    global model, pg_pool
+    global model
     if not MODEL_PATH:
         logger.error("MODEL_PATH is not set in .env. Cannot start service.")
         raise HTTPException(status_code=500, detail="Model path configuration error.")
 
     try:
-        # 1. 모델 로드
-        logger.info(f"Loading BGE-m3 model from {MODEL_PATH} on device: {DEVICE}...")
-        model = SentenceTransformer(MODEL_PATH, device=DEVICE)
-        logger.info("BGE-m3 model loaded successfully.")
-
-        # 2. asyncpg 연결 풀 생성
-        logger.info("Creating asyncpg connection pool...")
-        pg_pool = await asyncpg.create_pool(
-            user=PG_USER,
-            password=PG_PASS,
-            database=PG_DB,
-            host=PG_HOST,
-            port=int(PG_PORT), # <-- 형 변환: 포트 번호를 정수형으로 변환
-            timeout=5,
-            min_size=1,
-            max_size=10
-        )
-        logger.info("PostgreSQL connection pool created successfully.")
-        
-        # 3. pgvector 어댑터 등록
-        async with pg_pool.acquire() as conn:
-            await register_vector(conn)
-        logger.info("pgvector asyncpg adapter registered successfully.")
+        # 1. 모델 로드 (serve.py 로 fork 된 워커는 부모가 이미 로드한 모델을 그대로 씁니다)
+        if model is None:
+            load_bge_model()
+
+        # 2. 샤드별 asyncpg 연결 풀 생성 (연결은 fork 후 공유할 수 없으므로 워커마다 만듭니다)
+        # 풀의 모든 연결이 생성될 때 pgvector 코덱을 등록하고 검색 / 삽입 쿼리를 prepare 합니다.
+        # 3. 샤드마다 파티션 카탈로그 로드 (partitioned 모드, 테이블이 없으면 생성)
+        logger.info(f"Creating asyncpg connection pools for {len(store.shards)} shard(s)...")
+        with STARTUP.phase("db_pool"):
+            await store.open()
+        logger.info("PostgreSQL connection pools created successfully.")
+        STARTUP.done("embedding")
 
     except Exception as e:
         logger.error(f"Error during startup: {e}", exc_info=True)
@@ -90,87 +139,130 @@ async def load_model():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    global pg_pool
-    if pg_pool:
-        await pg_pool.close() # 서버 종료 시 연결 풀 닫기
-        logger.info("PostgreSQL connection pool closed.")
+    if store.opened:
+        await store.close() # 서버 종료 시 연결 풀 닫기
+        logger.info("PostgreSQL connection pools closed.")
 
 @app.get("/health", summary="Check the health of the embedding service")
 async def health_check():
     model_status = model is not None
     db_status = False
+    shard_status = {}
     
-    # asyncpg 연결 풀 상태 확인
-    if pg_pool:
-        try:
-            # async with 구문을 사용하여 안전하게 연결을 획득하고 해제
-            async with pg_pool.acquire() as conn:
-                # 이 부분이 들여쓰기 되어야 합니다 (스페이스 4칸 또는 탭 1번)
-                await conn.fetchval('SELECT 1') # 간단한 쿼리 실행
-            db_status = True
-        except Exception as e:
-            logger.error(f"PostgreSQL Health Check Failed: {e}", exc_info=True)
-            db_status = False
+    # 샤드별 연결 풀 상태 확인 (SELECT 1, 모든 샤드가 응답해야 db_connected)
+    if store.opened:
+        shard_status = await store.ping()
+        db_status = all(shard_status.values())
 
     return {
         "status": "ok",
         "model_loaded": model_status,
         "device": DEVICE,
-        "db_connected": db_status
+        "db_connected": db_status,
+        "db": {**store.stats(), "connected": shard_status},
+        "schema": {"mode": EMBED_SCHEMA_MODE, "partitioned": store.partitioned},
+        "startup": STARTUP.stats(),
+        "process": {"pid": os.getpid(), "worker": WORKER_INDEX, **memory_mb()},
+        "overload": {
+            "mode": EMBED_OVERLOAD_MODE,
+            "queue_limit": EMBED_OVERLOAD_QUEUE,
+            "bge_pending": bge_pending,
+            "fallback_model": fallback_embedder.model_name,
+            "requests": embed_stats["requests"],
+            "texts": embed_stats["texts"],
+            "avg_ms": {
+                name: round(ms / embed_stats["requests"][name], 2) for name, ms in embed_stats["ms"].items()
+            },
+        }
     }
 
+def choose_embedder(requested: str | None) -> str:
+    """요청을 처리할 모델 이름 (BGE_MODEL_NAME 또는 대체 임베더)"""
+    if requested == fallback_embedder.model_name:
+        return requested
+    if requested == BGE_MODEL_NAME or EMBED_OVERLOAD_MODE == "off":
+        if model is None:
+            raise HTTPException(status_code=503, detail="Embedding model not loaded.")
+        return BGE_MODEL_NAME
+    if requested is not None:
+        raise HTTPException(status_code=422, detail=f"Unknown model_name: {requested}")
+    if EMBED_OVERLOAD_MODE == "force" or model is None or bge_pending >= EMBED_OVERLOAD_QUEUE:
+        return fallback_embedder.model_name
+    return BGE_MODEL_NAME
+
+async def encode_bge(texts: list[str]) -> list[list[float]]:
+    """BGE-m3 encode 는 스레드에서 실행해 이벤트 루프를 막지 않고, 대기 수를 과부하 판단에 씁니다."""
+    global bge_pending
+    bge_pending += 1
+    queued = time.perf_counter()
+    try:
+        async with bge_slots:
+            record("encode_queue", (time.perf_counter() - queued) * 1000)
+            with stage("encode"):
+                return await asyncio.to_thread(
+                    lambda: model.encode(
+                        texts,
+                        convert_to_tensor=False,
+                        normalize_embeddings=True,  # RAG 검색 시 cosine similarity 대비 정규화 권장
+                        show_progress_bar=False
+                    ).tolist()
+                )
+    finally:
+        bge_pending -= 1
+
+def record_embed(model_name: str, count: int, started: float):
+    for key, value in (("requests", 1), ("texts", count), ("ms", (time.perf_counter() - started) * 1000)):
+        embed_stats[key][model_name] = embed_stats[key].get(model_name, 0) + value
+
 @app.post("/embed", summary="Generate embeddings for a list of texts")
 async def create_embedding(request: EmbeddingRequest):
-    if model is None:
-        raise HTTPException(status_code=503, detail="Embedding model not loaded.")
-    
+    model_name = choose_embedder(request.model_name)
+    started = time.perf_counter()
+
     try:
-        # texts를 SentenceTransformer에 전달하여 임베딩 생성
-        embeddings = model.encode(
-                request.texts,
-                convert_to_tensor=False,
-                normalize_embeddings=True,  # RAG 검색 시 cosine similarity 대비 정규화 권장
-                show_progress_bar=False
-            ).tolist()
-        
-        return {"embeddings": embeddings}
+        if model_name == BGE_MODEL_NAME:
+            # texts를 SentenceTransformer에 전달하여 임베딩 생성
+            embeddings = await encode_bge(request.texts)
+        else:
+            # 과부하/모델 없음: n-gram hashing 임베더 (CPU, 수천 문장/초)
+            with stage("encode"):
+                embeddings = fallback_embedder.encode(request.texts).tolist()
+        record_embed(model_name, len(request.texts), started)
+
+        return {"embeddings": embeddings, "model_name": model_name}
     except Exception as e:
         logger.error(f"Error during embedding generation: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Embedding generation failed: {e}")
 
 @app.post("/search", summary="Search PostgreSQL embeddings using a vector")
-async def search_embeddings(data: VectorSearch):
-    if not pg_pool:
+async def search_embeddings(data: VectorSearch, response: Response):
+    if not store.opened:
         raise HTTPException(status_code=503, detail="Database pool not initialized.")
 
     try:
-        # 1. 쿼리 벡터를 pgvector가 인식하는 문자열 형태로 변환
-        # 예: [0.1, -0.2, 0.3, ...]
-        query_vector_str = f"[{', '.join(map(str, data.query_vector))}]"
-        
-        # 2. PostgreSQL 유사도 검색 쿼리 실행 (ORDER BY embedding <-> $1)
-        # $1::vector 캐스팅을 사용하여 문자열을 벡터 타입으로 변환
-        query = """
-            SELECT content, ref_id, embedding <-> $1::vector AS distance
-            FROM embeddings
-            ORDER BY distance
-            LIMIT $2;
-        """
-        
-        # 3. asyncpg는 fetchall()을 사용하여 모든 결과를 비동기로 가져옵니다.
-        # 매개변수는 튜플 형태로 전달
-        results = await pg_pool.fetch(query, query_vector_str, data.limit)
+        # 1. 쿼리 벡터는 그대로 넘깁니다. (모든 연결에 pgvector 바이너리 코덱이 등록되어 있음)
+        # 2. 샤드마다 PostgreSQL 유사도 검색 (ORDER BY embedding <-> $1, 파티션 모드면 그 파티션만)
+        # 같은 모델로 만든 행만 검색합니다. (BGE-m3 와 hashing 벡터는 서로 비교할 수 없음)
+        # 3. 샤드가 여럿이면 동시에 보내고 distance 로 top-k 를 합칩니다. (늦은 샤드는 빼고 부분 결과)
+        with stage("query"):
+            result = await store.search(data.query_vector, data.limit, data.model_name, data.source)
+        if result.partial:
+            response.headers["X-Search-Partial"] = ",".join(result.missing)
 
         # 4. 결과 포맷팅: distance는 float로, ref_id는 int로 변환
-        return [
-            {
-                "content": row["content"],
-                "ref_id": row["ref_id"],
-                "distance": float(row["distance"])
-            }
-            for row in results
-        ]
-        
+        with stage("format"):
+            return [
+                {
+                    "content": row["content"],
+                    "ref_id": row["ref_id"],
+                    "distance": float(row["distance"])
+                }
+                for row in result.rows
+            ]
+
+    except ShardUnavailable as e:
+        logger.error(f"RAG search failed on every shard: {e}")
+        raise HTTPException(status_code=503, detail=f"RAG search unavailable: {e}")
     except Exception as e:
         logger.error(f"Error during RAG search: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"RAG search failed: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"RAG search failed: {e}")
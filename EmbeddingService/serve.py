@@ -0,0 +1,158 @@
+# MeQuest/EmbeddingService/serve.py
+# ------------------------------------------------------------
+# 멀티 워커 EmbeddingService (pre-fork: 모델은 한 번만 로드)
+#
+# `uvicorn main:app --workers N` 은 워커마다 main.py 를 새로 import 해서 BGE-m3 (2GB+) 를
+# N 번 올립니다. 이 런처는
+#   1) 부모 프로세스에서 main.load_bge_model() 로 모델을 한 번 로드하고
+#   2) 리슨 소켓을 만든 뒤 워커 N 개를 fork 합니다.
+# 워커는 읽기 전용 가중치 페이지를 copy-on-write 로 공유하므로 워커 하나를 늘릴 때 드는 메모리는
+# 파이썬 힙 + 활성화 메모리 정도입니다. (추론은 가중치에 쓰지 않으므로 페이지가 복사되지 않음)
+# - gc.freeze(): fork 전 객체를 GC 대상에서 빼서 GC 가 객체 헤더를 건드려 페이지가 복사되는 것을 막음
+# - model.share_memory() 는 쓰지 않습니다: 가중치를 /dev/shm 으로 복사하는데 도커 기본 /dev/shm 은 64MB
+# - asyncpg 풀은 각 워커의 startup 훅에서 따로 만듭니다. (fork 전 연결은 공유 불가)
+# - torch 스레드는 워커당 (코어 수 / 워커 수) 로 나눠 과도한 스레드 경쟁을 막습니다.
+# - 워커가 비정상 종료하면 부모가 다시 fork 합니다. (모델 재로드 없이 즉시)
+#   시작 직후 죽으면(DB 접속 실패 등) 전체를 종료합니다.
+# - CUDA 는 fork 후 사용할 수 없으므로 SERVICE_DEVICE=cpu 에서만 여러 워커를 띄웁니다.
+# Run:
+#   EMBED_WORKERS=4 python serve.py            (기본 0.0.0.0:8000)
+#   각 워커의 메모리는 /health 의 "process" (rss/pss/uss MB)
+# Env:
+#   EMBED_WORKERS=2  EMBED_HOST=0.0.0.0  EMBED_PORT=8000
+#   EMBED_TORCH_THREADS=0              워커당 torch 스레드 (0 = 코어 수 / 워커 수)
+#   EMBED_RESPAWN_MIN_UPTIME_S=10      이보다 빨리 죽은 워커는 다시 띄우지 않고 전체 종료
+# ------------------------------------------------------------
+
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Dict, Optional, Union
+
+log = logging.getLogger("embedding.serve")
+
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+EMBED_HOST = os.getenv("EMBED_HOST", "0.0.0.0")
+EMBED_PORT = int(os.getenv("EMBED_PORT", "8000"))
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))
+EMBED_RESPAWN_MIN_UPTIME_S = float(os.getenv("EMBED_RESPAWN_MIN_UPTIME_S", "10"))
+
+
+def memory_mb(pid: Union[int, str] = "self") -> Dict[str, Optional[float]]:
+    """
+    /proc/<pid>/smaps_rollup 기준 메모리 (MB, Linux 전용. 없으면 None)
+    rss: 공유 페이지 포함, pss: 공유 페이지를 나눠 가진 몫, uss: 이 프로세스만 가진 페이지
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            kb = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    kb[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {"rss_mb": None, "pss_mb": None, "uss_mb": None}
+    return {
+        "rss_mb": round(kb.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(kb.get("Pss", 0) / 1024, 1),
+        "uss_mb": round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+class PreforkServer:
+    def __init__(self, workers: int, host: str, port: int, torch_threads: int = 0):
+        import uvicorn
+
+        import main
+
+        self.main = main
+        self.workers = max(1, workers)
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.config = uvicorn.Config(main.app, host=host, port=port, lifespan="on")
+        self.children: Dict[int, tuple] = {}    # pid → (worker index, 시작 시각)
+        self.stopping = False
+
+    def run(self):
+        main = self.main
+        if self.workers > 1 and main.DEVICE != "cpu":
+            raise SystemExit(f"SERVICE_DEVICE={main.DEVICE}: CUDA cannot be used after fork, run with EMBED_WORKERS=1")
+        if not main.MODEL_PATH:
+            raise SystemExit("MODEL_PATH is not set in .env. Cannot start service.")
+
+        main.load_bge_model()
+        before = memory_mb()
+        log.info("model loaded in parent (rss %s MB); forking %d workers", before["rss_mb"], self.workers)
+
+        sock = self.config.bind_socket()
+        gc.collect()
+        gc.freeze()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for index in range(self.workers):
+            self._spawn(index, sock)
+        try:
+            self._supervise(sock)
+        finally:
+            sock.close()
+
+    def _spawn(self, index: int, sock):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (index, time.monotonic())
+            return
+        # ---- 워커 ----
+        import torch
+        import uvicorn
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        torch.set_num_threads(self.torch_threads)
+        self.main.WORKER_INDEX = index
+        server = uvicorn.Server(self.config)
+        code = 0
+        try:
+            server.run(sockets=[sock])
+            if not server.started:
+                code = 3    # startup 훅 실패 (uvicorn 의 STARTUP_FAILURE 와 같은 코드)
+        except BaseException:
+            log.exception("worker %d crashed", index)
+            code = 1
+        os._exit(code)
+
+    def _supervise(self, sock):
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index, started = self.children.pop(pid, (None, 0.0))
+            if index is None or self.stopping:
+                continue
+            uptime = time.monotonic() - started
+            log.warning(
+                "worker %d (pid %d) exited with code %d after %.1fs", index, pid, os.waitstatus_to_exitcode(status), uptime
+            )
+            if uptime < EMBED_RESPAWN_MIN_UPTIME_S:
+                log.error("worker %d died during startup; shutting down", index)
+                self._stop()
+                continue
+            self._spawn(index, sock)
+
+    def _stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    PreforkServer(EMBED_WORKERS, EMBED_HOST, EMBED_PORT, EMBED_TORCH_THREADS).run()
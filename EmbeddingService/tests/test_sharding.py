@@ -0,0 +1,205 @@
+# MeQuest/EmbeddingService/tests/test_sharding.py
+# ------------------------------------------------------------
+# 샤딩 확인 (MemoryShard, PostgreSQL 불필요): HRW 라우팅 / top-k 병합 + 중복 제거 /
+# 느린 샤드의 부분 결과와 X-Search-Partial / 전체 실패 시 ShardUnavailable / rebalance · drain
+# Run:
+#   python -m pytest -q tests/test_sharding.py
+# ------------------------------------------------------------
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from sharding import MemoryShard, ShardedStore, ShardUnavailable, owner_index, rebalance, shard_key
+
+MODEL = "BGE-m3"
+DIM = 8
+
+
+def vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def rows(n: int, seed: int = 0):
+    return [(f"doc {i}", v, i) for i, v in enumerate(vectors(n, seed))]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def filled(names, n=200, source="problem", **kwargs) -> ShardedStore:
+    store = await ShardedStore([MemoryShard(name) for name in names], **kwargs).open()
+    await store.insert(rows(n), MODEL, source)
+    return store
+
+
+def placement(store: ShardedStore):
+    return {r["ref_id"]: shard.name for shard in store.shards for r in shard.rows.values()}
+
+
+def brute_force(query, n=200, limit=5):
+    distances = np.linalg.norm(vectors(n) - query, axis=1)
+    return [int(i) for i in np.argsort(distances)[:limit]]
+
+
+class FailingShard(MemoryShard):
+    async def search(self, *args, **kwargs):
+        raise ConnectionError("shard down")
+
+
+# ---------------------- 라우팅 ------------------------------
+def test_hrw_owner_ignores_shard_order():
+    names = ["s0", "s1", "s2"]
+    for ref_id in range(100):
+        key = shard_key("ref_id", "problem", ref_id)
+        assert names[owner_index(names, key)] == list(reversed(names))[owner_index(list(reversed(names)), key)]
+
+
+def test_adding_a_shard_only_moves_keys_to_it():
+    old, new = ["s0", "s1", "s2"], ["s0", "s1", "s2", "s3"]
+    keys = [shard_key("ref_id", "problem", i) for i in range(2000)]
+    before = [old[owner_index(old, k)] for k in keys]
+    after = [new[owner_index(new, k)] for k in keys]
+    changed = [(b, a) for b, a in zip(before, after) if b != a]
+    assert all(a == "s3" for _, a in changed)          # 기존 샤드끼리는 옮기지 않음
+    assert 0.15 < len(changed) / len(keys) < 0.35      # 약 1/N
+
+
+def test_inserted_rows_land_on_their_owner():
+    async def scenario():
+        store = await filled(["s0", "s1", "s2"])
+        assert sum(len(s.rows) for s in store.shards) == 200
+        assert all(len(s.rows) > 0 for s in store.shards)
+        for ref_id, name in placement(store).items():
+            assert store.owner("problem", ref_id).name == name
+
+    run(scenario())
+
+
+# ---------------------- 검색 -------------------------------
+def test_fanout_merges_top_k_and_drops_duplicates():
+    async def scenario():
+        store = await filled(["s0", "s1", "s2"])
+        query = vectors(1, seed=7)[0]
+        # rebalance 도중처럼 가장 가까운 행이 두 샤드에 같이 있는 상황
+        nearest = brute_force(query)[0]
+        owner = store.owner("problem", nearest)
+        other = next(s for s in store.shards if s is not owner)
+        await other.insert(MODEL, "problem", [(f"doc {nearest}", vectors(200)[nearest], nearest)])
+
+        result = await store.search(query, 5, MODEL)
+        assert not result.partial
+        assert result.queried == ["s0", "s1", "s2"]
+        assert [r["ref_id"] for r in result.rows] == brute_force(query)
+        distances = [r["distance"] for r in result.rows]
+        assert distances == sorted(distances)
+
+    run(scenario())
+
+
+def test_slow_shard_gives_partial_result():
+    async def scenario():
+        store = await filled(["s0", "s1", "s2"], timeout_ms=50)
+        store.shards[1].delay_ms = 500
+        result = await store.search(vectors(1, seed=3)[0], 5, MODEL)
+        assert result.partial and result.missing == ["s1"]
+        assert len(result.rows) == 5
+        assert all(placement(store)[r["ref_id"]] != "s1" for r in result.rows)
+        assert store.partial_searches == 1
+        assert store.shards[1].search_stats.timeouts == 1
+
+    run(scenario())
+
+
+def test_all_shards_failing_raises_shard_unavailable():
+    async def scenario():
+        store = await ShardedStore([FailingShard("s0"), FailingShard("s1")]).open()
+        with pytest.raises(ShardUnavailable):
+            await store.search(vectors(1)[0], 5, MODEL)
+
+    run(scenario())
+
+
+def test_search_endpoint_sets_partial_header(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    store = run(filled(["s0", "s1"], timeout_ms=50))
+    store.shards[0].delay_ms = 500
+    monkeypatch.setattr(main, "store", store)
+
+    client = TestClient(main.app)
+    response = client.post("/search", json={"query_vector": vectors(1, seed=3)[0].tolist(), "limit": 3})
+    assert response.status_code == 200
+    assert response.headers["X-Search-Partial"] == "s0"
+    assert len(response.json()) == 3
+
+    store.shards[0].delay_ms = 0
+    response = client.post("/search", json={"query_vector": vectors(1, seed=3)[0].tolist(), "limit": 3})
+    assert "X-Search-Partial" not in response.headers
+
+    monkeypatch.setattr(main, "store", run(ShardedStore([FailingShard("s0"), FailingShard("s1")]).open()))
+    response = client.post("/search", json={"query_vector": vectors(1)[0].tolist(), "limit": 3})
+    assert response.status_code == 503
+
+
+# ---------------------- rebalance ---------------------------
+def test_rebalance_after_adding_a_shard():
+    async def scenario():
+        store = await filled(["s0", "s1"])
+        grown = ShardedStore([*store.shards, MemoryShard("s2")])
+        query = vectors(1, seed=5)[0]
+
+        dry = await rebalance(grown, dry_run=True)
+        assert dry["moved"] > 0 and dry["scanned"] == 200
+        assert sum(len(s.rows) for s in grown.shards[:2]) == 200   # dry-run 은 옮기지 않음
+
+        before = {shard.name: len(shard.rows) for shard in grown.shards}
+        result = await rebalance(grown, batch=16)
+        assert result["moved"] == dry["moved"] == len(grown.shards[2].rows)
+        assert set(result["by_shard"]["s0"]) == set(result["by_shard"]["s1"]) == {"s2"}
+        assert result["scanned"] == 200
+        assert result["scanned_by_shard"] == before
+        assert sum(len(s.rows) for s in grown.shards) == 200
+        for ref_id, name in placement(grown).items():
+            assert grown.owner("problem", ref_id).name == name
+        assert [r["ref_id"] for r in (await grown.search(query, 5, MODEL)).rows] == brute_force(query)
+
+        again = await rebalance(grown)
+        assert again["moved"] == 0 and again["scanned"] == 200
+
+    run(scenario())
+
+
+def test_rebalance_scanned_counts_moved_rows_once():
+    async def scenario():
+        # 모든 행이 s0 에 있고 s1 을 추가: s0 에서 s1 로 옮긴 행을 s1 을 훑을 때 다시 세지 않아야 합니다.
+        store = await filled(["s0"])
+        grown = ShardedStore([store.shards[0], MemoryShard("s1")])
+        result = await rebalance(grown)
+        assert result["scanned"] == 200
+        assert result["scanned_by_shard"] == {"s0": 200, "s1": 0}
+        assert result["moved"] == len(grown.shards[1].rows) > 0
+
+    run(scenario())
+
+
+def test_drain_moves_every_row_off_the_removed_shard():
+    async def scenario():
+        store = await filled(["s0", "s1", "s2"])
+        removed = store.shards[2]
+        remaining = ShardedStore(store.shards[:2])
+        draining = len(removed.rows)
+        result = await rebalance(remaining, drain=[removed])
+        assert len(removed.rows) == 0
+        assert set(result["by_shard"]) == {"s2"} and set(result["by_shard"]["s2"]) <= {"s0", "s1"}
+        assert result["moved"] == draining
+        assert sum(len(s.rows) for s in remaining.shards) == 200
+        assert result["scanned"] == 200
+        for ref_id, name in placement(remaining).items():
+            assert remaining.owner("problem", ref_id).name == name
+
+    run(scenario())
@@ -0,0 +1,242 @@
+# /mnt/d/MeQuest/LLMService/admission.py
+# ------------------------------------------------------------
+# 라우트별 admission control (동시 실행 수 제한 + 우선순위 대기열 + 조기 거절)
+#
+# 수업 단위로 요청이 몰리면 서비스가 동시 요청을 무제한으로 받아 OOM 이 나거나
+# 60초 타임아웃까지 붙잡고 있다가 실패합니다. 라우트마다 AdmissionController 를 두고
+# - 실행 중인 요청은 max_concurrency 개까지, 나머지는 우선순위(interactive > normal > batch) 대기열
+# - 대기열은 max_queue 로 제한. 가득 찼을 때 더 높은 우선순위 요청이 오면 가장 낮은 대기 요청을 밀어냄
+# - 예상 대기 시간(앞선 요청 수 × 평균 처리 시간 / 동시 실행 수)이 요청 deadline 을 넘으면
+#   대기열에 넣지 않고 즉시 429 + Retry-After 로 거절
+# - 대기 중 deadline 이 지나도 429 로 돌려보냄
+# - 대기열 길이 / 대기 시간 / 거절 수를 stats() 와 Prometheus 텍스트(/metrics)로 내보냄
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from mequest_common.server_timing import stage
+
+ADMISSION_ENABLED = os.getenv("ADMISSION", "1") == "1"
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_DEFAULT_DEADLINE_S = float(os.getenv("ADMISSION_DEFAULT_DEADLINE_S", "60"))
+# 처리 시간 EWMA 의 초기값 (첫 완료 전 예상 대기 시간 계산용)
+ADMISSION_INITIAL_SERVICE_S = float(os.getenv("ADMISSION_INITIAL_SERVICE_S", "5"))
+_EWMA_ALPHA = 0.2
+
+PRIORITIES = {"interactive": 0, "normal": 1, "batch": 2}
+
+
+def admission_concurrency(default: int) -> int:
+    """ADMISSION_MAX_CONCURRENCY 가 있으면 그 값, 없으면 서비스가 정한 기본값"""
+    return int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0")) or default
+
+
+def _reject(reason: str, retry_after_s: float, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"{detail} ({reason})",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after_s)))},
+    )
+
+
+class _Waiter:
+    __slots__ = ("priority", "future", "enqueued")
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.perf_counter()
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        default_priority: str = "normal",
+        default_deadline_s: float = ADMISSION_DEFAULT_DEADLINE_S,
+        enabled: bool = ADMISSION_ENABLED,
+    ):
+        if default_priority not in PRIORITIES:
+            raise ValueError(f"unknown priority: {default_priority}")
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.default_priority = default_priority
+        self.default_deadline_s = default_deadline_s
+        self.enabled = enabled
+
+        self.running = 0
+        self._heap: List[Tuple[int, int, _Waiter]] = []   # (priority, seq, waiter)
+        self._queued: Dict[int, int] = {p: 0 for p in PRIORITIES.values()}
+        self._seq = itertools.count()
+        self.service_s = ADMISSION_INITIAL_SERVICE_S       # 요청 1건 처리 시간 EWMA
+
+        self.admitted: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self.rejected: Dict[str, int] = {}
+        self.wait_s_total = 0.0
+        self.max_queue_seen = 0
+
+    # ---------- public API ----------
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None, deadline_ms: Optional[int] = None) -> AsyncIterator[None]:
+        """
+        실행 슬롯을 얻을 때까지 기다렸다가 본문을 실행합니다. 예상 대기 시간이 deadline 을 넘거나
+        대기열이 가득 차면 HTTPException(429, Retry-After) 을 던집니다.
+        """
+        if not self.enabled:
+            yield
+            return
+        name = priority or self.default_priority
+        if name not in PRIORITIES:
+            raise HTTPException(status_code=422, detail=f"priority must be one of {list(PRIORITIES)}")
+        deadline_s = deadline_ms / 1000 if deadline_ms else self.default_deadline_s
+
+        with stage("admission"):
+            await self._acquire(name, deadline_s)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.service_s += _EWMA_ALPHA * ((time.perf_counter() - start) - self.service_s)
+            self._release()
+
+    def estimated_wait_s(self, priority: int) -> float:
+        """이 우선순위로 지금 들어오면 기다릴 것으로 예상되는 시간"""
+        ahead = sum(n for p, n in self._queued.items() if p <= priority)
+        busy = self.running + ahead - self.max_concurrency + 1
+        if busy <= 0:
+            return 0.0
+        return math.ceil(busy / self.max_concurrency) * self.service_s
+
+    def stats(self) -> Dict[str, Any]:
+        admitted = sum(self.admitted.values())
+        return {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queued": {name: self._queued[p] for name, p in PRIORITIES.items()},
+            "max_queue_seen": self.max_queue_seen,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_s_total * 1000 / admitted, 2) if admitted else None,
+            "service_ms_ewma": round(self.service_s * 1000, 2),
+            "estimated_wait_ms": {
+                name: round(self.estimated_wait_s(p) * 1000, 2) for name, p in PRIORITIES.items()
+            },
+        }
+
+    # ---------- internals ----------
+    async def _acquire(self, name: str, deadline_s: float):
+        priority = PRIORITIES[name]
+        if self.running < self.max_concurrency and not self._heap:
+            self.running += 1
+            self._admit(name, 0.0)
+            return
+
+        wait_s = self.estimated_wait_s(priority)
+        if wait_s > deadline_s:
+            raise self._rejected("deadline", wait_s, "estimated wait exceeds deadline")
+        if len(self._heap) >= self.max_queue and not self._shed_lower_than(priority):
+            raise self._rejected("queue_full", wait_s, "admission queue is full")
+
+        waiter = _Waiter(priority)
+        heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+        self._queued[priority] += 1
+        self.max_queue_seen = max(self.max_queue_seen, len(self._heap))
+        try:
+            # 밀려난(shed) 요청은 future 에 설정된 429 가 여기서 그대로 올라갑니다.
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=deadline_s)
+        except asyncio.TimeoutError:
+            if not self._holds_slot(waiter):
+                self._remove(waiter)
+                raise self._rejected("timeout", self.estimated_wait_s(priority), "deadline expired while queued")
+            # 시간 초과와 동시에 슬롯을 받은 경우: 그대로 진행
+        except asyncio.CancelledError:
+            # 클라이언트가 끊겼을 때: 대기열에서 빼거나, 이미 받은 슬롯은 돌려줌
+            if self._holds_slot(waiter):
+                self._release()
+            else:
+                self._remove(waiter)
+            raise
+        # 대기열에서 깨어난 요청은 _release 가 running 을 그대로 넘겨준 상태입니다.
+        self._admit(name, time.perf_counter() - waiter.enqueued)
+
+    def _admit(self, name: str, waited_s: float):
+        self.admitted[name] += 1
+        self.wait_s_total += waited_s
+
+    def _release(self):
+        if self._heap:
+            priority, _, waiter = heapq.heappop(self._heap)
+            self._queued[priority] -= 1
+            # 슬롯을 그대로 넘겨주므로 running 은 줄이지 않습니다.
+            waiter.future.set_result(None)
+            return
+        self.running -= 1
+
+    @staticmethod
+    def _holds_slot(waiter: _Waiter) -> bool:
+        f = waiter.future
+        return f.done() and not f.cancelled() and f.exception() is None
+
+    def _remove(self, waiter: _Waiter):
+        """대기열에서 제거 (슬롯을 받지 못한 요청만)"""
+        for i, (_, _, w) in enumerate(self._heap):
+            if w is waiter:
+                self._heap[i] = self._heap[-1]
+                self._heap.pop()
+                heapq.heapify(self._heap)
+                self._queued[waiter.priority] -= 1
+                return
+
+    def _shed_lower_than(self, priority: int) -> bool:
+        """대기열에서 가장 낮은 우선순위(같으면 가장 나중) 요청이 들어올 요청보다 낮으면 밀어냅니다."""
+        victim = max(self._heap, key=lambda item: (item[0], item[1]), default=None)
+        if victim is None or victim[0] <= priority:
+            return False
+        waiter = victim[2]
+        self._remove(waiter)
+        waiter.future.set_exception(self._rejected("shed", self.service_s, "shed by higher priority request"))
+        return True
+
+    def _rejected(self, reason: str, retry_after_s: float, detail: str) -> HTTPException:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return _reject(reason, retry_after_s, f"{self.name}: {detail}")
+
+
+def metrics_text(*controllers: AdmissionController) -> str:
+    """Prometheus text exposition 형식의 대기열 지표"""
+    lines = [
+        "# TYPE admission_running gauge",
+        "# TYPE admission_queued gauge",
+        "# TYPE admission_admitted_total counter",
+        "# TYPE admission_rejected_total counter",
+        "# TYPE admission_service_seconds gauge",
+        "# TYPE admission_estimated_wait_seconds gauge",
+    ]
+    for c in controllers:
+        route = f'route="{c.name}"'
+        lines.append(f"admission_running{{{route}}} {c.running}")
+        lines.append(f"admission_service_seconds{{{route}}} {c.service_s:.4f}")
+        for name, p in PRIORITIES.items():
+            label = f'{route},priority="{name}"'
+            lines.append(f"admission_queued{{{label}}} {c._queued[p]}")
+            lines.append(f"admission_admitted_total{{{label}}} {c.admitted[name]}")
+            lines.append(f"admission_estimated_wait_seconds{{{label}}} {c.estimated_wait_s(p):.4f}")
+        for reason, count in c.rejected.items():
+            lines.append(f'admission_rejected_total{{{route},reason="{reason}"}} {count}')
+    return "\n".join(lines) + "\n"
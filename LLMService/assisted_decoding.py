@@ -0,0 +1,151 @@
+# /mnt/d/MeQuest/LLMService/assisted_decoding.py
+# ------------------------------------------------------------
+# 작은 draft 모델을 이용한 assisted (speculative) decoding
+#
+# 7~10B 모델의 디코딩은 토큰마다 한 번씩 순차 forward 가 필요합니다. 같은 토크나이저를
+# 쓰는 작은 draft 모델이 여러 토큰을 먼저 제안하고, 메인 모델이 한 번의 forward 로
+# 검증하면 (transformers assisted generation) 수용된 토큰만큼 메인 forward 가 줄어듭니다.
+# - 서비스별로 *_DRAFT_MODEL_PATH 가 설정되어 있으면 메인 모델과 함께 로드합니다.
+# - 요청의 assisted=true 일 때만 사용합니다. (배치 1 전용이라 BatchScheduler 는 거치지 않음)
+# - 메인/draft forward 호출 수로 수용률과 메인 forward 당 생성 토큰 수를 기록합니다.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from hf_loader import load_model
+
+if TYPE_CHECKING:   # 타입 표기 전용 (torch 는 load_model 이 import)
+    import torch
+
+# draft 가 한 번에 제안할 토큰 수 (미설정 시 transformers 기본 휴리스틱)
+NUM_ASSISTANT_TOKENS = int(os.getenv("DRAFT_NUM_TOKENS", "0")) or None
+# draft 확률이 이 값보다 낮으면 제안을 멈춤 (미설정 시 transformers 기본값, 0 이면 항상 끝까지 제안)
+CONFIDENCE_THRESHOLD = float(os.getenv("DRAFT_CONFIDENCE_THRESHOLD")) if os.getenv("DRAFT_CONFIDENCE_THRESHOLD") else None
+# draft 는 작으므로 기본적으로 4bit 양자화 없이 fp16 으로 올립니다.
+DRAFT_QUANTIZE = os.getenv("DRAFT_QUANTIZE", "0") == "1"
+
+
+class _ForwardCounter:
+    """지정한 스레드에서 호출된 model.forward 횟수만 셉니다. (스케줄러 스레드의 forward 제외)"""
+
+    def __init__(self, model):
+        self.calls = 0
+        self.thread: Optional[int] = None
+        model.register_forward_hook(self._hook)
+
+    def _hook(self, module, args, output):
+        if threading.get_ident() == self.thread:
+            self.calls += 1
+
+
+class DraftModel:
+    """메인 모델 옆에 올려 둔 draft 모델과 assisted generate 래퍼"""
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        draft_model,
+        draft_tokenizer,
+        num_assistant_tokens: Optional[int] = None,
+        confidence_threshold: Optional[float] = None,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.draft_model = draft_model
+        self.draft_tokenizer = draft_tokenizer
+        # vocab 이 다르면 transformers 의 universal assisted decoding (텍스트 재토큰화) 경로를 사용
+        self.same_tokenizer = draft_tokenizer.get_vocab() == tokenizer.get_vocab()
+        if num_assistant_tokens:
+            draft_model.generation_config.num_assistant_tokens = num_assistant_tokens
+        if confidence_threshold is not None:
+            draft_model.generation_config.assistant_confidence_threshold = confidence_threshold
+
+        self._target = _ForwardCounter(model)
+        self._draft = _ForwardCounter(draft_model)
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.fallbacks = 0
+        self.new_tokens = 0
+        self.draft_tokens = 0
+        self.accepted_tokens = 0
+        self.target_forwards = 0
+        self.seconds = 0.0
+
+    def generate(self, inputs: Dict[str, torch.Tensor], **kwargs) -> Tuple[torch.Tensor, Dict[str, Any]]:
+        """
+        model.generate(**inputs, assistant_model=draft, **kwargs). prefix KV 캐시
+        (past_key_values) 는 draft 와 공유되지 않으므로 전달하지 않습니다.
+        반환: (outputs, 요청별 통계)
+        """
+        kwargs.pop("past_key_values", None)
+        assisted = self.same_tokenizer or not kwargs.get("logits_processor")
+        if assisted:
+            kwargs["assistant_model"] = self.draft_model
+            if not self.same_tokenizer:
+                kwargs.update(tokenizer=self.tokenizer, assistant_tokenizer=self.draft_tokenizer)
+
+        with self._lock:
+            self._target.thread = self._draft.thread = threading.get_ident()
+            target_before, draft_before = self._target.calls, self._draft.calls
+            start = time.perf_counter()
+            try:
+                outputs = self.model.generate(**inputs, **kwargs)
+            finally:
+                self._target.thread = self._draft.thread = None
+            seconds = time.perf_counter() - start
+            target_forwards = self._target.calls - target_before
+            draft_tokens = self._draft.calls - draft_before
+
+        new_tokens = int(outputs.shape[1] - inputs["input_ids"].shape[1])
+        # 메인 forward 한 번은 수용된 draft 토큰 + 자신의 토큰 1개를 만듭니다.
+        accepted = max(min(new_tokens - target_forwards, draft_tokens), 0)
+        self.requests += 1
+        self.fallbacks += not assisted
+        self.new_tokens += new_tokens
+        self.draft_tokens += draft_tokens
+        self.accepted_tokens += accepted
+        self.target_forwards += target_forwards
+        self.seconds += seconds
+        return outputs, {
+            "assisted": assisted,
+            "new_tokens": new_tokens,
+            "draft_tokens": draft_tokens,
+            "accepted_tokens": accepted,
+            "acceptance_rate": round(accepted / draft_tokens, 4) if draft_tokens else None,
+            "target_forwards": target_forwards,
+            "latency_ms": round(seconds * 1000, 2),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "draft_model": getattr(self.draft_model, "name_or_path", None),
+            "same_tokenizer": self.same_tokenizer,
+            "requests": self.requests,
+            "fallbacks": self.fallbacks,
+            "acceptance_rate": round(self.accepted_tokens / self.draft_tokens, 4) if self.draft_tokens else None,
+            "tokens_per_target_forward": (
+                round(self.new_tokens / self.target_forwards, 3) if self.target_forwards else None
+            ),
+            "ms_per_token": round(self.seconds * 1000 / self.new_tokens, 2) if self.new_tokens else None,
+        }
+
+
+def load_draft(
+    model, tokenizer, draft_model_id: str, trust_remote_code: bool = False, timer=None
+) -> Optional[DraftModel]:
+    """draft 모델 경로가 설정되어 있으면 로드하여 DraftModel 로 반환합니다. (없으면 None)"""
+    if not draft_model_id:
+        return None
+    draft_tokenizer, draft_model = load_model(
+        draft_model_id, trust_remote_code=trust_remote_code, quantize=DRAFT_QUANTIZE, timer=timer, label="draft"
+    )
+    draft = DraftModel(model, tokenizer, draft_model, draft_tokenizer, NUM_ASSISTANT_TOKENS, CONFIDENCE_THRESHOLD)
+    print(f"✅ Draft model ready for assisted decoding: {draft_model_id} (same tokenizer: {draft.same_tokenizer})")
+    return draft
@@ -0,0 +1,398 @@
+# /mnt/d/MeQuest/LLMService/batch_scheduler.py
+# ------------------------------------------------------------
+# transformers 기반 서비스(GECKO / SOLAR / EXAONE) 공용 continuous batching 스케줄러
+#
+# - async 핸들러는 submit() 으로 요청을 큐에 넣고 결과를 await 합니다.
+# - 전용 워커 스레드가 step 단위로 디코딩하며, 끝난 시퀀스는 즉시 배치에서 빠지고
+#   대기 중인 요청은 다음 step 에 합류합니다.
+# - 새 요청은 (가능하면 prefix KV 캐시를 이어받아) 개별 prefill 한 뒤,
+#   KV 캐시/attention mask 를 왼쪽 패딩하여 실행 중인 배치에 붙입니다.
+# - GenerationParams.json_schema 가 있으면 시퀀스별로 스키마 제약 마스크를 적용합니다.
+# - submit(cancel=CancelToken) 으로 받은 요청이 취소되면(연결 종료 / deadline) 다음 step 에서
+#   배치에서 빼고 GenerationCancelled 로 끝냅니다. 빈 자리는 바로 대기 요청이 채웁니다.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from cancellation import CancelToken, GenerationCancelled
+from json_constraint import JsonConstraint, get_grammar
+from mequest_common.server_timing import record
+
+# torch / transformers 는 실제로 쓰는 함수 안에서 import 합니다. (모듈 import 를 가볍게, hf_loader 와 같은 방식)
+if TYPE_CHECKING:
+    import torch
+    from transformers import DynamicCache
+
+KVTuple = Tuple[Tuple["torch.Tensor", "torch.Tensor"], ...]
+
+
+# ---------------------- KV cache helpers ---------------------
+def cache_to_tuples(cache: Any) -> KVTuple:
+    """transformers 버전과 무관하게 ((k, v), ...) 형태로 변환합니다. k/v: [B, H, L, D]"""
+    if isinstance(cache, tuple):
+        return cache
+    if hasattr(cache, "layers"):  # transformers >= 4.56
+        return tuple((layer.keys, layer.values) for layer in cache.layers)
+    return tuple(zip(cache.key_cache, cache.value_cache))
+
+
+def tuples_to_cache(data: KVTuple) -> DynamicCache:
+    from transformers import DynamicCache
+
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(data)
+    return DynamicCache(data)
+
+
+def _left_pad(t: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    import torch
+
+    pad = length - t.shape[dim]
+    if pad <= 0:
+        return t
+    shape = list(t.shape)
+    shape[dim] = pad
+    return torch.cat([t.new_zeros(shape), t], dim=dim)
+
+
+# ---------------------- Sequence state -----------------------
+@dataclass
+class GenerationParams:
+    max_new_tokens: int = 256
+    temperature: float = 0.7
+    top_p: float = 1.0
+    repetition_penalty: float = 1.0
+    do_sample: bool = True
+    json_schema: Optional[Dict[str, Any]] = None      # 지정 시 스키마 제약 디코딩 (json_constraint)
+
+
+@dataclass
+class _Sequence:
+    prompt: str
+    params: GenerationParams
+    future: Future
+    prompt_ids: Optional[torch.Tensor] = None          # [L]
+    generated: List[int] = field(default_factory=list)
+    constraint: Optional[JsonConstraint] = None
+    cancel: Optional[CancelToken] = None
+    stopped: bool = False                              # EOS 생성 등으로 조기 종료
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    admitted_at: Optional[float] = None
+    first_token_at: Optional[float] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.future.cancelled() or (self.cancel is not None and self.cancel.cancelled)
+
+    @property
+    def finished(self) -> bool:
+        return self.stopped or len(self.generated) >= self.params.max_new_tokens or self.cancelled
+
+
+@dataclass
+class GenerationResult:
+    text: str
+    token_ids: List[int]
+    prompt_tokens: int
+    queue_ms: float
+    ttft_ms: float
+    total_ms: float
+
+
+def _resolve(future: Future, result: Any = None, error: Optional[BaseException] = None):
+    """
+    결과 / 예외 전달. asyncio 쪽에서 wrap_future 가 취소되면 같은 Future 가 워커 스레드와 경쟁적으로
+    cancelled 가 되므로 done() 확인 직후에도 InvalidStateError 가 날 수 있습니다. (이미 끝난 요청은 무시)
+    """
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+# ---------------------- Scheduler ----------------------------
+class BatchScheduler:
+    """요청 큐 + step 단위 continuous batching 디코딩 루프."""
+
+    def __init__(self, model, tokenizer, prefix_cache=None, max_batch_size: int = 8, name: str = "llm"):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.max_batch_size = max(1, max_batch_size)
+        self.name = name
+
+        self.eos_token_id = tokenizer.eos_token_id
+        self._queue: "queue.Queue[_Sequence]" = queue.Queue()
+        self._active: List[_Sequence] = []
+        self._past: Optional[KVTuple] = None
+        self._attention_mask: Optional[torch.Tensor] = None   # [B, L]
+
+        self.steps = 0
+        self.completed = 0
+        self.generated_tokens = 0
+        self.cancelled = 0
+        self.cancelled_tokens_saved = 0      # 취소로 생성하지 않은 토큰 (max_new_tokens 기준 상한)
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name=f"{name}-batch-scheduler", daemon=True)
+        self._thread.start()
+
+    # ---------- public API ----------
+    async def submit(
+        self, prompt: str, params: GenerationParams, cancel: Optional[CancelToken] = None
+    ) -> GenerationResult:
+        seq = _Sequence(prompt=prompt, params=params, future=Future(), cancel=cancel)
+        self._queue.put(seq)
+        try:
+            result = await asyncio.wrap_future(seq.future)
+        finally:
+            if cancel is not None:
+                cancel.generated = len(seq.generated)
+        # 요청의 Server-Timing 에 스케줄러 대기 / prefill / decode 시간을 남깁니다.
+        record("queue", result.queue_ms)
+        record("prefill", result.ttft_ms - result.queue_ms)
+        record("decode", result.total_ms - result.ttft_ms)
+        return result
+
+    def close(self):
+        """워커 스레드를 종료합니다. (모델 언로드 전 호출, 실행 중인 요청이 없을 때)"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "active": len(self._active),
+            "queued": self._queue.qsize(),
+            "steps": self.steps,
+            "completed": self.completed,
+            "generated_tokens": self.generated_tokens,
+            "cancelled": self.cancelled,
+            "cancelled_tokens_saved": self.cancelled_tokens_saved,
+        }
+
+    # ---------- worker loop ----------
+    def _run(self):
+        import torch
+
+        # grad 모드는 스레드별이므로 워커 스레드 전체(prefill / 합류 / 디코딩)를 no_grad 로 돌립니다.
+        with torch.no_grad():
+            while not self._closed:
+                # step 한 번(합류 / 디코딩 / 종료 처리) 어디서든 예외(CUDA OOM 등)가 나면 배치 전체를 실패시키고
+                # 상태를 비운 뒤 계속 돕니다. (스레드가 죽으면 이후 submit() 이 영원히 기다림)
+                try:
+                    # 실행 중인 시퀀스가 없으면 새 요청이 올 때까지 블록합니다.
+                    if not self._active:
+                        self._admit(block=True)
+                    else:
+                        self._admit(block=False)
+                    if not self._active:
+                        continue
+                    self._decode_step()
+                except Exception as e:  # 배치 전체 실패 → 모든 대기자에게 예외 전달
+                    print(f"❌ [{self.name}] batch step failed: {e}")
+                    for seq in self._active:
+                        _resolve(seq.future, error=e)
+                    self._reset()
+
+    def _reset(self):
+        self._active = []
+        self._past = None
+        self._attention_mask = None
+
+    def _admit(self, block: bool):
+        while len(self._active) < self.max_batch_size:
+            try:
+                seq = self._queue.get(block=block and not self._active)
+            except queue.Empty:
+                return
+            if seq is None:  # close() 신호
+                return
+            if seq.cancelled:
+                self._finish_cancelled(seq)
+                continue
+            seq.admitted_at = time.perf_counter()
+            try:
+                if seq.params.json_schema is not None:
+                    seq.constraint = JsonConstraint(
+                        get_grammar(self.tokenizer, seq.params.json_schema), seq.params.max_new_tokens
+                    )
+                past, first_logits = self._prefill(seq)
+            except Exception as e:
+                print(f"❌ [{self.name}] prefill failed: {e}")
+                _resolve(seq.future, error=e)
+                continue
+            try:
+                self._join(seq, past)
+            except Exception as e:  # 아직 _active 에 없으므로 여기서 실패 처리, 배치는 _run 에서 정리
+                _resolve(seq.future, error=e)
+                raise
+            self._append_tokens([seq], first_logits)
+            self._retire_finished()
+
+    def _prefill(self, seq: _Sequence) -> Tuple[KVTuple, torch.Tensor]:
+        """단일 요청 prefill. prefix 캐시가 맞으면 suffix 토큰만 계산합니다."""
+        if self.prefix_cache is not None:
+            inputs, past = self.prefix_cache.prepare(seq.prompt)
+        else:
+            inputs = self.tokenizer(seq.prompt, return_tensors="pt")
+            inputs.pop("token_type_ids", None)
+            inputs = inputs.to(self.model.device)
+            past = None
+
+        input_ids = inputs["input_ids"]
+        seq.prompt_ids = input_ids[0]
+        if past is not None:
+            outputs = self.model(
+                input_ids=input_ids[:, cache_to_tuples(past)[0][0].shape[2]:],   # 일치한 prefix 길이만큼 건너뜀
+                attention_mask=inputs["attention_mask"],
+                past_key_values=past,
+                use_cache=True,
+            )
+        else:
+            outputs = self.model(**inputs, use_cache=True)
+        return cache_to_tuples(outputs.past_key_values), outputs.logits[:, -1, :]
+
+    def _join(self, seq: _Sequence, past: KVTuple):
+        """새 시퀀스의 KV 캐시를 왼쪽 패딩하여 실행 중인 배치에 합칩니다."""
+        import torch
+
+        new_len = past[0][0].shape[2]
+        new_mask = torch.ones((1, new_len), dtype=torch.long, device=past[0][0].device)
+
+        if self._past is None:
+            self._past, self._attention_mask = past, new_mask
+        else:
+            length = max(new_len, self._attention_mask.shape[1])
+            self._past = tuple(
+                (
+                    torch.cat([_left_pad(k, length, 2), _left_pad(nk, length, 2)], dim=0),
+                    torch.cat([_left_pad(v, length, 2), _left_pad(nv, length, 2)], dim=0),
+                )
+                for (k, v), (nk, nv) in zip(self._past, past)
+            )
+            self._attention_mask = torch.cat(
+                [_left_pad(self._attention_mask, length, 1), _left_pad(new_mask, length, 1)], dim=0
+            )
+        self._active.append(seq)
+
+    def _decode_step(self):
+        import torch
+
+        last_tokens = torch.tensor(
+            [[seq.generated[-1]] for seq in self._active], dtype=torch.long, device=self._attention_mask.device
+        )
+        self._attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((len(self._active), 1))], dim=1
+        )
+        # 왼쪽 패딩이 있으므로 position_ids 는 실제 토큰 수 기준으로 계산합니다.
+        position_ids = self._attention_mask.sum(dim=1, keepdim=True) - 1
+
+        outputs = self.model(
+            input_ids=last_tokens,
+            attention_mask=self._attention_mask,
+            position_ids=position_ids,
+            past_key_values=tuples_to_cache(self._past),
+            use_cache=True,
+        )
+        self._past = cache_to_tuples(outputs.past_key_values)
+        self.steps += 1
+
+        self._append_tokens(self._active, outputs.logits[:, -1, :])
+        self._retire_finished()
+
+    def _append_tokens(self, seqs: List[_Sequence], logits: torch.Tensor):
+        now = time.perf_counter()
+        for row, seq in enumerate(seqs):
+            token = self._sample(logits[row], seq)
+            seq.generated.append(token)
+            if seq.constraint is not None:
+                seq.constraint.update(token)
+            if seq.first_token_at is None:
+                seq.first_token_at = now
+            if token == self.eos_token_id:
+                seq.stopped = True
+
+    def _sample(self, logits: torch.Tensor, seq: _Sequence) -> int:
+        import torch
+
+        p = seq.params
+        logits = logits.float()
+        if p.repetition_penalty and p.repetition_penalty != 1.0:
+            seen = torch.cat([seq.prompt_ids, torch.tensor(seq.generated, dtype=torch.long, device=logits.device)])
+            scores = logits.gather(0, seen)
+            scores = torch.where(scores < 0, scores * p.repetition_penalty, scores / p.repetition_penalty)
+            logits = logits.scatter(0, seen, scores)
+        if seq.constraint is not None:
+            logits = seq.constraint.mask_logits(logits)
+
+        if not p.do_sample or p.temperature <= 0:
+            return int(torch.argmax(logits))
+
+        probs = torch.softmax(logits / p.temperature, dim=-1)
+        if p.top_p < 1.0:
+            sorted_probs, sorted_idx = torch.sort(probs, descending=True)
+            cumulative = torch.cumsum(sorted_probs, dim=-1)
+            sorted_probs[cumulative - sorted_probs > p.top_p] = 0.0
+            probs = torch.zeros_like(probs).scatter(0, sorted_idx, sorted_probs)
+        return int(torch.multinomial(probs / probs.sum(), 1))
+
+    def _retire_finished(self):
+        import torch
+
+        keep = [i for i, seq in enumerate(self._active) if not seq.finished]
+        if len(keep) == len(self._active):
+            return
+
+        now = time.perf_counter()
+        for seq in (s for s in self._active if s.finished):
+            if seq.cancelled and not seq.stopped and len(seq.generated) < seq.params.max_new_tokens:
+                self._finish_cancelled(seq)
+                continue
+            ids = [t for t in seq.generated if t != self.eos_token_id]
+            self.completed += 1
+            self.generated_tokens += len(seq.generated)
+            if not seq.future.done():
+                _resolve(seq.future, GenerationResult(
+                    text=self.tokenizer.decode(ids, skip_special_tokens=True),
+                    token_ids=seq.generated,
+                    prompt_tokens=int(seq.prompt_ids.shape[0]),
+                    queue_ms=(seq.admitted_at - seq.enqueued_at) * 1000,
+                    ttft_ms=(seq.first_token_at - seq.enqueued_at) * 1000,
+                    total_ms=(now - seq.enqueued_at) * 1000,
+                ))
+
+        if not keep:
+            self._reset()
+            return
+
+        index = torch.tensor(keep, dtype=torch.long, device=self._attention_mask.device)
+        mask = self._attention_mask.index_select(0, index)
+        # 남은 시퀀스 모두에게 패딩인 왼쪽 열은 잘라내어 캐시를 작게 유지합니다.
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self._attention_mask = mask[:, start:]
+        self._past = tuple(
+            (k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:])
+            for k, v in self._past
+        )
+        self._active = [self._active[i] for i in keep]
+
+    def _finish_cancelled(self, seq: _Sequence):
+        self.cancelled += 1
+        self.generated_tokens += len(seq.generated)
+        self.cancelled_tokens_saved += seq.params.max_new_tokens - len(seq.generated)
+        if not seq.future.done():
+            reason = seq.cancel.reason if seq.cancel is not None else "aborted"
+            _resolve(seq.future, error=GenerationCancelled(reason or "aborted"))
@@ -0,0 +1,87 @@
+# /mnt/d/MeQuest/LLMService/bench_assisted_decoding.py
+# ------------------------------------------------------------
+# draft 모델 assisted decoding 벤치마크 (CPU 로 실행 가능한 작은 모델 쌍)
+# Run:
+#   BENCH_MODEL_ID=HuggingFaceTB/SmolLM2-360M-Instruct \
+#   BENCH_DRAFT_MODEL_ID=HuggingFaceTB/SmolLM2-135M-Instruct \
+#       python bench_assisted_decoding.py
+# 출력: plain model.generate 대비 assisted generate 의 end-to-end 지연 시간,
+#       draft 토큰 수용률, 메인 forward 당 생성 토큰 수, (greedy 기준) 출력 일치 여부
+# ------------------------------------------------------------
+
+import math
+import os
+import statistics
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from assisted_decoding import CONFIDENCE_THRESHOLD, NUM_ASSISTANT_TOKENS, DraftModel
+
+MODEL_ID = os.getenv("BENCH_MODEL_ID", "HuggingFaceTB/SmolLM2-360M-Instruct")
+DRAFT_MODEL_ID = os.getenv("BENCH_DRAFT_MODEL_ID", "HuggingFaceTB/SmolLM2-135M-Instruct")
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "8"))
+MAX_NEW_TOKENS = int(os.getenv("BENCH_MAX_NEW_TOKENS", "128"))
+
+PROMPTS = [
+    "다음 문서를 한국어로 요약하세요: 광합성은 식물이 빛 에너지를 이용해 이산화탄소와 물로 포도당을 만드는 과정이다.",
+    "Explain why the answer to 'What is 7 x 8?' is 56 and not 54, in three sentences.",
+    "피타고라스 정리에 대한 객관식 문제를 JSON 으로 하나 만드세요.",
+    "Summarize: The Joseon dynasty used a civil service examination system to select officials.",
+]
+
+
+def _ms(samples):
+    # p90 = nearest-rank (ceil(0.9 * n) 번째 값)
+    p90 = sorted(samples)[min(len(samples) - 1, math.ceil(0.9 * len(samples)) - 1)]
+    return f"{statistics.median(samples) * 1000:8.1f} ms (p90 {p90 * 1000:.1f})"
+
+
+@torch.no_grad()
+def main():
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+    model = AutoModelForCausalLM.from_pretrained(MODEL_ID).eval()
+    draft_tokenizer = AutoTokenizer.from_pretrained(DRAFT_MODEL_ID)
+    draft_model = AutoModelForCausalLM.from_pretrained(DRAFT_MODEL_ID).eval()
+    draft = DraftModel(model, tokenizer, draft_model, draft_tokenizer, NUM_ASSISTANT_TOKENS, CONFIDENCE_THRESHOLD)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    print(f"target={MODEL_ID} draft={DRAFT_MODEL_ID} same_tokenizer={draft.same_tokenizer} "
+          f"iterations={ITERATIONS} max_new_tokens={MAX_NEW_TOKENS}")
+
+    # greedy 로 비교해야 assisted 출력이 plain 과 같아야 함을 확인할 수 있습니다.
+    kwargs = dict(max_new_tokens=MAX_NEW_TOKENS, do_sample=False, pad_token_id=pad_id)
+    for warmup in PROMPTS[:1]:
+        inputs = tokenizer(warmup, return_tensors="pt")
+        model.generate(**inputs, **kwargs)
+        draft.generate(inputs, **kwargs)
+
+    plain, assisted, matches, tokens = [], [], 0, 0
+    acceptance = []
+    for i in range(ITERATIONS):
+        inputs = tokenizer(PROMPTS[i % len(PROMPTS)], return_tensors="pt")
+        inputs.pop("token_type_ids", None)
+
+        t0 = time.perf_counter()
+        reference = model.generate(**inputs, **kwargs)
+        plain.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        outputs, stats = draft.generate(inputs, **kwargs)
+        assisted.append(time.perf_counter() - t0)
+
+        matches += torch.equal(reference, outputs)
+        tokens += stats["new_tokens"]
+        if stats["acceptance_rate"] is not None:
+            acceptance.append(stats["acceptance_rate"])
+
+    print(f"plain generate   : {_ms(plain)}  ({sum(plain) * 1000 / max(tokens, 1):.2f} ms/token)")
+    print(f"assisted generate: {_ms(assisted)}  ({sum(assisted) * 1000 / max(tokens, 1):.2f} ms/token)")
+    print(f"speedup (median) : {statistics.median(plain) / statistics.median(assisted):.2f}x")
+    print(f"acceptance rate  : {statistics.mean(acceptance) if acceptance else float('nan'):.3f} (per request mean)")
+    print(f"greedy output identical: {matches}/{ITERATIONS}")
+    print(f"draft stats: {draft.stats()}")
+
+
+if __name__ == "__main__":
+    main()
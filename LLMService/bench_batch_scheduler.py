@@ -0,0 +1,95 @@
+# /mnt/d/MeQuest/LLMService/bench_batch_scheduler.py
+# ------------------------------------------------------------
+# continuous batching 스케줄러 처리량 벤치마크 (CPU, 작은 모델)
+# Run:
+#   BENCH_MODEL_ID=hf-internal-testing/tiny-random-LlamaForCausalLM \
+#       python bench_batch_scheduler.py
+# 출력: 동시 클라이언트 1 / 4 / 16 에서의 tokens/sec
+#       (요청별 model.generate 를 직렬 실행한 기존 방식과 비교)
+# ------------------------------------------------------------
+
+import asyncio
+import os
+import threading
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from batch_scheduler import BatchScheduler, GenerationParams
+from prefix_cache import PrefixCache
+
+MODEL_ID = os.getenv("BENCH_MODEL_ID", "hf-internal-testing/tiny-random-LlamaForCausalLM")
+CONCURRENCY = [int(c) for c in os.getenv("BENCH_CONCURRENCY", "1,4,16").split(",")]
+REQUESTS_PER_CLIENT = int(os.getenv("BENCH_REQUESTS_PER_CLIENT", "4"))
+MAX_NEW_TOKENS = int(os.getenv("BENCH_MAX_NEW_TOKENS", "64"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "16"))
+
+PROMPT_PREFIX = (
+    "You are an AI problem generator for MeQuest. "
+    "Create one multiple-choice question with 4 options and the correct answer based on the user's topic.\n\nTopic:"
+)
+TOPICS = ["피타고라스 정리", "광합성", "조선 시대 과거 제도", "Python list comprehension"]
+
+
+def _params():
+    return GenerationParams(max_new_tokens=MAX_NEW_TOKENS, do_sample=False, repetition_penalty=1.0)
+
+
+async def _bench_scheduler(scheduler, clients):
+    async def client(cid):
+        tokens = 0
+        for i in range(REQUESTS_PER_CLIENT):
+            result = await scheduler.submit(f"{PROMPT_PREFIX} {TOPICS[(cid + i) % len(TOPICS)]}\n\n", _params())
+            tokens += len(result.token_ids)
+        return tokens
+
+    start = time.perf_counter()
+    tokens = sum(await asyncio.gather(*[client(c) for c in range(clients)]))
+    return tokens, time.perf_counter() - start
+
+
+async def _bench_serial(model, tokenizer, prefix_cache, clients):
+    """기존 서비스 동작: async 핸들러 안에서 요청마다 generate (GPU 락으로 직렬화)"""
+    lock = threading.Lock()
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    def run(prompt):
+        with lock, torch.no_grad():
+            inputs, past = prefix_cache.prepare(prompt)
+            out = model.generate(
+                **inputs, past_key_values=past, max_new_tokens=MAX_NEW_TOKENS, do_sample=False, pad_token_id=pad_id
+            )
+            return out.shape[1] - inputs["input_ids"].shape[1]
+
+    async def client(cid):
+        tokens = 0
+        for i in range(REQUESTS_PER_CLIENT):
+            prompt = f"{PROMPT_PREFIX} {TOPICS[(cid + i) % len(TOPICS)]}\n\n"
+            tokens += await asyncio.to_thread(run, prompt)
+        return tokens
+
+    start = time.perf_counter()
+    tokens = sum(await asyncio.gather(*[client(c) for c in range(clients)]))
+    return tokens, time.perf_counter() - start
+
+
+async def main():
+    torch.set_grad_enabled(False)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+    model = AutoModelForCausalLM.from_pretrained(MODEL_ID).eval()
+    prefix_cache = PrefixCache(model, tokenizer, PROMPT_PREFIX).build()
+    scheduler = BatchScheduler(model, tokenizer, prefix_cache=prefix_cache, max_batch_size=MAX_BATCH_SIZE, name="bench")
+
+    print(f"model={MODEL_ID} max_new_tokens={MAX_NEW_TOKENS} requests/client={REQUESTS_PER_CLIENT}")
+    print(f"{'clients':>8} | {'serial tok/s':>12} | {'batched tok/s':>13} | speedup")
+    for clients in CONCURRENCY:
+        s_tokens, s_sec = await _bench_serial(model, tokenizer, prefix_cache, clients)
+        b_tokens, b_sec = await _bench_scheduler(scheduler, clients)
+        s_tps, b_tps = s_tokens / s_sec, b_tokens / b_sec
+        print(f"{clients:>8} | {s_tps:>12.1f} | {b_tps:>13.1f} | {b_tps / s_tps:.2f}x")
+    print(f"scheduler stats: {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
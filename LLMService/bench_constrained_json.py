@@ -0,0 +1,86 @@
+# /mnt/d/MeQuest/LLMService/bench_constrained_json.py
+# ------------------------------------------------------------
+# 스키마 제약 디코딩 벤치마크 (CPU, 작은 모델)
+# Run:
+#   BENCH_MODEL_ID=hf-internal-testing/tiny-random-LlamaForCausalLM \
+#       python bench_constrained_json.py
+# 출력: 프롬프트만 사용 vs logits processor 제약 디코딩의
+#       파싱 성공률 / 스키마 유효율 / 유효 문제당 생성 토큰 수 / 토큰당 디코딩 시간
+# (랜덤 가중치 모델은 문자열을 스스로 닫지 않으므로 BENCH_MAX_STRING_CHARS 로 슬롯 길이를 제한합니다.)
+# ------------------------------------------------------------
+
+import os
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, LogitsProcessorList
+
+from json_constraint import JsonSchemaLogitsProcessor, get_grammar
+from json_extract import PROBLEM_SCHEMAS, ParseStats, extract_json_object, validate
+from roles import GECKO_PROMPT_PREFIXES
+
+MODEL_ID = os.getenv("BENCH_MODEL_ID", "hf-internal-testing/tiny-random-LlamaForCausalLM")
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "20"))
+MAX_NEW_TOKENS = int(os.getenv("BENCH_MAX_NEW_TOKENS", "512"))
+MAX_STRING_CHARS = int(os.getenv("BENCH_MAX_STRING_CHARS", "48"))
+STYLE = os.getenv("BENCH_STYLE", "mcq")
+TOPICS = ["피타고라스 정리", "광합성", "조선 시대 과거 제도", "Python list comprehension"]
+
+
+def _bounded(schema):
+    """문자열 슬롯마다 maxLength 를 지정한 사본"""
+    if schema.get("type") == "string" and "enum" not in schema:
+        return {**schema, "maxLength": MAX_STRING_CHARS}
+    out = dict(schema)
+    if "properties" in schema:
+        out["properties"] = {k: _bounded(v) for k, v in schema["properties"].items()}
+    if "items" in schema:
+        out["items"] = _bounded(schema["items"])
+    return out
+
+
+@torch.no_grad()
+def main():
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+    model = AutoModelForCausalLM.from_pretrained(MODEL_ID).eval()
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    schema = _bounded(PROBLEM_SCHEMAS[STYLE])
+
+    start = time.perf_counter()
+    grammar = get_grammar(tokenizer, schema)
+    print(f"model={MODEL_ID} style={STYLE} iterations={ITERATIONS} max_new_tokens={MAX_NEW_TOKENS} "
+          f"vocab_build={(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for mode in ("prompt-only", "constrained"):
+        stats, decode_seconds = ParseStats(), 0.0
+        torch.manual_seed(0)
+        for i in range(ITERATIONS):
+            prompt = f"{GECKO_PROMPT_PREFIXES[STYLE]} {TOPICS[i % len(TOPICS)]}\n\n"
+            inputs = tokenizer(prompt, return_tensors="pt")
+            inputs.pop("token_type_ids", None)
+            processors = LogitsProcessorList(
+                [JsonSchemaLogitsProcessor(grammar, MAX_NEW_TOKENS)] if mode == "constrained" else []
+            )
+            t0 = time.perf_counter()
+            outputs = model.generate(
+                **inputs, max_new_tokens=MAX_NEW_TOKENS, do_sample=True, temperature=0.8, top_p=0.9,
+                logits_processor=processors, pad_token_id=pad_id,
+            )
+            decode_seconds += time.perf_counter() - t0
+
+            new_tokens = outputs[0, inputs["input_ids"].shape[1]:]
+            text = tokenizer.decode(new_tokens, skip_special_tokens=True)
+            parsed = extract_json_object(text)
+            stats.record(parsed, validate(parsed, schema) if parsed is not None else None, len(new_tokens))
+
+        result = stats.stats()
+        per_token = decode_seconds / max(result["generated_tokens"], 1) * 1000
+        print(f"{mode:<12} parse_success={result['parse_success_rate']:.2f} "
+              f"schema_valid={result['schema_valid_rate']:.2f} "
+              f"tokens/valid_problem={result['tokens_per_valid_problem']} "
+              f"decode={per_token:.2f} ms/token")
+    print(f"cached masks: {len(grammar._masks)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# /mnt/d/MeQuest/LLMService/bench_cpu_inference.py
+# ------------------------------------------------------------
+# GPU (nf4) / CPU fp32 / CPU int8 경로 비교: 생성 속도 (tokens/s), 메모리, 출력 일치도
+# Run:
+#   BENCH_ROLES=gecko,solar,exaone python bench_cpu_inference.py          (roles.py 의 모델 경로)
+#   BENCH_MODEL_ID=/tmp/tiny-llama BENCH_VARIANTS=cpu-fp32,cpu-int8 python bench_cpu_inference.py
+#   CPU_THREADS=16 python bench_cpu_inference.py                           (스레드 수 비교)
+# 변형마다 새 파이썬 프로세스에서 hf_loader.load_model 로 로드합니다. (서비스와 같은 경로, 메모리 측정 분리)
+#   gpu        INFERENCE_DEVICE=cuda, 4bit nf4 (기존 경로, CUDA 가 있을 때만)
+#   cpu-fp32   INFERENCE_DEVICE=cpu, CPU_QUANTIZE=none
+#   cpu-int8   INFERENCE_DEVICE=cpu, CPU_QUANTIZE=int8
+# 역할별 프롬프트(roles.py build_prompt)로 greedy 생성 BENCH_NEW_TOKENS 토큰 (eos 무시, 길이 고정)
+# 출력:
+#   load      준비 시간 (s)
+#   tok/s     디코딩 토큰 / 생성 시간 (프롬프트마다 따로 잰 값의 중앙값, prefill 포함)
+#   footprint memory_footprint (가중치, GB)   rss  프로세스 최대 RSS (GB, 로드 중 fp32 가중치 포함)
+#   parity    기준 변형(첫 번째) 대비 토큰 일치 비율 (처음 달라지는 위치까지) / 완전히 같은 출력 수
+# ------------------------------------------------------------
+
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROLES = [r for r in os.getenv("BENCH_ROLES", "gecko,solar,exaone").split(",") if r]
+MODEL_ID = os.getenv("BENCH_MODEL_ID", "")            # 지정하면 모든 역할에 이 모델 사용 (작은 모델로 확인용)
+VARIANTS = [v for v in os.getenv("BENCH_VARIANTS", "").split(",") if v]
+NEW_TOKENS = int(os.getenv("BENCH_NEW_TOKENS", "64"))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+VARIANT_ENV = {
+    "gpu": {"INFERENCE_DEVICE": "cuda"},
+    "cpu-fp32": {"INFERENCE_DEVICE": "cpu", "CPU_QUANTIZE": "none"},
+    "cpu-int8": {"INFERENCE_DEVICE": "cpu", "CPU_QUANTIZE": "int8"},
+}
+
+
+def sample_prompts(role) -> list:
+    from roles import FeedbackRequest, GeckoRequest, SummarizeRequest
+
+    requests = {
+        "gecko": [GeckoRequest(topic=t) for t in ("광합성", "피타고라스 정리", "조선 시대의 신분 제도")],
+        "solar": [SummarizeRequest(document=d) for d in (
+            "광합성은 식물이 빛 에너지를 이용해 이산화탄소와 물로 포도당과 산소를 만드는 과정이다. "
+            "엽록체의 틸라코이드에서 명반응이, 스트로마에서 캘빈 회로가 일어난다.",
+            "세종은 훈민정음을 창제하여 백성이 쉽게 글을 익힐 수 있도록 하였다. "
+            "집현전 학자들과 함께 여러 서적을 편찬하고 과학 기구를 만들었다.",
+        )],
+        "exaone": [FeedbackRequest(question=q, user_answer=u, correct_answer=c) for q, u, c in (
+            ("물의 끓는점은 몇 도인가?", "50도", "1기압에서 100도"),
+            ("삼각형 내각의 합은?", "360도", "180도"),
+        )],
+    }[role.name]
+    return [role.build_prompt(r) for r in requests]
+
+
+def child(role_name: str):
+    """새 프로세스에서 변형 하나를 로드해 프롬프트별 생성 결과와 시간을 JSON 한 줄로 출력"""
+    from mequest_common.startup_timing import STARTUP
+    import torch
+    from hf_loader import load_model, memory_footprint
+    from roles import ROLES as SPECS
+
+    role = SPECS[role_name]
+    tokenizer, model = load_model(MODEL_ID or role.model_id, trust_remote_code=role.trust_remote_code, timer=STARTUP)
+    STARTUP.done(role_name)
+    runs = []
+    for prompt in sample_prompts(role):
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        start = time.perf_counter()
+        with torch.no_grad():
+            out = model.generate(
+                **inputs, max_new_tokens=NEW_TOKENS, min_new_tokens=NEW_TOKENS, do_sample=False,
+                pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+            )
+        elapsed = time.perf_counter() - start
+        generated = out[0, inputs["input_ids"].shape[1]:].tolist()
+        runs.append({"tokens": generated, "seconds": elapsed})
+    print("BENCH_RESULT " + json.dumps({
+        "ready_ms": STARTUP.ready_ms,
+        "checkpoint": STARTUP.notes.get("model_checkpoint"),
+        "footprint": memory_footprint(model),
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,   # Linux: KB
+        "runs": runs,
+    }))
+
+
+def run_variant(role: str, variant: str) -> dict:
+    env = {**os.environ, **VARIANT_ENV[variant]}
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", role], cwd=HERE, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    line = next(l for l in out.splitlines() if l.startswith("BENCH_RESULT "))
+    return json.loads(line[len("BENCH_RESULT "):])
+
+
+def agreement(reference: list, tokens: list) -> float:
+    """처음 달라지는 위치까지 같은 토큰 비율"""
+    same = 0
+    for a, b in zip(reference, tokens):
+        if a != b:
+            break
+        same += 1
+    return same / max(1, len(reference))
+
+
+def report(variant: str, result: dict, reference: dict):
+    tps = statistics.median(len(r["tokens"]) / r["seconds"] for r in result["runs"])
+    pairs = list(zip(reference["runs"], result["runs"]))
+    parity = statistics.fmean(agreement(a["tokens"], b["tokens"]) for a, b in pairs)
+    exact = sum(a["tokens"] == b["tokens"] for a, b in pairs)
+    threads = (result["checkpoint"] or {}).get("threads") or {}
+    print(
+        f"  {variant:<9} load {result['ready_ms'] / 1000:6.1f}s   tok/s {tps:7.2f}   "
+        f"footprint {result['footprint'] / 2**30:6.2f}GB   rss {result['max_rss'] / 2**30:6.2f}GB   "
+        f"parity {parity:6.1%} ({exact}/{len(pairs)} exact)"
+        f"{'   threads ' + str(threads['intra_op']) if threads else ''}"
+    )
+
+
+def main():
+    import torch
+
+    variants = VARIANTS or (["gpu"] if torch.cuda.is_available() else []) + ["cpu-fp32", "cpu-int8"]
+    print(f"variants={variants} new_tokens={NEW_TOKENS} (parity vs {variants[0]})")
+    for role in ROLES:
+        print(f"\n[{role}] {MODEL_ID or '(roles.py model)'}")
+        results = {variant: run_variant(role, variant) for variant in variants}
+        for variant in variants:
+            report(variant, results[variant], results[variants[0]])
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child(sys.argv[sys.argv.index("--child") + 1])
+    else:
+        main()
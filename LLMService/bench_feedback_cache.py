@@ -0,0 +1,66 @@
+# /mnt/d/MeQuest/LLMService/bench_feedback_cache.py
+# ------------------------------------------------------------
+# feedback_cache 확인: 같은 문제의 서로 다른 오답은 miss, 같은 오답의 표기 차이는 hit 인지
+# Run:
+#   (EmbeddingService 또는 hashing 대체 서비스가 EMBEDDING_SERVICE_URL 에 떠 있어야 합니다)
+#   (cd ../backend/src/services && uvicorn embedding_service:app --port 8000) &      hashing 임베더 단독 서비스
+#   python bench_feedback_cache.py
+#   FEEDBACK_CACHE_THRESHOLD=0.9 python bench_feedback_cache.py
+# - 문제마다 새 캐시에 오답을 하나씩 저장하며, 저장 직전의 lookup 이 모두 miss 여야 합니다.
+#   (서로 다른 오답끼리 hit 이면 다른 오답의 피드백이 나가는 것이므로 실패, 종료 코드 1)
+# - 표기만 다른 같은 오답의 hit 여부와 유사도는 참고용으로 출력합니다. (임베딩 모델에 따라 다름)
+# ------------------------------------------------------------
+
+import asyncio
+import sys
+
+from feedback_cache import FeedbackCache
+
+LONG_QUESTION = (
+    "다음 중 파이썬 리스트의 끝에 원소 하나를 추가하는 메서드는 무엇인가? 리스트는 가변(mutable) 시퀀스이며, "
+    "원소를 추가하거나 제거하는 여러 메서드를 제공한다. 아래 보기 중 올바른 것을 하나 고르시오. "
+    "A) append  B) extend  C) remove  D) insert"
+)
+
+CASES = [
+    # (문제, 정답, 서로 다른 오답들, [(저장된 오답, 표기만 다른 같은 오답)])
+    ("리스트 끝에 원소를 추가하는 메서드는?", "B) extend",
+     ["A) append", "C) remove", "D) insert"], [("A) append", "a)  APPEND"), ("C) remove", "C) remove()")]),
+    (LONG_QUESTION, "A) append",
+     ["B) extend", "C) remove", "D) insert"], [("D) insert", "D) insert 메서드")]),
+    ("HTTP 상태 코드 404 의 의미는?", "요청한 리소스를 찾을 수 없음",
+     ["서버 내부 오류", "인증이 필요함", "요청이 너무 많음", "리소스가 영구적으로 이동함"],
+     [("서버 내부 오류", "서버 내부 오류입니다")]),
+]
+
+
+async def main() -> int:
+    failures = 0
+    cache = FeedbackCache()
+    print(f"embed_url={cache.embed_url} threshold={cache.threshold}")
+    try:
+        for question, correct, wrong, variants in CASES:
+            cache._store.clear()
+            print(f"\n[{question[:40]}{'…' if len(question) > 40 else ''}]")
+            for answer in wrong:
+                lookup = await cache.lookup(question, answer, correct)
+                sim = "-" if lookup.similarity is None else f"{lookup.similarity:.3f}"
+                ok = lookup.entry is None
+                failures += not ok
+                print(f"  distinct {answer!r:<28} best sim {sim:>6}  {'miss' if ok else 'HIT (wrong feedback)'}")
+                cache.store(lookup, answer, f"feedback for {answer}", generation_ms=1000.0)
+            for stored, variant in variants:
+                lookup = await cache.lookup(question, variant, correct)
+                reused = lookup.entry.user_answer if lookup.entry is not None else None
+                sim = "-" if lookup.similarity is None else f"{lookup.similarity:.3f}"
+                failures += reused not in (None, stored)
+                print(f"  variant  {variant!r:<28} best sim {sim:>6}  "
+                      f"{'hit ' + repr(reused) if reused else 'miss'}")
+    finally:
+        await cache.aclose()
+    print(f"\n{'OK' if not failures else f'FAILED: {failures} wrong reuse(s)'}  {cache.stats()}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
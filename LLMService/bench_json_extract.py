@@ -0,0 +1,83 @@
+# bench_json_extract.py
+# ------------------------------------------------------------
+# Microbenchmark: single-pass JsonObjectScanner vs the previous regex-based
+# extract_json_block (code-fence strip + re.search(r"\{[\s\S]*\}") + re.sub
+# + repeated json.loads) on typical, large and adversarial LLM outputs.
+# Run:
+#   python bench_json_extract.py
+# ------------------------------------------------------------
+
+import json
+import os
+import re
+import timeit
+
+from json_extract import JsonObjectScanner, extract_json_object
+
+REPEAT = int(os.getenv("BENCH_REPEAT", "5"))
+
+_CODEFENCE = re.compile(r"```(?:json)?|```", re.IGNORECASE)
+
+
+def legacy_extract_json_block(text):
+    """The pre-scanner implementation, kept here only as the baseline."""
+    if not text:
+        return None
+    cleaned = _CODEFENCE.sub("", text).strip()
+    try:
+        obj = json.loads(cleaned)
+        if isinstance(obj, dict):
+            return obj
+    except Exception:
+        pass
+    m = re.search(r"\{[\s\S]*\}", cleaned)
+    if not m:
+        return None
+    candidate = re.sub(r"\s+", " ", m.group(0)).strip()
+    try:
+        return json.loads(candidate)
+    except Exception:
+        try:
+            return json.loads(candidate.replace("'", '"'))
+        except Exception:
+            return None
+
+
+def streamed(text, chunk=4):
+    """Feed the scanner token-sized chunks, as the streaming backends do."""
+    scanner = JsonObjectScanner()
+    for i in range(0, len(text), chunk):
+        if scanner.feed(text[i:i + chunk]) != -1:
+            break
+    return scanner.result
+
+
+OBJ = json.dumps({
+    "question": "직각삼각형에서 밑변이 6cm, 높이가 8cm일 때 빗변의 길이는? {단위: cm}",
+    "options": ["A) 9cm", "B) 10cm", "C) 12cm", "D) 14cm"],
+    "answer": "B",
+}, ensure_ascii=False)
+
+CASES = {
+    "typical": f"```json\n{OBJ}\n```",
+    "large (200KB trailing prose)": OBJ + " " + ("설명 문장입니다. " * 20000),
+    "multiple objects": " ".join([OBJ] * 200),
+    "adversarial ({ x 20000, unclosed)": "{" * 20000,
+    "adversarial (many braces in strings)": '{"question": "' + "{}" * 50000 + '", "answer": "x"}',
+}
+
+
+def main():
+    print(f"{'case':<40} | {'legacy ms':>10} | {'scanner ms':>10} | {'streamed ms':>11} | legacy ok | found")
+    for name, text in CASES.items():
+        expected = extract_json_object(text)
+        n = 1 if "unclosed" in name else REPEAT
+        legacy = min(timeit.repeat(lambda: legacy_extract_json_block(text), number=1, repeat=n)) * 1000
+        scanner = min(timeit.repeat(lambda: extract_json_object(text), number=1, repeat=REPEAT)) * 1000
+        stream = min(timeit.repeat(lambda: streamed(text), number=1, repeat=REPEAT)) * 1000
+        legacy_ok = legacy_extract_json_block(text) == expected
+        print(f"{name:<40} | {legacy:>10.3f} | {scanner:>10.3f} | {stream:>11.3f} | {str(legacy_ok):>9} | {expected is not None}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# bench_llm_pipeline.py
+# ------------------------------------------------------------
+# End-to-end load benchmark of the LLM services against fake_inference_server.py.
+# By default it spawns the fake backend plus unified_llm_service (Ollama protocol)
+# and gecko_service_expand (vLLM / TGI / OpenAI protocol) on local ports, then
+# drives each /generate at increasing concurrency.
+# Run:
+#   python bench_llm_pipeline.py
+#   BENCH_CONCURRENCY=1,8,32 BENCH_REQUESTS=128 FAKE_TTFT_MS=300 python bench_llm_pipeline.py
+#   BENCH_SPAWN=0 BENCH_TARGETS=unified=http://host:8001/generate python bench_llm_pipeline.py
+# Output per target / concurrency: throughput, p50/p90/p99 latency, errors, and
+# service overhead = mean client latency - mean time spent inside the fake backend.
+# Env:
+#   BENCH_TARGETS=name=url,...          (default: the spawned services)
+#   BENCH_FAKE_URL=http://127.0.0.1:18100
+#   BENCH_EXPAND_BACKEND=vllm | tgi | openai
+#   FAKE_* are passed through to the spawned fake server
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SPAWN = os.environ.get("BENCH_SPAWN", "1") == "1"
+FAKE_URL = os.environ.get("BENCH_FAKE_URL", "http://127.0.0.1:18100").rstrip("/")
+UNIFIED_PORT = int(os.environ.get("BENCH_UNIFIED_PORT", "18101"))
+EXPAND_PORT = int(os.environ.get("BENCH_EXPAND_PORT", "18102"))
+EXPAND_BACKEND = os.environ.get("BENCH_EXPAND_BACKEND", "vllm")
+CONCURRENCY = [int(c) for c in os.environ.get("BENCH_CONCURRENCY", "1,4,16,64").split(",")]
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", "64"))
+TIMEOUT = float(os.environ.get("BENCH_TIMEOUT", "120"))
+VERBOSE = os.environ.get("BENCH_VERBOSE", "0") == "1"   # show the spawned services' logs
+
+PAYLOADS = {
+    "unified": {"topic": "피타고라스 정리"},
+    "expand": {"topic": "피타고라스 정리", "style": "qa", "max_new_tokens": 256},
+}
+
+
+def _targets() -> Dict[str, str]:
+    raw = os.environ.get("BENCH_TARGETS", "")
+    if raw:
+        return dict(item.split("=", 1) for item in raw.split(",") if item)
+    return {
+        "unified": f"http://127.0.0.1:{UNIFIED_PORT}/generate",
+        f"expand-{EXPAND_BACKEND}": f"http://127.0.0.1:{EXPAND_PORT}/generate",
+    }
+
+
+@contextmanager
+def spawned_services() -> Iterator[None]:
+    if not SPAWN:
+        yield
+        return
+    fake_port = FAKE_URL.rsplit(":", 1)[-1]
+    backend_env = {"GECKO_BACKEND": EXPAND_BACKEND}
+    if EXPAND_BACKEND == "openai":
+        backend_env.update(OPENAI_BASE_URL=f"{FAKE_URL}/v1", OPENAI_API_KEY="fake")
+    else:
+        backend_env["BACKEND_URLS"] = FAKE_URL
+    services = [
+        ("fake_inference_server:app", fake_port, {}),
+        ("unified_llm_service:app", UNIFIED_PORT, {"OLLAMA_HOST": FAKE_URL, "FEEDBACK_CACHE": "0"}),
+        ("gecko_service_expand:app", EXPAND_PORT, backend_env),
+    ]
+    procs = []
+    try:
+        for app, port, extra in services:
+            cmd = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning", "--no-access-log"]
+            out = None if VERBOSE else subprocess.DEVNULL
+            procs.append(subprocess.Popen(cmd, cwd=HERE, env={**os.environ, **extra}, stdout=out, stderr=out))
+        for _, port, _ in services:
+            _wait_ready(f"http://127.0.0.1:{port}/health")
+        yield
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def _wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"service did not become ready: {url}")
+
+
+def _pct(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def run_level(client: httpx.AsyncClient, url: str, payload: dict, concurrency: int) -> Tuple[List[float], int, float]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(REQUESTS))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(url, json=payload)
+                ok = r.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def fake_backend_ms(client: httpx.AsyncClient) -> Optional[float]:
+    try:
+        return (await client.get(f"{FAKE_URL}/fake/stats")).json().get("avg_backend_ms")
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+async def main():
+    limits = httpx.Limits(max_connections=max(CONCURRENCY) + 4, max_keepalive_connections=max(CONCURRENCY) + 4)
+    async with httpx.AsyncClient(timeout=TIMEOUT, limits=limits) as client:
+        try:
+            config = (await client.get(f"{FAKE_URL}/fake/stats")).json()["config"]
+            print(f"fake backend: {config}")
+        except (httpx.HTTPError, ValueError, KeyError):
+            print(f"fake backend at {FAKE_URL} not reachable; overhead column will be empty")
+        print(f"requests per level={REQUESTS}")
+        print(f"{'target':<16}{'conc':>5}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}"
+              f"{'backend':>9}{'overhead':>10}{'errors':>8}")
+        for name, url in _targets().items():
+            payload = PAYLOADS["unified" if name.startswith("unified") else "expand"]
+            await run_level(client, url, payload, 1)  # warmup (imports, first connections)
+            for concurrency in CONCURRENCY:
+                try:
+                    await client.post(f"{FAKE_URL}/fake/reset")
+                except httpx.HTTPError:
+                    pass
+                latencies, errors, wall = await run_level(client, url, payload, concurrency)
+                if not latencies:
+                    print(f"{name:<16}{concurrency:>5}{'-':>9}{'-':>9}{'-':>9}{'-':>9}{'-':>9}{'-':>10}{errors:>8}")
+                    continue
+                backend = await fake_backend_ms(client)
+                mean_ms = statistics.mean(latencies) * 1000
+                overhead = f"{mean_ms - backend:10.1f}" if backend is not None else f"{'-':>10}"
+                print(f"{name:<16}{concurrency:>5}{len(latencies) / wall:>9.1f}"
+                      f"{_pct(latencies, 0.5) * 1000:>9.1f}{_pct(latencies, 0.9) * 1000:>9.1f}"
+                      f"{_pct(latencies, 0.99) * 1000:>9.1f}"
+                      f"{backend if backend is not None else float('nan'):>9.1f}{overhead}{errors:>8}")
+
+
+if __name__ == "__main__":
+    with spawned_services():
+        asyncio.run(main())
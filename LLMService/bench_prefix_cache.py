@@ -0,0 +1,91 @@
+# /mnt/d/MeQuest/LLMService/bench_prefix_cache.py
+# ------------------------------------------------------------
+# 시스템 프롬프트 prefix KV 캐시 벤치마크 (CPU, 작은 모델)
+# Run:
+#   BENCH_MODEL_ID=hf-internal-testing/tiny-random-LlamaForCausalLM \
+#       python bench_prefix_cache.py
+# 출력: prefill 시간 / TTFT (max_new_tokens=1 generate) 을 캐시 사용/미사용으로 비교
+# ------------------------------------------------------------
+
+import math
+import os
+import statistics
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from prefix_cache import PrefixCache
+
+MODEL_ID = os.getenv("BENCH_MODEL_ID", "hf-internal-testing/tiny-random-LlamaForCausalLM")
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "20"))
+
+# 실제 서비스와 비슷한 길이가 되도록 시스템 프롬프트를 반복합니다.
+SYSTEM_PROMPT = (
+    "You are an AI problem generator for MeQuest. "
+    "Create one multiple-choice question with 4 options and the correct answer based on the user's topic. "
+    "Respond only with a single JSON object (strictly start with '{' and end with '}'): "
+) * int(os.getenv("BENCH_PREFIX_REPEAT", "4"))
+PROMPT_PREFIX = f"{SYSTEM_PROMPT}\n\nTopic:"
+TOPICS = ["피타고라스 정리", "광합성", "조선 시대 과거 제도", "Python list comprehension"]
+
+
+def _ms(samples):
+    # p90 = nearest-rank (ceil(0.9 * n) 번째 값)
+    p90 = sorted(samples)[min(len(samples) - 1, math.ceil(0.9 * len(samples)) - 1)]
+    return f"{statistics.median(samples) * 1000:8.2f} ms (p90 {p90 * 1000:.2f})"
+
+
+@torch.no_grad()
+def main():
+    torch.set_grad_enabled(False)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+    model = AutoModelForCausalLM.from_pretrained(MODEL_ID).eval()
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    cache = PrefixCache(model, tokenizer, PROMPT_PREFIX).build()
+    print(f"model={MODEL_ID} prefix_tokens={cache.prefix_len} iterations={ITERATIONS}")
+
+    prefill = {"full": [], "cached": []}
+    ttft = {"full": [], "cached": []}
+
+    for i in range(ITERATIONS):
+        prompt = f"{PROMPT_PREFIX} {TOPICS[i % len(TOPICS)]}\n\n"
+        inputs, past = cache.prepare(prompt)
+        if past is None:
+            raise SystemExit("prefix tokens did not match; choose a prefix that ends on a token boundary")
+        n = cache.prefix_len
+
+        # 1) prefill: 전체 프롬프트 forward vs 캐시 + suffix forward
+        t0 = time.perf_counter()
+        model(**inputs, use_cache=True)
+        prefill["full"].append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        model(
+            input_ids=inputs["input_ids"][:, n:],
+            attention_mask=inputs["attention_mask"],
+            past_key_values=past,
+            use_cache=True,
+        )
+        prefill["cached"].append(time.perf_counter() - t0)
+
+        # 2) TTFT: 첫 토큰까지의 generate 시간 (deepcopy 비용 포함)
+        t0 = time.perf_counter()
+        model.generate(**inputs, max_new_tokens=1, do_sample=False, pad_token_id=pad_id)
+        ttft["full"].append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        inputs, past = cache.prepare(prompt)
+        model.generate(**inputs, past_key_values=past, max_new_tokens=1, do_sample=False, pad_token_id=pad_id)
+        ttft["cached"].append(time.perf_counter() - t0)
+
+    print(f"prefill  without cache: {_ms(prefill['full'])}")
+    print(f"prefill  with cache   : {_ms(prefill['cached'])}")
+    print(f"TTFT     without cache: {_ms(ttft['full'])}")
+    print(f"TTFT     with cache   : {_ms(ttft['cached'])}")
+    print(f"cache stats: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# /mnt/d/MeQuest/LLMService/bench_router.py
+# ------------------------------------------------------------
+# model_router 시뮬레이션: stub 백엔드로 부하별 라우팅 결정 / SLO 달성률 / 지연 분포 비교
+# Run:
+#   python bench_router.py
+#   BENCH_RATES=0.5,1,2,3 BENCH_REQUESTS=400 BENCH_SCALE=0.01 python bench_router.py
+# - 백엔드 (실제 Ollama / 역할 서비스 대신 asyncio.sleep + 동시 실행 수 세마포어)
+#     large  tier 2, concurrency 4, 처리 시간 = 작업 기본값 + 입력 토큰당 비용
+#     small  tier 1, concurrency 4, large 의 SMALL_FACTOR 배
+# - 요청: 포아송 도착 (초당 BENCH_RATES), 작업 비율 feedback 50% / generate 30% / summarize 20%
+#   summarize 의 1/4 은 긴 문서 (ROUTER_LONG_INPUT_TOKENS 이상)
+# - static = ROUTER=0 (항상 large, 기존 동작), routed = ModelRouter 기본 정책
+# - 시간은 BENCH_SCALE 배로 줄여 실행하고, 출력은 원래 단위(ms)로 되돌려 표시합니다.
+# ------------------------------------------------------------
+
+import asyncio
+import os
+import random
+import statistics
+from collections import Counter
+
+from model_router import ROUTER_SLO_MS, BackendSpec, ModelRouter
+
+RATES = [float(r) for r in os.getenv("BENCH_RATES", "0.3,0.6,1.0,1.5").split(",")]
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "300"))
+SCALE = float(os.getenv("BENCH_SCALE", "0.01"))
+SMALL_FACTOR = float(os.getenv("BENCH_SMALL_FACTOR", "0.35"))
+SEED = int(os.getenv("BENCH_SEED", "0"))
+
+# large 모델 처리 시간 (ms) = 기본 + 입력 토큰당
+BASE_MS = {"generate": 6000.0, "summarize": 7000.0, "feedback": 3500.0}
+PER_TOKEN_MS = 1.5
+MIX = (("feedback", 0.5), ("generate", 0.3), ("summarize", 0.2))
+
+BACKENDS = [
+    BackendSpec(name="large", target="qwen2.5:14b", tier=2, concurrency=4),
+    BackendSpec(name="small", target="qwen2.5:3b", tier=1, concurrency=4),
+]
+
+
+def workload(rate: float, rng: random.Random):
+    """(도착 시각 ms, 작업, 입력 토큰 수) 목록"""
+    at, out = 0.0, []
+    tasks, weights = zip(*MIX)
+    for _ in range(REQUESTS):
+        at += rng.expovariate(rate) * 1000
+        task = rng.choices(tasks, weights)[0]
+        if task == "summarize":
+            tokens = rng.randint(1800, 3500) if rng.random() < 0.25 else rng.randint(300, 900)
+        elif task == "feedback":
+            tokens = rng.randint(80, 250)
+        else:
+            tokens = rng.randint(60, 150)
+        out.append((at, task, tokens))
+    return out
+
+
+class StubBackend:
+    def __init__(self, spec: BackendSpec, factor: float, rng: random.Random):
+        self.slots = asyncio.Semaphore(spec.concurrency)
+        self.factor = factor
+        self.rng = rng
+
+    async def call(self, task: str, tokens: int):
+        ms = (BASE_MS[task] + PER_TOKEN_MS * tokens) * self.factor * self.rng.uniform(0.8, 1.2)
+        async with self.slots:
+            await asyncio.sleep(ms / 1000 * SCALE)
+
+
+async def run(rate: float, routed: bool):
+    rng = random.Random(SEED)
+    router = ModelRouter(
+        BACKENDS,
+        slo_ms={task: ms * SCALE for task, ms in ROUTER_SLO_MS.items()},
+        initial_ms=BASE_MS["generate"] * SCALE,
+        enabled=routed,
+        decision_log=REQUESTS,
+    )
+    stubs = {
+        "large": StubBackend(BACKENDS[0], 1.0, random.Random(SEED + 1)),
+        "small": StubBackend(BACKENDS[1], SMALL_FACTOR, random.Random(SEED + 2)),
+    }
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def one(at, task, tokens):
+        await asyncio.sleep(max(0.0, start + at / 1000 * SCALE - loop.time()))
+        decision = router.choose(task, tokens)
+        async with router.track(decision):
+            await stubs[decision.backend].call(task, tokens)
+        return decision, tokens
+
+    return await asyncio.gather(*(one(*item) for item in workload(rate, rng)))
+
+
+def summarize(label: str, results):
+    by_task = {}
+    for decision, tokens in results:
+        by_task.setdefault(decision.task, []).append((decision, tokens))
+    for task in ("feedback", "generate", "summarize"):
+        items = by_task.get(task, [])
+        if not items:
+            continue
+        latencies = sorted(d.latency_ms / SCALE for d, _ in items)
+        slo = ROUTER_SLO_MS[task]
+        hit = sum(ms <= slo for ms in latencies) / len(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        share = Counter(d.backend for d, _ in items)
+        long_items = [d for d, t in items if t >= 1500]
+        long_share = f"  long->large {sum(d.backend == 'large' for d in long_items)}/{len(long_items)}" if long_items else ""
+        print(
+            f"  {label:<7} {task:<9} n={len(items):<4} slo {hit:6.1%}   p50 {statistics.median(latencies):8.0f}"
+            f"   p95 {p95:8.0f}   large {share['large']:>4} small {share['small']:>4}{long_share}"
+        )
+
+
+async def main():
+    print(f"requests={REQUESTS} scale={SCALE} small_factor={SMALL_FACTOR} slo_ms={ROUTER_SLO_MS}")
+    for rate in RATES:
+        print(f"\n[rate {rate}/s]  (ms, unscaled)")
+        for routed in (False, True):
+            summarize("routed" if routed else "static", await run(rate, routed))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
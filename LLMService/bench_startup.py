@@ -0,0 +1,89 @@
+# /mnt/d/MeQuest/LLMService/bench_startup.py
+# ------------------------------------------------------------
+# 모델 서비스 cold start 벤치마크 (체크포인트 캐시 사용/미사용)
+# Run:
+#   BENCH_MODEL_ID=/mnt/d/MeQuest/models/GECKO-7B python bench_startup.py
+#   BENCH_MODEL_ID=hf-internal-testing/tiny-random-LlamaForCausalLM BENCH_QUANTIZE=0 python bench_startup.py
+# 측정마다 새 파이썬 프로세스에서 hf_loader.load_model 을 실행합니다. (서비스 재시작과 같은 조건)
+#   1) MODEL_CACHE=0 으로 BENCH_RUNS 번: 매번 원본을 읽고 양자화 (기존 방식)
+#   2) 캐시 생성 1번: 원본 로드 + 양자화 + safetensors 저장
+#   3) 캐시 사용 BENCH_RUNS 번: 저장된 체크포인트를 mmap 으로 로드
+# 출력: 시나리오별 준비 시간 / 프로세스 전체 시간 / 단계별 시간 (중앙값)
+# ------------------------------------------------------------
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODEL_ID = os.getenv("BENCH_MODEL_ID", "hf-internal-testing/tiny-random-LlamaForCausalLM")
+QUANTIZE = os.getenv("BENCH_QUANTIZE", "1") == "1"
+RUNS = int(os.getenv("BENCH_RUNS", "3"))
+# 캐시 위치 (미지정 시 임시 디렉터리를 만들고 끝나면 남겨 둡니다: 디스크 사용량 확인용)
+CACHE_DIR = os.getenv("BENCH_CACHE_DIR") or tempfile.mkdtemp(prefix="mequest-ckpt-")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def child():
+    """새 프로세스에서 로더만 실행하고 STARTUP 통계를 JSON 한 줄로 출력"""
+    from mequest_common.startup_timing import STARTUP
+    from hf_loader import load_model
+
+    STARTUP.mark("import_hf_loader")
+    load_model(MODEL_ID, quantize=QUANTIZE, timer=STARTUP)
+    STARTUP.done("bench")
+    print("BENCH_RESULT " + json.dumps(STARTUP.stats()))
+
+
+def run_once(cache: bool) -> dict:
+    env = {**os.environ, "MODEL_CACHE": "1" if cache else "0", "MODEL_CACHE_DIR": CACHE_DIR}
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, __file__, "--child"], cwd=HERE, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    wall_ms = (time.perf_counter() - start) * 1000
+    line = next(l for l in out.splitlines() if l.startswith("BENCH_RESULT "))
+    result = json.loads(line[len("BENCH_RESULT "):])
+    result["wall_ms"] = wall_ms
+    return result
+
+
+def _median(results, key):
+    return statistics.median(r[key] for r in results)
+
+
+def report(name: str, results: list):
+    cache = results[0].get("model_checkpoint", {}).get("cache")
+    print(
+        f"{name:<14} ready {_median(results, 'ready_ms') / 1000:7.2f}s   "
+        f"process {_median(results, 'wall_ms') / 1000:7.2f}s   (cache: {cache}, n={len(results)})"
+    )
+    phases = results[0]["phases_ms"]
+    for phase in phases:
+        values = [r["phases_ms"].get(phase, 0.0) for r in results]
+        print(f"    {phase:<20} {statistics.median(values) / 1000:7.2f}s")
+
+
+def main():
+    print(f"model={MODEL_ID} quantize={QUANTIZE} runs={RUNS} cache_dir={CACHE_DIR}\n")
+    baseline = [run_once(cache=False) for _ in range(RUNS)]
+    report("no cache", baseline)
+    report("cache build", [run_once(cache=True)])
+    cached = [run_once(cache=True) for _ in range(RUNS)]
+    report("cached", cached)
+    weights = [statistics.median(r["phases_ms"]["model_weights"] for r in rs) for rs in (baseline, cached)]
+    print(
+        f"\nrestart speedup: ready {_median(baseline, 'ready_ms') / _median(cached, 'ready_ms'):.1f}x, "
+        f"weights {weights[0] / weights[1]:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child()
+    else:
+        main()
@@ -0,0 +1,233 @@
+# /mnt/d/MeQuest/LLMService/cancellation.py
+# ------------------------------------------------------------
+# 클라이언트 연결 종료 / deadline 초과 시 실행 중인 생성 중단
+#
+# Node 백엔드가 타임아웃으로 요청을 버리거나 사용자가 화면을 떠나도 model.generate /
+# ollama.chat 은 max_new_tokens 까지 계속 돌며 슬롯을 차지합니다.
+# - cancel_scope(): 요청마다 CancelToken 을 만들고, 연결 종료(request.is_disconnected 폴링)와
+#   deadline 타이머가 토큰을 취소합니다.
+# - 생성 쪽은 토큰을 확인해 멈춥니다.
+#     transformers generate  → CancelCriteria (StoppingCriteria)
+#     BatchScheduler         → 다음 step 에서 해당 행을 배치에서 제거 (빈 자리는 바로 대기 요청이 채움)
+#     Ollama / HTTP 백엔드   → 스트림을 닫아 upstream 생성을 중단
+# - 중단된 요청 수와 아낀 토큰 수(추정)를 CANCEL_STATS 로 /health, /metrics 에 내보냅니다.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "1") == "1"
+CANCEL_POLL_INTERVAL_S = float(os.getenv("CANCEL_POLL_INTERVAL_S", "0.5"))
+
+# 취소 사유별 응답 코드 (499: nginx 관례의 "client closed request")
+_STATUS = {"disconnect": 499, "deadline": 504}
+
+
+class GenerationCancelled(Exception):
+    """생성 도중 토큰이 취소되어 중단됨"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"generation cancelled ({reason})")
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    스레드 안전한 취소 플래그. 워커 스레드는 cancelled 를 확인하고 (deadline 도 여기서 판정),
+    생성한 토큰 수는 generated 에 기록합니다.
+    """
+
+    def __init__(self, deadline_s: Optional[float] = None):
+        self.deadline = time.monotonic() + deadline_s if deadline_s else None
+        self.reason: Optional[str] = None
+        self.generated = 0
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self._event.is_set()
+
+    def cancel(self, reason: str):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """취소 시 (취소한 스레드에서) 호출. 이미 취소되었으면 즉시 호출"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise GenerationCancelled(self.reason)
+
+
+class CancelCriteria:
+    """
+    model.generate 용 StoppingCriteria: 토큰이 취소되면 모든 행을 멈춥니다.
+    (Ollama / HTTP 서비스가 torch 를 import 하지 않도록 상속 없이 같은 호출 규약만 따릅니다.)
+    """
+
+    def __init__(self, token: CancelToken, prompt_len: int):
+        self.token = token
+        self.prompt_len = prompt_len
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.token.generated = int(input_ids.shape[1]) - self.prompt_len
+        return input_ids.new_full((input_ids.shape[0],), int(self.token.cancelled)).bool()
+
+
+class CancelStats:
+    """라우트별 취소 수 / 아낀 토큰 수(추정) / 완료 요청의 평균 생성 토큰 수"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cancelled: Dict[str, Dict[str, int]] = {}
+        self.tokens_generated: Dict[str, int] = {}     # 취소 전까지 생성된 토큰
+        self.tokens_saved: Dict[str, int] = {}
+        self._completed: Dict[str, List[int]] = {}     # [요청 수, 토큰 합]
+
+    def completed(self, route: str, tokens: int):
+        with self._lock:
+            n = self._completed.setdefault(route, [0, 0])
+            n[0] += 1
+            n[1] += tokens
+
+    def record(self, route: str, reason: str, generated: int, budget: Optional[int] = None) -> int:
+        """
+        아낀 토큰 = 예상 생성 길이 - 이미 생성한 토큰. 예상 길이는 완료 요청의 평균 길이
+        (max_new_tokens 로 상한), 완료 기록이 없으면 max_new_tokens.
+        """
+        with self._lock:
+            count, total = self._completed.get(route, (0, 0))
+            expected = total / count if count else budget
+            if budget is not None and expected is not None:
+                expected = min(expected, budget)
+            saved = max(0, round(expected - generated)) if expected is not None else 0
+            by_reason = self.cancelled.setdefault(route, {})
+            by_reason[reason] = by_reason.get(reason, 0) + 1
+            self.tokens_generated[route] = self.tokens_generated.get(route, 0) + generated
+            self.tokens_saved[route] = self.tokens_saved.get(route, 0) + saved
+        return saved
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                route: {
+                    "cancelled": dict(self.cancelled.get(route, {})),
+                    "tokens_generated_before_cancel": self.tokens_generated.get(route, 0),
+                    "tokens_saved_est": self.tokens_saved.get(route, 0),
+                    "avg_completion_tokens": (
+                        round(self._completed[route][1] / self._completed[route][0], 1)
+                        if self._completed.get(route, (0,))[0] else None
+                    ),
+                }
+                for route in sorted(set(self.cancelled) | set(self._completed))
+            }
+
+    def metrics_text(self) -> str:
+        """Prometheus text exposition 형식 (admission.metrics_text 뒤에 이어 붙입니다)"""
+        lines = [
+            "# TYPE generation_cancelled_total counter",
+            "# TYPE generation_cancel_tokens_saved_total counter",
+        ]
+        with self._lock:
+            for route, by_reason in self.cancelled.items():
+                for reason, count in by_reason.items():
+                    lines.append(f'generation_cancelled_total{{route="{route}",reason="{reason}"}} {count}')
+                lines.append(f'generation_cancel_tokens_saved_total{{route="{route}"}} {self.tokens_saved[route]}')
+        return "\n".join(lines) + "\n"
+
+
+CANCEL_STATS = CancelStats()
+
+
+async def _watch_disconnect(request: Request, token: CancelToken):
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("disconnect")
+            return
+        await asyncio.sleep(CANCEL_POLL_INTERVAL_S)
+
+
+@asynccontextmanager
+async def cancel_scope(
+    route: str,
+    request: Optional[Request] = None,
+    deadline_ms: Optional[int] = None,
+    budget: Optional[int] = None,
+) -> AsyncIterator[CancelToken]:
+    """
+    본문 실행 동안 연결 종료 / deadline 을 감시하는 CancelToken 을 제공합니다.
+    본문에서 GenerationCancelled 가 올라오면 통계를 남기고 HTTPException(499 | 504) 으로 바꿉니다.
+    (budget: 요청의 max_new_tokens, 아낀 토큰 추정용)
+    """
+    token = CancelToken(deadline_ms / 1000 if deadline_ms else None)
+    loop = asyncio.get_running_loop()
+    timer = loop.call_later(deadline_ms / 1000, token.cancel, "deadline") if deadline_ms else None
+    watcher = (
+        asyncio.create_task(_watch_disconnect(request, token))
+        if request is not None and CANCEL_ON_DISCONNECT else None
+    )
+    try:
+        yield token
+    except GenerationCancelled as e:
+        CANCEL_STATS.record(route, e.reason, token.generated, budget)
+        raise HTTPException(status_code=_STATUS.get(e.reason, 499), detail=f"{route}: {e}") from e
+    except asyncio.CancelledError:
+        # 서버 종료 등으로 핸들러가 취소됨: 스레드에서 돌고 있는 생성도 멈춥니다.
+        token.cancel("aborted")
+        raise
+    else:
+        if token.generated:
+            CANCEL_STATS.completed(route, token.generated)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if watcher is not None:
+            watcher.cancel()
+
+
+async def wait_cancellable(coro, token: CancelToken):
+    """
+    코루틴(HTTP 스트림 등)을 실행하다가 토큰이 취소되면 task 를 취소하고 GenerationCancelled.
+    task 취소로 열려 있던 upstream 스트림이 닫혀 백엔드 생성도 중단됩니다.
+    """
+    task = asyncio.ensure_future(coro)
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    token.add_callback(lambda: loop.call_soon_threadsafe(lambda: stop.done() or stop.set_result(None)))
+    try:
+        await asyncio.wait({task, stop}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if task.done():
+        stop.cancel()
+        return task.result()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    raise GenerationCancelled(token.reason)
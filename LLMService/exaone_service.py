@@ -1,71 +1,85 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+# 시작 단계별 시간은 다른 import 보다 먼저 재기 시작합니다. (/health 의 "startup")
+from mequest_common.startup_timing import STARTUP
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from transformers import StoppingCriteriaList
+import asyncio
 import torch
 import os
-import json 
-import gc
+import time
+
+from hf_loader import load_model
+from assisted_decoding import load_draft
+from prefix_cache import PrefixCache
+from batch_scheduler import BatchScheduler
+from admission import AdmissionController, admission_concurrency, metrics_text
+from cancellation import CANCEL_STATS, CancelCriteria, GenerationCancelled, cancel_scope
+from mequest_common.server_timing import FirstTokenTimer, install_server_timing, stage
+from feedback_cache import FeedbackCache
+from job_queue import install_jobs
+from roles import EXAONE, FeedbackRequest as GenerateRequest, FeedbackResponse as GenerateResponse
+STARTUP.mark("import")
 
 # -----------------
 # 1. 모델 설정
 # -----------------
 # EXAONE 공식 Instruct 모델 경로 (로컬 다운로드 위치)
 # .env에 EXAONE_MODEL_PATH 환경 변수를 설정할 수 있습니다.
-MODEL_ID = os.getenv("EXAONE_MODEL_PATH", "/mnt/d/mequest/models/EXAONE-3.5-7.8B-Instruct")
-
-# 4bit 양자화 설정 (RTX 5070 환경 기준)
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_use_double_quant=True,
-    bnb_4bit_compute_dtype=torch.float16,
-)
+MODEL_ID = EXAONE.model_id
+
+# 시스템 프롬프트 prefix KV 캐시 사용 여부 (PREFIX_CACHE=0 으로 비활성화)
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE", "1") == "1"
+
+# continuous batching 스케줄러 사용 여부 및 최대 동시 디코딩 수 (BATCH_SCHEDULER=0 이면 요청별 generate)
+BATCH_SCHEDULER_ENABLED = os.getenv("BATCH_SCHEDULER", "1") == "1"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
 
 # -----------------
 # 2. FastAPI 및 모델 로드
 # -----------------
 app = FastAPI(title="MeQuest EXAONE Feedback Generator", version="1.0.0")
+install_server_timing(app, "exaone")
 
 try:
     print(f"Loading {MODEL_ID} (EXAONE-7.8B Instruct) ...")
-    # tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
-    tokenizer = AutoTokenizer.from_pretrained(
-        MODEL_ID,
-        trust_remote_code=True
-    )
+    tokenizer, model = load_model(MODEL_ID, trust_remote_code=EXAONE.trust_remote_code, timer=STARTUP)
+    print(f"✅ EXAONE-7.8B Model Loaded Successfully on {model.device}!")
+
+    with STARTUP.phase("prefix_cache"):
+        prefix_cache = PrefixCache(model, tokenizer, EXAONE.prompt_prefix, enabled=PREFIX_CACHE_ENABLED).build()
 
-    model = AutoModelForCausalLM.from_pretrained(
-        MODEL_ID,
-        quantization_config=bnb_config,
-        device_map="auto",
-        low_cpu_mem_usage=True,
-        trust_remote_code=True
+    # EXAONE_DRAFT_MODEL_PATH 가 있으면 assisted decoding 용 draft 모델을 함께 로드합니다.
+    draft = load_draft(
+        model, tokenizer, EXAONE.draft_model_id, trust_remote_code=EXAONE.trust_remote_code, timer=STARTUP
     )
-    print("✅ EXAONE-7.8B Model Loaded Successfully on GPU!")
+
+    # 동시 요청을 하나의 배치로 묶어 step 단위로 디코딩합니다.
+    with STARTUP.phase("scheduler"):
+        scheduler = BatchScheduler(
+            model, tokenizer, prefix_cache=prefix_cache, max_batch_size=MAX_BATCH_SIZE, name="exaone"
+        ) if BATCH_SCHEDULER_ENABLED else None
 except Exception as e:
     print(f"❌ Failed to load EXAONE model: {e}")
     # 모델 로드 실패는 치명적이므로 서버 시작을 중단합니다.
     raise RuntimeError(f"Model Load Failed: {e}")
 
+# 같은 문제의 비슷한 오답이면 이전 피드백을 재사용합니다. (FEEDBACK_CACHE=0 으로 비활성화)
+feedback_cache = FeedbackCache()
+
+@app.on_event("shutdown")
+async def close_feedback_cache():
+    await feedback_cache.aclose()
+
+# 동시 실행 수 제한 + 우선순위 대기열 (스케줄러가 있으면 배치 크기만큼, 없으면 1개씩 generate)
+admission = AdmissionController(
+    "exaone", admission_concurrency(MAX_BATCH_SIZE if scheduler is not None else 1), default_priority=EXAONE.priority
+)
+STARTUP.done("exaone")
+
 # -----------------
 # 3. Pydantic 요청/응답 모델 정의
 # -----------------
-class GenerateRequest(BaseModel):
-    """
-    오답 피드백을 위해 문제, 사용자 답변, 정답을 받습니다.
-    (Node.js llmService.js에서 이 필드명에 맞춰 요청을 전송해야 합니다.)
-    """
-    question: str                 # 원래 문제
-    user_answer: str              # 사용자 답변
-    correct_answer: str           # 정답
-    max_new_tokens: int = 512
-    temperature: float = 0.5
-    repetition_penalty: float = 1.2
-    
-class GenerateResponse(BaseModel):
-    """ 응답 포맷을 GECKO/SOLAR와 통일합니다. """
-    model_id: str
-    output: str 
+# GenerateRequest / GenerateResponse 는 roles.py 에서 model_host 와 공유합니다.
 
 # -----------------
 # 4. API 엔드포인트
@@ -74,69 +88,119 @@ class GenerateResponse(BaseModel):
 @app.get("/health")
 async def health():
     """ 서버 및 모델 로드 상태 확인 """
-    return {"status": "ok", "model_loaded": model is not None}
+    return {
+        "status": "ok",
+        "model_loaded": model is not None,
+        "prefix_cache": prefix_cache.stats(),
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "draft": draft.stats() if draft is not None else None,
+        "feedback_cache": feedback_cache.stats(),
+        "admission": admission.stats(),
+        "cancellation": CANCEL_STATS.stats(),
+        "startup": STARTUP.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """admission 대기열 지표 (Prometheus text format)"""
+    return metrics_text(admission) + CANCEL_STATS.metrics_text()
+
+@app.get("/feedback/cache")
+async def feedback_cache_stats():
+    """피드백 재사용 캐시 hit rate / threshold / 절약 시간(추정)"""
+    return feedback_cache.stats()
+
+@app.post("/feedback/cache")
+async def configure_feedback_cache(threshold: float | None = None, enabled: bool | None = None):
+    """threshold (cosine 유사도) 와 사용 여부를 실행 중에 변경합니다."""
+    if threshold is not None and not 0.0 < threshold <= 1.0:
+        raise HTTPException(status_code=422, detail="threshold must be in (0, 1]")
+    feedback_cache.configure(threshold=threshold, enabled=enabled)
+    return feedback_cache.stats()
 
 @app.post("/feedback", response_model=GenerateResponse)
-async def generate_feedback(request: GenerateRequest):
+async def generate_feedback(request: GenerateRequest, http_request: Request):
     """
     사용자의 오답에 대해 EXAONE 7.8B를 사용하여 건설적인 피드백을 제공합니다.
+    같은 문제의 비슷한 오답에 대한 피드백이 캐시에 있으면 모델을 실행하지 않습니다.
     """
-    try:
-        # EXAONE 역할: 오답 피드백 (일관성을 위해 결정론적 샘플링)
-        system_prompt = (
-            "너는 MeQuest의 오답 피드백 전문가이다. "
-            "사용자가 제출한 답변을 분석하고, 왜 정답이 올바른지 한국어로 3~5 문장으로 친절하고 상세하게 설명하라."
-        )
-
-        # EXAONE Instruct 모델의 프롬프트 포맷 (Mistral/Llama Instruct 포맷 사용 가정)
-        prompt_template = f"""<s>[INST] {system_prompt}
-
-질문: {request.question}
-사용자 답변: {request.user_answer}
-정답: {request.correct_answer} [/INST]"""
-        
-        # 1. 토큰화 및 GPU 이동
-        inputs = tokenizer(prompt_template, return_tensors="pt")
-        # token_type_ids 제거 로직은 EXAONE 모델에서 불필요하다고 가정하고 제거
-        inputs = inputs.to(model.device)   
-        
-        # 2. 텍스트 생성 (결정론적 샘플링)
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=request.max_new_tokens,
-            temperature=request.temperature,
-            do_sample=(request.temperature > 0), # ← 조건부 샘플링
-            repetition_penalty=request.repetition_penalty,
-            pad_token_id=tokenizer.eos_token_id
-        )
-
-        # 3. 결과 디코딩 및 후처리
-        generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
-        
-        # 프롬프트 템플릿 제거
-        if '[/INST]' in generated_text:
-            feedback = generated_text.split('[/INST]', 1)[-1].strip()
-        else:
-            feedback = generated_text.strip()
-            
-        # VRAM 정리 (안정성 확보)
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            
-        return GenerateResponse(model_id=MODEL_ID, output=feedback)
-
-    except Exception as e:
-        print(f"❌ Feedback Generation failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Feedback Generation failed: {e}")
+    lookup = None
+    if feedback_cache.enabled and request.use_cache:
+        lookup = await feedback_cache.lookup(request.question, request.user_answer, request.correct_answer)
+        if lookup.entry is not None:
+            return GenerateResponse(model_id=MODEL_ID, output=lookup.entry.feedback, cached=True)
+
+    start = time.perf_counter()
+    # 대기열에서 슬롯을 얻은 요청만 모델을 실행합니다. (예상 대기 > deadline 이면 429 + Retry-After)
+    # 실행 중 연결이 끊기거나 deadline 이 지나면 생성을 멈추고 슬롯을 돌려줍니다.
+    async with cancel_scope("exaone", http_request, request.deadline_ms, request.max_new_tokens) as cancel, \
+            admission.slot(request.priority, request.deadline_ms):
+        try:
+            prompt_template = EXAONE.build_prompt(request)
+            # assisted 요청은 draft 와 함께 단일 시퀀스로 generate 합니다. (스케줄러 미사용)
+            use_draft = request.assisted and draft is not None
+
+            if scheduler is not None and not use_draft:
+                # 1~3. 스케줄러 큐에 넣고 배치 디코딩 결과(새로 생성된 텍스트)를 기다립니다.
+                result = await scheduler.submit(prompt_template, EXAONE.generation_params(request), cancel)
+                generated_text = result.text
+            else:
+                # 1. 토큰화 및 GPU 이동 (prefix 가 일치하면 시스템 프롬프트 KV 캐시 복사본을 함께 받음)
+                #    draft 는 prefix 캐시를 공유하지 않으므로 assisted 요청은 전체 prefill
+                with stage("tokenize"):
+                    if use_draft:
+                        inputs, past_key_values = prefix_cache.tokenize(prompt_template), None
+                    else:
+                        inputs, past_key_values = prefix_cache.prepare(prompt_template)
+
+                # 2. 텍스트 생성 (결정론적 샘플링, 캐시가 있으면 질문/답변 부분만 prefill, draft 가 있으면 assisted decoding)
+                first_token = FirstTokenTimer()
+                generate_kwargs = dict(
+                    past_key_values=past_key_values,
+                    max_new_tokens=request.max_new_tokens,
+                    temperature=request.temperature,
+                    do_sample=(request.temperature > 0), # ← 조건부 샘플링
+                    repetition_penalty=request.repetition_penalty,
+                    pad_token_id=tokenizer.eos_token_id,
+                    stopping_criteria=StoppingCriteriaList([CancelCriteria(cancel, inputs["input_ids"].shape[1]), first_token])
+                )
+                # 연결 종료를 감시할 수 있도록 generate 는 스레드에서 실행합니다.
+                if use_draft:
+                    outputs, _ = await asyncio.to_thread(draft.generate, inputs, **generate_kwargs)
+                else:
+                    outputs = await asyncio.to_thread(model.generate, **inputs, **generate_kwargs)
+                first_token.record()
+                cancel.raise_if_cancelled()
+
+                # 3. 결과 디코딩
+                generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+            # VRAM 정리 (안정성 확보)
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+            # 프롬프트 템플릿 제거
+            response = EXAONE.build_response(MODEL_ID, prompt_template, generated_text)
+            if lookup is not None:
+                feedback_cache.store(lookup, request.user_answer, response.output, (time.perf_counter() - start) * 1000)
+            return response
+
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            print(f"❌ Feedback Generation failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Feedback Generation failed: {e}")
+
+# 비동기 작업 API: POST /jobs/feedback → GET /jobs/{id}/result (job_queue.py)
+JOBS = install_jobs(app, "exaone", {"feedback": (GenerateRequest, lambda req: generate_feedback(req, None))})
 
 if __name__ == "__main__":
     import uvicorn
     # 💡 8003 포트 사용
-    uvicorn.run(app, host="0.0.0.0", port=8003) 
+    uvicorn.run(app, host="0.0.0.0", port=EXAONE.port)
 
 # VRAM 정리
 import gc
 gc.collect()
 if torch.cuda.is_available():
     torch.cuda.empty_cache()
-
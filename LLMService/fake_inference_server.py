@@ -0,0 +1,424 @@
+# /mnt/d/MeQuest/LLMService/fake_inference_server.py
+# ------------------------------------------------------------
+# GPU 없이 서비스 부하 테스트를 하기 위한 가짜 LLM 추론 서버
+# unified_llm_service.py (Ollama) 와 gecko_service_expand.py (vLLM / TGI / OpenAI 호환) 가
+# 쓰는 만큼만 각 upstream 프로토콜을 흉내 냅니다.
+#
+#   Ollama   POST /api/chat, POST /api/generate, GET /api/tags   (NDJSON 스트리밍)
+#   vLLM     POST /generate {"prompt": ...}                        (NUL 구분 스트리밍)
+#   TGI      POST /generate {"inputs": ...}, POST /generate_stream (SSE)
+#   OpenAI   POST /v1/chat/completions, POST /v1/completions, GET /v1/models (SSE)
+#
+# 지연 모델: FAKE_SLOTS 개 디코딩 슬롯 중 하나를 기다린 뒤 (0 = 무제한) 첫 토큰까지 TTFT 만큼 대기,
+# 이후 FAKE_TOKENS_PER_SEC (± FAKE_JITTER) 속도로 토큰을 내보냅니다.
+# Run:
+#   FAKE_TTFT_MS=300 FAKE_TOKENS_PER_SEC=40 uvicorn fake_inference_server:app --port 18100
+# Env:
+#   FAKE_TTFT_MS=200           FAKE_TOKENS_PER_SEC=50     FAKE_JITTER=0.1
+#   FAKE_SLOTS=0               FAKE_ERROR_RATE=0.0        FAKE_ERROR_STATUS=503
+#   FAKE_PAD_TO_MAX=0          # JSON 뒤에 max tokens 까지 채움 문장을 계속 출력
+#   FAKE_REPLAY_FILE=recorded.jsonl  # 줄마다 {"prompt": "...", "text": "..."}; 프롬프트가
+#                                    # 정확히 일치하면 그 텍스트, 아니면 순서대로 돌아가며 사용
+#   FAKE_SEED=0
+# 실행 중 변경: GET /fake/stats, POST /fake/config (같은 키, 소문자, FAKE_ 제외)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeConfig:
+    ttft_ms: float = float(os.environ.get("FAKE_TTFT_MS", "200"))
+    tokens_per_sec: float = float(os.environ.get("FAKE_TOKENS_PER_SEC", "50"))
+    jitter: float = float(os.environ.get("FAKE_JITTER", "0.1"))
+    slots: int = int(os.environ.get("FAKE_SLOTS", "0"))
+    error_rate: float = float(os.environ.get("FAKE_ERROR_RATE", "0"))
+    error_status: int = int(os.environ.get("FAKE_ERROR_STATUS", "503"))
+    pad_to_max: bool = os.environ.get("FAKE_PAD_TO_MAX", "0") == "1"
+
+
+CONFIG = FakeConfig()
+REPLAY_FILE = os.environ.get("FAKE_REPLAY_FILE", "")
+_rng = random.Random(int(os.environ.get("FAKE_SEED", "0")))
+
+# 단어 조각 하나를 대략 토큰 하나로 봅니다. (시간 측정용으로는 충분)
+_TOKEN = re.compile(r"\s*[^\s]{1,4}|\s+")
+_FILLER = " 그리고 추가 설명을 덧붙이면"
+
+_QA = {"question": "직각삼각형에서 밑변이 6cm, 높이가 8cm일 때 빗변의 길이는?", "answer": "10cm"}
+_MCQ = {
+    "question": "직각삼각형에서 빗변의 길이를 구하시오. 밑변 6cm, 높이 8cm.",
+    "options": ["A) 9cm", "B) 10cm", "C) 12cm", "D) 14cm"],
+    "answer": "B",
+}
+_QUIZ = {
+    "question": "직각삼각형에서 밑변이 6cm, 높이가 8cm일 때 빗변의 길이는?",
+    "options": ["9cm", "10cm", "12cm", "14cm"],
+    "answer_index": 1,
+    "explanation": "피타고라스 정리에 의해 6² + 8² = 100 이므로 빗변은 10cm 입니다.",
+}
+_FEEDBACK = "사용자의 답은 피타고라스 정리를 잘못 적용한 결과입니다. 6² + 8² = 100 이므로 정답은 10cm 입니다."
+_SUMMARY = "광합성은 식물이 빛 에너지로 이산화탄소와 물에서 포도당을 만드는 과정입니다."
+
+
+# ---------------------- Replay -------------------------------
+class Replay:
+    def __init__(self, path: str):
+        self.by_prompt: Dict[str, str] = {}
+        texts: List[str] = []
+        if path:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    rec = json.loads(line)
+                    texts.append(str(rec["text"]))
+                    if rec.get("prompt"):
+                        self.by_prompt[rec["prompt"]] = str(rec["text"])
+        self.size = len(texts)
+        self._cycle = itertools.cycle(texts) if texts else None
+
+    def pick(self, prompt: str) -> Optional[str]:
+        if prompt in self.by_prompt:
+            return self.by_prompt[prompt]
+        return next(self._cycle) if self._cycle is not None else None
+
+
+REPLAY = Replay(REPLAY_FILE)
+
+
+def synth_text(prompt: str) -> str:
+    """호출한 서비스가 기대하는 형식의 고정 출력"""
+    replayed = REPLAY.pick(prompt)
+    if replayed is not None:
+        return replayed
+    p = prompt.lower()
+    if "answer_index" in p:
+        return json.dumps(_QUIZ, ensure_ascii=False)
+    if "options" in p:
+        return json.dumps(_MCQ, ensure_ascii=False)
+    if "question" in p:
+        return json.dumps(_QA, ensure_ascii=False)
+    if "요약" in prompt or "summar" in p:
+        return _SUMMARY
+    return _FEEDBACK
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text)
+
+
+# ---------------------- Stats --------------------------------
+class Stats:
+    def __init__(self):
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self.tokens = 0
+        self.active = 0
+        self.max_active = 0
+        self.queued_ms = 0.0
+        self.busy_ms = 0.0
+        self.completed = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "completed": self.completed,
+            "tokens": self.tokens,
+            "active": self.active,
+            "max_active": self.max_active,
+            # 요청이 가짜 백엔드 안에서 보낸 평균 시간 (대기 + 생성)
+            "avg_backend_ms": round(self.busy_ms / self.completed, 2) if self.completed else None,
+            "avg_queue_ms": round(self.queued_ms / self.completed, 2) if self.completed else None,
+        }
+
+
+STATS = Stats()
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def _slot_semaphore() -> Optional[asyncio.Semaphore]:
+    global _slots
+    if CONFIG.slots <= 0:
+        return None
+    if _slots is None or getattr(_slots, "_fake_size", None) != CONFIG.slots:
+        _slots = asyncio.Semaphore(CONFIG.slots)
+        _slots._fake_size = CONFIG.slots
+    return _slots
+
+
+# ---------------------- Generation ---------------------------
+class Generation:
+    """가짜 디코딩 하나: 슬롯을 잡고 TTFT / 토큰별 지연만큼 sleep 합니다."""
+
+    def __init__(self, protocol: str, prompt: str, max_tokens: Optional[int]):
+        STATS.requests[protocol] = STATS.requests.get(protocol, 0) + 1
+        if CONFIG.error_rate and _rng.random() < CONFIG.error_rate:
+            STATS.errors += 1
+            raise HTTPException(status_code=CONFIG.error_status, detail="fake backend error")
+        self.prompt = prompt
+        tokens = tokenize(synth_text(prompt))
+        if max_tokens:
+            if CONFIG.pad_to_max:
+                filler = tokenize(_FILLER)
+                while len(tokens) < max_tokens:
+                    tokens.extend(filler)
+            tokens = tokens[:max_tokens]
+        self.tokens = tokens
+        self.prompt_tokens = len(tokenize(prompt))
+        self.emitted = 0
+        self._start = time.perf_counter()
+        self._ttft_s = 0.0
+
+    def _delay(self, seconds: float) -> float:
+        if CONFIG.jitter:
+            seconds *= 1 + _rng.uniform(-CONFIG.jitter, CONFIG.jitter)
+        return max(seconds, 0.0)
+
+    async def stream(self) -> AsyncIterator[str]:
+        slots = _slot_semaphore()
+        if slots is not None:
+            await slots.acquire()
+        STATS.queued_ms += (time.perf_counter() - self._start) * 1000
+        STATS.active += 1
+        STATS.max_active = max(STATS.max_active, STATS.active)
+        try:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self._delay(CONFIG.ttft_ms / 1000))
+            self._ttft_s = time.perf_counter() - t0
+            per_token = 1.0 / CONFIG.tokens_per_sec if CONFIG.tokens_per_sec > 0 else 0.0
+            for i, token in enumerate(self.tokens):
+                if i and per_token:
+                    await asyncio.sleep(self._delay(per_token))
+                self.emitted += 1
+                STATS.tokens += 1
+                yield token
+        finally:
+            # 정상 종료와 스트리밍 중 클라이언트 연결 종료 모두에서 실행
+            STATS.active -= 1
+            STATS.completed += 1
+            STATS.busy_ms += (time.perf_counter() - self._start) * 1000
+            if slots is not None:
+                slots.release()
+
+    async def text(self) -> str:
+        return "".join([t async for t in self.stream()])
+
+    def ollama_counts(self) -> Dict[str, Any]:
+        total_ns = int((time.perf_counter() - self._start) * 1e9)
+        prompt_ns = int(self._ttft_s * 1e9)
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": total_ns,
+            "load_duration": 0,
+            "prompt_eval_count": self.prompt_tokens,
+            "prompt_eval_duration": prompt_ns,
+            "eval_count": self.emitted,
+            "eval_duration": max(total_ns - prompt_ns, 0),
+        }
+
+
+async def _body(request: Request) -> Dict[str, Any]:
+    """Content-Type 과 무관하게 JSON 을 파싱합니다. (curl / Ollama CLI 는 자주 생략)"""
+    try:
+        body = json.loads(await request.body() or b"{}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid JSON body")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="JSON object expected")
+    return body
+
+
+def _messages_prompt(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(str(m.get("content") or "") for m in messages or [])
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _sse(obj: Any) -> str:
+    return f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+
+# ---------------------- App ----------------------------------
+app = FastAPI(title="MeQuest Fake Inference Server", version="0.1.0")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "service": "fake-inference", "config": asdict(CONFIG), "replay": REPLAY.size}
+
+
+@app.get("/fake/stats")
+async def fake_stats():
+    return {**STATS.to_dict(), "config": asdict(CONFIG)}
+
+
+@app.post("/fake/config")
+async def fake_config(request: Request):
+    for key, value in (await _body(request)).items():
+        if not hasattr(CONFIG, key):
+            raise HTTPException(status_code=422, detail=f"unknown config key: {key}")
+        kind = type(getattr(CONFIG, key))
+        if kind is bool and isinstance(value, str):
+            value = value.lower() in {"1", "true", "yes"}
+        setattr(CONFIG, key, kind(value))
+    return asdict(CONFIG)
+
+
+@app.post("/fake/reset")
+async def fake_reset():
+    global STATS
+    STATS = Stats()
+    return STATS.to_dict()
+
+
+# ---- Ollama ----
+@app.get("/api/tags")
+async def ollama_tags():
+    return {"models": [{"name": "fake:latest", "model": "fake:latest", "size": 0, "digest": "fake"}]}
+
+
+@app.post("/api/chat")
+async def ollama_chat(request: Request):
+    body = await _body(request)
+    return await _ollama(body, _messages_prompt(body.get("messages")), chat=True)
+
+
+@app.post("/api/generate")
+async def ollama_generate(request: Request):
+    body = await _body(request)
+    return await _ollama(body, str(body.get("prompt") or ""), chat=False)
+
+
+async def _ollama(body: Dict[str, Any], prompt: str, chat: bool):
+    gen = Generation("ollama", prompt, (body.get("options") or {}).get("num_predict"))
+    model = body.get("model") or "fake"
+
+    def chunk(text: str, done: bool) -> Dict[str, Any]:
+        base = {"model": model, "created_at": _now()}
+        if chat:
+            base["message"] = {"role": "assistant", "content": text}
+        else:
+            base["response"] = text
+        return {**base, **(gen.ollama_counts() if done else {"done": False})}
+
+    if body.get("stream", True):
+        async def lines():
+            async for token in gen.stream():
+                yield json.dumps(chunk(token, False), ensure_ascii=False) + "\n"
+            yield json.dumps(chunk("", True), ensure_ascii=False) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    return chunk(await gen.text(), True)
+
+
+# ---- vLLM api_server / TGI (둘 다 POST /generate) ----
+@app.post("/generate")
+async def generate(request: Request):
+    body = await _body(request)
+    if "inputs" in body:
+        params = body.get("parameters") or {}
+        gen = Generation("tgi", str(body["inputs"]), params.get("max_new_tokens"))
+        text = await gen.text()
+        if params.get("return_full_text"):
+            text = gen.prompt + text
+        return [{"generated_text": text}]
+
+    prompt = str(body.get("prompt") or "")
+    gen = Generation("vllm", prompt, body.get("max_tokens"))
+    if body.get("stream"):
+        async def parts():
+            text = prompt
+            async for token in gen.stream():
+                text += token
+                yield json.dumps({"text": [text]}, ensure_ascii=False).encode("utf-8") + b"\0"
+        return StreamingResponse(parts(), media_type="application/octet-stream")
+    return {"text": [prompt + await gen.text()]}
+
+
+@app.post("/generate_stream")
+async def tgi_generate_stream(request: Request):
+    body = await _body(request)
+    params = body.get("parameters") or {}
+    gen = Generation("tgi", str(body.get("inputs") or ""), params.get("max_new_tokens"))
+
+    async def events():
+        parts: List[str] = []
+        async for token in gen.stream():
+            parts.append(token)
+            yield _sse({"token": {"id": len(parts), "text": token, "logprob": 0.0, "special": False},
+                        "generated_text": None, "details": None})
+        yield _sse({"token": {"id": 0, "text": "", "logprob": 0.0, "special": True},
+                    "generated_text": "".join(parts), "details": None})
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ---- OpenAI-compatible ----
+@app.get("/v1/models")
+async def openai_models():
+    return {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "fake"}]}
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    body = await _body(request)
+    return await _openai(body, _messages_prompt(body.get("messages")), chat=True)
+
+
+@app.post("/v1/completions")
+async def openai_completions(request: Request):
+    body = await _body(request)
+    return await _openai(body, str(body.get("prompt") or ""), chat=False)
+
+
+async def _openai(body: Dict[str, Any], prompt: str, chat: bool):
+    gen = Generation("openai", prompt, body.get("max_tokens"))
+    rid = f"fake-{int(time.time() * 1000)}"
+    obj = "chat.completion" if chat else "text_completion"
+
+    if body.get("stream"):
+        async def events():
+            async for token in gen.stream():
+                choice = {"index": 0, "delta": {"content": token}} if chat else {"index": 0, "text": token}
+                yield _sse({"id": rid, "object": f"{obj}.chunk", "model": body.get("model"), "choices": [choice]})
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    text = await gen.text()
+    choice = {"index": 0, "finish_reason": "stop"}
+    choice.update({"message": {"role": "assistant", "content": text}} if chat else {"text": text})
+    return {
+        "id": rid,
+        "object": obj,
+        "model": body.get("model"),
+        "choices": [choice],
+        "usage": {"prompt_tokens": gen.prompt_tokens, "completion_tokens": gen.emitted,
+                  "total_tokens": gen.prompt_tokens + gen.emitted},
+    }
+
+
+@app.exception_handler(HTTPException)
+async def _http_error(request: Request, exc: HTTPException):
+    # Ollama / OpenAI 클라이언트는 {"error": ...} 를 읽고, FastAPI 방식 호출자를 위해 "detail" 도 유지
+    return JSONResponse(status_code=exc.status_code, content={"error": exc.detail, "detail": exc.detail})
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("FAKE_PORT", "18100")))
@@ -0,0 +1,202 @@
+# /mnt/d/MeQuest/LLMService/feedback_cache.py
+# ------------------------------------------------------------
+# 오답 피드백 의미 기반 재사용 캐시 (EXAONE / unified_llm_service 공용)
+#
+# 같은 문제에 대한 오답은 몇 가지 유형으로 몰리는 경우가 많으므로, 문제(+정답)별로
+# 이전 오답과 그 피드백을 보관해 두고 새 오답이 충분히 비슷하면 LLM 호출 없이 재사용합니다.
+# - user_answer 만 EmbeddingService /embed 로 임베딩 (정규화 벡터 → 내적 = cosine)
+#   비교는 항상 같은 (question, correct_answer) 버킷 안에서만 하므로 문제 문장은 넣지 않습니다.
+#   (넣으면 모든 항목이 같은 문제 문장을 공유해 벡터를 지배하고, 서로 다른 오답끼리도 threshold 근처가 됨)
+# - 같은 문제의 저장된 오답 중 유사도가 threshold 이상인 것이 있으면 hit
+#   (정규화한 답변 문자열이 같으면 임베딩 없이 바로 hit)
+# - miss 일 때만 LLM 을 실행하고 결과를 저장
+# - hit rate / threshold / 절약한 생성 시간(추정)을 stats() 로 보고
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from mequest_common.server_timing import stage
+
+log = logging.getLogger("feedback_cache")
+
+FEEDBACK_CACHE_ENABLED = os.getenv("FEEDBACK_CACHE", "1") == "1"
+EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL", "http://localhost:8000").rstrip("/")
+FEEDBACK_CACHE_THRESHOLD = float(os.getenv("FEEDBACK_CACHE_THRESHOLD", "0.92"))
+FEEDBACK_CACHE_MAX_PER_QUESTION = int(os.getenv("FEEDBACK_CACHE_MAX_PER_QUESTION", "32"))
+FEEDBACK_CACHE_MAX_QUESTIONS = int(os.getenv("FEEDBACK_CACHE_MAX_QUESTIONS", "10000"))
+FEEDBACK_CACHE_TIMEOUT = float(os.getenv("FEEDBACK_CACHE_TIMEOUT", "2"))
+
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text).split()).lower()
+
+
+def question_key(question: str, correct_answer: str) -> str:
+    """피드백은 문제와 정답에 따라 달라지므로 둘을 함께 키로 씁니다."""
+    raw = f"{_normalize(question)}\x00{_normalize(correct_answer)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class FeedbackEntry:
+    user_answer: str
+    vector: np.ndarray
+    feedback: str
+    generation_ms: float          # 이 피드백을 만드는 데 걸린 LLM 시간 (hit 시 절약 시간 추정에 사용)
+    hits: int = 0
+    model_name: Optional[str] = None  # 벡터를 만든 임베딩 모델 (과부하 시 대체 임베더일 수 있음)
+
+
+@dataclass
+class Lookup:
+    """lookup() 결과. miss 이면 entry 가 None 이고, vector 는 store() 에 그대로 넘깁니다."""
+    key: str
+    entry: Optional[FeedbackEntry]
+    vector: Optional[np.ndarray]
+    similarity: Optional[float]
+    lookup_ms: float
+    model_name: Optional[str] = None
+
+
+class FeedbackCache:
+    def __init__(
+        self,
+        embed_url: str = EMBEDDING_SERVICE_URL,
+        threshold: float = FEEDBACK_CACHE_THRESHOLD,
+        max_per_question: int = FEEDBACK_CACHE_MAX_PER_QUESTION,
+        max_questions: int = FEEDBACK_CACHE_MAX_QUESTIONS,
+        timeout: float = FEEDBACK_CACHE_TIMEOUT,
+        enabled: bool = FEEDBACK_CACHE_ENABLED,
+    ):
+        self.embed_url = embed_url.rstrip("/")
+        self.threshold = threshold
+        self.max_per_question = max_per_question
+        self.max_questions = max_questions
+        self.timeout = timeout
+        self.enabled = enabled
+        # question key → 최근 오답들 (OrderedDict 순서 = LRU)
+        self._store: "OrderedDict[str, Deque[FeedbackEntry]]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.lookups = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.embed_errors = 0
+        self.lookup_ms = 0.0
+        self.saved_ms = 0.0
+
+    # ---------- lifecycle ----------
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ---------- embedding ----------
+    async def embed(self, user_answer: str) -> Tuple[np.ndarray, Optional[str]]:
+        """(정규화 벡터, 임베딩 모델 이름). 문제는 버킷 키로만 구분합니다."""
+        r = await self._http().post(f"{self.embed_url}/embed", json={"texts": [user_answer]})
+        r.raise_for_status()
+        data = r.json()
+        vector = np.asarray(data["embeddings"][0], dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm > 0 else vector), data.get("model_name")
+
+    # ---------- public API ----------
+    async def lookup(self, question: str, user_answer: str, correct_answer: str) -> Lookup:
+        """같은 문제의 이전 오답 중 가장 비슷한 것을 찾습니다. (threshold 미만이면 miss)"""
+        start = time.perf_counter()
+        key = question_key(question, correct_answer)
+        entries = self._store.get(key)
+        self.lookups += 1
+
+        # 1) 답변 문자열이 같으면 임베딩 없이 hit
+        answer = _normalize(user_answer)
+        for entry in entries or ():
+            if _normalize(entry.user_answer) == answer:
+                self.exact_hits += 1
+                return self._hit(key, entry, entry.vector, 1.0, start, entry.model_name)
+
+        # 2) 임베딩 유사도 (실패하면 miss 로 처리하고 저장도 하지 않음)
+        try:
+            with stage("cache_embed"):
+                vector, model_name = await self.embed(user_answer)
+        except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+            self.embed_errors += 1
+            log.warning("feedback cache embedding failed, treating as miss: %s", e)
+            return self._miss(key, None, None, start)
+
+        # 다른 임베딩 모델로 만든 벡터끼리는 비교하지 않습니다.
+        candidates = [e for e in entries or () if e.model_name == model_name]
+        if candidates:
+            sims = np.stack([e.vector for e in candidates]) @ vector
+            best = int(np.argmax(sims))
+            if float(sims[best]) >= self.threshold:
+                return self._hit(key, candidates[best], vector, float(sims[best]), start, model_name)
+            return self._miss(key, vector, float(sims[best]), start, model_name)
+        return self._miss(key, vector, None, start, model_name)
+
+    def store(self, lookup: Lookup, user_answer: str, feedback: str, generation_ms: float):
+        """miss 후 LLM 이 만든 피드백을 저장합니다."""
+        if lookup.vector is None or not feedback:
+            return
+        entries = self._store.get(lookup.key)
+        if entries is None:
+            entries = self._store[lookup.key] = deque(maxlen=self.max_per_question)
+            while len(self._store) > self.max_questions:
+                self._store.popitem(last=False)
+        self._store.move_to_end(lookup.key)
+        entries.append(FeedbackEntry(user_answer, lookup.vector, feedback, generation_ms, model_name=lookup.model_name))
+
+    def configure(self, threshold: Optional[float] = None, enabled: Optional[bool] = None):
+        if threshold is not None:
+            self.threshold = threshold
+        if enabled is not None:
+            self.enabled = enabled
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "questions": len(self._store),
+            "entries": sum(len(e) for e in self._store.values()),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else None,
+            "embed_errors": self.embed_errors,
+            "avg_lookup_ms": round(self.lookup_ms / self.lookups, 2) if self.lookups else None,
+            "latency_saved_ms_est": round(self.saved_ms, 1),
+        }
+
+    # ---------- internals ----------
+    def _hit(self, key: str, entry: FeedbackEntry, vector, similarity: float, start: float,
+             model_name: Optional[str] = None) -> Lookup:
+        elapsed = (time.perf_counter() - start) * 1000
+        self.hits += 1
+        self.lookup_ms += elapsed
+        self.saved_ms += max(entry.generation_ms - elapsed, 0.0)
+        entry.hits += 1
+        self._store.move_to_end(key)
+        return Lookup(key, entry, vector, similarity, elapsed, model_name)
+
+    def _miss(self, key: str, vector, similarity: Optional[float], start: float,
+              model_name: Optional[str] = None) -> Lookup:
+        elapsed = (time.perf_counter() - start) * 1000
+        self.lookup_ms += elapsed
+        return Lookup(key, None, vector, similarity, elapsed, model_name)
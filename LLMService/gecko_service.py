@@ -1,24 +1,39 @@
 # /mnt/d/MeQuest/LLMService/gecko_service.py
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import torch
-import json
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+# 시작 단계별 시간은 다른 import 보다 먼저 재기 시작합니다. (/health 의 "startup")
+from mequest_common.startup_timing import STARTUP
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+import asyncio
+import os
+
+from hf_loader import load_model
+from assisted_decoding import load_draft
+from prefix_cache import PrefixCache
+from batch_scheduler import BatchScheduler
+from admission import AdmissionController, admission_concurrency, metrics_text
+from cancellation import CANCEL_STATS, CancelCriteria, GenerationCancelled, cancel_scope
+from mequest_common.server_timing import FirstTokenTimer, install_server_timing, stage
+from job_queue import install_jobs
+from json_constraint import JsonSchemaLogitsProcessor, get_grammar
+from roles import (
+    GECKO, GECKO_PARSE_STATS, check_gecko_response, gecko_schema,
+    GeckoRequest as GenerateRequest, GeckoResponse as GenerateResponse
+)
+STARTUP.mark("import")
 
 # -----------------
 # 1. 모델 설정
 # -----------------
-# Hugging Face Hub 모델 ID 대신 로컬 절대 경로 권장
-MODEL_ID = "/mnt/d/MeQuest/models/GECKO-7B"
-
-# 4bit 양자화 설정 (RTX 5070 12GB 환경 기준)
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_use_double_quant=True,
-    bnb_4bit_compute_dtype=torch.float16
-)
+# Hugging Face Hub 모델 ID 대신 로컬 절대 경로 권장 (GECKO_MODEL_PATH 로 변경 가능)
+MODEL_ID = GECKO.model_id
+
+# 시스템 프롬프트 prefix KV 캐시 사용 여부 (PREFIX_CACHE=0 으로 비활성화)
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE", "1") == "1"
+
+# continuous batching 스케줄러 사용 여부 및 최대 동시 디코딩 수 (BATCH_SCHEDULER=0 이면 요청별 generate)
+BATCH_SCHEDULER_ENABLED = os.getenv("BATCH_SCHEDULER", "1") == "1"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
 
 # -----------------
 # 2. FastAPI 및 모델 로드
@@ -27,41 +42,39 @@ app = FastAPI(
     title="MeQuest GECKO-7B Problem Generator",
     version="1.0.1"
 )
+install_server_timing(app, "gecko")
 
 # 모델 및 토크나이저를 전역에 선언하여 서버 시작 시 한 번만 로드합니다.
 try:
-    print(f"Loading Model: {MODEL_ID} with 4-bit quantization...")
+    tokenizer, model = load_model(MODEL_ID, timer=STARTUP)
+    print(f"✅ GECKO-7B Model Loaded Successfully on {model.device}!")
+
+    with STARTUP.phase("prefix_cache"):
+        prefix_cache = PrefixCache(model, tokenizer, GECKO.prompt_prefix, enabled=PREFIX_CACHE_ENABLED).build()
 
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
-    model = AutoModelForCausalLM.from_pretrained(
-        MODEL_ID,
-        quantization_config=bnb_config,
-        device_map="auto",
-        low_cpu_mem_usage=True
-    )
-    print("✅ GECKO-7B Model Loaded Successfully on GPU!")
+    # GECKO_DRAFT_MODEL_PATH 가 있으면 assisted decoding 용 draft 모델을 함께 로드합니다.
+    draft = load_draft(model, tokenizer, GECKO.draft_model_id, timer=STARTUP)
+
+    # 동시 요청을 하나의 배치로 묶어 step 단위로 디코딩합니다.
+    with STARTUP.phase("scheduler"):
+        scheduler = BatchScheduler(
+            model, tokenizer, prefix_cache=prefix_cache, max_batch_size=MAX_BATCH_SIZE, name="gecko"
+        ) if BATCH_SCHEDULER_ENABLED else None
 
 except Exception as e:
     print(f"❌ FATAL ERROR: Failed to load GECKO-7B model: {e}")
     raise RuntimeError(f"Model Load Failed: {e}")
 
+# 동시 실행 수 제한 + 우선순위 대기열 (스케줄러가 있으면 배치 크기만큼, 없으면 1개씩 generate)
+admission = AdmissionController(
+    "gecko", admission_concurrency(MAX_BATCH_SIZE if scheduler is not None else 1), default_priority=GECKO.priority
+)
+STARTUP.done("gecko")
+
 # -----------------
 # 3. Pydantic 요청/응답 모델 정의
 # -----------------
-class GenerateRequest(BaseModel):
-    """Node.js 백엔드로부터 받을 요청 데이터 모델"""
-    topic: str
-    max_new_tokens: int = 256
-    temperature: float = 0.8
-    top_p: float = 0.9
-    repetition_penalty: float = 1.2
-
-class GenerateResponse(BaseModel):
-    """응답 데이터 모델"""
-    model_id: str
-    prompt: str
-    generated_text: str
-    parsed_json: dict | None = None
+# GenerateRequest / GenerateResponse 는 roles.py 에서 model_host 와 공유합니다.
 
 # -----------------
 # 4. API 엔드포인트
@@ -70,68 +83,105 @@ class GenerateResponse(BaseModel):
 @app.get("/health")
 async def health_check():
     """모델 및 서버 상태 확인"""
-    return {"status": "ok", "model_loaded": model is not None}
+    return {
+        "status": "ok",
+        "model_loaded": model is not None,
+        "prefix_cache": prefix_cache.stats(),
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "draft": draft.stats() if draft is not None else None,
+        "parse_stats": GECKO_PARSE_STATS.stats(),
+        "admission": admission.stats(),
+        "cancellation": CANCEL_STATS.stats(),
+        "startup": STARTUP.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """admission 대기열 지표 (Prometheus text format)"""
+    return metrics_text(admission) + CANCEL_STATS.metrics_text()
 
 @app.post("/generate", response_model=GenerateResponse)
-async def generate_problem(request: GenerateRequest):
+async def generate_problem(request: GenerateRequest, http_request: Request):
     """
     주제를 받아 GECKO-7B를 사용하여 객관식 문제를 JSON 형식으로 생성합니다.
     """
-    system_prompt = (
-        "You are an AI problem generator for MeQuest. "
-        "Create one multiple-choice question with 4 options and the correct answer based on the user's topic. "
-        "Respond only with a single JSON object (strictly start with '{' and end with '}'): "
-    )
-
-    full_prompt = f"{system_prompt}\n\nTopic: {request.topic}\n\n"
-
-    try:
-        # 1. 토큰화
-        inputs = tokenizer(full_prompt, return_tensors="pt")
-        inputs.pop("token_type_ids", None)   # 불필요한 key 제거
-        inputs = inputs.to(model.device)
-
-        # 2. 텍스트 생성
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=request.max_new_tokens,
-            do_sample=True,
-            temperature=request.temperature,
-            top_p=request.top_p,
-            repetition_penalty=request.repetition_penalty,
-            pad_token_id=tokenizer.eos_token_id
-        )
-
-        # 3. 결과 디코딩
-        generated_text = tokenizer.decode(
-            outputs[0], skip_special_tokens=True
-        ).replace(full_prompt, "").strip()
-
-        # 4. JSON 파싱 시도
-        parsed_json = None
+    full_prompt = GECKO.build_prompt(request)
+
+    # assisted 요청은 draft 와 함께 단일 시퀀스로 generate 합니다. (스케줄러 미사용)
+    use_draft = request.assisted and draft is not None
+
+    # 대기열에서 슬롯을 얻은 요청만 모델을 실행합니다. (예상 대기 > deadline 이면 429 + Retry-After)
+    # 실행 중 연결이 끊기거나 deadline 이 지나면 생성을 멈추고 슬롯을 돌려줍니다.
+    async with cancel_scope("gecko", http_request, request.deadline_ms, request.max_new_tokens) as cancel, \
+            admission.slot(request.priority, request.deadline_ms):
         try:
-            start_index = generated_text.find("{")
-            end_index = generated_text.rfind("}")
-            if start_index != -1 and end_index != -1:
-                json_str = generated_text[start_index:end_index + 1]
-                parsed_json = json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"⚠️ JSON Parsing Error: {e}")
-
-        return GenerateResponse(
-            model_id=MODEL_ID,
-            prompt=full_prompt,
-            generated_text=generated_text,
-            parsed_json=parsed_json
-        )
-
-    except Exception as e:
-        print(f"❌ Text Generation Error: {e}")
-        raise HTTPException(status_code=500, detail=f"LLM Generation Failed: {e}")
+            if scheduler is not None and not use_draft:
+                # 1~3. 스케줄러 큐에 넣고 배치 디코딩 결과(새로 생성된 텍스트)를 기다립니다.
+                result = await scheduler.submit(full_prompt, GECKO.generation_params(request), cancel)
+                generated_text = result.text
+                generated_tokens = len(result.token_ids)
+            else:
+                # 1. 토큰화 (prefix 가 일치하면 시스템 프롬프트 KV 캐시 복사본을 함께 받음)
+                #    draft 는 prefix 캐시를 공유하지 않으므로 assisted 요청은 전체 prefill
+                with stage("tokenize"):
+                    if use_draft:
+                        inputs, past_key_values = prefix_cache.tokenize(full_prompt), None
+                    else:
+                        inputs, past_key_values = prefix_cache.prepare(full_prompt)
+
+                from transformers import LogitsProcessorList, StoppingCriteriaList
+
+                # constrained 모드: style 스키마를 벗어나는 토큰을 매 step 마스킹
+                schema = gecko_schema(request)
+                logits_processor = LogitsProcessorList(
+                    [JsonSchemaLogitsProcessor(get_grammar(tokenizer, schema), request.max_new_tokens)]
+                    if schema is not None else []
+                )
+
+                # 2. 텍스트 생성 (캐시가 있으면 사용자 suffix 만 prefill, draft 가 있으면 assisted decoding)
+                first_token = FirstTokenTimer()
+                generate_kwargs = dict(
+                    past_key_values=past_key_values,
+                    max_new_tokens=request.max_new_tokens,
+                    do_sample=True,
+                    temperature=request.temperature,
+                    top_p=request.top_p,
+                    repetition_penalty=request.repetition_penalty,
+                    logits_processor=logits_processor,
+                    pad_token_id=tokenizer.eos_token_id,
+                    stopping_criteria=StoppingCriteriaList([CancelCriteria(cancel, inputs["input_ids"].shape[1]), first_token])
+                )
+                # 연결 종료를 감시할 수 있도록 generate 는 스레드에서 실행합니다.
+                if use_draft:
+                    outputs, _ = await asyncio.to_thread(draft.generate, inputs, **generate_kwargs)
+                else:
+                    outputs = await asyncio.to_thread(model.generate, **inputs, **generate_kwargs)
+                first_token.record()
+                cancel.raise_if_cancelled()
+
+                # 3. 결과 디코딩
+                generated_text = tokenizer.decode(
+                    outputs[0], skip_special_tokens=True
+                ).replace(full_prompt, "")
+                generated_tokens = outputs.shape[1] - inputs["input_ids"].shape[1]
+
+            # 4. JSON 파싱 시도 + 스키마 검증 / 파싱 통계 기록
+            with stage("postprocess"):
+                response = GECKO.build_response(MODEL_ID, full_prompt, generated_text)
+                return check_gecko_response(request, response, generated_tokens)
+
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            print(f"❌ Text Generation Error: {e}")
+            raise HTTPException(status_code=500, detail=f"LLM Generation Failed: {e}")
+
+# 비동기 작업 API: POST /jobs/generate → GET /jobs/{id}/result (job_queue.py)
+JOBS = install_jobs(app, "gecko", {"generate": (GenerateRequest, lambda req: generate_problem(req, None))})
 
 # -----------------
 # 5. 서버 실행
 # -----------------
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    uvicorn.run(app, host="0.0.0.0", port=GECKO.port)
@@ -8,23 +8,37 @@
 #   MODEL_ID=/mnt/d/MeQuest/models/GECKO-7B
 #   GECKO_BACKEND=mock | vllm | tgi | openai
 #   BACKEND_URL=http://localhost:8001  # for vllm/tgi (example)
+#   BACKEND_URLS=http://gpu1:8005,http://gpu2:8005   # several upstreams, load-balanced
 #   OPENAI_API_KEY=sk-...              # for openai
-#   OPENAI_BASE_URL=http://localhost:1234/v1   # LM Studio/OpenAI-compatible
+#   OPENAI_BASE_URL=http://localhost:1234/v1   # LM Studio/OpenAI-compatible (OPENAI_BASE_URLS for several)
 #   OPENAI_MODEL=gecko-7b
+#   GECKO_STREAM=1                     # stream vllm/tgi/openai and stop once the JSON closes
+#   HTTP2=0                            # HTTP/2 to upstreams (needs the `h2` package)
+#   BACKEND_HEALTH_PATH=/health        # probed every BACKEND_HEALTH_INTERVAL seconds
+#   GECKO_MAX_CONCURRENCY=16           # in-flight /generate limit; ADMISSION_* in admission.py
+# Load testing without GPUs: point BACKEND_URLS at fake_inference_server.py
+# (see bench_llm_pipeline.py); GECKO_BACKEND=mock returns instantly.
 # ------------------------------------------------------------
 
 from __future__ import annotations
 
 import os
-import re
 import json
+import time
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
 
 import httpx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
 
+from admission import AdmissionController, admission_concurrency, metrics_text
+from cancellation import CANCEL_STATS, CancelToken, GenerationCancelled, cancel_scope, wait_cancellable
+from json_extract import JsonObjectScanner, extract_json_object, validate_problem
+from mequest_common.server_timing import install_server_timing, record, stage
+from upstream_pool import UpstreamPool
+
 # ---------------------- Logging (KST) ------------------------
 class KSTFormatter(logging.Formatter):
     converter = None  # use default time; we format manually
@@ -52,11 +66,64 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "").rstrip("/")
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
 
+def _url_list(name: str, fallback: str) -> List[str]:
+    return [u.strip().rstrip("/") for u in os.environ.get(name, fallback).split(",") if u.strip()]
+
+BACKEND_URLS = _url_list("BACKEND_URLS", BACKEND_URL)
+OPENAI_BASE_URLS = _url_list("OPENAI_BASE_URLS", OPENAI_BASE_URL or "https://api.openai.com/v1")
+
 HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "60"))
+HTTP2 = os.environ.get("HTTP2", "0") == "1"
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+BACKEND_HEALTH_PATH = os.environ.get("BACKEND_HEALTH_PATH", "/models" if BACKEND_KIND == "openai" else "/health")
+BACKEND_HEALTH_INTERVAL = float(os.environ.get("BACKEND_HEALTH_INTERVAL", "10"))
 DEFAULT_STOP = json.loads(os.environ.get("STOP_TOKENS", '["```"]'))
+STREAM_ENABLED = os.environ.get("GECKO_STREAM", "1") == "1"
+# requests allowed in flight to the upstreams at once; the rest wait in a priority queue
+GECKO_MAX_CONCURRENCY = int(os.environ.get("GECKO_MAX_CONCURRENCY", "16"))
 
 # ---------------------- FastAPI ------------------------------
 app = FastAPI(title="MeQuest GECKO Service", version="1.0")
+install_server_timing(app, "gecko_expand")
+
+# Bounded priority queue in front of /generate (429 + Retry-After when the wait exceeds the deadline)
+admission = AdmissionController("generate", admission_concurrency(GECKO_MAX_CONCURRENCY), default_priority="batch")
+
+# ---------------------- Upstream pool ------------------------
+_pool: Optional[UpstreamPool] = None
+
+def get_pool() -> UpstreamPool:
+    """Shared keep-alive client over the configured upstreams (created at startup)."""
+    global _pool
+    if _pool is None:
+        urls = OPENAI_BASE_URLS if BACKEND_KIND == "openai" else BACKEND_URLS
+        if not urls:
+            raise RuntimeError(f"BACKEND_URL(S) is not set for {BACKEND_KIND} backend")
+        headers = {"Content-Type": "application/json"}
+        if BACKEND_KIND == "openai" and OPENAI_API_KEY:
+            headers["Authorization"] = f"Bearer {OPENAI_API_KEY}"
+        _pool = UpstreamPool(
+            urls,
+            timeout=HTTP_TIMEOUT,
+            http2=HTTP2,
+            max_connections=HTTP_MAX_CONNECTIONS,
+            health_path=BACKEND_HEALTH_PATH,
+            health_interval=BACKEND_HEALTH_INTERVAL,
+            headers=headers,
+        )
+    return _pool
+
+@app.on_event("startup")
+async def _start_pool():
+    if BACKEND_KIND in {"vllm", "tgi", "openai"}:
+        await get_pool().start()
+
+@app.on_event("shutdown")
+async def _close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.aclose()
+        _pool = None
 
 # ---------------------- Schemas ------------------------------
 class GenerateRequest(BaseModel):
@@ -76,11 +143,17 @@ class GenerateRequest(BaseModel):
     style: str = Field(default="qa", description="qa | mcq")  # output schema type
     stop: Optional[List[str]] = None    # override default stop tokens
 
+    # admission
+    priority: Optional[str] = Field(default=None, description="interactive | normal | batch")
+    deadline_ms: Optional[int] = Field(default=None, ge=1)   # max time including queueing
+
 class GenerateResponse(BaseModel):
     model_id: str
     prompt: str
     generated_text: str
     parsed_json: Optional[Dict[str, Any]] = None
+    schema_errors: Optional[List[str]] = None   # [] when parsed_json matches the qa/mcq shape
+    stream_stats: Optional[Dict[str, Any]] = None
 
 # ---------------------- Prompting ----------------------------
 def build_prompt(user_text: str, style: str = "qa", strict_json: bool = True) -> str:
@@ -109,36 +182,9 @@ def build_prompt(user_text: str, style: str = "qa", strict_json: bool = True) ->
     return f"Generate a single problem and answer for topic: {user_text}. Return JSON: {schema_hint}"
 
 # ---------------------- Parsing utils ------------------------
-_CODEFENCE = re.compile(r"```(?:json)?|```", re.IGNORECASE)
-
 def extract_json_block(text: str) -> Optional[Dict[str, Any]]:
-    """Remove code fences, find the first {...} and parse."""
-    if not text:
-        return None
-    cleaned = _CODEFENCE.sub("", text).strip()
-    # try direct
-    try:
-        obj = json.loads(cleaned)
-        if isinstance(obj, dict):
-            return obj
-    except Exception:
-        pass
-    # find first {...}
-    m = re.search(r"\{[\s\S]*\}", cleaned)
-    if not m:
-        return None
-    candidate = m.group(0)
-    # compact whitespace
-    candidate = re.sub(r"\s+", " ", candidate).strip()
-    # try parse as-is
-    try:
-        return json.loads(candidate)
-    except Exception:
-        # tiny fix: single quotes to double (very limited)
-        try:
-            return json.loads(candidate.replace("'", '"'))
-        except Exception:
-            return None
+    """First complete top-level {...} in the text (single pass, string aware)."""
+    return extract_json_object(text)
 
 # ---------------------- Backends -----------------------------
 def _infer_mock(prompt: str, req: GenerateRequest) -> str:
@@ -154,13 +200,7 @@ def _infer_mock(prompt: str, req: GenerateRequest) -> str:
         "answer": "10cm"
     }, ensure_ascii=False)
 
-def _infer_vllm(prompt: str, req: GenerateRequest) -> str:
-    """
-    vLLM-style /generate example (adjust to your server schema).
-    Expected BACKEND_URL like http://localhost:8005
-    """
-    if not BACKEND_URL:
-        raise RuntimeError("BACKEND_URL is not set for vllm backend")
+def _payload_vllm(prompt: str, req: GenerateRequest, stream: bool = False) -> Dict[str, Any]:
     payload = {
         "prompt": prompt,
         "temperature": req.temperature,
@@ -169,21 +209,12 @@ def _infer_vllm(prompt: str, req: GenerateRequest) -> str:
         "repetition_penalty": req.repetition_penalty,
         "stop": req.stop or DEFAULT_STOP,
     }
-    with httpx.Client(timeout=HTTP_TIMEOUT) as client:
-        r = client.post(f"{BACKEND_URL}/generate", json=payload)
-        r.raise_for_status()
-        data = r.json()
-        # common patterns: {"text": "..."} or {"generated_text":"..."} or {"output":"..."}
-        return str(data.get("text") or data.get("generated_text") or data.get("output") or data)
+    if stream:
+        payload["stream"] = True
+    return payload
 
-def _infer_tgi(prompt: str, req: GenerateRequest) -> str:
-    """
-    Hugging Face Text Generation Inference (TGI) /generate
-    BACKEND_URL like http://localhost:8080
-    """
-    if not BACKEND_URL:
-        raise RuntimeError("BACKEND_URL is not set for tgi backend")
-    payload = {
+def _payload_tgi(prompt: str, req: GenerateRequest) -> Dict[str, Any]:
+    return {
         "inputs": prompt,
         "parameters": {
             "temperature": req.temperature,
@@ -194,26 +225,10 @@ def _infer_tgi(prompt: str, req: GenerateRequest) -> str:
             "return_full_text": False,
         },
     }
-    with httpx.Client(timeout=HTTP_TIMEOUT) as client:
-        r = client.post(f"{BACKEND_URL}/generate", json=payload)
-        r.raise_for_status()
-        data = r.json()
-        # TGI usually returns list[ { "generated_text": "..." } ]
-        if isinstance(data, list) and data:
-            return str(data[0].get("generated_text") or "")
-        return str(data.get("generated_text") or data)
 
-def _infer_openai(prompt: str, req: GenerateRequest) -> str:
-    """
-    OpenAI-compatible /v1/chat/completions (LM Studio, Ollama proxy, etc.)
-    """
-    base = OPENAI_BASE_URL or "https://api.openai.com/v1"
-    model = OPENAI_MODEL
-    headers = {"Content-Type": "application/json"}
-    if OPENAI_API_KEY:
-        headers["Authorization"] = f"Bearer {OPENAI_API_KEY}"
+def _payload_openai(prompt: str, req: GenerateRequest, stream: bool = False) -> Dict[str, Any]:
     payload = {
-        "model": model,
+        "model": OPENAI_MODEL,
         "messages": [
             {"role": "system", "content": "You are an AI problem generator for MeQuest."},
             {"role": "user", "content": prompt},
@@ -224,37 +239,197 @@ def _infer_openai(prompt: str, req: GenerateRequest) -> str:
         "max_tokens": req.max_new_tokens,
         "stop": req.stop or DEFAULT_STOP,
     }
-    with httpx.Client(timeout=HTTP_TIMEOUT) as client:
-        r = client.post(f"{base}/chat/completions", headers=headers, json=payload)
+    if stream:
+        payload["stream"] = True
+    return payload
+
+async def _infer_vllm(prompt: str, req: GenerateRequest) -> str:
+    """
+    vLLM-style /generate example (adjust to your server schema).
+    Expected BACKEND_URLS like http://localhost:8005
+    """
+    r = await get_pool().request("POST", "/generate", json=_payload_vllm(prompt, req))
+    r.raise_for_status()
+    data = r.json()
+    # common patterns: {"text": "..."} or {"generated_text":"..."} or {"output":"..."}
+    return str(data.get("text") or data.get("generated_text") or data.get("output") or data)
+
+async def _infer_tgi(prompt: str, req: GenerateRequest) -> str:
+    """
+    Hugging Face Text Generation Inference (TGI) /generate
+    BACKEND_URLS like http://localhost:8080
+    """
+    r = await get_pool().request("POST", "/generate", json=_payload_tgi(prompt, req))
+    r.raise_for_status()
+    data = r.json()
+    # TGI usually returns list[ { "generated_text": "..." } ]
+    if isinstance(data, list) and data:
+        return str(data[0].get("generated_text") or "")
+    return str(data.get("generated_text") or data)
+
+async def _infer_openai(prompt: str, req: GenerateRequest) -> str:
+    """
+    OpenAI-compatible /v1/chat/completions (LM Studio, Ollama proxy, etc.)
+    """
+    r = await get_pool().request("POST", "/chat/completions", json=_payload_openai(prompt, req))
+    r.raise_for_status()
+    data = r.json()
+    try:
+        return data["choices"][0]["message"]["content"]
+    except Exception:
+        return str(data)
+
+# ---------------------- Streaming ----------------------------
+# process-wide counters, exposed on /health
+STREAM_STATS: Dict[str, Any] = {
+    "requests": 0,
+    "early_stops": 0,
+    "tokens_received": 0,
+    "tokens_saved_est": 0,
+    "latency_saved_ms_est": 0.0,
+}
+
+async def _sse_data(r: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+    """Yield parsed JSON payloads of `data:` lines from a server-sent event stream."""
+    async for line in r.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if not data or data == "[DONE]":
+            continue
+        yield json.loads(data)
+
+async def _stream_vllm(prompt: str, req: GenerateRequest) -> AsyncIterator[str]:
+    """vLLM api_server /generate with stream=true (NUL-delimited cumulative text)."""
+    async with get_pool().stream("POST", "/generate", json=_payload_vllm(prompt, req, stream=True)) as r:
         r.raise_for_status()
-        data = r.json()
-        try:
-            return data["choices"][0]["message"]["content"]
-        except Exception:
-            return str(data)
-
-def model_generate(prompt: str, req: GenerateRequest) -> str:
-    if BACKEND_KIND == "vllm":
-        return _infer_vllm(prompt, req)
-    if BACKEND_KIND == "tgi":
-        return _infer_tgi(prompt, req)
-    if BACKEND_KIND == "openai":
-        return _infer_openai(prompt, req)
+        buf, prev = b"", ""
+        async for raw in r.aiter_bytes():
+            buf += raw
+            *parts, buf = buf.split(b"\0")
+            for part in parts:
+                if not part.strip():
+                    continue
+                data = json.loads(part)
+                text = data.get("text") or ""
+                text = text[0] if isinstance(text, list) else str(text)
+                if text.startswith(prompt):
+                    text = text[len(prompt):]
+                delta, prev = text[len(prev):], text
+                yield delta
+
+async def _stream_tgi(prompt: str, req: GenerateRequest) -> AsyncIterator[str]:
+    """TGI /generate_stream (SSE, one token per event)."""
+    payload = _payload_tgi(prompt, req)
+    payload["parameters"].pop("return_full_text")
+    async with get_pool().stream("POST", "/generate_stream", json=payload) as r:
+        r.raise_for_status()
+        async for data in _sse_data(r):
+            token = data.get("token") or {}
+            if token.get("special"):
+                continue
+            yield str(token.get("text") or "")
+
+async def _stream_openai(prompt: str, req: GenerateRequest) -> AsyncIterator[str]:
+    """OpenAI-compatible /chat/completions with stream=true (SSE deltas)."""
+    async with get_pool().stream("POST", "/chat/completions", json=_payload_openai(prompt, req, stream=True)) as r:
+        r.raise_for_status()
+        async for data in _sse_data(r):
+            choices = data.get("choices") or [{}]
+            yield str((choices[0].get("delta") or {}).get("content") or "")
+
+async def collect_stream(
+    deltas: AsyncIterator[str], req: GenerateRequest, cancel: Optional[CancelToken] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Drain a delta stream. With strict_json, stop as soon as the first top-level
+    JSON object closes; closing the generator closes the upstream connection,
+    which cancels the generation on the backend. The received count is mirrored
+    into `cancel.generated` so an aborted request can report tokens saved.
+    """
+    scanner = JsonObjectScanner() if req.strict_json else None
+    parts: List[str] = []
+    chunks, stopped_early = 0, False
+    start = time.perf_counter()
+    first_at = None
+    try:
+        async for delta in deltas:
+            if first_at is None:
+                first_at = time.perf_counter()
+            chunks += 1
+            if cancel is not None:
+                cancel.generated = chunks
+            if scanner is not None:
+                end = scanner.feed(delta)
+                if end != -1:
+                    parts.append(delta[:end])
+                    stopped_early = True
+                    break
+            parts.append(delta)
+    finally:
+        await deltas.aclose()
+
+    end = time.perf_counter()
+    elapsed = end - start
+    # time to first streamed token covers upstream queueing + prefill
+    record("prefill", ((first_at or end) - start) * 1000)
+    record("decode", (end - (first_at or end)) * 1000)
+    # Each streamed event is ~one token; estimate the decode time per token
+    per_token = (elapsed - (first_at - start)) / max(chunks - 1, 1) if first_at else 0.0
+    saved = max(req.max_new_tokens - chunks, 0) if stopped_early else 0
+    stats = {
+        "stopped_early": stopped_early,
+        "tokens_received": chunks,
+        "tokens_saved_est": saved,
+        "latency_ms": round(elapsed * 1000, 2),
+        "latency_saved_ms_est": round(saved * per_token * 1000, 2),
+    }
+    STREAM_STATS["requests"] += 1
+    STREAM_STATS["early_stops"] += int(stopped_early)
+    STREAM_STATS["tokens_received"] += chunks
+    STREAM_STATS["tokens_saved_est"] += saved
+    STREAM_STATS["latency_saved_ms_est"] += stats["latency_saved_ms_est"]
+    return "".join(parts), stats
+
+_STREAMERS = {"vllm": _stream_vllm, "tgi": _stream_tgi, "openai": _stream_openai}
+
+async def model_generate(
+    prompt: str, req: GenerateRequest, cancel: Optional[CancelToken] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    if STREAM_ENABLED and BACKEND_KIND in _STREAMERS:
+        return await collect_stream(_STREAMERS[BACKEND_KIND](prompt, req), req, cancel)
+    with stage("upstream"):
+        if BACKEND_KIND == "vllm":
+            return await _infer_vllm(prompt, req), None
+        if BACKEND_KIND == "tgi":
+            return await _infer_tgi(prompt, req), None
+        if BACKEND_KIND == "openai":
+            return await _infer_openai(prompt, req), None
     # default mock
-    return _infer_mock(prompt, req)
+    return _infer_mock(prompt, req), None
 
 # ---------------------- Routes -------------------------------
 @app.get("/health")
-def health():
+async def health():
     return {
         "status": "ok",
         "service": "gecko",
         "model_id": MODEL_ID,
         "backend": BACKEND_KIND,
+        "stream": STREAM_ENABLED and BACKEND_KIND in _STREAMERS,
+        "stream_stats": STREAM_STATS,
+        "upstreams": _pool.stats()["upstreams"] if _pool is not None else [],
+        "admission": admission.stats(),
+        "cancellation": CANCEL_STATS.stats(),
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Admission queue metrics in Prometheus text format."""
+    return metrics_text(admission) + CANCEL_STATS.metrics_text()
+
 @app.post("/generate", response_model=GenerateResponse)
-def generate(req: GenerateRequest):
+async def generate(req: GenerateRequest, request: Request):
     # 1) unify input
     text = req.topic or req.input or req.prompt
     if not text or not str(text).strip():
@@ -263,22 +438,30 @@ def generate(req: GenerateRequest):
     # 2) build prompt
     prompt = build_prompt(text, style=req.style, strict_json=req.strict_json)
 
-    # 3) inference
-    try:
-        out_text = model_generate(prompt, req)
-    except httpx.HTTPError as e:
-        log.exception("Backend HTTP error")
-        raise HTTPException(status_code=502, detail=f"Backend error: {e}") from e
-    except Exception as e:
-        log.exception("Generation error")
-        raise HTTPException(status_code=500, detail=f"Generation failed: {e}") from e
+    # 3) inference (after admission); a client disconnect or the deadline aborts the upstream request
+    async with cancel_scope("generate", request, req.deadline_ms, req.max_new_tokens) as cancel, \
+            admission.slot(req.priority, req.deadline_ms):
+        try:
+            out_text, stream_stats = await wait_cancellable(model_generate(prompt, req, cancel), cancel)
+        except GenerationCancelled:
+            raise
+        except httpx.HTTPError as e:
+            log.exception("Backend HTTP error")
+            raise HTTPException(status_code=502, detail=f"Backend error: {e}") from e
+        except Exception as e:
+            log.exception("Generation error")
+            raise HTTPException(status_code=500, detail=f"Generation failed: {e}") from e
 
     # 4) parse
-    parsed = extract_json_block(out_text)
+    with stage("postprocess"):
+        parsed = extract_json_block(out_text)
+        schema_errors = validate_problem(parsed, req.style) if parsed is not None else None
 
     return GenerateResponse(
         model_id=MODEL_ID,
         prompt=prompt,
         generated_text=out_text,
         parsed_json=parsed,
+        schema_errors=schema_errors,
+        stream_stats=stream_stats,
     )
@@ -0,0 +1,268 @@
+# /mnt/d/MeQuest/LLMService/hf_loader.py
+# ------------------------------------------------------------
+# GECKO / SOLAR / EXAONE 공용 HF 모델 로더 (GPU: 4bit 양자화, CPU: int8 동적 양자화)
+#
+# 재시작 시간을 줄이기 위해
+# - torch / transformers 는 load_model 안에서 import 합니다. (hf_loader import 자체는 가볍게)
+# - 처음 로드할 때 양자화된 모델(또는 .bin 원본을 변환한 모델)을 MODEL_CACHE_DIR 에 safetensors 로
+#   저장하고, 다음 시작부터는 그 체크포인트를 바로 읽습니다. safetensors 는 mmap 으로 읽히고
+#   저장된 config.json 에 quantization_config 가 들어 있어 4bit 변환을 다시 하지 않습니다.
+#   (원본이 이미 safetensors 인 fp16/fp32 로드는 캐시하지 않습니다)
+# - 캐시 키: 원본 경로/ID + 변형(nf4/fp16/fp32) + 원본 파일 크기·수정 시각 + 라이브러리 버전
+#   (원본 가중치나 transformers / bitsandbytes 가 바뀌면 새로 만듭니다, mequest_common.checkpoint_cache)
+# - GPU 가 없는 노드: bitsandbytes 4bit 는 CUDA 전용이라 CPU 에서는 fp32 로 올린 뒤
+#   nn.Linear 를 int8 동적 양자화(torch.ao.quantization.quantize_dynamic)로 바꿉니다.
+#   모델 객체는 그대로 HF 모델이라 generate / prefix 캐시 / 배치 스케줄러 / 요청·응답 형식이 같습니다.
+#   lm_head 는 fp32 로 둡니다. (임베딩과 가중치를 공유하는 모델이 많고, 마지막 logits 오차가 출력에 바로 드러남)
+#   int8 모델은 save_pretrained 가 안 되므로 캐시에는 fp32 (원본이 .bin 인 경우) 만 두고 매 시작마다 양자화합니다.
+#   로드 중에는 fp32 가중치만큼 메모리가 필요합니다. (7B ≈ 28GB, 양자화 후 ≈ 8GB)
+#   활성값 scale 을 배치 텐서 전체로 정하므로 배치 스케줄러에서는 같은 greedy 요청도 함께 묶인
+#   요청에 따라 출력이 조금 달라질 수 있습니다. (fp32 / GPU 경로는 배치와 무관하게 같음)
+# - CPU 스레드: intra-op = CPU_THREADS (기본: 이 프로세스가 쓸 수 있는 코어 수), inter-op = CPU_INTEROP_THREADS
+#   (generate 는 연산 하나씩 순서대로 돌기 때문에 inter-op 스레드가 많으면 코어만 나눠 가짐)
+# - estimate_footprint(): 로드 전에 메모리 크기를 추정합니다. (model_host 가 로드 전에 예산을 비우고 예약)
+#   safetensors 헤더의 텐서 모양(없으면 .bin 크기 / config dtype)으로 파라미터 수를 세고 변형별 바이트로 환산:
+#   nf4 / int8 은 2차원 가중치(임베딩 / lm_head 제외)만 0.5 / 1 바이트, 나머지는 fp16 / fp32.
+#   nf4 체크포인트 캐시가 있으면 그 파일 크기를 그대로 씁니다. Hub ID 처럼 로컬 파일이 없으면 0.
+# Env:
+#   MODEL_CACHE=1                                   체크포인트 캐시 사용 여부
+#   MODEL_CACHE_DIR=~/.cache/mequest/checkpoints    캐시 위치 (모델 크기만큼 디스크 필요)
+#   INFERENCE_DEVICE=auto                           auto (CUDA 있으면 cuda) | cuda | cpu
+#   CPU_QUANTIZE=int8                               CPU 에서 quantize=True 일 때: int8 | none (fp32)
+#   CPU_THREADS=0  CPU_INTEROP_THREADS=1            0 = 사용 가능한 코어 수
+# ------------------------------------------------------------
+
+import json
+import math
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Dict
+
+# 체크포인트 캐시 (MODEL_CACHE / MODEL_CACHE_DIR, EmbeddingService 와 공용)
+from mequest_common.checkpoint_cache import MODEL_CACHE, checkpoint_dir, has_safetensors, is_cached, save_checkpoint
+
+INFERENCE_DEVICE = os.getenv("INFERENCE_DEVICE", "auto")
+CPU_QUANTIZE = os.getenv("CPU_QUANTIZE", "int8")
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))
+CPU_INTEROP_THREADS = int(os.getenv("CPU_INTEROP_THREADS", "1"))
+
+
+def bnb_config():
+    """4bit 양자화 설정 (RTX 5070 12GB 환경 기준)"""
+    import torch
+    from transformers import BitsAndBytesConfig
+
+    return BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_use_double_quant=True,
+        bnb_4bit_compute_dtype=torch.float16,
+    )
+
+
+# ---------------------- CPU 경로 ---------------------------
+def inference_device() -> str:
+    """INFERENCE_DEVICE 에 따라 cuda 또는 cpu 를 반환"""
+    import torch
+
+    if INFERENCE_DEVICE not in ("auto", "cuda", "cpu"):
+        raise ValueError(f"INFERENCE_DEVICE must be auto, cuda or cpu, got {INFERENCE_DEVICE!r}")
+    if INFERENCE_DEVICE == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError("INFERENCE_DEVICE=cuda but CUDA is not available")
+    if INFERENCE_DEVICE == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return INFERENCE_DEVICE
+
+
+def cpu_threads() -> int:
+    if CPU_THREADS > 0:
+        return CPU_THREADS
+    try:
+        return len(os.sched_getaffinity(0))     # taskset / 컨테이너 cpuset 반영
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def configure_cpu_threads() -> Dict[str, int]:
+    """torch CPU 스레드 수 설정 (inter-op 은 프로세스에서 병렬 연산 전에 한 번만 바꿀 수 있음)"""
+    import torch
+
+    torch.set_num_threads(cpu_threads())
+    try:
+        torch.set_num_interop_threads(CPU_INTEROP_THREADS)
+    except RuntimeError:
+        pass    # 이미 다른 모델을 로드했거나 연산을 돌린 프로세스 (기존 값 유지)
+    return {"intra_op": torch.get_num_threads(), "inter_op": torch.get_num_interop_threads()}
+
+
+def quantize_int8(model):
+    """lm_head 를 뺀 nn.Linear 를 int8 동적 양자화 (가중치 int8, 활성값은 실행 시 양자화)"""
+    import torch
+    from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic
+
+    qconfig = {
+        name: default_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, torch.nn.Linear) and not name.endswith("lm_head")
+    }
+    return quantize_dynamic(model, qconfig, dtype=torch.qint8, inplace=True)
+
+
+# ---------------------- 메모리 추정 -------------------------
+_SAFETENSORS_DTYPE_BYTES = {"F64": 8, "F32": 4, "F16": 2, "BF16": 2, "I64": 8, "I32": 4, "I16": 2, "I8": 1, "U8": 1,
+                            "BOOL": 1, "F8_E4M3": 1, "F8_E5M2": 1}
+_CONFIG_DTYPE_BYTES = {"float32": 4, "float16": 2, "bfloat16": 2}
+# 변형별 파라미터당 바이트: (양자화되는 2차원 가중치, 그 밖의 텐서)
+_VARIANT_BYTES = {"nf4": (0.5, 2), "int8": (1, 4), "fp16": (2, 2), "fp32": (4, 4)}
+
+
+def _tensor_shapes(path: Path):
+    """safetensors 헤더만 읽어 (이름, 모양) 을 돌려줍니다. (가중치는 읽지 않음)"""
+    for file in sorted(path.glob("*.safetensors")):
+        with open(file, "rb") as f:
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length))
+        for name, info in header.items():
+            if name != "__metadata__":
+                yield name, info["shape"], _SAFETENSORS_DTYPE_BYTES.get(info["dtype"], 2)
+
+
+def _quantized(name: str, shape) -> bool:
+    return len(shape) == 2 and "embed" not in name and "lm_head" not in name
+
+
+def estimate_footprint(model_id: str, quantize: bool = True) -> int:
+    """로드하기 전 예상 메모리 (bytes). load_model 과 같은 장치 / 변형 기준, 추정할 수 없으면 0"""
+    device = inference_device()
+    nf4 = device == "cuda" and quantize
+    variant = "nf4" if nf4 else ("int8" if device == "cpu" and quantize and CPU_QUANTIZE == "int8"
+                                 else "fp16" if device == "cuda" else "fp32")
+    if nf4:
+        cache_path = checkpoint_dir(model_id, "nf4")
+        if is_cached(cache_path):
+            return sum(p.stat().st_size for p in cache_path.glob("*.safetensors"))
+
+    path = Path(model_id).expanduser()
+    if not path.is_dir():
+        return 0
+    quantized_bytes, full_bytes = _VARIANT_BYTES[variant]
+    if any(path.glob("*.safetensors")):
+        return int(sum(
+            math.prod(shape) * (quantized_bytes if _quantized(name, shape) else full_bytes)
+            for name, shape, _ in _tensor_shapes(path)
+        ))
+    # .bin 만 있으면 파일 크기 / config 의 dtype 으로 파라미터 수를 근사 (모두 양자화 대상으로 봄)
+    size = sum(p.stat().st_size for p in path.glob("*.bin"))
+    config = path / "config.json"
+    dtype = json.loads(config.read_text()).get("torch_dtype") if config.exists() else None
+    return int(size / _CONFIG_DTYPE_BYTES.get(dtype, 4) * quantized_bytes)
+
+
+# ---------------------- 로더 -------------------------------
+def load_model(model_id: str, trust_remote_code: bool = False, quantize: bool = True, timer=None, label: str = "model"):
+    """
+    토크나이저와 모델을 로드하여 (tokenizer, model) 로 반환합니다.
+    quantize=True 이면 GPU 에서는 4bit (nf4), CPU 에서는 int8 동적 양자화 (CPU_QUANTIZE=int8) 입니다.
+    quantize=False 이면 fp16 (CPU 에서는 fp32) 로 올립니다. (작은 draft 모델 등)
+    timer(StartupTimer) 를 넘기면 import / tokenizer / weights / cache_save / quantize 단계를
+    "{label}_..." 이름으로 기록합니다.
+    """
+    from mequest_common.startup_timing import StartupTimer
+
+    timer = timer or StartupTimer()
+    start = time.perf_counter()
+    with timer.phase(f"{label}_import"):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    device = inference_device()
+    threads = configure_cpu_threads() if device == "cpu" else None
+    # CPU int8 은 로드 후 메모리에서 양자화하므로 체크포인트 관점에서는 fp32 로드와 같습니다.
+    int8 = device == "cpu" and quantize and CPU_QUANTIZE == "int8"
+    nf4 = device == "cuda" and quantize
+    variant = "nf4" if nf4 else ("fp16" if device == "cuda" else "fp32")
+    use_cache = MODEL_CACHE and (nf4 or not has_safetensors(model_id))
+    cache_path = checkpoint_dir(model_id, variant) if use_cache else None
+    cached = is_cached(cache_path)
+    source = str(cache_path) if cached else model_id
+    timer.note(f"{label}_checkpoint", {
+        "source": model_id,
+        "device": device,
+        "variant": "int8" if int8 else variant,
+        "threads": threads,
+        "cache": ("hit" if cached else "miss") if use_cache else ("disabled" if not MODEL_CACHE else "not_needed"),
+        "cache_path": str(cache_path) if cache_path is not None else None,
+    })
+    print(
+        f"Loading Model: {model_id} on {device} with "
+        f"{'4-bit quantization' if nf4 else 'int8 dynamic quantization' if int8 else 'full weights'}"
+        f"{f' (cached checkpoint {cache_path})' if cached else ''}..."
+    )
+
+    with timer.phase(f"{label}_tokenizer"):
+        tokenizer = AutoTokenizer.from_pretrained(source, trust_remote_code=trust_remote_code)
+    if nf4:
+        # 캐시된 체크포인트는 config.json 의 quantization_config 로 이미 양자화된 가중치를 그대로 읽습니다.
+        weights = {} if cached else {"quantization_config": bnb_config()}
+    else:
+        weights = {"dtype": torch.float16 if device == "cuda" else torch.float32}
+    with timer.phase(f"{label}_weights"):
+        model = AutoModelForCausalLM.from_pretrained(
+            source,
+            **weights,
+            # CPU 선택 시 GPU 가 있어도 올리지 않음
+            device_map="auto" if device == "cuda" else "cpu",
+            low_cpu_mem_usage=True,
+            trust_remote_code=trust_remote_code
+        )
+    if cached:
+        # 로그 / 통계에는 캐시 경로 대신 원래 모델 ID 가 보이도록 합니다.
+        model.config.name_or_path = model.name_or_path = model_id
+    elif cache_path is not None:
+        with timer.phase(f"{label}_cache_save"):
+            def _save(directory: str):
+                model.save_pretrained(directory)
+                tokenizer.save_pretrained(directory)
+
+            if save_checkpoint(cache_path, _save, {"source": model_id, "variant": variant}):
+                print(f"💾 Cached {variant} checkpoint for {model_id} at {cache_path}")
+    if int8:
+        with timer.phase(f"{label}_quantize"):
+            model = quantize_int8(model)
+    print(f"✅ {model_id} loaded in {time.perf_counter() - start:.1f}s")
+    return tokenizer, model
+
+
+def memory_footprint(model) -> int:
+    """모델 파라미터/버퍼가 차지하는 바이트 수 (양자화 반영)"""
+    if hasattr(model, "get_memory_footprint"):
+        size = int(model.get_memory_footprint())
+    else:
+        size = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+    return size + _packed_bytes(model)
+
+
+def _packed_bytes(model) -> int:
+    """int8 동적 양자화 Linear 의 가중치는 parameters() 에 잡히지 않아 따로 셉니다."""
+    size = 0
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is None or not hasattr(packed, "_weight_bias"):
+            continue
+        weight, bias = packed._weight_bias()
+        size += weight.numel() * weight.element_size()
+        if bias is not None:
+            size += bias.numel() * bias.element_size()
+    return size
+
+
+def release_memory():
+    """모델 해제 후 VRAM 정리"""
+    import gc
+    import torch
+
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
@@ -0,0 +1,427 @@
+# /mnt/d/MeQuest/LLMService/job_queue.py
+# ------------------------------------------------------------
+# 오래 걸리는 생성 / 요약을 위한 비동기 작업 API (submit → poll → result, 선택적 webhook)
+#
+# 긴 /summarize 나 배치 문제 생성은 HTTP 연결을 수십 초 붙잡고 있다가 Node 쪽 타임아웃에 끊겼습니다.
+# - POST /jobs/{kind}        동기 엔드포인트와 같은 본문을 받아 작업 ID 를 바로 돌려줌 (202, Location)
+#                            ?webhook=URL 이면 끝났을 때 {job_id, status, result | error} 를 POST
+# - GET  /jobs/{id}          상태 (queued | running | done | failed | cancelled)
+# - GET  /jobs/{id}/result   done 이면 결과 (동기 응답과 같은 형식), 진행 중이면 202 + Retry-After,
+#                            실패면 원래 상태 코드 + detail
+# - DELETE /jobs/{id}        대기 중이면 취소, 실행 중이면 생성을 중단 (cancel_scope 의 aborted)
+# - GET  /jobs               상태별 작업 수 / 워커 수
+# 동작
+# - 작업은 서비스별 SQLite 파일(JOB_DIR/{service}.sqlite3)에 저장: 재시작해도 대기 / 실행 중 작업이 다시 실행됨
+# - JOB_CONCURRENCY 개의 워커가 오래된 작업부터 꺼내 동기 엔드포인트 함수를 그대로 호출합니다.
+#   priority 를 주지 않은 작업은 JOB_PRIORITY(batch) 로 admission 대기열에 들어가므로
+#   interactive 요청이 항상 먼저 슬롯을 얻습니다. admission 이 429 / 503 으로 거절하면 실패가 아니라
+#   Retry-After (없으면 JOB_RETRY_S) 뒤에 다시 실행합니다.
+# - 같은 kind + 같은 요청(기본값 채운 뒤)은 대기 / 실행 중이거나 보관 중인 작업의 ID 를 그대로 돌려줌 (중복 제거)
+# - 끝난 작업(결과 포함)은 JOB_RESULT_TTL_S 동안 보관 후 삭제
+# - SQLite 접근은 작은 단건 쿼리라 이벤트 루프에서 바로 실행합니다. (WAL, 서비스 프로세스 하나 기준)
+# Env:
+#   JOBS=1                      0 이면 /jobs 라우트를 등록하지 않음
+#   JOB_DIR=~/.cache/mequest/jobs
+#   JOB_CONCURRENCY=1           동시에 실행하는 작업 수 (admission 동시 실행 수 안에서 나눠 씀)
+#   JOB_PRIORITY=batch          priority 없는 작업의 admission 우선순위
+#   JOB_RESULT_TTL_S=3600       결과 보관 시간
+#   JOB_MAX_QUEUED=1000         대기 작업 상한 (넘으면 submit 이 429)
+#   JOB_RETRY_S=5  JOB_MAX_ATTEMPTS=3   (재시작으로 중단된 실행도 시도 횟수에 포함)
+#   JOB_WEBHOOK_TIMEOUT_S=10  JOB_WEBHOOK_RETRIES=3
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+import httpx
+from fastapi import Body, FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+
+log = logging.getLogger("job_queue")
+
+JOBS_ENABLED = os.getenv("JOBS", "1") == "1"
+JOB_DIR = Path(os.getenv("JOB_DIR", str(Path.home() / ".cache" / "mequest" / "jobs")))
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "1"))
+JOB_PRIORITY = os.getenv("JOB_PRIORITY", "batch")
+JOB_RESULT_TTL_S = float(os.getenv("JOB_RESULT_TTL_S", "3600"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_RETRY_S = float(os.getenv("JOB_RETRY_S", "5"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_WEBHOOK_TIMEOUT_S = float(os.getenv("JOB_WEBHOOK_TIMEOUT_S", "10"))
+JOB_WEBHOOK_RETRIES = int(os.getenv("JOB_WEBHOOK_RETRIES", "3"))
+
+STATUSES = ("queued", "running", "done", "failed", "cancelled")
+_FINISHED = ("done", "failed", "cancelled")
+_RETRYABLE = (429, 503)     # admission 거절 / 과부하: 나중에 다시 실행
+
+# kind → (요청 모델, 요청을 받아 동기 엔드포인트와 같은 응답을 돌려주는 코루틴 함수)
+JobHandler = Tuple[Type[BaseModel], Callable[[Any], Awaitable[Any]]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    request TEXT NOT NULL,
+    webhooks TEXT NOT NULL DEFAULT '[]',
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    not_before REAL NOT NULL DEFAULT 0,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, not_before, created_at);
+CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key);
+"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str
+    attempts: int
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    expires_at: Optional[float]
+    request: Dict[str, Any]
+    webhooks: List[str]
+    result: Any = None
+    error: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(
+            id=row["id"], kind=row["kind"], status=row["status"], attempts=row["attempts"],
+            created_at=row["created_at"], started_at=row["started_at"], finished_at=row["finished_at"],
+            expires_at=row["expires_at"], request=json.loads(row["request"]), webhooks=json.loads(row["webhooks"]),
+            result=json.loads(row["result"]) if row["result"] is not None else None,
+            error=json.loads(row["error"]) if row["error"] is not None else None,
+        )
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED
+
+    def to_dict(self) -> Dict[str, Any]:
+        """상태 조회용 (결과 본문은 /result 에서)"""
+        return {
+            "job_id": self.id, "kind": self.kind, "status": self.status, "attempts": self.attempts,
+            "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+            "expires_at": self.expires_at, "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        service: str,
+        handlers: Dict[str, JobHandler],
+        concurrency: int = JOB_CONCURRENCY,
+        path: Optional[Path] = None,
+        ttl_s: float = JOB_RESULT_TTL_S,
+    ):
+        self.service = service
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.path = Path(path) if path is not None else JOB_DIR / f"{service}.sqlite3"
+        self.ttl_s = ttl_s
+        self.db: Optional[sqlite3.Connection] = None
+        self._wake = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._background: set = set()
+        self._stopping = False
+        self.counters = {"submitted": 0, "deduplicated": 0, "requeued": 0, "webhook_failures": 0}
+
+    # ---------- lifecycle ----------
+    def open(self) -> "JobQueue":
+        if self.db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+            self.db.row_factory = sqlite3.Row
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(_SCHEMA)
+            # 지난 프로세스가 실행하다 멈춘 작업: 시도 횟수가 남았으면 다시 대기열로
+            now = time.time()
+            self.db.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, expires_at = ?, error = ? "
+                "WHERE status = 'running' AND attempts >= ?",
+                (now, now + self.ttl_s, json.dumps({"status_code": 500, "detail": "interrupted too many times"}),
+                 JOB_MAX_ATTEMPTS),
+            )
+            recovered = self.db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+            if recovered:
+                log.info("%s: re-queued %d interrupted job(s)", self.service, recovered)
+        return self
+
+    async def start(self):
+        self.open()
+        self._stopping = False
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._janitor()))
+
+    async def stop(self):
+        """실행 중 작업은 중단하고 대기열로 되돌립니다. (다음 시작 때 다시 실행)"""
+        self._stopping = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    # ---------- API ----------
+    def submit(self, kind: str, body: Dict[str, Any], webhook: Optional[str] = None) -> Tuple[Job, bool]:
+        """(작업, 중복 여부). 요청 검증 실패는 422, 대기열이 가득 차면 429"""
+        if kind not in self.handlers:
+            raise HTTPException(status_code=404, detail=f"unknown job kind: {kind}")
+        model, _ = self.handlers[kind]
+        try:
+            request = model.model_validate(body)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors()))
+        if "priority" in model.model_fields and getattr(request, "priority") is None:
+            request = request.model_copy(update={"priority": JOB_PRIORITY})
+        payload = json.dumps(request.model_dump(mode="json"), sort_keys=True, ensure_ascii=False)
+        dedup_key = hashlib.sha256(f"{kind}\x1f{payload}".encode()).hexdigest()
+        now = time.time()
+
+        row = self.db.execute(
+            "SELECT * FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running', 'done') "
+            "AND (expires_at IS NULL OR expires_at > ?) ORDER BY created_at DESC LIMIT 1",
+            (dedup_key, now),
+        ).fetchone()
+        if row is not None:
+            job = Job.from_row(row)
+            self.counters["deduplicated"] += 1
+            if webhook:
+                if job.finished:
+                    self._spawn(self._notify(job, [webhook]))
+                elif webhook not in job.webhooks:
+                    job.webhooks.append(webhook)
+                    self.db.execute("UPDATE jobs SET webhooks = ? WHERE id = ?", (json.dumps(job.webhooks), job.id))
+            return job, True
+
+        queued = self.db.execute("SELECT count(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= JOB_MAX_QUEUED:
+            raise HTTPException(status_code=429, detail=f"job queue is full ({queued} queued)",
+                                headers={"Retry-After": str(int(JOB_RETRY_S))})
+        job_id = uuid.uuid4().hex
+        self.db.execute(
+            "INSERT INTO jobs (id, kind, dedup_key, request, webhooks, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, kind, dedup_key, payload, json.dumps([webhook] if webhook else []), now),
+        )
+        self.counters["submitted"] += 1
+        self._wake.set()
+        return self.get(job_id), False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+            return None
+        return Job.from_row(row)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        if job.status == "queued":
+            self._finish(job.id, "cancelled", error={"status_code": 499, "detail": "cancelled by client"})
+            job = self.get(job_id)
+            self._spawn(self._notify(job))
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()   # 워커가 cancelled 로 기록하고 webhook 을 보냄
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self.db.execute("SELECT status, count(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "service": self.service,
+            "concurrency": self.concurrency,
+            "priority": JOB_PRIORITY,
+            "ttl_s": self.ttl_s,
+            "jobs": {status: counts.get(status, 0) for status in STATUSES},
+            "running": list(self._running),
+            **self.counters,
+        }
+
+    # ---------- 워커 ----------
+    def _claim(self) -> Optional[Job]:
+        row = self.db.execute(
+            "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 "
+            "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND not_before <= ? "
+            "ORDER BY created_at LIMIT 1) RETURNING *",
+            (time.time(), time.time()),
+        ).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    def _next_wakeup_s(self) -> float:
+        row = self.db.execute("SELECT min(not_before) FROM jobs WHERE status = 'queued'").fetchone()
+        if row[0] is None:
+            return 60.0
+        return min(60.0, max(0.05, row[0] - time.time()))
+
+    async def _worker(self, index: int):
+        while True:
+            job = self._claim()
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self._next_wakeup_s())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._run(job))
+            self._running[job.id] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not self._stopping:
+                    continue    # DELETE /jobs/{id} 로 이 작업만 취소됨
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise
+            finally:
+                self._running.pop(job.id, None)
+
+    async def _run(self, job: Job):
+        model, handler = self.handlers[job.kind]
+        try:
+            result = await handler(model.model_validate(job.request))
+        except asyncio.CancelledError:
+            if self._stopping:
+                self.db.execute("UPDATE jobs SET status = 'queued' WHERE id = ?", (job.id,))
+            else:
+                self._finish(job.id, "cancelled", error={"status_code": 499, "detail": "cancelled by client"})
+                self._spawn(self._notify(self.get(job.id)))
+            raise
+        except HTTPException as e:
+            if e.status_code in _RETRYABLE:
+                # admission 이 대기열 / deadline 으로 거절: interactive 요청에 자리를 내주고 나중에 다시
+                retry_s = float((e.headers or {}).get("Retry-After", JOB_RETRY_S))
+                self.db.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = attempts - 1, not_before = ? WHERE id = ?",
+                    (time.time() + retry_s, job.id),
+                )
+                self.counters["requeued"] += 1
+                return
+            self._finish(job.id, "failed", error={"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            log.exception("%s job %s (%s) failed", self.service, job.id, job.kind)
+            self._finish(job.id, "failed", error={"status_code": 500, "detail": str(e)})
+        else:
+            self._finish(job.id, "done", result=jsonable_encoder(result))
+        self._spawn(self._notify(self.get(job.id)))
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[Dict[str, Any]] = None):
+        now = time.time()
+        self.db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, expires_at = ? WHERE id = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             json.dumps(error, ensure_ascii=False) if error is not None else None, now, now + self.ttl_s, job_id),
+        )
+
+    async def _janitor(self):
+        while True:
+            await asyncio.sleep(60)
+            removed = self.db.execute("DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                                      (time.time(),)).rowcount
+            if removed:
+                log.info("%s: removed %d expired job(s)", self.service, removed)
+
+    # ---------- webhook ----------
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _notify(self, job: Optional[Job], urls: Optional[List[str]] = None):
+        if job is None or not (urls or job.webhooks):
+            return
+        payload = {"job_id": job.id, "kind": job.kind, "status": job.status, "result": job.result, "error": job.error}
+        async with httpx.AsyncClient(timeout=JOB_WEBHOOK_TIMEOUT_S) as client:
+            for url in urls or job.webhooks:
+                for attempt in range(JOB_WEBHOOK_RETRIES):
+                    try:
+                        response = await client.post(url, json=payload)
+                        if response.status_code < 500:
+                            break
+                    except httpx.HTTPError as e:
+                        log.warning("webhook %s for job %s failed: %s", url, job.id, e)
+                    await asyncio.sleep(2 ** attempt)
+                else:
+                    self.counters["webhook_failures"] += 1
+
+
+def install_jobs(app: FastAPI, service: str, handlers: Dict[str, JobHandler], **kwargs) -> Optional[JobQueue]:
+    """
+    /jobs 라우트와 워커 시작 / 종료 훅을 등록합니다. (JOBS=0 이면 아무것도 하지 않고 None)
+    handlers: {"summarize": (SummarizeRequest, lambda req: summarize(req, None)), ...}
+    """
+    if not JOBS_ENABLED:
+        return None
+    queue = JobQueue(service, handlers, **kwargs)
+    app.on_event("startup")(queue.start)
+    app.on_event("shutdown")(queue.stop)
+
+    def _job_or_404(job_id: str) -> Job:
+        job = queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"job not found or expired: {job_id}")
+        return job
+
+    @app.post("/jobs/{kind}", status_code=202)
+    async def submit_job(kind: str, body: Dict[str, Any] = Body(...), webhook: Optional[str] = None):
+        """동기 엔드포인트와 같은 요청 본문. 바로 job_id 를 돌려주고 백그라운드에서 실행"""
+        job, deduplicated = queue.submit(kind, body, webhook)
+        return JSONResponse(
+            {**job.to_dict(), "deduplicated": deduplicated}, status_code=202, headers={"Location": f"/jobs/{job.id}"}
+        )
+
+    @app.get("/jobs")
+    async def job_stats():
+        return queue.stats()
+
+    @app.get("/jobs/{job_id}")
+    async def job_status(job_id: str):
+        return _job_or_404(job_id).to_dict()
+
+    @app.get("/jobs/{job_id}/result")
+    async def job_result(job_id: str):
+        job = _job_or_404(job_id)
+        if job.status == "done":
+            return job.result
+        if not job.finished:
+            return JSONResponse(job.to_dict(), status_code=202, headers={"Retry-After": "2"})
+        error = job.error or {}
+        raise HTTPException(status_code=error.get("status_code", 500), detail=error.get("detail", job.status))
+
+    @app.delete("/jobs/{job_id}")
+    async def cancel_job(job_id: str):
+        _job_or_404(job_id)
+        return queue.cancel(job_id).to_dict()
+
+    return queue
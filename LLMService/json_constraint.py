@@ -0,0 +1,421 @@
+# /mnt/d/MeQuest/LLMService/json_constraint.py
+# ------------------------------------------------------------
+# JSON 스키마 제약 디코딩 (transformers logits processor)
+#
+# 프롬프트로 "JSON 한 줄만" 을 부탁하는 대신, 매 step 스키마를 벗어나는 토큰을
+# 마스킹하여 생성 결과가 항상 qa/mcq 스키마(json_extract.PROBLEM_SCHEMAS)에 맞는
+# compact JSON 이 되도록 합니다.
+# - 스키마를 고정 키 순서의 템플릿(리터럴 / 문자열 슬롯 / enum)으로 컴파일
+# - vocab 을 한 번 문자열로 풀어 두고 상태별 허용 토큰 마스크를 캐시
+#   (문자열 내부에서는 따옴표·역슬래시가 없는 토큰을 미리 계산한 마스크로 한 번에 허용)
+# - 남은 생성 토큰 수(max_new_tokens - 생성한 토큰)를 알면, 상태마다 객체를 끝내는 데 필요한 최소 문자 수와
+#   비교하여 예산이 거의 남지 않았을 때는 끝까지 닫을 수 있는 토큰만 허용합니다. (토큰 하나는 최소 한 글자이므로
+#   "다음 상태의 최소 문자 수 <= 그 뒤 남은 토큰 수" 이면 항상 끝낼 수 있음) 문자열 슬롯이 max_new_tokens 에서
+#   잘려 파싱할 수 없는 출력이 나오지 않습니다.
+# - model.generate(logits_processor=...) 와 BatchScheduler 가 함께 사용합니다.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+# torch 는 마스크를 만드는 함수 안에서 import 합니다. (서비스 모듈 import 를 가볍게)
+if TYPE_CHECKING:
+    import torch
+
+DEFAULT_MAX_STRING_CHARS = 512     # maxLength 가 없는 문자열 슬롯의 상한 (도달하면 닫는 따옴표만 허용)
+_OPAQUE = "\ufffd"                 # 멀티바이트 문자의 일부인 byte 토큰 (문자열 내부에서만 허용)
+_BYTE_TOKEN = re.compile(r"<0x([0-9A-Fa-f]{2})>")
+_ESCAPES = set('"\\/bfnrt')
+
+
+# ---------------------- Grammar parts ------------------------
+@dataclass(frozen=True)
+class _Literal:
+    text: str
+
+
+@dataclass(frozen=True)
+class _String:
+    """여는 따옴표 이후의 문자열 내용 + 닫는 따옴표"""
+    min_chars: int        # 공백이 아닌 문자 수 하한 (minLength)
+    max_chars: int
+
+
+@dataclass(frozen=True)
+class _Enum:
+    values: Tuple[str, ...]   # JSON 인코딩된 후보 (예: '"A"', '3')
+
+
+def _compile(schema: Dict[str, Any], parts: list):
+    kind = schema.get("type")
+    if "enum" in schema:
+        parts.append(_Enum(tuple(json.dumps(v, ensure_ascii=False) for v in schema["enum"])))
+    elif kind == "integer" and "minimum" in schema and "maximum" in schema:
+        parts.append(_Enum(tuple(str(v) for v in range(schema["minimum"], schema["maximum"] + 1))))
+    elif kind == "string":
+        parts.append(_Literal('"'))
+        parts.append(_String(schema.get("minLength", 0), schema.get("maxLength", DEFAULT_MAX_STRING_CHARS)))
+    elif kind == "object":
+        parts.append(_Literal("{"))
+        for i, (key, sub) in enumerate(schema.get("properties", {}).items()):
+            parts.append(_Literal(("," if i else "") + json.dumps(key, ensure_ascii=False) + ":"))
+            _compile(sub, parts)
+        parts.append(_Literal("}"))
+    elif kind == "array" and schema.get("minItems") is not None and schema.get("minItems") == schema.get("maxItems"):
+        parts.append(_Literal("["))
+        for i in range(schema["minItems"]):
+            if i:
+                parts.append(_Literal(","))
+            _compile(schema.get("items", {}), parts)
+        parts.append(_Literal("]"))
+    else:
+        raise ValueError(f"unsupported schema for constrained decoding: {schema}")
+
+
+def compile_schema(schema: Dict[str, Any]) -> List[Any]:
+    """
+    스키마를 compact JSON 템플릿으로 컴파일합니다. 모든 properties 를 선언 순서대로
+    출력하며, 배열은 minItems == maxItems 인 고정 길이만 지원합니다.
+    """
+    parts: list = []
+    _compile(schema, parts)
+    merged: list = []
+    for part in parts:
+        if isinstance(part, _Literal) and merged and isinstance(merged[-1], _Literal):
+            merged[-1] = _Literal(merged[-1].text + part.text)
+        else:
+            merged.append(part)
+    return merged
+
+
+# ---------------------- Vocabulary ---------------------------
+class TokenVocab:
+    """토큰 id → 디코딩 문자열 표와 첫 글자 색인 (토크나이저당 한 번 계산)"""
+
+    def __init__(self, tokenizer):
+        import torch
+
+        self.size = max(len(tokenizer), getattr(tokenizer, "vocab_size", 0))
+        special = set(tokenizer.all_special_ids)
+        eos = tokenizer.eos_token_id
+        self.eos_ids = [eos] if isinstance(eos, int) else list(eos or [])
+
+        self.texts: List[Optional[str]] = [None] * self.size
+        for i, tok in enumerate(tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))):
+            if i in special or tok is None:
+                continue
+            m = _BYTE_TOKEN.fullmatch(tok)
+            if m:
+                b = int(m.group(1), 16)
+                text = chr(b) if b < 0x80 else _OPAQUE
+            else:
+                text = tokenizer.convert_tokens_to_string([tok])
+                if tok.startswith("▁") and not text.startswith(" "):
+                    text = " " + text
+            self.texts[i] = text or None
+
+        self.by_first: Dict[str, List[int]] = {}
+        plain = torch.zeros(self.size, dtype=torch.bool)
+        nonspace = torch.zeros(self.size, dtype=torch.bool)
+        self.string_special: List[int] = []     # 문자열 안에서 개별 검사가 필요한 토큰
+        for i, text in enumerate(self.texts):
+            if text is None:
+                continue
+            self.by_first.setdefault(text[0], []).append(i)
+            if '"' in text or "\\" in text or any(ord(c) < 0x20 for c in text):
+                self.string_special.append(i)
+            else:
+                plain[i] = True
+                nonspace[i] = not text.isspace()
+        self.string_plain = plain               # 문자열 안이면 언제나 허용되는 토큰
+        self.string_plain_nonspace = nonspace   # 그중 minLength 를 채우는 (공백이 아닌 글자가 있는) 토큰
+
+
+# ---------------------- Grammar ------------------------------
+State = Tuple[int, Any]   # (part index, part-local data); part index == len(parts) 이면 완료
+
+
+class SchemaGrammar:
+    """컴파일된 스키마 위의 문자 단위 상태 기계 + 상태별 허용 토큰 마스크 캐시"""
+
+    def __init__(self, schema: Dict[str, Any], vocab: TokenVocab):
+        self.parts = compile_schema(schema)
+        self.vocab = vocab
+        self._masks: Dict[Any, torch.Tensor] = {}
+        # _tail[i] = 파트 i 부터 끝까지 출력해야 하는 최소 문자 수
+        self._tail = [0] * (len(self.parts) + 1)
+        for i in range(len(self.parts) - 1, -1, -1):
+            self._tail[i] = self._tail[i + 1] + self._min_chars(self.parts[i])
+
+    @staticmethod
+    def _min_chars(part) -> int:
+        if isinstance(part, _Literal):
+            return len(part.text)
+        if isinstance(part, _String):
+            return part.min_chars + 1       # 내용 + 닫는 따옴표
+        return min(len(v) for v in part.values)
+
+    # ---------- character level ----------
+    def _enter(self, i: int) -> State:
+        if i >= len(self.parts):
+            return (len(self.parts), None)
+        part = self.parts[i]
+        if isinstance(part, _Literal):
+            return (i, 0)
+        if isinstance(part, _String):
+            return (i, (0, 0, False))   # (length, non-space chars, escape pending)
+        return (i, "")
+
+    def start(self) -> State:
+        return self._enter(0)
+
+    def done(self, state: State) -> bool:
+        return state[0] >= len(self.parts)
+
+    def _step(self, state: State, ch: str) -> Optional[State]:
+        i, data = state
+        if i >= len(self.parts):
+            return None
+        part = self.parts[i]
+
+        if isinstance(part, _Literal):
+            if part.text[data] != ch:
+                return None
+            return self._enter(i + 1) if data + 1 == len(part.text) else (i, data + 1)
+
+        if isinstance(part, _String):
+            length, content, escape = data
+            if escape:
+                return (i, (length + 1, content + 1, False)) if ch in _ESCAPES else None
+            if ch == "\\":
+                return (i, (length + 1, content, True))
+            if ch == '"':
+                return self._enter(i + 1) if content >= part.min_chars else None
+            if ord(ch) < 0x20:
+                return None
+            return (i, (length + 1, content + (not ch.isspace()), False))
+
+        # _Enum
+        prefix = data + ch
+        if any(v.startswith(prefix) for v in part.values):
+            if prefix in part.values and not any(len(v) > len(prefix) and v.startswith(prefix) for v in part.values):
+                return self._enter(i + 1)
+            return (i, prefix)
+        if data in part.values:   # 더 긴 후보로 이어지지 않으면 다음 파트로 넘어감
+            return self._step(self._enter(i + 1), ch)
+        return None
+
+    def advance_text(self, state: Optional[State], text: str) -> Optional[State]:
+        for ch in text:
+            if state is None:
+                return None
+            state = self._step(state, ch)
+        return state
+
+    def advance(self, state: Optional[State], token_id: int) -> Optional[State]:
+        """토큰 하나를 소비한 다음 상태. 완료 후의 토큰(EOS/pad)은 무시합니다."""
+        if state is None or self.done(state):
+            return state
+        text = self.vocab.texts[token_id] if token_id < self.vocab.size else None
+        if text is None:
+            return None
+        return self.advance_text(state, text)
+
+    def remaining_chars(self, state: State) -> int:
+        """state 에서 객체를 끝내기 위해 더 출력해야 하는 최소 문자 수"""
+        i, data = state
+        if i >= len(self.parts):
+            return 0
+        part = self.parts[i]
+        if isinstance(part, _Literal):
+            need = len(part.text) - data
+        elif isinstance(part, _String):
+            length, content, escape = data
+            need = escape + max(part.min_chars - content, 0) + 1
+        else:
+            need = min(len(v) - len(data) for v in part.values if v.startswith(data))
+        return need + self._tail[i + 1]
+
+    # ---------- token level ----------
+    def _key(self, state: State):
+        i, data = state
+        if i < len(self.parts) and isinstance(self.parts[i], _String):
+            part = self.parts[i]
+            length, content, escape = data
+            return (i, escape, min(content, part.min_chars), length >= part.max_chars)
+        return state
+
+    def allowed_mask(self, state: State, device, remaining: Optional[int] = None) -> torch.Tensor:
+        """
+        state 에서 허용되는 토큰의 bool 마스크 [V] (상태 키별로 캐시).
+        remaining(이번 토큰 포함 남은 생성 토큰 수)이 객체를 끝내는 데 필요한 최소치에 가까우면 마감 마스크.
+        """
+        import torch
+
+        if remaining is not None and not self.done(state):
+            slack = remaining - 1 - self.remaining_chars(state)
+            if slack <= 1:
+                return self._finish_mask(state, device, max(slack, -1))
+        key = (self._key(state), str(device))
+        mask = self._masks.get(key)
+        if mask is not None:
+            return mask
+
+        vocab = self.vocab
+        mask = torch.zeros(vocab.size, dtype=torch.bool)
+        if self.done(state):
+            mask[vocab.eos_ids] = True
+        else:
+            i, data = state
+            part = self.parts[i]
+            if isinstance(part, _String) and not data[2]:
+                if data[0] < part.max_chars:
+                    mask |= vocab.string_plain
+                candidates = vocab.string_special
+                if data[0] >= part.max_chars:   # 상한 도달: 닫는 따옴표로 시작하는 토큰만
+                    candidates = vocab.by_first.get('"', [])
+            else:
+                candidates = [
+                    t for ch, ids in vocab.by_first.items() if self._step(state, ch) is not None for t in ids
+                ]
+            ok = [t for t in candidates if self.advance_text(state, vocab.texts[t]) is not None]
+            if ok:
+                mask[ok] = True
+        mask = mask.to(device)
+        self._masks[key] = mask
+        return mask
+
+
+    def _finish_mask(self, state: State, device, slack: int) -> torch.Tensor:
+        """
+        남은 토큰으로 끝낼 수 있는 토큰만: remaining_chars(다음 상태) <= remaining_chars(state) + slack.
+        (slack = 이번 토큰 뒤 남는 토큰 수 - 현재 최소 문자 수, -1 이면 매 토큰이 최소 한 글자씩 진행해야 함)
+        """
+        import torch
+
+        key = ("finish", self._key(state), slack, str(device))
+        mask = self._masks.get(key)
+        if mask is not None:
+            return mask
+
+        vocab = self.vocab
+        limit = self.remaining_chars(state) + slack
+        mask = torch.zeros(vocab.size, dtype=torch.bool)
+        i, data = state
+        part = self.parts[i]
+        if isinstance(part, _String) and not data[2]:
+            length, content, _ = data
+            if length < part.max_chars:
+                if slack >= 0:          # 내용 토큰은 최소 문자 수를 늘리지 않음
+                    mask |= vocab.string_plain
+                elif content < part.min_chars:
+                    mask |= vocab.string_plain_nonspace
+            candidates = vocab.by_first.get('"', [])
+        else:
+            candidates = [
+                t for ch, ids in vocab.by_first.items() if self._step(state, ch) is not None for t in ids
+            ]
+        for t in candidates:
+            nxt = self.advance_text(state, vocab.texts[t])
+            if nxt is not None and self.remaining_chars(nxt) <= limit:
+                mask[t] = True
+        mask = mask.to(device)
+        self._masks[key] = mask
+        return mask
+
+
+_GRAMMARS: Dict[Tuple[int, str], SchemaGrammar] = {}
+_VOCABS: Dict[int, TokenVocab] = {}
+
+
+def get_grammar(tokenizer, schema: Dict[str, Any]) -> SchemaGrammar:
+    """(토크나이저, 스키마) 별로 vocab 표와 마스크 캐시를 재사용합니다."""
+    key = (id(tokenizer), json.dumps(schema, sort_keys=True))
+    grammar = _GRAMMARS.get(key)
+    if grammar is None:
+        vocab = _VOCABS.get(id(tokenizer))
+        if vocab is None:
+            vocab = _VOCABS[id(tokenizer)] = TokenVocab(tokenizer)
+        grammar = _GRAMMARS[key] = SchemaGrammar(schema, vocab)
+    return grammar
+
+
+# ---------------------- Per-sequence constraint --------------
+def mask_logits(
+    grammar: SchemaGrammar, state: Optional[State], logits: torch.Tensor, remaining: Optional[int] = None
+) -> torch.Tensor:
+    """
+    logits: [V'] (모델 vocab 크기). 상태를 잃은 경우(None)에는 제약 없이 통과시킵니다.
+    remaining: 이번 토큰을 포함해 남은 생성 토큰 수 (None 이면 예산을 고려하지 않음)
+    """
+    import torch
+
+    if state is None:
+        return logits
+    mask = grammar.allowed_mask(state, logits.device, remaining)
+    n = min(mask.shape[0], logits.shape[-1])
+    out = torch.full_like(logits, float("-inf"))
+    out[..., :n] = torch.where(mask[:n], logits[..., :n], out[..., :n])
+    return out
+
+
+class JsonConstraint:
+    """시퀀스 하나의 제약 상태. logits 마스킹 → 샘플링 → update(token) 순서로 사용합니다."""
+
+    def __init__(self, grammar: SchemaGrammar, max_new_tokens: Optional[int] = None):
+        self.grammar = grammar
+        self.state: Optional[State] = grammar.start()
+        self.max_new_tokens = max_new_tokens
+        self.generated = 0
+
+    @property
+    def done(self) -> bool:
+        return self.state is not None and self.grammar.done(self.state)
+
+    def mask_logits(self, logits: torch.Tensor) -> torch.Tensor:
+        remaining = None if self.max_new_tokens is None else self.max_new_tokens - self.generated
+        return mask_logits(self.grammar, self.state, logits, remaining)
+
+    def update(self, token_id: int):
+        self.generated += 1
+        self.state = self.grammar.advance(self.state, token_id)
+
+
+class JsonSchemaLogitsProcessor:
+    """
+    model.generate(logits_processor=LogitsProcessorList([...])) 용 래퍼.
+    (cancellation.CancelCriteria 처럼 상속 없이 LogitsProcessor 호출 규약만 따릅니다. 모듈 import 시 transformers 불필요)
+    행마다 (토큰, 상태) 이력을 두고 매 호출 input_ids 와 공통 prefix 까지 되감으므로,
+    assisted generation 처럼 후보 토큰이 거절되어 길이가 줄어드는 경우에도 상태가 맞습니다.
+    """
+
+    def __init__(self, grammar: SchemaGrammar, max_new_tokens: Optional[int] = None):
+        self.grammar = grammar
+        self.max_new_tokens = max_new_tokens               # generate() 에 넘긴 값과 같게 (마감 마스크용)
+        self._start: Optional[int] = None                 # 프롬프트 길이 (첫 호출 기준)
+        self._rows: List[Tuple[List[int], List[Optional[State]]]] = []
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        import torch
+
+        if self._start is None:
+            self._start = input_ids.shape[1]
+            self._rows = [([], [self.grammar.start()]) for _ in range(input_ids.shape[0])]
+
+        masked = []
+        for row, (tokens, states) in enumerate(self._rows):
+            ids = input_ids[row, self._start:].tolist()
+            n = 0
+            while n < len(tokens) and n < len(ids) and tokens[n] == ids[n]:
+                n += 1
+            del tokens[n:], states[n + 1:]
+            for token in ids[n:]:
+                tokens.append(token)
+                states.append(self.grammar.advance(states[-1], token))
+            remaining = None if self.max_new_tokens is None else self.max_new_tokens - len(tokens)
+            masked.append(mask_logits(self.grammar, states[-1], scores[row], remaining))
+        return torch.stack(masked)
@@ -0,0 +1,214 @@
+# /mnt/d/MeQuest/LLMService/json_extract.py
+# ------------------------------------------------------------
+# LLM 출력에서 JSON 객체를 한 번의 순회로 추출 (문자열 안의 중괄호 / 따옴표 구분)
+# gecko_service / gecko_service_expand / unified_llm_service 공용
+#
+# - JsonObjectScanner 는 스트리밍 청크를 차례로 받을 수 있습니다. 현재 상태에서 의미 있는 문자
+#   (객체 밖: {, 객체 안: { } ", 문자열 안: " \) 사이를 str.find / 정규식 검색으로 건너뛰고,
+#   현재 열려 있는 객체의 텍스트만 보관하며, 파싱되는 첫 번째 최상위 객체에서 멈춥니다.
+# - PROBLEM_SCHEMAS: build_prompt 의 qa / mcq 형식 (+ unified_llm_service 의 quiz 형식) JSON Schema 와
+#   그 부분집합만 다루는 작은 검증기. json_constraint 가 같은 스키마로 제약 디코딩을 합니다.
+# - ParseStats: 파싱 성공률 / 유효 문제당 생성 토큰 수
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+_STRUCTURAL = re.compile(r'[{}"]')          # 객체 안, 문자열 밖
+_STRING_SPECIAL = re.compile(r'["\\]')       # 문자열 안
+
+
+def _loads(text: str) -> Optional[Dict[str, Any]]:
+    # 모델이 문자열 안에 줄바꿈 / 탭을 그대로 넣는 경우가 많아 strict=False 로 허용
+    for candidate in (text, text.replace("'", '"')):
+        try:
+            obj = json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+        if isinstance(obj, dict):
+            return obj
+    return None
+
+
+class JsonObjectScanner:
+    """청크 단위로 중괄호를 맞춰 가며 처음 완결된 최상위 JSON 객체를 반환합니다."""
+
+    def __init__(self):
+        self.result: Optional[Dict[str, Any]] = None
+        self._parts: List[str] = []      # 현재 열린 객체의 텍스트 (이전 청크분)
+        self._depth = 0
+        self._in_string = False
+        self._escape = False             # 이전 청크가 역슬래시로 끝남
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def feed(self, chunk: str) -> int:
+        """
+        chunk 를 소비합니다. 파싱 가능한 첫 객체가 완성되면 닫는 중괄호 바로 뒤 위치를 반환하고
+        (객체는 .result), 아니면 -1 을 반환합니다.
+        """
+        if self.result is not None or not chunk:
+            return -1
+
+        n = len(chunk)
+        pos = 0
+        if self._escape:
+            self._escape, pos = False, 1
+        start = 0 if self._depth else -1     # 이 청크에서 열린 객체가 시작하는 위치
+
+        while pos < n:
+            if self._depth == 0:
+                # 객체 밖에서는 '{' 만 의미가 있고 따옴표 / 짝 없는 '}' 는 본문 텍스트
+                i = chunk.find("{", pos)
+                if i == -1:
+                    break
+                self._depth, start, pos = 1, i, i + 1
+                continue
+
+            m = (_STRING_SPECIAL if self._in_string else _STRUCTURAL).search(chunk, pos)
+            if m is None:
+                break
+            i = m.start()
+            ch = chunk[i]
+            pos = i + 1
+            if self._in_string:
+                if ch == "\\":
+                    pos = i + 2
+                    if pos > n:
+                        self._escape = True
+                else:
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            else:  # "}"
+                self._depth -= 1
+                if self._depth == 0:
+                    text = "".join(self._parts) + chunk[start:pos]
+                    self._parts = []
+                    start = -1
+                    obj = _loads(text)
+                    if obj is not None:
+                        self.result = obj
+                        return pos
+
+        if self._depth:
+            self._parts.append(chunk[start:])
+        return -1
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """text 에서 처음으로 완결되고 파싱되는 최상위 JSON 객체를 반환합니다."""
+    if not text:
+        return None
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    return scanner.result
+
+
+# ---------------------- Schemas ------------------------------
+PROBLEM_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    # {"question":"...","answer":"..."}
+    "qa": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string", "minLength": 1},
+            "answer": {"type": "string", "minLength": 1},
+        },
+        "required": ["question", "answer"],
+    },
+    # {"question":"...","options":["A) ...","B) ...","C) ...","D) ..."],"answer":"A"}
+    "mcq": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string", "minLength": 1},
+            "options": {"type": "array", "items": {"type": "string", "minLength": 1}, "minItems": 4, "maxItems": 4},
+            "answer": {"type": "string", "enum": ["A", "B", "C", "D"]},
+        },
+        "required": ["question", "options", "answer"],
+    },
+    # unified_llm_service (Ollama) 기본 프롬프트
+    # {"question":"...","options":["...","...","...","..."],"answer_index":0,"explanation":"..."}
+    "quiz": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string", "minLength": 1},
+            "options": {"type": "array", "items": {"type": "string", "minLength": 1}, "minItems": 4, "maxItems": 4},
+            "answer_index": {"type": "integer", "minimum": 0, "maximum": 3},
+            "explanation": {"type": "string"},
+        },
+        "required": ["question", "options", "answer_index", "explanation"],
+    },
+}
+
+_TYPES = {"object": dict, "array": list, "string": str, "integer": int, "number": (int, float), "boolean": bool}
+
+
+def validate(obj: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """여기서 쓰는 JSON Schema 부분집합으로 검증합니다. 오류 목록을 반환 (비어 있으면 유효)"""
+    expected = schema.get("type")
+    if expected and not isinstance(obj, _TYPES[expected]):
+        return [f"{path}: expected {expected}"]
+    errors: List[str] = []
+    if "enum" in schema and obj not in schema["enum"]:
+        errors.append(f"{path}: must be one of {schema['enum']}")
+    if isinstance(obj, str) and len(obj.strip()) < schema.get("minLength", 0):
+        errors.append(f"{path}: must not be empty")
+    if isinstance(obj, str) and len(obj) > schema.get("maxLength", len(obj)):
+        errors.append(f"{path}: longer than {schema['maxLength']} chars")
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        if obj < schema.get("minimum", obj) or obj > schema.get("maximum", obj):
+            errors.append(f"{path}: expected {schema.get('minimum')}..{schema.get('maximum')}")
+    if isinstance(obj, list):
+        if len(obj) < schema.get("minItems", 0) or len(obj) > schema.get("maxItems", len(obj)):
+            errors.append(f"{path}: expected {schema.get('minItems')}..{schema.get('maxItems')} items")
+        for n, item in enumerate(obj):
+            errors.extend(validate(item, schema.get("items", {}), f"{path}[{n}]"))
+    if isinstance(obj, dict):
+        for key in schema.get("required", []):
+            if key not in obj:
+                errors.append(f"{path}.{key}: required")
+        for key, sub in schema.get("properties", {}).items():
+            if key in obj:
+                errors.extend(validate(obj[key], sub, f"{path}.{key}"))
+    return errors
+
+
+def validate_problem(obj: Optional[Dict[str, Any]], style: str) -> List[str]:
+    """파싱된 문제를 build_prompt 가 요청한 qa / mcq 형식으로 검사합니다."""
+    if obj is None:
+        return ["$: no JSON object found"]
+    return validate(obj, PROBLEM_SCHEMAS.get(style, PROBLEM_SCHEMAS["qa"]))
+
+
+class ParseStats:
+    """누적 파싱 성공률 / 스키마 일치율 / 유효 문제당 생성 토큰 수"""
+
+    def __init__(self):
+        self.requests = 0
+        self.parsed = 0
+        self.valid = 0
+        self.tokens = 0
+
+    def record(self, parsed: Optional[Dict[str, Any]], errors: Optional[List[str]], tokens: int = 0):
+        self.requests += 1
+        self.parsed += parsed is not None
+        self.valid += parsed is not None and not errors
+        self.tokens += tokens
+
+    def stats(self) -> Dict[str, Any]:
+        n = max(self.requests, 1)
+        return {
+            "requests": self.requests,
+            "parse_success_rate": round(self.parsed / n, 4),
+            "schema_valid_rate": round(self.valid / n, 4),
+            "generated_tokens": self.tokens,
+            # 실패한 시도의 토큰까지 모두 유효 문제 수로 나눔
+            "tokens_per_valid_problem": round(self.tokens / self.valid, 1) if self.valid else None,
+        }
@@ -0,0 +1,428 @@
+# /mnt/d/MeQuest/LLMService/model_host.py
+# ------------------------------------------------------------
+# 단일 프로세스 멀티 모델 호스트 (GECKO / SOLAR / EXAONE)
+#
+# 세 개의 프로세스(8001/8002/8003) 대신 하나의 프로세스가 /generate, /summarize,
+# /feedback 을 모두 서빙합니다. 모델은 첫 요청 시 lazy 로드되고, 메모리 예산을
+# 넘으면 가장 오래 사용하지 않은(LRU) 모델부터 내립니다. 자주 쓰는 모델은 pin 하여
+# 언로드 대상에서 제외할 수 있습니다.
+# 로드 전에 예상 크기(처음이면 MODEL_HOST_ESTIMATES_GB 또는 체크포인트 추정, 이후 측정값)만큼 공간을 비우고
+# 예약하므로, 서로 다른 모델의 cold 요청이 동시에 와도 예산을 넘겨 함께 올리지 않고 앞선 로드를 기다립니다.
+# Run:
+#   MODEL_HOST_MEMORY_BUDGET_GB=11 MODEL_HOST_PINNED=gecko \
+#       uvicorn model_host:app --host 0.0.0.0 --port 8001
+# (Node.js 의 GECKO/SOLAR/EXAONE URL 은 모두 이 포트를 가리키면 됩니다.)
+# ------------------------------------------------------------
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from admission import AdmissionController, admission_concurrency, metrics_text
+from batch_scheduler import BatchScheduler
+from cancellation import CANCEL_STATS, GenerationCancelled, cancel_scope
+from job_queue import JobHandler, install_jobs
+from hf_loader import estimate_footprint, load_model, memory_footprint, release_memory
+from prefix_cache import PrefixCache
+from roles import GECKO_PARSE_STATS, ROLES, RoleSpec
+from mequest_common.server_timing import install_server_timing, stage
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger("model_host")
+
+# ---------------------- Config -------------------------------
+GB = 1024 ** 3
+MEMORY_BUDGET_GB = float(os.getenv("MODEL_HOST_MEMORY_BUDGET_GB", "11"))
+PINNED_ROLES = [r.strip() for r in os.getenv("MODEL_HOST_PINNED", "").split(",") if r.strip()]
+HOST_ROLES = [r.strip() for r in os.getenv("MODEL_HOST_ROLES", "gecko,solar,exaone").split(",") if r.strip()]
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE", "1") == "1"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+# 처음 로드하는 모델의 예상 크기 (GB, "gecko=4.5,solar=6.5"). 없으면 체크포인트로 추정 (hf_loader.estimate_footprint)
+SIZE_ESTIMATES_GB = {
+    name.strip(): float(size)
+    for name, _, size in (item.partition("=") for item in os.getenv("MODEL_HOST_ESTIMATES_GB", "").split(","))
+    if name.strip() and size.strip()
+}
+# 예산이 모자랄 때 로드 중 / 사용 중인 다른 모델이 내려갈 수 있게 될 때까지 기다리는 최대 시간 (넘으면 경고 후 로드)
+LOAD_WAIT_S = float(os.getenv("MODEL_HOST_LOAD_WAIT_S", "30"))
+
+
+# ---------------------- Registry -----------------------------
+@dataclass
+class ModelEntry:
+    spec: RoleSpec
+    pinned: bool = False
+    tokenizer: Any = None
+    model: Any = None
+    prefix_cache: Optional[PrefixCache] = None
+    scheduler: Optional[BatchScheduler] = None
+    footprint: int = 0            # bytes (로드 후 측정)
+    inflight: int = 0
+    loads: int = 0
+    evictions: int = 0
+    last_used: float = 0.0
+    load_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model_id": self.spec.model_id,
+            "route": self.spec.route,
+            "loaded": self.loaded,
+            "pinned": self.pinned,
+            "footprint_gb": round(self.footprint / GB, 3),
+            "inflight": self.inflight,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "last_used": self.last_used or None,
+            "scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+        }
+
+
+class ModelRegistry:
+    """역할별 모델을 lazy 로드하고, 메모리 예산 초과 시 LRU 로 언로드합니다."""
+
+    def __init__(
+        self,
+        specs: Iterable[RoleSpec],
+        memory_budget: int,
+        pinned: Iterable[str] = (),
+        loader: Callable[[RoleSpec], Any] = None,
+        estimator: Callable[[RoleSpec], int] = None,
+        max_batch_size: int = 8,
+        prefix_cache_enabled: bool = True,
+        max_events: int = 200,
+        load_wait_s: float = LOAD_WAIT_S,
+    ):
+        pinned = set(pinned)
+        # OrderedDict 순서 = LRU 순서 (앞쪽이 가장 오래 전에 사용됨)
+        self.entries: "OrderedDict[str, ModelEntry]" = OrderedDict(
+            (spec.name, ModelEntry(spec=spec, pinned=spec.name in pinned)) for spec in specs
+        )
+        self.memory_budget = memory_budget
+        self.loader = loader or (lambda spec: load_model(spec.model_id, trust_remote_code=spec.trust_remote_code))
+        self.max_batch_size = max_batch_size
+        self.prefix_cache_enabled = prefix_cache_enabled
+        self.estimator = estimator or (
+            lambda spec: int(SIZE_ESTIMATES_GB[spec.name] * GB) if spec.name in SIZE_ESTIMATES_GB
+            else estimate_footprint(spec.model_id)
+        )
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        # 마지막으로 측정한 모델별 메모리 (재로드 전 미리 공간을 비우는 데 사용)
+        self._estimates: Dict[str, int] = {}
+        # 로드 중인 모델이 예약한 메모리. 예약은 _budget(=_evict_lock) 안에서만 바뀌고,
+        # 예약이 있는 동안 다른 로드가 예산을 넘기면 그 로드가 끝날 때까지 기다립니다. (동시 cold 로드 OOM 방지)
+        self._reserved: Dict[str, int] = {}
+        self._evict_lock = asyncio.Lock()
+        self._budget = asyncio.Condition(self._evict_lock)
+        self._waiting = 0
+        self.load_wait_s = load_wait_s
+
+    # ---------- public API ----------
+    @property
+    def used_memory(self) -> int:
+        return sum(e.footprint for e in self.entries.values() if e.loaded)
+
+    @property
+    def reserved_memory(self) -> int:
+        return sum(self._reserved.values())
+
+    @asynccontextmanager
+    async def use(self, name: str):
+        """모델을 (필요 시 로드하여) 사용하는 동안 언로드되지 않도록 붙잡습니다."""
+        # 모델이 내려가 있으면 로드 시간이 여기에 잡힙니다.
+        with stage("model_acquire"):
+            entry = await self._acquire(name)
+        try:
+            yield entry
+        finally:
+            entry.inflight -= 1
+            entry.last_used = time.time()
+            if not entry.inflight and self._waiting:
+                async with self._budget:    # 공간을 기다리는 로드에게 이제 내릴 수 있다고 알림
+                    self._budget.notify_all()
+
+    def pin(self, name: str, pinned: bool = True):
+        self._entry(name).pinned = pinned
+
+    async def evict(self, name: str) -> bool:
+        entry = self._entry(name)
+        async with self._evict_lock:
+            if not entry.loaded or entry.inflight:
+                return False
+            await self._unload(entry, reason="manual")
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_budget_gb": round(self.memory_budget / GB, 3),
+            "memory_used_gb": round(self.used_memory / GB, 3),
+            "memory_reserved_gb": round(self.reserved_memory / GB, 3),
+            "lru_order": [name for name, e in self.entries.items() if e.loaded],
+            "models": {name: e.stats() for name, e in self.entries.items()},
+        }
+
+    # ---------- internals ----------
+    def _entry(self, name: str) -> ModelEntry:
+        if name not in self.entries:
+            raise KeyError(name)
+        return self.entries[name]
+
+    async def _acquire(self, name: str) -> ModelEntry:
+        entry = self._entry(name)
+        # 로드 중 / 로드 직후 다른 코루틴이 언로드하지 못하도록 먼저 붙잡습니다. (로드 전에는 evict 대상도 아님)
+        entry.inflight += 1
+        try:
+            if not entry.loaded:
+                async with entry.load_lock:
+                    if not entry.loaded:
+                        await self._load(entry)
+        except BaseException:
+            entry.inflight -= 1
+            raise
+        entry.last_used = time.time()
+        self.entries.move_to_end(name)
+        return entry
+
+    def _estimate(self, entry: ModelEntry) -> int:
+        """마지막으로 측정한 크기, 처음이면 설정 / 체크포인트 기준 추정"""
+        name = entry.spec.name
+        if name not in self._estimates:
+            try:
+                self._estimates[name] = int(self.estimator(entry.spec))
+            except Exception as e:
+                log.warning("cannot estimate size of %s: %s", name, e)
+                self._estimates[name] = 0
+            if not self._estimates[name]:
+                log.warning("no size estimate for %s (set MODEL_HOST_ESTIMATES_GB); loading without reservation", name)
+        return self._estimates[name]
+
+    async def _load(self, entry: ModelEntry):
+        name = entry.spec.name
+        needed = self._estimate(entry)
+        deadline = time.monotonic() + self.load_wait_s
+        async with self._budget:
+            # 다른 모델이 로드 중이거나 사용 중이라 공간이 없으면 그 모델을 LRU 로 내릴 수 있을 때까지 기다립니다.
+            while not await self._evict_for(needed, keep=name) and self._releasable(keep=name):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._waiting += 1
+                try:
+                    await asyncio.wait_for(self._budget.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                finally:
+                    self._waiting -= 1
+            if not self._fits(needed):
+                self._warn_over_budget(needed)
+            self._reserved[name] = needed
+
+        start = time.perf_counter()
+        try:
+            tokenizer, model = await asyncio.to_thread(self.loader, entry.spec)
+            load_seconds = time.perf_counter() - start
+
+            prefix_cache = await asyncio.to_thread(
+                PrefixCache(model, tokenizer, entry.spec.prompt_prefix, enabled=self.prefix_cache_enabled).build
+            )
+        except BaseException:
+            async with self._budget:
+                self._reserved.pop(name, None)
+                self._budget.notify_all()
+            raise
+        entry.tokenizer, entry.model, entry.prefix_cache = tokenizer, model, prefix_cache
+        entry.scheduler = BatchScheduler(
+            model, tokenizer, prefix_cache=prefix_cache, max_batch_size=self.max_batch_size, name=name
+        )
+        entry.footprint = memory_footprint(model)
+        entry.loads += 1
+        self._estimates[name] = entry.footprint
+        self._record("load", entry, seconds=time.perf_counter() - start, load_seconds=load_seconds,
+                     reserved_gb=round(needed / GB, 3))
+
+        # 예약을 실제 크기로 바꾸고, 예상보다 커서 예산을 넘었다면 다른 모델을 추가로 내립니다.
+        async with self._budget:
+            self._reserved.pop(name, None)
+            if not await self._evict_for(0, keep=name):
+                self._warn_over_budget(0)
+            self._budget.notify_all()
+
+    def _fits(self, needed: int) -> bool:
+        return self.used_memory + self.reserved_memory + needed <= self.memory_budget
+
+    def _releasable(self, keep: str) -> bool:
+        """기다리면 공간이 생길 수 있는지 (로드 중인 예약, 또는 pin 되지 않았지만 사용 중인 모델)"""
+        return bool(self._reserved) or any(
+            e.loaded and e.inflight and not e.pinned for name, e in self.entries.items() if name != keep
+        )
+
+    async def _evict_for(self, needed: int, keep: str) -> bool:
+        """
+        used + 예약 + needed 가 예산 이하가 될 때까지 pin/사용 중이 아닌 모델을 LRU 순으로 언로드합니다.
+        예산 안에 들어오면 True
+        """
+        for name, entry in list(self.entries.items()):
+            if self._fits(needed):
+                return True
+            if name == keep or not entry.loaded or entry.pinned or entry.inflight:
+                continue
+            await self._unload(entry, reason="lru")
+        return self._fits(needed)
+
+    def _warn_over_budget(self, needed: int):
+        log.warning(
+            "memory budget exceeded: used=%.2fGB reserved=%.2fGB needed=%.2fGB budget=%.2fGB "
+            "(remaining models pinned, in use or loading)",
+            self.used_memory / GB, self.reserved_memory / GB, needed / GB, self.memory_budget / GB,
+        )
+
+    async def _unload(self, entry: ModelEntry, reason: str):
+        start = time.perf_counter()
+        # 먼저 엔트리에서 떼어내 새 요청이 닫히는 스케줄러를 받지 않게 하고,
+        # 워커 스레드 join / gc 는 이벤트 루프를 막지 않도록 스레드에서 실행합니다.
+        scheduler = entry.scheduler
+        footprint = entry.footprint
+        entry.tokenizer = entry.model = entry.prefix_cache = entry.scheduler = None
+        entry.footprint = 0
+        entry.evictions += 1
+        if scheduler is not None:
+            await asyncio.to_thread(scheduler.close)
+        del scheduler
+        await asyncio.to_thread(release_memory)
+        self._record("evict", entry, seconds=time.perf_counter() - start, reason=reason, freed_gb=round(footprint / GB, 3))
+
+    def _record(self, event: str, entry: ModelEntry, seconds: float, **extra):
+        record = {
+            "ts": time.time(),
+            "event": event,
+            "role": entry.spec.name,
+            "model_id": entry.spec.model_id,
+            "seconds": round(seconds, 3),
+            "memory_used_gb": round(self.used_memory / GB, 3),
+            **extra,
+        }
+        self.events.append(record)
+        log.info("model %s: %s", event, record)
+
+
+# ---------------------- FastAPI ------------------------------
+app = FastAPI(title="MeQuest Multi-Model Host", version="1.0.0")
+install_server_timing(app, "model_host")
+
+registry = ModelRegistry(
+    specs=[ROLES[name] for name in HOST_ROLES],
+    memory_budget=int(MEMORY_BUDGET_GB * GB),
+    pinned=PINNED_ROLES,
+    max_batch_size=MAX_BATCH_SIZE,
+    prefix_cache_enabled=PREFIX_CACHE_ENABLED,
+)
+
+
+@app.on_event("startup")
+async def preload_pinned():
+    """pin 된 모델은 첫 요청을 기다리지 않고 시작 시 로드합니다."""
+    for name in PINNED_ROLES:
+        if name in registry.entries:
+            async with registry.use(name):
+                pass
+
+
+# 역할(라우트)마다 대기열을 따로 둡니다. (피드백 요청이 배치 생성 뒤에 밀리지 않도록)
+admission: Dict[str, AdmissionController] = {}
+# 라우트 이름(generate / summarize / feedback) → 비동기 작업 핸들러 (job_queue.py)
+job_handlers: Dict[str, JobHandler] = {}
+
+
+def _register_route(spec: RoleSpec):
+    admission[spec.name] = AdmissionController(
+        spec.name, admission_concurrency(MAX_BATCH_SIZE), default_priority=spec.priority
+    )
+
+    async def handler(request: spec.request_model, http_request: Request):
+        prompt = spec.build_prompt(request)
+        async with cancel_scope(spec.name, http_request, request.deadline_ms, request.max_new_tokens) as cancel, \
+                admission[spec.name].slot(request.priority, request.deadline_ms):
+            try:
+                async with registry.use(spec.name) as entry:
+                    result = await entry.scheduler.submit(prompt, spec.generation_params(request), cancel)
+            except GenerationCancelled:
+                raise
+            except Exception as e:
+                log.exception("%s failed", spec.name)
+                raise HTTPException(status_code=500, detail=f"{spec.name} generation failed: {e}") from e
+        response = spec.build_response(spec.model_id, prompt, result.text)
+        if spec.check_response is not None:
+            # gecko_service 와 같은 스키마 검증 + 파싱 통계 (GECKO_PARSE_STATS)
+            with stage("postprocess"):
+                response = spec.check_response(request, response, len(result.token_ids))
+        return response
+
+    handler.__name__ = f"{spec.name}_handler"
+    app.post(spec.route, response_model=spec.response_model)(handler)
+    job_handlers[spec.route.strip("/")] = (spec.request_model, lambda req: handler(req, None))
+
+
+for _spec in registry.entries.values():
+    _register_route(_spec.spec)
+
+# POST /jobs/{generate|summarize|feedback} → GET /jobs/{id}/result
+jobs = install_jobs(app, "model_host", job_handlers)
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "service": "model_host",
+        **registry.stats(),
+        "parse_stats": GECKO_PARSE_STATS.stats(),
+        "admission": {name: c.stats() for name, c in admission.items()},
+        "cancellation": CANCEL_STATS.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """역할별 admission 대기열 지표 (Prometheus text format)"""
+    return metrics_text(*admission.values()) + CANCEL_STATS.metrics_text()
+
+
+@app.get("/models")
+async def list_models():
+    """레지스트리 상태 + 최근 load/evict 이벤트와 소요 시간"""
+    return {**registry.stats(), "events": list(registry.events)}
+
+
+@app.post("/models/{name}/pin")
+async def pin_model(name: str, pinned: bool = True):
+    try:
+        registry.pin(name, pinned)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model role: {name}")
+    return registry.entries[name].stats()
+
+
+@app.post("/models/{name}/evict")
+async def evict_model(name: str):
+    try:
+        evicted = await registry.evict(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model role: {name}")
+    return {"evicted": evicted, **registry.entries[name].stats()}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("MODEL_HOST_PORT", "8001")))
@@ -0,0 +1,310 @@
+# /mnt/d/MeQuest/LLMService/model_router.py
+# ------------------------------------------------------------
+# 요청별 모델(백엔드) 선택: 작업 종류 + 입력 길이 + 대기 중 요청 수 + 관측 지연 시간
+#
+# unified_llm_service 는 호출자가 model 을 지정하지 않으면 항상 LLM_MODEL_ID 하나로 보냈습니다.
+# 라우터는 요청마다 백엔드(Ollama 모델 또는 GECKO / SOLAR / EXAONE 서비스)를 고릅니다.
+# - 작업(generate / summarize / feedback)을 처리할 수 있는 정상 백엔드만 후보
+#   (max_input_tokens 를 넘는 입력은 그 백엔드를 후보에서 뺌)
+# - 예상 지연 = 작업별 처리 시간 EWMA × (앞에 밀린 라운드 수 + 1)
+#   라운드 수 = 실행 중인 요청 수 // concurrency
+# - 긴 입력(ROUTER_LONG_INPUT_TOKENS 이상): 가장 큰 모델(tier 최대)로 보냄 (긴 요약은 품질 우선)
+# - 그 외: 예상 지연이 작업 SLO 안인 후보 중 가장 큰 모델, 없으면 예상 지연이 가장 짧은 모델
+#   → 한가할 때는 큰 모델, 몰리면 짧은 피드백부터 작은 모델로 넘어감
+# - 연속 실패 ROUTER_EJECT_AFTER 번이면 ROUTER_EJECT_S 동안 후보에서 제외 (upstream_pool 과 같은 방식)
+# - 결정(작업, 백엔드, 이유, 예상 / 실제 지연)을 최근 ROUTER_DECISION_LOG 개 보관 (/router)
+# 이 모듈은 백엔드를 호출하지 않습니다. (선택 + 관측만, 호출은 서비스가 함)
+# 시뮬레이션: bench_router.py (stub 백엔드)
+# Env:
+#   ROUTER=1                              0 이면 항상 기본 백엔드 (기존 동작)
+#   ROUTER_BACKENDS=[{...}, ...]          JSON. 없으면 LLM_MODEL_ID (+ 아래 URL / 모델) 로 구성
+#       {"name": "qwen3b", "kind": "ollama", "target": "qwen2.5:3b", "tier": 1,
+#        "tasks": ["feedback", "summarize"], "concurrency": 4, "max_input_tokens": 4000}
+#       kind: ollama (target = 모델 이름) | role (target = GECKO / SOLAR / EXAONE 서비스 URL)
+#   LLM_SMALL_MODEL_ID=                   작은 Ollama 모델 (예: qwen2.5:3b)
+#   GECKO_URL= SOLAR_URL= EXAONE_URL=     역할 서비스 (예: http://localhost:8003)
+#   ROUTER_SLO_MS=generate=20000,summarize=30000,feedback=8000
+#   ROUTER_LONG_INPUT_TOKENS=1500         ROUTER_INITIAL_MS=5000 (첫 관측 전 처리 시간)
+#   ROUTER_EJECT_AFTER=3  ROUTER_EJECT_S=30  ROUTER_DECISION_LOG=200
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+TASKS = ("generate", "summarize", "feedback")
+
+ROUTER_ENABLED = os.getenv("ROUTER", "1") == "1"
+ROUTER_LONG_INPUT_TOKENS = int(os.getenv("ROUTER_LONG_INPUT_TOKENS", "1500"))
+ROUTER_INITIAL_MS = float(os.getenv("ROUTER_INITIAL_MS", "5000"))
+ROUTER_EJECT_AFTER = int(os.getenv("ROUTER_EJECT_AFTER", "3"))
+ROUTER_EJECT_S = float(os.getenv("ROUTER_EJECT_S", "30"))
+ROUTER_DECISION_LOG = int(os.getenv("ROUTER_DECISION_LOG", "200"))
+_EWMA_ALPHA = 0.2
+# 목록에 없는 모델을 직접 지정한 요청을 requests 통계에 모으는 이름 (모델 이름마다 항목을 만들지 않음)
+UNLISTED = "(unlisted)"
+
+
+def parse_slo(value: str) -> Dict[str, float]:
+    """'generate=20000,feedback=8000' → {"generate": 20000.0, ...} (없는 작업은 기본값)"""
+    slo = {"generate": 20000.0, "summarize": 30000.0, "feedback": 8000.0}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        task, _, ms = item.partition("=")
+        if task not in TASKS:
+            raise ValueError(f"ROUTER_SLO_MS: unknown task {task!r}")
+        slo[task] = float(ms)
+    return slo
+
+
+ROUTER_SLO_MS = parse_slo(os.getenv("ROUTER_SLO_MS", ""))
+
+
+@dataclass(frozen=True)
+class BackendSpec:
+    name: str
+    kind: str = "ollama"                  # ollama | role
+    target: str = ""                      # Ollama 모델 이름 또는 역할 서비스 URL
+    tasks: Tuple[str, ...] = TASKS
+    tier: int = 1                         # 클수록 큰(느리지만 좋은) 모델
+    concurrency: int = 1                  # 동시에 처리하는 요청 수 (대기 라운드 계산용)
+    max_input_tokens: int = 0             # 0 = 제한 없음
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "BackendSpec":
+        spec = cls(
+            name=d["name"], kind=d.get("kind", "ollama"), target=d.get("target") or d["name"],
+            tasks=tuple(d.get("tasks") or TASKS), tier=int(d.get("tier", 1)),
+            concurrency=max(1, int(d.get("concurrency", 1))), max_input_tokens=int(d.get("max_input_tokens", 0)),
+        )
+        if spec.kind not in ("ollama", "role"):
+            raise ValueError(f"backend {spec.name}: kind must be ollama or role, got {spec.kind!r}")
+        unknown = set(spec.tasks) - set(TASKS)
+        if unknown:
+            raise ValueError(f"backend {spec.name}: unknown tasks {sorted(unknown)}")
+        return spec
+
+
+def default_backends(model_id: str, concurrency: int = 1) -> List[BackendSpec]:
+    """ROUTER_BACKENDS 가 없을 때: 기본 Ollama 모델 + (설정된 경우) 작은 모델 / 역할 서비스"""
+    raw = os.getenv("ROUTER_BACKENDS", "").strip()
+    if raw:
+        return [BackendSpec.from_dict(d) for d in json.loads(raw)]
+    backends = [BackendSpec(name=model_id, target=model_id, tier=2, concurrency=concurrency)]
+    small = os.getenv("LLM_SMALL_MODEL_ID", "")
+    if small:
+        backends.append(BackendSpec(name=small, target=small, tier=1, concurrency=concurrency))
+    for name, task in (("gecko", "generate"), ("solar", "summarize"), ("exaone", "feedback")):
+        url = os.getenv(f"{name.upper()}_URL", "")
+        if url:
+            backends.append(BackendSpec(name=name, kind="role", target=url.rstrip("/"), tasks=(task,), tier=1))
+    return backends
+
+
+@dataclass
+class RouteDecision:
+    task: str
+    backend: str
+    model: str                            # Ollama 모델 이름 또는 역할 서비스 URL
+    kind: str
+    reason: str                           # pinned | disabled | fallback | long_input | within_slo | fastest
+    input_tokens: int
+    queue_depth: int                      # 선택 시점 이 백엔드에서 실행 중인 요청 수
+    predicted_ms: float
+    slo_ms: float
+    at: float = field(default_factory=time.time)
+    latency_ms: Optional[float] = None
+    status: str = "running"               # running | ok | error | cancelled
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        out["predicted_ms"] = round(self.predicted_ms, 1)
+        if self.latency_ms is not None:
+            out["latency_ms"] = round(self.latency_ms, 1)
+        return out
+
+
+class _BackendState:
+    def __init__(self, spec: BackendSpec, initial_ms: float):
+        self.spec = spec
+        self.initial_ms = initial_ms
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.ejected_until = 0.0
+        self.ewma_ms: Dict[str, float] = {}
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def service_ms(self, task: str) -> float:
+        return self.ewma_ms.get(task, self.initial_ms)
+
+    def predicted_ms(self, task: str) -> float:
+        return self.service_ms(task) * (self.inflight // self.spec.concurrency + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **asdict(self.spec),
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ewma_ms": {task: round(ms, 1) for task, ms in self.ewma_ms.items()},
+        }
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        backends: List[BackendSpec],
+        slo_ms: Optional[Dict[str, float]] = None,
+        long_input_tokens: int = ROUTER_LONG_INPUT_TOKENS,
+        initial_ms: float = ROUTER_INITIAL_MS,
+        enabled: bool = ROUTER_ENABLED,
+        decision_log: int = ROUTER_DECISION_LOG,
+    ):
+        if not backends:
+            raise ValueError("ModelRouter needs at least one backend")
+        names = [b.name for b in backends]
+        if len(set(names)) != len(names):
+            raise ValueError(f"duplicate backend names: {names}")
+        self.default = backends[0].name            # ROUTER=0 / 후보가 없을 때
+        self.slo_ms = dict(slo_ms or ROUTER_SLO_MS)
+        self.long_input_tokens = long_input_tokens
+        self.initial_ms = initial_ms
+        self.enabled = enabled
+        self._states: Dict[str, _BackendState] = {b.name: _BackendState(b, initial_ms) for b in backends}
+        self.decisions: Deque[RouteDecision] = deque(maxlen=decision_log)
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.reasons: Dict[str, int] = {}
+
+    # ---------- 선택 ----------
+    def backend(self, name: str) -> BackendSpec:
+        return self._states[name].spec
+
+    def choose(
+        self,
+        task: str,
+        input_tokens: int = 0,
+        pinned: Optional[str] = None,
+        eligible: Optional[Callable[[BackendSpec], bool]] = None,
+    ) -> RouteDecision:
+        """
+        pinned: 호출자가 지정한 모델 (백엔드 이름 또는 Ollama 모델 이름, 목록에 없으면 그 Ollama 모델로 보냄)
+        eligible: 요청 형태상 보낼 수 없는 백엔드를 거르는 조건 (예: RAG 프롬프트는 GECKO 불가)
+        """
+        if task not in TASKS:
+            raise ValueError(f"unknown task: {task}")
+        if pinned:
+            return self._decide(task, self._pinned_state(pinned), "pinned", input_tokens)
+        if not self.enabled:
+            return self._decide(task, self._states[self.default], "disabled", input_tokens)
+
+        serving = [
+            s for s in self._states.values()
+            if task in s.spec.tasks and (eligible is None or eligible(s.spec))
+        ]
+        candidates = [s for s in serving if s.healthy] or serving
+        fits = [s for s in candidates if not s.spec.max_input_tokens or input_tokens <= s.spec.max_input_tokens]
+        candidates = fits or candidates
+        if not candidates:
+            return self._decide(task, self._states[self.default], "fallback", input_tokens)
+
+        if input_tokens >= self.long_input_tokens:
+            top = max(s.spec.tier for s in candidates)
+            best = min((s for s in candidates if s.spec.tier == top), key=lambda s: s.predicted_ms(task))
+            return self._decide(task, best, "long_input", input_tokens)
+
+        slo = self.slo_ms.get(task, float("inf"))
+        within = [s for s in candidates if s.predicted_ms(task) <= slo]
+        if within:
+            best = min(within, key=lambda s: (-s.spec.tier, s.predicted_ms(task)))
+            return self._decide(task, best, "within_slo", input_tokens)
+        best = min(candidates, key=lambda s: (s.predicted_ms(task), -s.spec.tier))
+        return self._decide(task, best, "fastest", input_tokens)
+
+    def _pinned_state(self, pinned: str) -> _BackendState:
+        state = self._states.get(pinned)
+        if state is None:
+            state = next((s for s in self._states.values() if s.spec.target == pinned), None)
+        if state is None:
+            # 목록에 없는 Ollama 모델을 직접 지정 (기존 model 필드 동작 유지)
+            # 클라이언트가 보낸 이름이라 _states 에 넣지 않고 요청마다 임시 상태로 둡니다. (EWMA / 축출 없음)
+            state = self._unlisted(pinned)
+        return state
+
+    def _unlisted(self, target: str) -> _BackendState:
+        return _BackendState(BackendSpec(name=target, target=target, tier=0), self.initial_ms)
+
+    def _decide(self, task: str, state: _BackendState, reason: str, input_tokens: int) -> RouteDecision:
+        return RouteDecision(
+            task=task, backend=state.spec.name, model=state.spec.target, kind=state.spec.kind, reason=reason,
+            input_tokens=input_tokens, queue_depth=state.inflight, predicted_ms=state.predicted_ms(task),
+            slo_ms=self.slo_ms.get(task, 0.0),
+        )
+
+    # ---------- 관측 ----------
+    @asynccontextmanager
+    async def track(self, decision: RouteDecision, cancelled: Tuple[type, ...] = ()) -> AsyncIterator[RouteDecision]:
+        """
+        선택한 백엔드로 요청을 보내는 동안 감쌉니다. 실행 중 수를 올리고, 끝나면 처리 시간 EWMA 갱신.
+        cancelled 에 해당하는 예외(클라이언트 취소 등)는 실패로 세지 않습니다.
+        """
+        state, key = self._states.get(decision.backend), decision.backend
+        if state is None:
+            state, key = self._unlisted(decision.model), UNLISTED
+        state.inflight += 1
+        state.requests += 1
+        self.counts.setdefault(decision.task, {})
+        self.counts[decision.task][key] = self.counts[decision.task].get(key, 0) + 1
+        self.reasons[decision.reason] = self.reasons.get(decision.reason, 0) + 1
+        self.decisions.append(decision)
+        start = time.perf_counter()
+        try:
+            yield decision
+        except cancelled:
+            decision.status = "cancelled"
+            raise
+        except BaseException:
+            decision.status = "error"
+            state.errors += 1
+            state.consecutive_errors += 1
+            if state.consecutive_errors >= ROUTER_EJECT_AFTER:
+                state.ejected_until = time.monotonic() + ROUTER_EJECT_S
+            raise
+        else:
+            ms = (time.perf_counter() - start) * 1000
+            decision.status = "ok"
+            state.consecutive_errors = 0
+            previous = state.ewma_ms.get(decision.task)
+            state.ewma_ms[decision.task] = ms if previous is None else previous + _EWMA_ALPHA * (ms - previous)
+        finally:
+            decision.latency_ms = (time.perf_counter() - start) * 1000
+            state.inflight -= 1
+
+    def stats(self, recent: int = 20) -> Dict[str, Any]:
+        slo_hits: Dict[str, List[int]] = {}
+        for d in self.decisions:
+            if d.status == "ok":
+                hit = slo_hits.setdefault(d.task, [0, 0])
+                hit[0] += d.latency_ms <= d.slo_ms
+                hit[1] += 1
+        return {
+            "enabled": self.enabled,
+            "slo_ms": self.slo_ms,
+            "long_input_tokens": self.long_input_tokens,
+            "backends": [s.stats() for s in self._states.values()],
+            "requests": self.counts,
+            "reasons": self.reasons,
+            # 최근 결정 로그 기준 SLO 안에 끝난 비율
+            "slo_attainment": {task: round(ok / n, 3) for task, (ok, n) in slo_hits.items()},
+            "recent": [d.to_dict() for d in list(self.decisions)[-recent:]] if recent else [],
+        }
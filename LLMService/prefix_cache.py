@@ -0,0 +1,110 @@
+# /mnt/d/MeQuest/LLMService/prefix_cache.py
+# ------------------------------------------------------------
+# 고정 시스템 프롬프트 prefix 의 KV 캐시 재사용
+#
+# GECKO / SOLAR / EXAONE 서비스는 매 요청마다 동일한 긴 시스템 프롬프트를
+# 처음부터 다시 prefill 합니다. 서버 시작 시 prefix 의 past_key_values 를
+# 한 번만 계산해 두고, 요청마다 복사(deepcopy)하여 model.generate 에 넘기면
+# 사용자별 suffix 토큰만 prefill 하면 됩니다.
+# prefix 를 여러 개 줄 수 있습니다. (GECKO 는 style 별 시스템 프롬프트) 요청마다 일치하는 가장 긴 prefix 사용
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import copy
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
+
+# torch 는 build / prepare 안에서 import 합니다. (모듈 import 를 가볍게)
+if TYPE_CHECKING:
+    import torch
+
+
+class PrefixCache:
+    """시스템 프롬프트 prefix 의 past_key_values 를 보관하고 요청마다 복사본을 내어줍니다."""
+
+    def __init__(self, model, tokenizer, prefix_text: Union[str, Sequence[str]], enabled: bool = True):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_texts: List[str] = [prefix_text] if isinstance(prefix_text, str) else list(prefix_text)
+        self.prefix_text = self.prefix_texts[0]
+        self.enabled = enabled
+
+        # prefix 문자열 -> (토큰, KV 캐시). prepare 는 긴 prefix 부터 비교합니다.
+        self._by_text: Dict[str, Tuple[torch.Tensor, Any]] = {}
+        self._entries: List[Tuple[torch.Tensor, Any]] = []
+        self.build_seconds = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def prefix_ids(self) -> Optional[torch.Tensor]:
+        """첫 번째(기본) prefix 의 토큰"""
+        entry = self._by_text.get(self.prefix_text)
+        return None if entry is None else entry[0]
+
+    @property
+    def past_key_values(self) -> Any:
+        """첫 번째(기본) prefix 의 KV 캐시"""
+        entry = self._by_text.get(self.prefix_text)
+        return None if entry is None else entry[1]
+
+    @property
+    def prefix_len(self) -> int:
+        return 0 if self.prefix_ids is None else int(self.prefix_ids.shape[1])
+
+    def tokenize(self, text: str):
+        inputs = self.tokenizer(text, return_tensors="pt")
+        inputs.pop("token_type_ids", None)   # 불필요한 key 제거
+        return inputs.to(self.model.device)
+
+    def build(self) -> "PrefixCache":
+        """prefix 마다 한 번 prefill 하여 KV 캐시를 만들어 둡니다. (서버 시작 시 1회)"""
+        import torch
+
+        if not self.enabled:
+            return self
+        start = time.perf_counter()
+        self._by_text = {}
+        with torch.no_grad():
+            for text in dict.fromkeys(self.prefix_texts):
+                inputs = self.tokenize(text)
+                outputs = self.model(**inputs, use_cache=True)
+                self._by_text[text] = (inputs["input_ids"], outputs.past_key_values)
+        self._entries = sorted(self._by_text.values(), key=lambda e: e[0].shape[1], reverse=True)
+        self.build_seconds = time.perf_counter() - start
+        lengths = ", ".join(str(int(ids.shape[1])) for ids, _ in self._by_text.values())
+        print(f"✅ Prefix KV cache built: {lengths} tokens in {self.build_seconds * 1000:.1f} ms")
+        return self
+
+    def prepare(self, full_prompt: str) -> Tuple[Dict[str, torch.Tensor], Any]:
+        """
+        full_prompt 를 토큰화하고, prefix 토큰이 그대로 앞에 있으면 캐시 복사본을 함께 반환합니다.
+        (캐시 길이 = 일치한 prefix 토큰 수, 나머지만 prefill)
+        토큰 경계가 달라져 prefix 가 일치하지 않으면 (inputs, None) 을 반환하여 전체 prefill 로 동작합니다.
+        """
+        import torch
+
+        inputs = self.tokenize(full_prompt)
+        input_ids = inputs["input_ids"]
+
+        if input_ids.shape[0] == 1:
+            for prefix_ids, past in self._entries:
+                n = prefix_ids.shape[1]
+                if input_ids.shape[1] > n and torch.equal(input_ids[0, :n], prefix_ids[0]):
+                    self.hits += 1
+                    # generate 가 캐시를 제자리에서 확장하므로 요청마다 복사본을 사용합니다.
+                    return inputs, copy.deepcopy(past)
+
+        self.misses += 1
+        return inputs, None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled and bool(self._entries),
+            "prefix_tokens": self.prefix_len,
+            "prefixes": len(self._entries),
+            "build_ms": round(self.build_seconds * 1000, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
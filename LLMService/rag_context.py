@@ -0,0 +1,222 @@
+# /mnt/d/MeQuest/LLMService/rag_context.py
+# ------------------------------------------------------------
+# RAG 검색 + 토큰 예산 기반 컨텍스트 패킹 (unified_llm_service 용)
+#
+# 지금까지는 Node 가 검색 결과를 그대로 이어 붙인 프롬프트를 보내서 prefill 이 길어졌습니다.
+# topic + retrieval spec 만 받아 LLM 서비스가 직접 컨텍스트를 만듭니다.
+# - EmbeddingService /embed → /search 로 검색 (프롬프트 헤더 준비와 동시에 실행)
+# - 거의 같은 청크는 문자 n-gram Jaccard 유사도로 제거
+# - 관련도(거리) 순으로 모델 토크나이저 기준 토큰 예산 안에 들어가는 청크만 채움
+# - 요청마다 검색 시간 / 컨텍스트 토큰 수 / 제거된 청크 수를 RagStats 로 반환
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel
+
+from mequest_common.server_timing import record, stage
+
+log = logging.getLogger("rag_context")
+
+EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL", "http://localhost:8000").rstrip("/")
+# Ollama 모델과 같은 토크나이저 (HF id 또는 로컬 경로). 로드 실패 시 문자 수 기반 근사치 사용
+RAG_TOKENIZER_ID = os.getenv("RAG_TOKENIZER_ID", "Qwen/Qwen2.5-14B-Instruct")
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1024"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+RAG_DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))
+RAG_TIMEOUT = float(os.getenv("RAG_TIMEOUT", "5"))
+
+_SHINGLE = 5                  # 한국어는 공백 기준 단어가 길어 문자 n-gram 을 씁니다.
+_APPROX_CHARS_PER_TOKEN = 2.5
+
+
+class RetrievalSpec(BaseModel):
+    query: Optional[str] = None                  # 미지정 시 topic 으로 검색
+    top_k: int = RAG_TOP_K                       # /search 로 가져올 후보 수
+    source: Optional[str] = None                 # 지정 시 그 source 의 청크만 검색 (Node 의 filter.source)
+    max_distance: Optional[float] = None         # 이보다 먼 청크는 버림 (L2, 정규화 벡터 기준 0~2)
+    context_tokens: int = RAG_CONTEXT_TOKENS     # 컨텍스트 블록 토큰 예산
+    dedup_threshold: float = RAG_DEDUP_THRESHOLD
+
+
+@dataclass
+class Chunk:
+    content: str
+    ref_id: Any
+    distance: float
+
+
+@dataclass
+class RagStats:
+    retrieval_ms: float = 0.0
+    retrieved: int = 0
+    duplicates: int = 0
+    over_budget: int = 0
+    packed: int = 0
+    context_tokens: int = 0
+    prompt_tokens: int = 0
+    tokenizer: str = ""
+    refs: List[Any] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        out["retrieval_ms"] = round(self.retrieval_ms, 2)
+        return out
+
+
+# ---------- tokenizer ----------
+class TokenCounter:
+    def __init__(self, tokenizer_id: str = RAG_TOKENIZER_ID):
+        self.name = tokenizer_id
+        self._tokenizer = None
+        try:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
+        except Exception as e:
+            self.name = "approx"
+            log.warning("RAG tokenizer %s unavailable, falling back to character estimate: %s", tokenizer_id, e)
+
+    def count(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        if self._tokenizer is None:
+            return [max(1, round(len(t) / _APPROX_CHARS_PER_TOKEN)) for t in texts]
+        encoded = self._tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+
+@lru_cache(maxsize=4)
+def get_token_counter(tokenizer_id: str = RAG_TOKENIZER_ID) -> TokenCounter:
+    return TokenCounter(tokenizer_id)
+
+
+# ---------- dedup / packing ----------
+def _shingles(text: str) -> frozenset:
+    text = " ".join(text.split())
+    if len(text) <= _SHINGLE:
+        return frozenset([text])
+    return frozenset(text[i:i + _SHINGLE] for i in range(len(text) - _SHINGLE + 1))
+
+
+def drop_near_duplicates(chunks: List[Chunk], threshold: float) -> Tuple[List[Chunk], int]:
+    """관련도 순서를 유지하며, 앞선 청크와 Jaccard 유사도가 threshold 이상인 청크를 제거"""
+    kept: List[Chunk] = []
+    seen: List[frozenset] = []
+    for chunk in chunks:
+        grams = _shingles(chunk.content)
+        if any(len(grams & s) / len(grams | s) >= threshold for s in seen):
+            continue
+        kept.append(chunk)
+        seen.append(grams)
+    return kept, len(chunks) - len(kept)
+
+
+def format_chunk(index: int, chunk: Chunk) -> str:
+    return f"# CONTEXT {index}\n{chunk.content.strip()}\n(거리:{chunk.distance:.4f})"
+
+
+def pack_context(chunks: List[Chunk], budget: int, counter: TokenCounter) -> Tuple[List[Chunk], int, int]:
+    """
+    관련도 순으로 예산에 들어가는 청크를 채웁니다. 들어가지 않는 청크는 건너뛰고
+    다음(덜 관련된, 더 짧을 수 있는) 청크를 시도합니다. 반환: (청크, 토큰 수, 초과로 제외된 수)
+    """
+    # 번호는 패킹 후 바뀌므로 자리수가 같은 임시 번호로 한 번에 셉니다.
+    costs = counter.count([format_chunk(i + 1, c) for i, c in enumerate(chunks)])
+    separator = counter.count(["\n\n"])[0] if chunks else 0
+    packed, used = [], 0
+    for chunk, cost in zip(chunks, costs):
+        extra = cost + (separator if packed else 0)
+        if used + extra > budget:
+            continue
+        packed.append(chunk)
+        used += extra
+    return packed, used, len(chunks) - len(packed)
+
+
+# ---------- retrieval ----------
+class Retriever:
+    def __init__(self, embed_url: str = EMBEDDING_SERVICE_URL, timeout: float = RAG_TIMEOUT):
+        self.embed_url = embed_url.rstrip("/")
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def search(self, query: str, top_k: int, source: Optional[str] = None) -> List[Chunk]:
+        r = await self._http().post(f"{self.embed_url}/embed", json={"texts": [query]})
+        r.raise_for_status()
+        data = r.json()
+        body = {"query_vector": data["embeddings"][0], "limit": top_k}
+        if data.get("model_name"):
+            # 과부하 시 대체 임베더 벡터가 올 수 있으므로 같은 모델의 행만 검색
+            body["model_name"] = data["model_name"]
+        if source is not None:
+            body["source"] = source
+        r = await self._http().post(f"{self.embed_url}/search", json=body)
+        r.raise_for_status()
+        return [Chunk(str(h.get("content") or ""), h.get("ref_id"), float(h["distance"])) for h in r.json()]
+
+    async def build_context(self, topic: str, spec: RetrievalSpec, header: str) -> Tuple[str, RagStats]:
+        """
+        검색과 헤더 토큰 계산(토크나이저 로드 포함)을 동시에 실행한 뒤 컨텍스트 블록을 패킹합니다.
+        검색이 실패하면 빈 컨텍스트로 진행하고 stats.error 에 남깁니다.
+        """
+        stats = RagStats()
+
+        async def _search():
+            start = time.perf_counter()
+            try:
+                return await self.search(spec.query or topic, spec.top_k, spec.source)
+            finally:
+                stats.retrieval_ms = (time.perf_counter() - start) * 1000
+
+        search = asyncio.create_task(_search())
+
+        def _prepare():
+            counter = get_token_counter()
+            return counter, counter.count([header])[0]
+
+        counter, header_tokens = await asyncio.to_thread(_prepare)
+        stats.tokenizer = counter.name
+        try:
+            chunks = await search
+        except (httpx.HTTPError, KeyError, IndexError, ValueError, TypeError) as e:
+            log.warning("RAG retrieval failed, continuing without context: %s", e)
+            stats.error = str(e)
+            chunks = []
+        stats.retrieved = len(chunks)
+        record("retrieval", stats.retrieval_ms)
+
+        chunks = [c for c in chunks if c.content.strip()]
+        if spec.max_distance is not None:
+            chunks = [c for c in chunks if c.distance <= spec.max_distance]
+        chunks.sort(key=lambda c: c.distance)
+        chunks, stats.duplicates = drop_near_duplicates(chunks, spec.dedup_threshold)
+        with stage("rag_pack"):
+            packed, stats.context_tokens, stats.over_budget = await asyncio.to_thread(
+                pack_context, chunks, spec.context_tokens, counter
+            )
+        stats.packed = len(packed)
+        stats.refs = [c.ref_id for c in packed]
+        stats.prompt_tokens = header_tokens + stats.context_tokens
+
+        context = "\n\n".join(format_chunk(i + 1, c) for i, c in enumerate(packed))
+        return context, stats
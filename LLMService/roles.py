@@ -0,0 +1,294 @@
+# /mnt/d/MeQuest/LLMService/roles.py
+# ------------------------------------------------------------
+# GECKO(문제 생성) / SOLAR(요약) / EXAONE(오답 피드백) 역할 정의
+#
+# 각 서비스(gecko_service / solar_service / exaone_service)와 단일 프로세스
+# 멀티 모델 호스트(model_host)가 같은 프롬프트·요청/응답 스키마를 쓰도록
+# 한 곳에 모아 둡니다. (이 모듈은 모델을 로드하지 않습니다.)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from batch_scheduler import GenerationParams
+from json_extract import PROBLEM_SCHEMAS, ParseStats, extract_json_object, validate_problem
+
+
+# ---------------------- 공통 후처리 --------------------------
+def strip_inst(text: str) -> str:
+    """생성 텍스트에 프롬프트 템플릿이 남아 있으면 [/INST] 이후만 반환합니다."""
+    if '[/INST]' in text:
+        return text.split('[/INST]', 1)[-1].strip()
+    return text.strip()
+
+
+def parse_problem_json(text: str) -> Optional[Dict[str, Any]]:
+    """생성 텍스트에서 처음으로 완결된 최상위 JSON 객체를 파싱합니다. (json_extract 공용 스캐너)"""
+    parsed = extract_json_object(text)
+    if parsed is None and "{" in text:
+        print("⚠️ JSON Parsing Error: no complete JSON object in generated text")
+    return parsed
+
+
+# -----------------
+# 1. GECKO-7B (문제 생성, 8001)
+# -----------------
+GECKO_MODEL_ID = os.getenv("GECKO_MODEL_PATH", "/mnt/d/MeQuest/models/GECKO-7B")
+# assisted decoding 용 draft 모델 (같은 토크나이저의 작은 모델, 비우면 사용 안 함)
+GECKO_DRAFT_MODEL_ID = os.getenv("GECKO_DRAFT_MODEL_PATH", "")
+
+# style 별 문제 형식 지시 (json_extract.PROBLEM_SCHEMAS 와 같은 키)
+GECKO_STYLE_INSTRUCTIONS = {
+    "mcq": "Create one multiple-choice question with 4 options and the correct answer based on the user's topic. ",
+    "qa": "Create one short-answer question and its answer based on the user's topic. ",
+}
+
+
+def gecko_system_prompt(style: str) -> str:
+    return (
+        "You are an AI problem generator for MeQuest. "
+        f"{GECKO_STYLE_INSTRUCTIONS[style]}"
+        "Respond only with a single JSON object (strictly start with '{' and end with '}'): "
+    )
+
+
+# 같은 style 요청끼리 동일한 앞부분. 사용자 topic 직전에서 끊어 style 마다 KV 캐시를 재사용합니다.
+GECKO_PROMPT_PREFIXES = {style: f"{gecko_system_prompt(style)}\n\nTopic:" for style in GECKO_STYLE_INSTRUCTIONS}
+GECKO_PROMPT_PREFIX = GECKO_PROMPT_PREFIXES["mcq"]
+
+# 스키마 제약 디코딩 기본값 (기본: 프롬프트만으로 JSON 을 요청. GECKO_CONSTRAINED=1 이면 요청 기본값이 스키마 제약)
+GECKO_CONSTRAINED = os.getenv("GECKO_CONSTRAINED", "0") == "1"
+
+# 파싱 성공률 / 유효 문제당 생성 토큰 수 (각 서비스 /health 에 노출)
+GECKO_PARSE_STATS = ParseStats()
+
+
+class GeckoRequest(BaseModel):
+    """Node.js 백엔드로부터 받을 요청 데이터 모델"""
+    topic: str
+    max_new_tokens: int = 256
+    temperature: float = 0.8
+    top_p: float = 0.9
+    repetition_penalty: float = 1.2
+    style: str = "mcq"                        # qa | mcq (json_extract.PROBLEM_SCHEMAS)
+    constrained: bool = GECKO_CONSTRAINED     # 스키마 제약 디코딩 사용 여부
+    assisted: bool = False                    # draft 모델 assisted decoding (draft 가 로드된 경우)
+    priority: str | None = None               # interactive | normal | batch (기본: 역할별 RoleSpec.priority)
+    deadline_ms: int | None = None            # 이 시간 안에 시작할 수 없으면 429 (admission.py)
+
+
+class GeckoResponse(BaseModel):
+    """응답 데이터 모델"""
+    model_id: str
+    prompt: str
+    generated_text: str
+    parsed_json: dict | None = None
+    schema_errors: list[str] | None = None    # [] 이면 style 스키마와 일치
+
+
+def gecko_style(request: GeckoRequest) -> str:
+    return "qa" if request.style == "qa" else "mcq"
+
+
+def gecko_prompt(request: GeckoRequest) -> str:
+    return f"{GECKO_PROMPT_PREFIXES[gecko_style(request)]} {request.topic}\n\n"
+
+
+def gecko_params(request: GeckoRequest) -> GenerationParams:
+    return GenerationParams(
+        max_new_tokens=request.max_new_tokens,
+        temperature=request.temperature,
+        top_p=request.top_p,
+        repetition_penalty=request.repetition_penalty,
+        do_sample=True,
+        json_schema=gecko_schema(request)
+    )
+
+
+def gecko_schema(request: GeckoRequest) -> Optional[Dict[str, Any]]:
+    """constrained 요청이면 style 에 맞는 JSON 스키마를, 아니면 None 을 반환합니다."""
+    if not request.constrained:
+        return None
+    return PROBLEM_SCHEMAS[gecko_style(request)]
+
+
+def gecko_response(model_id: str, prompt: str, text: str) -> GeckoResponse:
+    generated_text = text.strip()
+    return GeckoResponse(
+        model_id=model_id,
+        prompt=prompt,
+        generated_text=generated_text,
+        parsed_json=parse_problem_json(generated_text)
+    )
+
+
+def check_gecko_response(request: GeckoRequest, response: GeckoResponse, generated_tokens: int) -> GeckoResponse:
+    """요청한 style 스키마로 검증하여 schema_errors 를 채우고 GECKO_PARSE_STATS 에 기록합니다."""
+    if response.parsed_json is not None:
+        response.schema_errors = validate_problem(response.parsed_json, request.style)
+    GECKO_PARSE_STATS.record(response.parsed_json, response.schema_errors, generated_tokens)
+    return response
+
+
+# -----------------
+# 2. SOLAR-10.7B (요약, 8002)
+# -----------------
+SOLAR_MODEL_ID = os.getenv("SOLAR_MODEL_PATH", "/mnt/d/mequest/models/SOLAR-10.7B-Instruct-v1.0")
+SOLAR_DRAFT_MODEL_ID = os.getenv("SOLAR_DRAFT_MODEL_PATH", "")
+
+# SOLAR-10.7B의 역할: 요약 및 시각화 준비
+SOLAR_SYSTEM_PROMPT = (
+    "너는 한국어 교육 플랫폼을 위한 전문 요약입니다."
+    "모든 응답은 **반드시 한국어(Korean)로만** 작성해야 하며, 다른 언어나 불필요한 마커([SOLUTION], [RESULT] 등)는 절대 포함하지 마세요. "
+    "문서를 핵심만 요약하세요."
+)
+# 💡 SOLAR Instruct 모델의 대화 템플릿 (Mistral 포맷 사용) 중 문서 직전까지의 고정 prefix
+SOLAR_PROMPT_PREFIX = f"<s>[INST] {SOLAR_SYSTEM_PROMPT}\n\nDocument:"
+
+
+class SummarizeRequest(BaseModel):
+    """
+    Node.js 백엔드와의 일관성을 위해 'text' 필드로 통일합니다.
+    """
+    document: str                     # 요약할 문서/텍스트
+    max_new_tokens: int = 512
+    temperature: float = 0.5
+    repetition_penalty: float = 1.2
+    assisted: bool = False            # draft 모델 assisted decoding (draft 가 로드된 경우)
+    priority: str | None = None       # interactive | normal | batch
+    deadline_ms: int | None = None    # 이 시간 안에 시작할 수 없으면 429
+
+
+# 응답은 단순 텍스트 반환
+class SummarizeResponse(BaseModel):
+    model_id: str
+    summary: str
+
+
+def solar_prompt(request: SummarizeRequest) -> str:
+    return f"{SOLAR_PROMPT_PREFIX} {request.document} [/INST]"
+
+
+def solar_params(request: SummarizeRequest) -> GenerationParams:
+    return GenerationParams(
+        max_new_tokens=request.max_new_tokens,
+        temperature=request.temperature,
+        repetition_penalty=request.repetition_penalty,
+        do_sample=False
+    )
+
+
+def solar_response(model_id: str, prompt: str, text: str) -> SummarizeResponse:
+    return SummarizeResponse(model_id=model_id, summary=strip_inst(text))
+
+
+# -----------------
+# 3. EXAONE-3.5-7.8B (오답 피드백, 8003)
+# -----------------
+# .env에 EXAONE_MODEL_PATH 환경 변수를 설정할 수 있습니다.
+EXAONE_MODEL_ID = os.getenv("EXAONE_MODEL_PATH", "/mnt/d/mequest/models/EXAONE-3.5-7.8B-Instruct")
+# 예: EXAONE-3.5-2.4B-Instruct (같은 토크나이저)
+EXAONE_DRAFT_MODEL_ID = os.getenv("EXAONE_DRAFT_MODEL_PATH", "")
+
+# EXAONE 역할: 오답 피드백 (일관성을 위해 결정론적 샘플링)
+EXAONE_SYSTEM_PROMPT = (
+    "너는 MeQuest의 오답 피드백 전문가이다. "
+    "사용자가 제출한 답변을 분석하고, 왜 정답이 올바른지 한국어로 3~5 문장으로 친절하고 상세하게 설명하라."
+)
+# EXAONE Instruct 모델의 프롬프트 포맷 중 질문 직전까지의 고정 prefix
+EXAONE_PROMPT_PREFIX = f"<s>[INST] {EXAONE_SYSTEM_PROMPT}\n\n질문:"
+
+
+class FeedbackRequest(BaseModel):
+    """
+    오답 피드백을 위해 문제, 사용자 답변, 정답을 받습니다.
+    (Node.js llmService.js에서 이 필드명에 맞춰 요청을 전송해야 합니다.)
+    """
+    question: str                 # 원래 문제
+    user_answer: str              # 사용자 답변
+    correct_answer: str           # 정답
+    max_new_tokens: int = 512
+    temperature: float = 0.5
+    repetition_penalty: float = 1.2
+    assisted: bool = False        # draft 모델 assisted decoding (draft 가 로드된 경우)
+    use_cache: bool = True        # 비슷한 이전 오답의 피드백 재사용 (feedback_cache)
+    priority: str | None = None   # interactive | normal | batch
+    deadline_ms: int | None = None  # 이 시간 안에 시작할 수 없으면 429
+
+
+class FeedbackResponse(BaseModel):
+    """ 응답 포맷을 GECKO/SOLAR와 통일합니다. """
+    model_id: str
+    output: str
+    cached: bool = False          # feedback_cache 에서 재사용한 피드백이면 True
+
+
+def exaone_prompt(request: FeedbackRequest) -> str:
+    # EXAONE Instruct 모델의 프롬프트 포맷 (Mistral/Llama Instruct 포맷 사용 가정)
+    return f"""{EXAONE_PROMPT_PREFIX} {request.question}
+사용자 답변: {request.user_answer}
+정답: {request.correct_answer} [/INST]"""
+
+
+def exaone_params(request: FeedbackRequest) -> GenerationParams:
+    return GenerationParams(
+        max_new_tokens=request.max_new_tokens,
+        temperature=request.temperature,
+        repetition_penalty=request.repetition_penalty,
+        do_sample=(request.temperature > 0)  # ← 조건부 샘플링
+    )
+
+
+def exaone_response(model_id: str, prompt: str, text: str) -> FeedbackResponse:
+    return FeedbackResponse(model_id=model_id, output=strip_inst(text))
+
+
+# ---------------------- Registry -----------------------------
+@dataclass(frozen=True)
+class RoleSpec:
+    """역할 하나(모델 + 라우트 + 프롬프트/스키마)를 묶은 정의"""
+    name: str
+    route: str
+    port: int
+    model_id: str
+    prompt_prefix: str | Tuple[str, ...]     # 여러 개면 PrefixCache 가 prefix 마다 KV 캐시를 만듭니다.
+    request_model: Type[BaseModel]
+    response_model: Type[BaseModel]
+    build_prompt: Callable[[Any], str]
+    generation_params: Callable[[Any], GenerationParams]
+    build_response: Callable[[str, str, str], BaseModel]
+    # (요청, 응답, 생성 토큰 수) → 응답. 스키마 검증 + 파싱 통계 기록 (GECKO: check_gecko_response)
+    check_response: Optional[Callable[[Any, BaseModel, int], BaseModel]] = None
+    trust_remote_code: bool = False
+    draft_model_id: str = ""
+    priority: str = "normal"          # admission 대기열 기본 우선순위 (interactive > normal > batch)
+
+
+GECKO = RoleSpec(
+    name="gecko", route="/generate", port=8001,
+    model_id=GECKO_MODEL_ID, prompt_prefix=tuple(GECKO_PROMPT_PREFIXES.values()),
+    request_model=GeckoRequest, response_model=GeckoResponse,
+    build_prompt=gecko_prompt, generation_params=gecko_params, build_response=gecko_response,
+    check_response=check_gecko_response, draft_model_id=GECKO_DRAFT_MODEL_ID, priority="batch",
+)
+SOLAR = RoleSpec(
+    name="solar", route="/summarize", port=8002,
+    model_id=SOLAR_MODEL_ID, prompt_prefix=SOLAR_PROMPT_PREFIX,
+    request_model=SummarizeRequest, response_model=SummarizeResponse,
+    build_prompt=solar_prompt, generation_params=solar_params, build_response=solar_response,
+    draft_model_id=SOLAR_DRAFT_MODEL_ID,
+)
+EXAONE = RoleSpec(
+    name="exaone", route="/feedback", port=8003,
+    model_id=EXAONE_MODEL_ID, prompt_prefix=EXAONE_PROMPT_PREFIX,
+    request_model=FeedbackRequest, response_model=FeedbackResponse,
+    build_prompt=exaone_prompt, generation_params=exaone_params, build_response=exaone_response,
+    trust_remote_code=True, draft_model_id=EXAONE_DRAFT_MODEL_ID, priority="interactive",
+)
+
+ROLES: Dict[str, RoleSpec] = {spec.name: spec for spec in (GECKO, SOLAR, EXAONE)}
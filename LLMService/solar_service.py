@@ -1,60 +1,74 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+# 시작 단계별 시간은 다른 import 보다 먼저 재기 시작합니다. (/health 의 "startup")
+from mequest_common.startup_timing import STARTUP
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from transformers import StoppingCriteriaList
+import asyncio
 import torch
+import os
+
+from hf_loader import load_model
+from assisted_decoding import load_draft
+from prefix_cache import PrefixCache
+from batch_scheduler import BatchScheduler
+from admission import AdmissionController, admission_concurrency, metrics_text
+from cancellation import CANCEL_STATS, CancelCriteria, GenerationCancelled, cancel_scope
+from mequest_common.server_timing import FirstTokenTimer, install_server_timing, stage
+from job_queue import install_jobs
+from roles import SOLAR, SummarizeRequest as GenerateRequest, SummarizeResponse as GenerateResponse
+STARTUP.mark("import")
 
 # -----------------
 # 1. 모델 설정
 # Instruct 버전 사용을 강력히 권장합니다. (지시 수행 능력 향상)
-# 만약 로컬 경로를 사용한다면: MODEL_ID = "/mnt/d/mequest/models/SOLAR-10.7B-Instruct-v1.0"
+# 만약 로컬 경로를 사용한다면: SOLAR_MODEL_PATH=/mnt/d/mequest/models/SOLAR-10.7B-Instruct-v1.0
 
-MODEL_ID = "/mnt/d/mequest/models/SOLAR-10.7B-Instruct-v1.0"
+MODEL_ID = SOLAR.model_id
 
-# 4bit 양자화 설정 (RTX 5070 환경 기준)
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_use_double_quant=True,
-    bnb_4bit_compute_dtype=torch.float16,
-)
+# 시스템 프롬프트 prefix KV 캐시 사용 여부 (PREFIX_CACHE=0 으로 비활성화)
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE", "1") == "1"
+
+# continuous batching 스케줄러 사용 여부 및 최대 동시 디코딩 수 (BATCH_SCHEDULER=0 이면 요청별 generate)
+BATCH_SCHEDULER_ENABLED = os.getenv("BATCH_SCHEDULER", "1") == "1"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
 
 # -----------------
 # 2. FastAPI 및 모델 로드
 # -----------------
 app = FastAPI(title="MeQuest SOLAR-10.7B Summarizer", version="1.0.1")
+install_server_timing(app, "solar")
 
 try:
-    print(f"Loading {MODEL_ID} ...")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
-    model = AutoModelForCausalLM.from_pretrained(
-        MODEL_ID,
-        quantization_config=bnb_config,
-        device_map="auto",
-        low_cpu_mem_usage=True
-    )
+    tokenizer, model = load_model(MODEL_ID, timer=STARTUP)
     print("✅ SOLAR-10.7B Model Loaded Successfully")
+
+    with STARTUP.phase("prefix_cache"):
+        prefix_cache = PrefixCache(model, tokenizer, SOLAR.prompt_prefix, enabled=PREFIX_CACHE_ENABLED).build()
+
+    # SOLAR_DRAFT_MODEL_PATH 가 있으면 assisted decoding 용 draft 모델을 함께 로드합니다.
+    draft = load_draft(model, tokenizer, SOLAR.draft_model_id, timer=STARTUP)
+
+    # 동시 요청을 하나의 배치로 묶어 step 단위로 디코딩합니다.
+    with STARTUP.phase("scheduler"):
+        scheduler = BatchScheduler(
+            model, tokenizer, prefix_cache=prefix_cache, max_batch_size=MAX_BATCH_SIZE, name="solar"
+        ) if BATCH_SCHEDULER_ENABLED else None
 except Exception as e:
     print(f"❌ Failed to load SOLAR model: {e}")
     # 모델 로드 실패 시 서버를 강제 종료하여 무거운 모델이 메모리만 차지하지 않도록 합니다.
     raise RuntimeError(f"Model Load Failed: {e}")
 
+# 동시 실행 수 제한 + 우선순위 대기열 (스케줄러가 있으면 배치 크기만큼, 없으면 1개씩 generate)
+admission = AdmissionController(
+    "solar", admission_concurrency(MAX_BATCH_SIZE if scheduler is not None else 1), default_priority=SOLAR.priority
+)
+STARTUP.done("solar")
+
 # -----------------
 # 3. Pydantic 요청/응답 모델 정의
 # -----------------
-class GenerateRequest(BaseModel):
-    """
-    Node.js 백엔드와의 일관성을 위해 'text' 필드로 통일합니다.
-    """
-    document: str                     # 요약할 문서/텍스트
-    max_new_tokens: int = 512
-    temperature: float = 0.5
-    repetition_penalty: float = 1.2
-
-# 응답은 단순 텍스트 반환
-class GenerateResponse(BaseModel):
-    model_id: str
-    summary: str
-    
+# GenerateRequest / GenerateResponse 는 roles.py 에서 model_host 와 공유합니다.
+
 # -----------------
 # 4. API 엔드포인트
 # -----------------
@@ -62,65 +76,90 @@ class GenerateResponse(BaseModel):
 @app.get("/health")
 async def health():
     """모델 및 서버 상태 확인"""
-    return {"status": "ok", "model_loaded": model is not None}
+    return {
+        "status": "ok",
+        "model_loaded": model is not None,
+        "prefix_cache": prefix_cache.stats(),
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "draft": draft.stats() if draft is not None else None,
+        "admission": admission.stats(),
+        "cancellation": CANCEL_STATS.stats(),
+        "startup": STARTUP.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """admission 대기열 지표 (Prometheus text format)"""
+    return metrics_text(admission) + CANCEL_STATS.metrics_text()
 
 @app.post("/summarize", response_model=GenerateResponse)
-async def summarize(request: GenerateRequest):
+async def summarize(request: GenerateRequest, http_request: Request):
     """
     문서를 받아 SOLAR-10.7B를 사용하여 요약합니다.
     """
-    try:
-        # SOLAR-10.7B의 역할: 요약 및 시각화 준비
-        system_prompt = (
-            "너는 한국어 교육 플랫폼을 위한 전문 요약입니다."
-            "모든 응답은 **반드시 한국어(Korean)로만** 작성해야 하며, 다른 언어나 불필요한 마커([SOLUTION], [RESULT] 등)는 절대 포함하지 마세요. "
-            "문서를 핵심만 요약하세요."
-        )
-
-        # 💡 SOLAR Instruct 모델의 대화 템플릿 (Mistral 포맷 사용)
-        prompt_template = f"<s>[INST] {system_prompt}\n\nDocument: {request.document} [/INST]"
-        
-        # 1. 토큰화
-        inputs = tokenizer(prompt_template, return_tensors="pt")
-        inputs.pop("token_type_ids", None)   # 불필요한 key 제거
-        inputs = inputs.to(model.device)
-        
-        # 2. 텍스트 생성
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=request.max_new_tokens,
-            temperature=request.temperature,
-            do_sample=False,
-            # repetition_penalty=1.2,
-            repetition_penalty=request.repetition_penalty,
-            pad_token_id=tokenizer.eos_token_id
-        )
-
-        # 3. 결과 디코딩 및 후처리 (프롬프트 제거)
-        generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
-        
-        # 💡 생성된 텍스트에서 모델의 답변만 추출 (입력 프롬프트 템플릿 제거)
-        # generated_text는 보통 "<s>[INST]...[/INST] 답변" 형태로 나오므로, [/INST] 이후를 추출합니다.
-        
-        if '[/INST]' in generated_text:
-            summary = generated_text.split('[/INST]', 1)[-1].strip()
-        else:
-            summary = generated_text.strip() # 템플릿이 없을 경우 전체 반환
-        
-
-        # 💡 GPU 메모리 정리 (VRAM 안정성 향상)
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-
-
-        return GenerateResponse(model_id=MODEL_ID, summary=summary)
-
-    except Exception as e:
-        print(f"❌ Summarization failed: {e}")
-        # 추론 중 OOM 오류 등 발생 시 500 에러 반환
-        raise HTTPException(status_code=500, detail=f"Summarization failed: {e}")
+    # 대기열에서 슬롯을 얻은 요청만 모델을 실행합니다. (예상 대기 > deadline 이면 429 + Retry-After)
+    # 실행 중 연결이 끊기거나 deadline 이 지나면 생성을 멈추고 슬롯을 돌려줍니다.
+    async with cancel_scope("solar", http_request, request.deadline_ms, request.max_new_tokens) as cancel, \
+            admission.slot(request.priority, request.deadline_ms):
+        try:
+            prompt_template = SOLAR.build_prompt(request)
+            # assisted 요청은 draft 와 함께 단일 시퀀스로 generate 합니다. (스케줄러 미사용)
+            use_draft = request.assisted and draft is not None
+
+            if scheduler is not None and not use_draft:
+                # 1~3. 스케줄러 큐에 넣고 배치 디코딩 결과(새로 생성된 텍스트)를 기다립니다.
+                result = await scheduler.submit(prompt_template, SOLAR.generation_params(request), cancel)
+                generated_text = result.text
+            else:
+                # 1. 토큰화 (prefix 가 일치하면 시스템 프롬프트 KV 캐시 복사본을 함께 받음)
+                #    draft 는 prefix 캐시를 공유하지 않으므로 assisted 요청은 전체 prefill
+                with stage("tokenize"):
+                    if use_draft:
+                        inputs, past_key_values = prefix_cache.tokenize(prompt_template), None
+                    else:
+                        inputs, past_key_values = prefix_cache.prepare(prompt_template)
+
+                # 2. 텍스트 생성 (캐시가 있으면 문서 부분만 prefill, draft 가 있으면 assisted decoding)
+                first_token = FirstTokenTimer()
+                generate_kwargs = dict(
+                    past_key_values=past_key_values,
+                    max_new_tokens=request.max_new_tokens,
+                    temperature=request.temperature,
+                    do_sample=False,
+                    # repetition_penalty=1.2,
+                    repetition_penalty=request.repetition_penalty,
+                    pad_token_id=tokenizer.eos_token_id,
+                    stopping_criteria=StoppingCriteriaList([CancelCriteria(cancel, inputs["input_ids"].shape[1]), first_token])
+                )
+                # 연결 종료를 감시할 수 있도록 generate 는 스레드에서 실행합니다.
+                if use_draft:
+                    outputs, _ = await asyncio.to_thread(draft.generate, inputs, **generate_kwargs)
+                else:
+                    outputs = await asyncio.to_thread(model.generate, **inputs, **generate_kwargs)
+                first_token.record()
+                cancel.raise_if_cancelled()
+
+                # 3. 결과 디코딩
+                generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+            # 💡 GPU 메모리 정리 (VRAM 안정성 향상)
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+            # 💡 생성된 텍스트에서 모델의 답변만 추출 ("<s>[INST]...[/INST] 답변" 이면 [/INST] 이후)
+            return SOLAR.build_response(MODEL_ID, prompt_template, generated_text)
+
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            print(f"❌ Summarization failed: {e}")
+            # 추론 중 OOM 오류 등 발생 시 500 에러 반환
+            raise HTTPException(status_code=500, detail=f"Summarization failed: {e}")
+
+# 긴 문서 요약은 POST /jobs/summarize 로 제출하고 GET /jobs/{id}/result 로 조회 (job_queue.py)
+JOBS = install_jobs(app, "solar", {"summarize": (GenerateRequest, lambda req: summarize(req, None))})
 
 if __name__ == "__main__":
     import uvicorn
     # 💡 포트 8002 사용
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+    uvicorn.run(app, host="0.0.0.0", port=SOLAR.port)
@@ -0,0 +1,133 @@
+# /mnt/d/MeQuest/LLMService/tests/test_model_router.py
+# ------------------------------------------------------------
+# ModelRouter 결정 확인 (stub 백엔드: 실제 호출 없이 track 으로 실행 중 수 / 결과만 흉내)
+# Run:
+#   python -m pytest -q tests/test_model_router.py
+# ------------------------------------------------------------
+
+import asyncio
+from contextlib import AsyncExitStack
+
+import pytest
+
+from model_router import UNLISTED, BackendSpec, ModelRouter
+
+SLO = {"generate": 20000.0, "summarize": 30000.0, "feedback": 8000.0}
+
+
+def make_router(**kwargs) -> ModelRouter:
+    return ModelRouter(
+        [
+            BackendSpec(name="large", target="qwen2.5:7b", tier=2),
+            BackendSpec(name="small", target="qwen2.5:3b", tier=1, concurrency=4),
+        ],
+        slo_ms=SLO, long_input_tokens=1500, initial_ms=5000.0, enabled=True, **kwargs,
+    )
+
+
+async def hold(router: ModelRouter, stack: AsyncExitStack, task: str, n: int, pinned: str):
+    """pinned 백엔드에 끝나지 않은 요청 n 개를 걸어 둡니다. (부하 흉내)"""
+    for _ in range(n):
+        await stack.enter_async_context(router.track(router.choose(task, 10, pinned=pinned)))
+
+
+def test_idle_short_feedback_uses_large_tier():
+    decision = make_router().choose("feedback", input_tokens=50)
+    assert (decision.backend, decision.reason) == ("large", "within_slo")
+
+
+def test_short_feedback_under_load_moves_to_small_tier():
+    router = make_router()
+
+    async def run():
+        async with AsyncExitStack() as stack:
+            # large 예상 지연 = 5000 × (1 + 1) > feedback SLO 8000
+            await hold(router, stack, "generate", 1, "large")
+            return router.choose("feedback", input_tokens=50)
+
+    decision = asyncio.run(run())
+    assert (decision.backend, decision.reason) == ("small", "within_slo")
+
+
+def test_long_summary_goes_to_large_tier_under_load():
+    router = make_router()
+
+    async def run():
+        async with AsyncExitStack() as stack:
+            await hold(router, stack, "generate", 3, "large")
+            return router.choose("summarize", input_tokens=4000)
+
+    decision = asyncio.run(run())
+    assert (decision.backend, decision.reason) == ("large", "long_input")
+
+
+def test_pinned_model_is_respected():
+    router = make_router()
+    by_name = router.choose("generate", input_tokens=4000, pinned="small")
+    by_target = router.choose("feedback", input_tokens=50, pinned="qwen2.5:3b")
+    assert (by_name.backend, by_name.reason) == ("small", "pinned")
+    assert (by_target.backend, by_target.model, by_target.reason) == ("small", "qwen2.5:3b", "pinned")
+
+
+def test_unlisted_pin_stays_transient():
+    router = make_router()
+
+    async def run():
+        for i in range(20):
+            decision = router.choose("feedback", 10, pinned=f"client-model-{i}")
+            with pytest.raises(RuntimeError):
+                async with router.track(decision):
+                    raise RuntimeError("upstream failed")
+        return decision
+
+    decision = asyncio.run(run())
+    assert (decision.backend, decision.model, decision.reason) == ("client-model-19", "client-model-19", "pinned")
+    stats = router.stats()
+    assert [b["name"] for b in stats["backends"]] == ["large", "small"]
+    assert stats["requests"]["feedback"] == {UNLISTED: 20}
+
+
+def test_decision_is_recorded():
+    router = make_router()
+
+    async def run():
+        ok = router.choose("feedback", input_tokens=50)
+        async with router.track(ok):
+            pass
+        failed = router.choose("generate", input_tokens=50, pinned="small")
+        with pytest.raises(RuntimeError):
+            async with router.track(failed):
+                raise RuntimeError("backend error")
+        return ok, failed
+
+    ok, failed = asyncio.run(run())
+    assert list(router.decisions) == [ok, failed]
+    assert ok.status == "ok" and ok.latency_ms is not None
+    assert failed.status == "error"
+    recent = router.stats(recent=2)
+    assert recent["requests"] == {"feedback": {"large": 1}, "generate": {"small": 1}}
+    assert recent["reasons"] == {"within_slo": 1, "pinned": 1}
+    assert [d["status"] for d in recent["recent"]] == ["ok", "error"]
+
+
+def test_failing_backend_is_ejected(monkeypatch):
+    monkeypatch.setattr("model_router.ROUTER_EJECT_AFTER", 2)
+    router = make_router()
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                async with router.track(router.choose("feedback", 10, pinned="large")):
+                    raise RuntimeError("down")
+        return router.choose("feedback", input_tokens=50)
+
+    assert asyncio.run(run()).backend == "small"
+
+
+def test_disabled_router_uses_default():
+    router = ModelRouter(
+        [BackendSpec(name="large", target="qwen2.5:7b", tier=2), BackendSpec(name="small", target="qwen2.5:3b")],
+        enabled=False,
+    )
+    decision = router.choose("feedback", input_tokens=50)
+    assert (decision.backend, decision.reason) == ("large", "disabled")
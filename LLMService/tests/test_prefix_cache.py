@@ -0,0 +1,147 @@
+# /mnt/d/MeQuest/LLMService/tests/test_prefix_cache.py
+# ------------------------------------------------------------
+# prefix KV 캐시 / 배치 스케줄러가 캐시 없는 전체 prefill 과 같은 greedy 토큰을 내는지 확인
+# (작은 랜덤 Llama + 문자 단위 토크나이저, 다운로드 없음)
+# Run:
+#   python -m pytest -q tests/test_prefix_cache.py
+# ------------------------------------------------------------
+
+import asyncio
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from batch_scheduler import BatchScheduler, GenerationParams, cache_to_tuples
+from prefix_cache import PrefixCache
+
+PREFIX = "system: you are a quiz generator. answer in json.\nuser: "
+OTHER_PREFIX = "system: you are a short answer grader.\nuser: "
+SUFFIXES = ["python lists", "http status codes and caching", "sql", "binary search trees in depth"]
+MAX_NEW_TOKENS = 12
+
+
+@pytest.fixture(scope="module")
+def tiny():
+    specials = ["<unk>", "<s>", "</s>", "<pad>"]
+    chars = sorted(set(PREFIX + OTHER_PREFIX + "".join(SUFFIXES) + "abcdefghijklmnopqrstuvwxyz0123456789 .,:{}\"\n"))
+    vocab = {tok: i for i, tok in enumerate(specials + chars)}
+    backend = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.Split(tokenizers.Regex("."), behavior="isolated")
+    tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend, unk_token="<unk>", bos_token="<s>", eos_token="</s>", pad_token="<pad>"
+    )
+
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=len(vocab), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+        bos_token_id=1, eos_token_id=2, pad_token_id=3,
+    )
+    model = transformers.LlamaForCausalLM(config).eval()
+    return tokenizer, model
+
+
+def full_prefill_tokens(tokenizer, model, prompt):
+    """캐시 없이 프롬프트 전체를 prefill 한 greedy 결과 (기준값)"""
+    inputs = tokenizer(prompt, return_tensors="pt")
+    inputs.pop("token_type_ids", None)
+    with torch.no_grad():
+        out = model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS, do_sample=False, pad_token_id=3)
+    return out[0, inputs["input_ids"].shape[1]:].tolist()
+
+
+def snapshot(cache):
+    return [(k.clone(), v.clone()) for k, v in cache_to_tuples(cache)]
+
+
+def assert_unchanged(cache, before):
+    after = cache_to_tuples(cache)
+    assert len(after) == len(before)
+    for (k, v), (k0, v0) in zip(after, before):
+        assert k.shape == k0.shape and v.shape == v0.shape
+        assert torch.equal(k, k0) and torch.equal(v, v0)
+
+
+def test_prepare_matches_full_prefill(tiny):
+    tokenizer, model = tiny
+    cache = PrefixCache(model, tokenizer, PREFIX).build()
+    before = snapshot(cache.past_key_values)
+
+    for suffix in SUFFIXES:
+        prompt = PREFIX + suffix
+        inputs, past = cache.prepare(prompt)
+        assert past is not None
+        with torch.no_grad():
+            out = model.generate(
+                **inputs, past_key_values=past, max_new_tokens=MAX_NEW_TOKENS, do_sample=False, pad_token_id=3
+            )
+        cached = out[0, inputs["input_ids"].shape[1]:].tolist()
+        assert cached == full_prefill_tokens(tokenizer, model, prompt)
+
+    # generate 가 확장한 것은 요청별 복사본이어야 합니다.
+    assert_unchanged(cache.past_key_values, before)
+    assert cache.stats()["hits"] == len(SUFFIXES)
+
+
+def test_prepare_misses_without_prefix(tiny):
+    tokenizer, model = tiny
+    cache = PrefixCache(model, tokenizer, PREFIX).build()
+    _, past = cache.prepare("user: " + SUFFIXES[0])
+    assert past is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_scheduler_matches_full_prefill(tiny):
+    tokenizer, model = tiny
+    cache = PrefixCache(model, tokenizer, PREFIX).build()
+    before = snapshot(cache.past_key_values)
+    scheduler = BatchScheduler(model, tokenizer, prefix_cache=cache, max_batch_size=4, name="test")
+    params = GenerationParams(max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+
+    async def run_all():
+        # 길이가 다른 요청을 동시에 넣어 왼쪽 패딩된 배치로 함께 디코딩되게 합니다.
+        return await asyncio.gather(*(scheduler.submit(PREFIX + s, params) for s in SUFFIXES))
+
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        scheduler.close()
+
+    for suffix, result in zip(SUFFIXES, results):
+        assert result.token_ids == full_prefill_tokens(tokenizer, model, PREFIX + suffix)
+    assert cache.stats()["hits"] == len(SUFFIXES)
+    assert_unchanged(cache.past_key_values, before)
+
+
+def test_multiple_prefixes_pick_longest_match(tiny):
+    tokenizer, model = tiny
+    # 짧은 prefix 가 긴 prefix 의 앞부분이어도 긴 쪽 캐시를 사용해야 합니다.
+    prefixes = ("system: ", PREFIX, OTHER_PREFIX)
+    cache = PrefixCache(model, tokenizer, prefixes).build()
+    assert cache.prefix_text == "system: "
+    assert cache.stats()["prefixes"] == 3
+
+    for prefix in (PREFIX, OTHER_PREFIX):
+        _, past = cache.prepare(prefix + SUFFIXES[0])
+        assert cache_to_tuples(past)[0][0].shape[2] == len(prefix)   # 문자 단위 토크나이저
+
+    before = [snapshot(past) for _, past in cache._entries]
+    scheduler = BatchScheduler(model, tokenizer, prefix_cache=cache, max_batch_size=4, name="test")
+    params = GenerationParams(max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+    prompts = [p + s for p, s in zip((PREFIX, OTHER_PREFIX, PREFIX, OTHER_PREFIX), SUFFIXES)]
+
+    async def run_all():
+        return await asyncio.gather(*(scheduler.submit(prompt, params) for prompt in prompts))
+
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        scheduler.close()
+
+    for prompt, result in zip(prompts, results):
+        assert result.token_ids == full_prefill_tokens(tokenizer, model, prompt)
+    for (_, past), snap in zip(cache._entries, before):
+        assert_unchanged(past, snap)
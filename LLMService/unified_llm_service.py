@@ -1,10 +1,23 @@
 # /mnt/d/MeQuest/LLMService/unified_llm_service.py
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
+import asyncio
 import os
 import ollama
 import json
+import time
+
+from admission import AdmissionController, admission_concurrency, metrics_text
+from cancellation import CANCEL_STATS, GenerationCancelled, cancel_scope, wait_cancellable
+from feedback_cache import FeedbackCache
+from job_queue import install_jobs
+from json_extract import PROBLEM_SCHEMAS, ParseStats, extract_json_object, validate
+from model_router import ModelRouter, RouteDecision, default_backends
+from rag_context import Retriever, RetrievalSpec, get_token_counter
+from mequest_common.server_timing import install_server_timing, record, stage
+from upstream_pool import UpstreamPool
 
 # -----------------
 # 1. 모델 설정
@@ -13,6 +26,35 @@ import json
 # 'qwen2.5:14b'를 기본값으로 사용
 MODEL_ID = os.getenv("LLM_MODEL_ID", "qwen2.5:14b")
 
+# constrained 요청이면 문제 생성 시 Ollama format 에 전체 JSON 스키마를 넘겨 디코딩 단계에서 형태를 강제합니다.
+# (기본값: 기존처럼 format="json" 만 사용. LLM_CONSTRAINED=1 이면 요청 기본값이 스키마 제약)
+CONSTRAINED_DEFAULT = os.getenv("LLM_CONSTRAINED", "0") == "1"
+
+# 파싱 성공률 / 유효 문제당 생성 토큰 수
+PARSE_STATS = ParseStats()
+
+# 같은 문제의 비슷한 오답이면 이전 피드백을 재사용 (FEEDBACK_CACHE=0 으로 비활성화)
+FEEDBACK_CACHE = FeedbackCache()
+
+# topic + retrieval 요청의 RAG 컨텍스트를 직접 검색/패킹 (EmbeddingService)
+RETRIEVER = Retriever()
+
+# 라우트별 동시 실행 수 제한 + 우선순위 대기열 (Ollama 가 동시에 처리하는 요청 수 기준)
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+ADMISSION = {
+    route: AdmissionController(route, admission_concurrency(OLLAMA_NUM_PARALLEL), default_priority=priority)
+    for route, priority in (("generate", "batch"), ("summarize", "normal"), ("feedback", "interactive"))
+}
+
+# 요청별 백엔드 선택 (작업 종류 / 입력 토큰 수 / 실행 중 요청 수 / 관측 지연 시간, model_router.py)
+# model 을 지정한 요청은 그 모델로 고정합니다.
+ROUTER = ModelRouter(default_backends(MODEL_ID, concurrency=OLLAMA_NUM_PARALLEL))
+
+# 역할 서비스(GECKO / SOLAR / EXAONE) 백엔드의 라우트와 keep-alive 클라이언트 (백엔드 이름 → 풀)
+ROLE_ROUTES = {"generate": "/generate", "summarize": "/summarize", "feedback": "/feedback"}
+ROLE_TIMEOUT_S = float(os.getenv("ROLE_TIMEOUT_S", "120"))
+ROLE_POOLS: dict[str, UpstreamPool] = {}
+
 # -----------------
 # 2. FastAPI 앱 설정
 # -----------------
@@ -21,6 +63,19 @@ app = FastAPI(
     version="3.0.0",
     description="Integrated service for Problem Generation, Summarization, and Feedback using Ollama"
 )
+install_server_timing(app, "unified")
+
+@app.on_event("startup")
+async def load_rag_tokenizer():
+    # 첫 RAG 요청에서 토크나이저 로드 시간이 생기지 않도록 미리 올립니다.
+    get_token_counter()
+
+@app.on_event("shutdown")
+async def close_clients():
+    await FEEDBACK_CACHE.aclose()
+    await RETRIEVER.aclose()
+    for pool in ROLE_POOLS.values():
+        await pool.aclose()
 
 # -----------------
 # 3. 요청/응답 모델
@@ -29,41 +84,135 @@ app = FastAPI(
 class GenerateRequest(BaseModel):
     topic: str
     prompt: str | None = None # RAG 컨텍스트가 포함된 완성된 프롬프트일 수 있음
-    model: str = MODEL_ID
+    model: str | None = None # 지정하면 그 모델로 고정, 없으면 라우터가 선택
     temperature: float = 0.7
     top_p: float = 0.9
+    # 출력 스키마: 기본값은 prompt(RAG) 요청이면 qa, 아니면 quiz (json_extract.PROBLEM_SCHEMAS)
+    style: str | None = None
+    constrained: bool = CONSTRAINED_DEFAULT
+    # prompt 대신 검색 조건을 보내면 서비스가 컨텍스트를 검색하고 토큰 예산에 맞춰 프롬프트를 만듭니다.
+    retrieval: RetrievalSpec | None = None
+    # admission: interactive | normal | batch (미지정 시 라우트 기본값), deadline 은 대기열 포함 허용 시간
+    priority: str | None = None
+    deadline_ms: int | None = None
 
 class SummarizeRequest(BaseModel):
     document: str
-    model: str = MODEL_ID
+    model: str | None = None
+    priority: str | None = None
+    deadline_ms: int | None = None
 
 class FeedbackRequest(BaseModel):
     question: str
     user_answer: str
     correct_answer: str
-    model: str = MODEL_ID
+    model: str | None = None
+    use_cache: bool = True
+    priority: str | None = None
+    deadline_ms: int | None = None
 
 # -----------------
 # 4. 헬퍼 함수
 # -----------------
-def generate_text(messages, model_id=MODEL_ID, temperature=0.7, format=None):
+def chat(messages, model_id=MODEL_ID, temperature=0.7, format=None, cancel=None):
+    """
+    ollama.chat 원본 응답 (eval_count 등 토큰 수 포함).
+    cancel(CancelToken) 을 주면 스트리밍으로 받다가 취소되는 즉시 연결을 닫아 Ollama 생성을 멈춥니다.
+    """
     try:
         options = {
             "temperature": temperature,
             "top_p": 0.9,
         }
         
-        response = ollama.chat(
-            model=model_id,
-            messages=messages,
-            options=options,
-            format=format 
-        )
-        return response['message']['content']
+        if cancel is not None:
+            stream = ollama.chat(model=model_id, messages=messages, options=options, format=format, stream=True)
+            response = collect_chat_stream(stream, cancel)
+        else:
+            response = ollama.chat(
+                model=model_id,
+                messages=messages,
+                options=options,
+                format=format 
+            )
+        record_ollama_timings(response)
+        return response
+    except GenerationCancelled:
+        raise
     except Exception as e:
         print(f"❌ Ollama Error: {e}")
         raise HTTPException(status_code=500, detail=f"Ollama generation failed: {str(e)}")
 
+def generate_text(messages, model_id=MODEL_ID, temperature=0.7, format=None, cancel=None):
+    return chat(messages, model_id, temperature, format, cancel)['message']['content']
+
+def record_ollama_timings(response):
+    """Ollama 가 보고한 모델 로드 / prompt eval (prefill) / eval (decode) 시간을 Server-Timing 에 남깁니다."""
+    for stage_name, key in (("ollama_load", 'load_duration'), ("prefill", 'prompt_eval_duration'), ("decode", 'eval_duration')):
+        if response.get(key):
+            record(stage_name, response.get(key) / 1e6)
+
+def collect_chat_stream(stream, cancel):
+    """스트리밍 청크를 non-stream 응답과 같은 형태(message.content + 마지막 청크의 토큰 통계)로 모읍니다."""
+    parts, last = [], None
+    try:
+        for chunk in stream:
+            parts.append(chunk['message']['content'] or "")
+            last = chunk
+            cancel.generated = len(parts)
+            if cancel.cancelled:
+                raise GenerationCancelled(cancel.reason)
+    finally:
+        # 제너레이터를 닫으면 HTTP 스트림이 닫히고 Ollama 는 해당 요청의 생성을 중단합니다.
+        stream.close()
+    response = last.model_dump() if hasattr(last, "model_dump") else dict(last or {})
+    response['message'] = {**(response.get('message') or {}), 'content': "".join(parts)}
+    cancel.generated = response.get('eval_count') or len(parts)
+    return response
+
+# ollama 클라이언트는 동기 호출이라 이벤트 루프를 막습니다. 스레드에서 실행해야
+# 여러 요청이 동시에 Ollama 로 나가고 대기열/헬스체크가 응답합니다.
+async def chat_async(*args, **kwargs):
+    return await asyncio.to_thread(chat, *args, **kwargs)
+
+async def generate_text_async(*args, **kwargs):
+    return await asyncio.to_thread(generate_text, *args, **kwargs)
+
+def rag_header(topic):
+    """Node buildPrompt 와 같은 지시문. 컨텍스트 블록은 뒤에 붙습니다."""
+    return "\n".join([
+        "당신은 교과 기반 문제 생성기입니다.",
+        f"주제: {topic}",
+        "요구사항: 아래 컨텍스트만을 근거로 단일 문제와 정답을 한국어로 생성하세요. 추측 금지.",
+        "출력형식(JSON, 한 줄, 추가 텍스트 금지):",
+        '{"question":"...","answer":"..."}',
+        "",
+        "===== KNOWLEDGE CONTEXT =====",
+    ])
+
+def route_request(task, text, model=None, eligible=None) -> RouteDecision:
+    """입력 토큰 수를 세어 백엔드를 고릅니다. (model 지정 시 고정)"""
+    with stage("route"):
+        tokens = get_token_counter().count([text])[0] if text else 0
+        return ROUTER.choose(task, tokens, pinned=model, eligible=eligible)
+
+def role_pool(decision: RouteDecision) -> UpstreamPool:
+    pool = ROLE_POOLS.get(decision.backend)
+    if pool is None:
+        pool = ROLE_POOLS[decision.backend] = UpstreamPool([decision.model], timeout=ROLE_TIMEOUT_S, health_path=None)
+    return pool
+
+async def call_role(decision: RouteDecision, payload: dict, cancel) -> dict:
+    """GECKO / SOLAR / EXAONE 서비스에 같은 작업을 보냅니다. (취소되면 연결을 닫아 생성 중단)"""
+    response = await wait_cancellable(
+        role_pool(decision).request("POST", ROLE_ROUTES[decision.task], json=payload), cancel
+    )
+    if response.status_code >= 400:
+        # 역할 서비스의 admission 거절(429) / 과부하(503)는 그대로, 나머지는 502
+        status = response.status_code if response.status_code in (429, 503) else 502
+        raise HTTPException(status_code=status, detail=f"{decision.backend}: {response.text[:200]}")
+    return response.json()
+
 # -----------------
 # 5. 엔드포인트
 # -----------------
@@ -72,66 +221,181 @@ def generate_text(messages, model_id=MODEL_ID, temperature=0.7, format=None):
 async def health_check():
     try:
         # Ollama 서버 상태 확인
-        ollama.list()
-        return {"status": "ok", "backend": "ollama", "model": MODEL_ID}
+        await asyncio.to_thread(ollama.list)
+        return {"status": "ok", "backend": "ollama", "model": MODEL_ID, "parse_stats": PARSE_STATS.stats(),
+                "router": ROUTER.stats(recent=0),
+                "feedback_cache": FEEDBACK_CACHE.stats(),
+                "admission": {route: c.stats() for route, c in ADMISSION.items()},
+                "cancellation": CANCEL_STATS.stats()}
     except Exception as e:
         return {"status": "error", "detail": str(e)}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """라우트별 admission 대기열 지표 (Prometheus text format)"""
+    return metrics_text(*ADMISSION.values()) + CANCEL_STATS.metrics_text()
+
+@app.get("/router")
+async def router_stats(recent: int = 50):
+    """백엔드별 실행 중 요청 / 처리 시간 EWMA, 작업별 선택 횟수, 최근 라우팅 결정"""
+    return ROUTER.stats(recent=recent)
+
 # [기능 1] 문제 생성
 @app.post("/generate")
-async def generate_problem(req: GenerateRequest):
-    if req.prompt:
-         messages = [{"role": "user", "content": req.prompt}]
-    else:
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant that generates quiz problems in JSON format."},
-            {"role": "user", "content": f"주제 '{req.topic}'에 대한 객관식 문제를 하나 만들어주세요. 출력은 오직 JSON 형식이어야 합니다. 키: question, options(배열), answer_index(0-3), explanation."}
-        ]
+async def generate_problem(req: GenerateRequest, request: Request):
+    # 검색(/embed + pgvector)도 슬롯을 차지하는 작업이므로 admission 대기열 / deadline 검사를 먼저 통과해야 합니다.
+    # 연결이 끊기거나 deadline 이 지나면 Ollama 스트림을 닫아 생성을 중단합니다.
+    async with cancel_scope("generate", request, req.deadline_ms) as cancel, \
+            ADMISSION["generate"].slot(req.priority, req.deadline_ms):
+        rag = None
+        if req.retrieval is not None and not req.prompt:
+            header = rag_header(req.topic)
+            with stage("rag"):
+                context, rag = await RETRIEVER.build_context(req.topic, req.retrieval, header)
+            messages = [{"role": "user", "content": f"{header}\n{context or '(no retrieved context)'}"}]
+        elif req.prompt:
+             messages = [{"role": "user", "content": req.prompt}]
+        else:
+            messages = [
+                {"role": "system", "content": "You are a helpful assistant that generates quiz problems in JSON format."},
+                {"role": "user", "content": f"주제 '{req.topic}'에 대한 객관식 문제를 하나 만들어주세요. 출력은 오직 JSON 형식이어야 합니다. 키: question, options(배열), answer_index(0-3), explanation."}
+            ]
 
-    try:
-        # JSON 포맷 강제 (Ollama 지원 시)
-        result_text = generate_text(messages, req.model, req.temperature, format="json")
+        style = req.style or ("qa" if req.prompt or rag is not None else "quiz")
+        schema = PROBLEM_SCHEMAS.get(style, PROBLEM_SCHEMAS["qa"])
+
+        # GECKO 는 주제만 받아 qa / mcq 를 생성하므로 프롬프트 / RAG 요청이나 quiz 형식은 Ollama 로만 보냅니다.
+        gecko_ok = not req.prompt and rag is None and style in ("qa", "mcq")
+        decision = route_request("generate", messages[-1]["content"], req.model,
+                                 eligible=lambda b: b.kind == "ollama" or gecko_ok)
+
+        async with ROUTER.track(decision, cancelled=(GenerationCancelled,)):
+            try:
+                if decision.kind == "role":
+                    data = await call_role(decision, {
+                        "topic": req.topic, "style": style, "constrained": req.constrained,
+                        "temperature": req.temperature, "top_p": req.top_p,
+                        "priority": req.priority, "deadline_ms": req.deadline_ms,
+                    }, cancel)
+                    return {
+                        "generated_text": data.get("generated_text"),
+                        "parsed_json": data.get("parsed_json"),
+                        "schema_errors": data.get("schema_errors"),
+                        "model": data.get("model_id", decision.backend),
+                        "route": decision.to_dict(),
+                    }
+
+                # JSON 스키마 강제 (Ollama structured outputs), 비활성화 시 JSON 형식만 강제
+                response = await chat_async(messages, decision.model, req.temperature, format=schema if req.constrained else "json", cancel=cancel)
+                result_text = response['message']['content']
         
-        # JSON 파싱
-        try:
-            parsed = json.loads(result_text)
-        except:
-            parsed = None
-            
-        return {
-            "generated_text": result_text,
-            "parsed_json": parsed
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+                # JSON 파싱 (앞뒤 잡음이 있어도 첫 번째 완결된 객체를 추출)
+                with stage("postprocess"):
+                    parsed = extract_json_object(result_text)
+                    schema_errors = validate(parsed, schema) if parsed is not None else None
+                PARSE_STATS.record(parsed, schema_errors, response.get('eval_count') or 0)
+
+                result = {
+                    "generated_text": result_text,
+                    "parsed_json": parsed,
+                    "schema_errors": schema_errors,
+                    "model": decision.model,
+                    "route": decision.to_dict(),
+                }
+                if rag is not None:
+                    # 검색 시간 / 컨텍스트 토큰 / Ollama 가 보고한 prefill (prompt eval) 시간
+                    result["rag"] = {
+                        **rag.to_dict(),
+                        "prefill_ms": round((response.get('prompt_eval_duration') or 0) / 1e6, 2),
+                        "prefill_tokens": response.get('prompt_eval_count'),
+                    }
+                return result
+            except (GenerationCancelled, HTTPException):
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
 
 # [기능 2] 요약
 @app.post("/summarize")
-async def summarize_document(req: SummarizeRequest):
+async def summarize_document(req: SummarizeRequest, request: Request):
     messages = [
         {"role": "system", "content": "You are an expert summarizer. Summarize the following text in Korean."},
         {"role": "user", "content": f"다음 텍스트를 요약해 주세요:\n\n{req.document}"}
     ]
+    decision = route_request("summarize", req.document, req.model)
     
-    try:
-        summary = generate_text(messages, req.model, temperature=0.5)
-        return {"summary": summary}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with cancel_scope("summarize", request, req.deadline_ms) as cancel, \
+            ADMISSION["summarize"].slot(req.priority, req.deadline_ms), \
+            ROUTER.track(decision, cancelled=(GenerationCancelled,)):
+        try:
+            if decision.kind == "role":
+                summary = (await call_role(decision, {
+                    "document": req.document, "priority": req.priority, "deadline_ms": req.deadline_ms,
+                }, cancel)).get("summary")
+            else:
+                summary = await generate_text_async(messages, decision.model, temperature=0.5, cancel=cancel)
+            return {"summary": summary, "model": decision.model, "route": decision.to_dict()}
+        except (GenerationCancelled, HTTPException):
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 # [기능 3] 피드백
 @app.post("/feedback")
-async def provide_feedback(req: FeedbackRequest):
+async def provide_feedback(req: FeedbackRequest, request: Request):
+    # 캐시는 기본 모델의 피드백만 보관합니다. (라우터에 맡긴 요청은 기본 모델 기준으로 조회)
+    lookup = None
+    if FEEDBACK_CACHE.enabled and req.use_cache and req.model in (None, MODEL_ID):
+        lookup = await FEEDBACK_CACHE.lookup(req.question, req.user_answer, req.correct_answer)
+        if lookup.entry is not None:
+            return {"feedback": lookup.entry.feedback, "cached": True, "model": MODEL_ID}
+
     messages = [
         {"role": "system", "content": "You are an AI tutor. Explain why the user's answer is incorrect and provide the correct explanation in Korean."},
         {"role": "user", "content": f"문제: {req.question}\n사용자 답: {req.user_answer}\n정답: {req.correct_answer}\n\n사용자의 답이 왜 틀렸는지, 그리고 정답에 대한 해설을 친절하게 설명해 주세요."}
     ]
+    decision = route_request("feedback", messages[-1]["content"], req.model)
     
-    try:
-        feedback = generate_text(messages, req.model, temperature=0.7)
-        return {"feedback": feedback}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with cancel_scope("feedback", request, req.deadline_ms) as cancel, \
+            ADMISSION["feedback"].slot(req.priority, req.deadline_ms), \
+            ROUTER.track(decision, cancelled=(GenerationCancelled,)):
+        try:
+            start = time.perf_counter()
+            if decision.kind == "role":
+                feedback = (await call_role(decision, {
+                    "question": req.question, "user_answer": req.user_answer,
+                    "correct_answer": req.correct_answer, "use_cache": req.use_cache,
+                    "priority": req.priority, "deadline_ms": req.deadline_ms,
+                }, cancel)).get("output")
+            else:
+                feedback = await generate_text_async(messages, decision.model, temperature=0.7, cancel=cancel)
+            if lookup is not None and decision.model == MODEL_ID:
+                FEEDBACK_CACHE.store(lookup, req.user_answer, feedback, (time.perf_counter() - start) * 1000)
+            return {"feedback": feedback, "cached": False, "model": decision.model, "route": decision.to_dict()}
+        except (GenerationCancelled, HTTPException):
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/feedback/cache")
+async def feedback_cache_stats():
+    return FEEDBACK_CACHE.stats()
+
+@app.post("/feedback/cache")
+async def configure_feedback_cache(threshold: float | None = None, enabled: bool | None = None):
+    """threshold (cosine 유사도) 와 사용 여부를 실행 중에 변경"""
+    if threshold is not None and not 0.0 < threshold <= 1.0:
+        raise HTTPException(status_code=422, detail="threshold must be in (0, 1]")
+    FEEDBACK_CACHE.configure(threshold=threshold, enabled=enabled)
+    return FEEDBACK_CACHE.stats()
+
+# 긴 요약 / 배치 문제 생성은 /jobs/{generate|summarize|feedback} 로 제출하고 /jobs/{id}/result 로 조회 (job_queue.py)
+# 작업은 위 엔드포인트를 그대로 실행하되 priority 미지정이면 batch 로 대기하므로 interactive 요청이 먼저 처리됩니다.
+JOBS = install_jobs(app, "unified", {
+    "generate": (GenerateRequest, lambda req: generate_problem(req, None)),
+    "summarize": (SummarizeRequest, lambda req: summarize_document(req, None)),
+    "feedback": (FeedbackRequest, lambda req: provide_feedback(req, None)),
+})
 
 if __name__ == "__main__":
     import uvicorn
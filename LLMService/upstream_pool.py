@@ -0,0 +1,229 @@
+# /mnt/d/MeQuest/LLMService/upstream_pool.py
+# ------------------------------------------------------------
+# 추론 upstream (vLLM / TGI / OpenAI 호환 / 역할 서비스) 에 대한 장기 유지 비동기 HTTP 클라이언트 풀
+# 생성 서비스들이 공유합니다. (gecko_service_expand, unified_llm_service)
+#
+# - keep-alive 를 유지하는 httpx.AsyncClient 하나 (`h2` 가 설치되어 있으면 HTTP/2 선택 가능)
+# - 정상 upstream 중 처리 중인 요청이 가장 적은 곳으로 분산
+# - 연속 연결 실패 시 일정 시간 제외(ejection), 주기적 health check 로 복귀,
+#   연결 단계 오류는 다른 upstream 으로 재시도
+# - 유휴 keep-alive 연결은 upstream 의 idle timeout 보다 먼저 닫습니다. (keepalive_expiry)
+#   upstream 이 닫은 연결을 재사용하다 RemoteProtocolError 가 나는 경우를 줄이기 위함
+# - 그래도 RemoteProtocolError 가 나면 멱등 메서드(GET / HEAD / OPTIONS)만 새 연결로 한 번 재전송합니다.
+#   POST 는 서버가 이미 받았을 수 있으므로 (생성이 두 번 실행됨) 재전송하지 않고 오류를 그대로 올립니다.
+# Env:
+#   UPSTREAM_KEEPALIVE_S=4     유휴 연결 유지 시간 (uvicorn 기본 timeout_keep_alive 5초보다 짧게)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+log = logging.getLogger("upstream")
+
+UPSTREAM_KEEPALIVE_S = float(os.getenv("UPSTREAM_KEEPALIVE_S", "4"))
+
+# upstream 이 요청을 받지 못했음이 확실한 오류 → 다른 upstream 으로 재시도해도 안전
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# 두 번 실행되어도 결과가 같은 메서드만 끊긴 keep-alive 연결에서 재전송합니다.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class NoHealthyUpstream(httpx.TransportError):
+    """모든 upstream 이 제외되었거나 연결에 실패했을 때"""
+
+
+@dataclass
+class Upstream:
+    url: str
+    outstanding: int = 0
+    requests: int = 0
+    failures: int = 0                  # 연속 연결 실패 횟수
+    total_failures: int = 0
+    stale_retries: int = 0             # upstream 이 닫은 유휴 연결 때문에 재전송한 횟수 (멱등 메서드만)
+    ejected_until: float = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.total_failures,
+            "stale_retries": self.stale_retries,
+        }
+
+
+class UpstreamPool:
+    def __init__(
+        self,
+        urls: List[str],
+        timeout: float = 60.0,
+        http2: bool = False,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = UPSTREAM_KEEPALIVE_S,
+        health_path: Optional[str] = "/health",
+        health_interval: float = 10.0,
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        urls = [u.rstrip("/") for u in urls if u and u.strip()]
+        if not urls:
+            raise ValueError("UpstreamPool needs at least one upstream URL")
+        self.upstreams = [Upstream(url=u) for u in urls]
+        self.timeout = timeout
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                log.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+                http2 = False
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            http2=http2,
+            headers=headers,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,   # upstream 보다 먼저 유휴 연결을 닫음
+            ),
+        )
+        self._health_task: Optional[asyncio.Task] = None
+
+    # ---------- lifecycle ----------
+    async def start(self):
+        if self.health_path and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def aclose(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await self.client.aclose()
+
+    # ---------- selection ----------
+    def _pick(self, exclude: set) -> Upstream:
+        candidates = [u for u in self.upstreams if u.healthy and u.url not in exclude]
+        if not candidates:
+            # 모두 제외된 상태: 바로 실패하지 않고 가장 먼저 제외된 upstream 을 시도
+            candidates = sorted(
+                (u for u in self.upstreams if u.url not in exclude), key=lambda u: u.ejected_until
+            )[:1]
+        if not candidates:
+            raise NoHealthyUpstream("no upstream available")
+        least = min(u.outstanding for u in candidates)
+        return random.choice([u for u in candidates if u.outstanding == least])
+
+    def _on_success(self, upstream: Upstream):
+        upstream.failures = 0
+
+    def _on_failure(self, upstream: Upstream, error: Exception):
+        upstream.failures += 1
+        upstream.total_failures += 1
+        if upstream.failures >= self.eject_after and upstream.healthy:
+            upstream.ejected_until = time.monotonic() + self.eject_seconds
+            log.warning("ejecting upstream %s for %.0fs: %s", upstream.url, self.eject_seconds, error)
+
+    # ---------- requests ----------
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """upstream 하나에 요청을 보내고, 연결에 실패하면 다른 upstream 으로 재시도합니다."""
+        async with self.stream(method, path, **kwargs) as r:
+            await r.aread()
+            return r
+
+    async def _send(self, upstream: Upstream, request: httpx.Request) -> httpx.Response:
+        """
+        재사용한 keep-alive 연결을 upstream 이 막 닫았다면 응답 전에 RemoteProtocolError 가 납니다.
+        요청이 전송되지 않았는지는 알 수 없으므로 멱등 메서드만 새 연결로 한 번 재전송하고,
+        POST 등은 그대로 오류를 올립니다. (keepalive_expiry 로 이 경우 자체를 줄임)
+        """
+        try:
+            return await self.client.send(request, stream=True)
+        except httpx.RemoteProtocolError as e:
+            if request.method not in IDEMPOTENT_METHODS:
+                raise
+            upstream.stale_retries += 1
+            log.debug("upstream %s closed a pooled connection (%s), resending", upstream.url, e)
+            return await self.client.send(request, stream=True)
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        스트리밍 응답을 엽니다. 응답 헤더를 받기 전의 연결 실패는 다음 upstream 으로 재시도하고,
+        컨텍스트를 닫으면 연결을 닫습니다. (upstream 의 생성도 취소됨)
+        """
+        tried: set = set()
+        last_error: Optional[Exception] = None
+        for _ in range(len(self.upstreams)):
+            upstream = self._pick(tried)
+            tried.add(upstream.url)
+            upstream.outstanding += 1
+            upstream.requests += 1
+            try:
+                request = self.client.build_request(method, f"{upstream.url}{path}", **kwargs)
+                try:
+                    response = await self._send(upstream, request)
+                except RETRYABLE_ERRORS as e:
+                    self._on_failure(upstream, e)
+                    last_error = e
+                    continue
+                self._on_success(upstream)
+                try:
+                    yield response
+                finally:
+                    await response.aclose()
+                return
+            finally:
+                upstream.outstanding -= 1
+        raise NoHealthyUpstream(f"all upstreams failed: {last_error}")
+
+    # ---------- health ----------
+    async def check_health(self):
+        async def probe(upstream: Upstream):
+            try:
+                r = await self.client.get(f"{upstream.url}{self.health_path}", timeout=min(self.timeout, 5.0))
+                ok = r.status_code < 500
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                if not upstream.healthy:
+                    log.info("upstream %s is healthy again", upstream.url)
+                upstream.ejected_until = 0.0
+                upstream.failures = 0
+            elif upstream.healthy:
+                upstream.ejected_until = time.monotonic() + self.eject_seconds
+                log.warning("health check failed, ejecting upstream %s", upstream.url)
+
+        await asyncio.gather(*(probe(u) for u in self.upstreams))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception:
+                log.exception("upstream health check failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"upstreams": [u.stats() for u in self.upstreams]}
@@ -22,6 +22,8 @@ export const config = {
         geckoUrl: process.env.GECKO_LLM_URL || "http://localhost:8001/generate",
         solarUrl: process.env.SOLAR_LLM_URL || "http://localhost:8001/summarize",
         exaoneUrl: process.env.EXAONE_LLM_URL || "http://localhost:8001/feedback",
-        embeddingUrl: (process.env.EXPRESS_EMBEDDING_URL || "http://localhost:8000/embeddings").replace(/\/$/, "")
+        embeddingUrl: (process.env.EXPRESS_EMBEDDING_URL || "http://localhost:8000/embeddings").replace(/\/$/, ""),
+        // 1 이면 RAG 검색/컨텍스트 패킹을 LLM 서비스(unified_llm_service)에 맡깁니다.
+        serverSideRag: process.env.LLM_SERVER_SIDE_RAG === "1"
     }
 };
@@ -9,6 +9,11 @@ const EMB_URL = config.llm.embeddingUrl;
 
 // 1) 텍스트를 벡터로
 export async function embedText(text) {
+  return (await embedTextTagged(text)).vector;
+}
+
+// 벡터 + 생성 모델 이름 (과부하 시 EmbeddingService 가 hashing 임베더로 응답할 수 있음)
+export async function embedTextTagged(text) {
   if (!EMB_URL) throw new Error("EXPRESS_EMBEDDING_URL is not set");
   try {
     const { data } = await axios.post(
@@ -24,7 +29,7 @@ export async function embedText(text) {
     if (!Array.isArray(vec)) {
       throw new Error(`Invalid embedding format from ${EMB_URL}`);
     }
-    return vec.map(Number);
+    return { vector: vec.map(Number), modelName: data?.model_name ?? null };
   } catch (error) {
     const status = error?.response?.status;
     const url = error?.config?.url;
@@ -54,8 +59,9 @@ export async function searchByVector(vector, topK = 5, filter = {}) {
     const values = [vecLit, topK];
     let idx = 3;
 
+    // 임베딩 모델 구분은 Python EmbeddingService 가 쓰고 검색하는 model_name 컬럼 (database.search_sql 과 같은 조건)
     if (filter.model) {
-      where.push(`model = $${idx++}`);
+      where.push(`model_name = $${idx++}`);
       values.push(filter.model);
     }
     if (filter.source) {
@@ -65,7 +71,7 @@ export async function searchByVector(vector, topK = 5, filter = {}) {
 
     const whereSql = where.length ? `WHERE ${where.join(" AND ")}` : "";
     const sql = `
-      SELECT id, model, "source", ref_id, content, embedding <-> $1::vector AS distance
+      SELECT id, model_name AS model, "source", ref_id, content, embedding <-> $1::vector AS distance
       FROM embeddings
       ${whereSql}
       ORDER BY embedding <-> $1::vector
@@ -80,8 +86,9 @@ export async function searchByVector(vector, topK = 5, filter = {}) {
 
 // 3) 텍스트 검색 (텍스트→벡터→pgvector)
 export async function searchByText(query, topK = 5, filter = {}) {
-  const vector = await embedText(query);
-  return searchByVector(vector, topK, filter);
+  const { vector, modelName } = await embedTextTagged(query);
+  // 질의 벡터를 만든 모델의 행만 검색 (BGE-m3 와 대체 임베더 벡터를 섞지 않음)
+  return searchByVector(vector, topK, modelName ? { ...filter, model: modelName } : filter);
 }
 
 
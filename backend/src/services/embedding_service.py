@@ -1,24 +1,70 @@
-from fastapi import FastAPI
+# backend/src/services/embedding_service.py
+# ------------------------------------------------------------
+# 문자 n-gram hashing 임베더 단독 서비스 (BGE-m3 없이 개발/테스트할 때 쓰는 대체 서비스)
+#
+# 임베더 자체는 공용 패키지 mequest_common.hashing_embedder 에 있고 EmbeddingService 도 같은 것을 씁니다.
+# 기존 목(mock) 서비스와 같은 /health, /embeddings 를 제공하고 /embed 도 지원합니다.
+# Run:
+#   pip install -e ../../../common
+#   uvicorn embedding_service:app --port 8000
+# ------------------------------------------------------------
+
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List
 
-app = FastAPI(title="MeQuest Embedding Service")
+from mequest_common.hashing_embedder import get_embedder
+# 단계별 Server-Timing / 프로파일러 (공용 모듈)
+from mequest_common.server_timing import install_server_timing, stage
+
+
+# ---------------------- 단독 서비스 ----------------------------
+app = FastAPI(title="MeQuest Embedding Service (hashing fallback)")
+
+install_server_timing(app, "embedding_hashing")
+
 
 class EmbeddingRequest(BaseModel):
-    input: str
+    # 기존 목 서비스는 {"input": "..."}, Node EmbeddingService.js 는 {"texts": [...]} 를 보냅니다.
+    input: Optional[str | List[str]] = None
+    texts: Optional[List[str]] = None
+
 
 class EmbeddingResponse(BaseModel):
     embedding: List[float]
+    embeddings: List[List[float]]
     dim: int
     model: str
+    model_name: str
+
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "service": "embedding", "port": 8000}
+    embedder = get_embedder()
+    return {"status": "ok", "service": "embedding", "port": 8000, "model_name": embedder.model_name, "dim": embedder.dim}
+
+
+def _texts(req: EmbeddingRequest) -> List[str]:
+    if req.texts is not None:
+        return req.texts
+    if isinstance(req.input, list):
+        return req.input
+    if req.input is not None:
+        return [req.input]
+    raise HTTPException(status_code=422, detail="Field required: texts | input")
+
 
 @app.post("/embeddings", response_model=EmbeddingResponse)
+@app.post("/embed", response_model=EmbeddingResponse)
 def create_embedding(req: EmbeddingRequest):
-    text = req.input or ""
-    # 데모 임베딩(임시): 길이 기반 3차원 벡터
-    vec = [len(text) % 7 / 10, len(text) % 11 / 10, len(text) % 13 / 10]
-    return {"embedding": vec, "dim": len(vec), "model": "mock-emb"}
+    embedder = get_embedder()
+    with stage("encode"):
+        vectors = embedder.encode(_texts(req)).tolist()
+    return {
+        "embedding": vectors[0] if vectors else [],
+        "embeddings": vectors,
+        "dim": embedder.dim,
+        "model": embedder.model_name,
+        "model_name": embedder.model_name,
+    }
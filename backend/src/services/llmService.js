@@ -163,16 +163,20 @@ function buildPrompt(topic, contexts) {
 export async function callGeckoRAG({ topic, topK = 5, filter = { source: "problem" } }) {
   if (!GECKO_LLM_URL) throw new Error("GECKO_LLM_URL is not set");
 
-  // 1) 검색 (토픽 기반)
-  const hits = await searchByText(topic, topK, filter);
+  // 1) 검색 (토픽 기반) — serverSideRag 이면 LLM 서비스가 검색과 토큰 예산 패킹을 수행
+  const hits = config.llm.serverSideRag ? [] : await searchByText(topic, topK, filter);
 
   // 2) 프롬프트 구성
-  const prompt = buildPrompt(topic, hits);
+  const prompt = config.llm.serverSideRag ? undefined : buildPrompt(topic, hits);
 
   // 3. GECKO (Qwen) 호출
   const payload = {
     topic: topic,
     prompt: prompt, // 💡 Unified Service expects 'prompt' for RAG
+    // 클라이언트 측 검색과 같은 범위로 검색되도록 filter.source 도 넘깁니다.
+    retrieval: config.llm.serverSideRag
+      ? { top_k: topK, ...(filter?.source ? { source: filter.source } : {}) }
+      : undefined,
     max_new_tokens: 512, // Increased for Qwen
     temperature: 0.7,
     top_p: 0.9,
@@ -220,7 +224,7 @@ export async function callGeckoRAG({ topic, topK = 5, filter = { source: "proble
       null,
       JSON.stringify({
         topic,
-        retrieved: hits.map(h => ({ id: h.id, ref_id: h.ref_id, distance: h.distance })),
+        retrieved: data?.rag ?? hits.map(h => ({ id: h.id, ref_id: h.ref_id, distance: h.distance })),
         // LLM 생성 결과의 원본 텍스트도 로그에 추가 (디버깅 용이)
         raw_output: data?.generated_text.slice(0, 1000) // 너무 길면 잘라냄
       }),
@@ -0,0 +1,8 @@
+# MeQuest/common/mequest_common/__init__.py
+# ------------------------------------------------------------
+# LLMService / EmbeddingService / backend 가 함께 쓰는 모듈 (각 서비스 디렉터리에서 pip install -e ../common)
+# - server_timing, stack_profiler : 단계별 Server-Timing 헤더 + 관리자용 /debug/profile
+# - startup_timing                : 시작 단계별 소요 시간
+# - checkpoint_cache              : 변환된 모델 체크포인트 캐시
+# - hashing_embedder              : 문자 n-gram hashing 임베더 (BGE-m3 과부하 대체)
+# ------------------------------------------------------------
@@ -0,0 +1,91 @@
+# MeQuest/common/mequest_common/checkpoint_cache.py
+# ------------------------------------------------------------
+# 변환된 모델 체크포인트 캐시 (LLMService hf_loader / EmbeddingService BGE-m3 공용)
+#
+# .bin 원본을 변환하거나 양자화한 모델을 MODEL_CACHE_DIR 에 safetensors 로 저장해 두고
+# 다음 시작부터는 그 체크포인트를 mmap 으로 바로 읽습니다.
+# - checkpoint_dir(source, variant, packages): 원본 경로/ID + 변형 + 원본 파일 크기·수정 시각 +
+#   라이브러리 버전으로 정해지는 캐시 디렉터리 (원본 가중치나 라이브러리가 바뀌면 새로 만듭니다)
+# - save_checkpoint(): 임시 디렉터리에 저장한 뒤 이름을 바꾸고, 마지막에 manifest 를 남깁니다.
+#   manifest 가 없는 디렉터리는 캐시로 보지 않습니다. (중간에 죽은 저장본)
+# Env:
+#   MODEL_CACHE=1                                   체크포인트 캐시 사용 여부
+#   MODEL_CACHE_DIR=~/.cache/mequest/checkpoints    캐시 위치 (모델 크기만큼 디스크 필요)
+# ------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+MODEL_CACHE = os.getenv("MODEL_CACHE", "1") == "1"
+MODEL_CACHE_DIR = Path(os.getenv("MODEL_CACHE_DIR", str(Path.home() / ".cache" / "mequest" / "checkpoints")))
+
+# 저장이 끝난 캐시에만 생기는 파일 (중간에 죽은 저장본은 캐시로 보지 않음)
+CACHE_MANIFEST = "mequest_checkpoint.json"
+
+
+def _version(package: str) -> str:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return "none"
+
+
+def _fingerprint(source: str) -> Dict[str, Any]:
+    """로컬 경로면 파일 이름/크기/수정 시각, Hub ID 면 ID 자체"""
+    path = Path(source).expanduser()
+    if not path.exists():
+        return {"id": source}
+    files = [path] if path.is_file() else sorted(p for p in path.iterdir() if p.is_file())
+    return {
+        "path": str(path.resolve()),
+        "files": [[p.name, p.stat().st_size, p.stat().st_mtime_ns] for p in files],
+    }
+
+
+def checkpoint_dir(source: str, variant: str, packages=("transformers", "bitsandbytes")) -> Path:
+    """원본 + 변형 + 라이브러리 버전으로 정해지는 캐시 디렉터리 (존재 여부와 무관)"""
+    key = json.dumps(
+        {"source": _fingerprint(source), "variant": variant, "versions": {p: _version(p) for p in packages}},
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(key.encode()).hexdigest()[:12]
+    name = Path(source.rstrip("/")).name or source.replace("/", "--")
+    return MODEL_CACHE_DIR / f"{name}-{variant}-{digest}"
+
+
+def has_safetensors(source: str) -> bool:
+    """로컬 원본이 이미 safetensors 면 fp16/fp32 로드는 mmap 이라 캐시할 이유가 없습니다."""
+    path = Path(source).expanduser()
+    return path.is_dir() and any(path.glob("*.safetensors"))
+
+
+def is_cached(path: Optional[Path]) -> bool:
+    return path is not None and (path / CACHE_MANIFEST).exists()
+
+
+def save_checkpoint(path: Path, save: Callable[[str], None], meta: Dict[str, Any]) -> bool:
+    """
+    save(dir) 로 임시 디렉터리에 저장한 뒤 이름을 바꿔 캐시로 만듭니다.
+    (여러 워커가 동시에 저장해도 먼저 끝난 쪽만 남음) 실패하면 경고만 남기고 False.
+    """
+    tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    try:
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        save(str(tmp))
+        (tmp / CACHE_MANIFEST).write_text(json.dumps({**meta, "created": time.time()}, ensure_ascii=False, indent=2))
+        if path.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            os.replace(tmp, path)
+        return True
+    except Exception as e:
+        print(f"⚠️ Checkpoint cache save failed ({path}): {e}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
@@ -0,0 +1,89 @@
+# MeQuest/common/mequest_common/hashing_embedder.py
+# ------------------------------------------------------------
+# 문자 n-gram feature hashing 임베더 (BGE-m3 과부하/장애 시 degraded-mode 대체 계층)
+#
+# - 소문자화 + 공백 정리 후 앞뒤에 공백을 붙여 단어 경계 n-gram 도 만듭니다.
+# - 배치 전체를 하나의 UTF-32 코드포인트 배열로 만들어 n-gram 해시를 NumPy 로 한 번에 계산하고
+#   (문서 경계를 넘는 n-gram 은 제외) bincount 로 (문서, 버킷) 에 부호 있는 카운트를 누적합니다.
+# - 고정 차원(HASH_EMBED_DIM, 기본 1024 = BGE-m3 와 같은 vector 컬럼 크기), L2 정규화.
+# - 의미 공간이 BGE-m3 와 다르므로 벡터는 반드시 model_name 으로 태그해 따로 저장/검색해야 합니다.
+# EmbeddingService (과부하 대체) 와 backend/src/services/embedding_service.py (단독 서비스) 가 함께 씁니다.
+# Env:
+#   HASH_EMBED_DIM=1024  HASH_NGRAM_MIN=2  HASH_NGRAM_MAX=4
+# ------------------------------------------------------------
+
+import os
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+HASH_EMBED_DIM = int(os.getenv("HASH_EMBED_DIM", "1024"))
+# 포함할 n-gram 길이 (양 끝 포함)
+HASH_NGRAM_MIN = int(os.getenv("HASH_NGRAM_MIN", "2"))
+HASH_NGRAM_MAX = int(os.getenv("HASH_NGRAM_MAX", "4"))
+
+_PRIME = np.uint64(1099511628211)            # FNV-1a 64bit prime (롤링 결합용)
+_MIX = np.uint64(0x9E3779B97F4A7C15)         # splitmix64 상수 (버킷 분산용)
+
+
+class HashingEmbedder:
+    """문자 n-gram feature hashing (signed) 임베더"""
+
+    def __init__(self, dim: int = HASH_EMBED_DIM, ngram_range: Tuple[int, int] = (HASH_NGRAM_MIN, HASH_NGRAM_MAX)):
+        if dim <= 0 or ngram_range[0] < 1 or ngram_range[0] > ngram_range[1]:
+            raise ValueError(f"invalid hashing embedder config: dim={dim} ngram_range={ngram_range}")
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.model_name = f"hash-ngram{ngram_range[0]}{ngram_range[1]}-d{dim}"
+        # n 마다 다른 seed 를 섞어 같은 해시가 길이만 다른 n-gram 과 겹치지 않게 합니다.
+        self._seeds = {n: np.uint64((n * 0x632BE59BD9B4E019) & 0xFFFFFFFFFFFFFFFF) for n in range(1, ngram_range[1] + 1)}
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        words = str(text or "").lower().split()
+        return f" {' '.join(words)} " if words else ""
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dim) float32, 각 행은 L2 정규화 (빈 텍스트는 0 벡터)"""
+        batch = len(texts)
+        if batch == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        normalized = [self._normalize(t) for t in texts]
+        lengths = np.fromiter((len(t) for t in normalized), dtype=np.int64, count=batch)
+        codes = np.frombuffer("".join(normalized).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        doc = np.repeat(np.arange(batch, dtype=np.int64), lengths)
+
+        counts = np.zeros(batch * self.dim, dtype=np.float64)
+        total = codes.shape[0]
+        h = codes.copy()                       # 길이 n 인 n-gram 의 롤링 해시 (위치 i 에서 시작)
+        with np.errstate(over="ignore"):
+            for n in range(1, self.ngram_range[1] + 1):
+                if n > 1:
+                    h = h[:-1] * _PRIME + codes[n - 1:]
+                if n < self.ngram_range[0]:
+                    continue
+                span = total - n + 1
+                if span <= 0:
+                    break
+                valid = doc[:span] == doc[n - 1:]
+                x = (h ^ self._seeds[n]) * _MIX
+                x ^= x >> np.uint64(31)
+                bucket = ((x >> np.uint64(32)) % np.uint64(self.dim)).astype(np.int64)
+                sign = 1.0 - 2.0 * (x & np.uint64(1)).astype(np.float64)
+                flat = doc[:span][valid] * self.dim + bucket[valid]
+                counts += np.bincount(flat, weights=sign[valid], minlength=batch * self.dim)
+
+        out = counts.reshape(batch, self.dim).astype(np.float32)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+_embedder: Optional[HashingEmbedder] = None
+
+
+def get_embedder() -> HashingEmbedder:
+    global _embedder
+    if _embedder is None:
+        _embedder = HashingEmbedder()
+    return _embedder
@@ -0,0 +1,235 @@
+# MeQuest/common/mequest_common/server_timing.py
+# ------------------------------------------------------------
+# 요청 단계별 소요 시간 → Server-Timing 헤더 + 구조화 로그
+#
+# /generate, /search 가 느려질 때 JSON 파싱 / 대기열 / 토큰화 / prefill / decode / 직렬화 중
+# 어디서 시간이 드는지 보이도록 요청마다 단계 시간을 모읍니다.
+# - install_server_timing(app, service): 앱 생성 직후 호출. 미들웨어, 라우트 클래스, /debug/profile 을 등록
+# - 자동 측정: parse (본문 읽기 + 검증), handler (엔드포인트), serialize (응답 직렬화), total
+# - 엔드포인트/공용 모듈 안에서는 `with stage("prefill"):` 또는 record("decode", ms) 로 추가
+#   (요청 밖에서 호출되면 아무 일도 하지 않으므로 공용 모듈에서 그대로 써도 됩니다)
+# - 응답 헤더: Server-Timing: parse;dur=0.4, admission;dur=0.0, prefill;dur=120.3, ..., total;dur=930.1
+# - 로그: logger "server_timing" 에 요청당 JSON 한 줄
+# Env:
+#   SERVER_TIMING=1                   헤더 추가 여부
+#   SERVER_TIMING_LOG=1               구조화 로그 여부
+#   SERVER_TIMING_LOG_MIN_MS=0        이보다 빠른 요청은 로그 생략
+#   SERVER_TIMING_SKIP=/health,/metrics   로그 생략 경로 (헤더는 추가)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import time
+import typing
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING", "1") == "1"
+SERVER_TIMING_LOG = os.getenv("SERVER_TIMING_LOG", "1") == "1"
+SERVER_TIMING_LOG_MIN_MS = float(os.getenv("SERVER_TIMING_LOG_MIN_MS", "0"))
+SERVER_TIMING_SKIP = {p for p in os.getenv("SERVER_TIMING_SKIP", "/health,/metrics").split(",") if p}
+
+log = logging.getLogger("server_timing")
+
+
+class RequestTimings:
+    """요청 하나의 단계별 시간 (ms). 같은 이름은 누적합니다."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.handler_start: Optional[float] = None
+        self.handler_end: Optional[float] = None
+
+    def add(self, name: str, ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + max(ms, 0.0)
+
+    def since_start_ms(self, at: Optional[float] = None) -> float:
+        return ((at or time.perf_counter()) - self.start) * 1000
+
+    def header(self, total_ms: float) -> str:
+        items = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        items.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(items)
+
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("server_timing", default=None)
+
+
+def current() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def record(name: str, ms: float):
+    """현재 요청에 단계 시간을 더합니다. (asyncio.to_thread 안에서도 동작, 요청 밖이면 무시)"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, ms)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """with 블록 실행 시간을 단계로 기록 (await 를 포함해도 됩니다)"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - start) * 1000)
+
+
+class FirstTokenTimer:
+    """
+    model.generate 용 StoppingCriteria: 첫 호출(= 첫 토큰 생성) 시각으로 prefill / decode 를 나눕니다.
+    (CancelCriteria 와 같이 상속 없이 호출 규약만 따르며, 항상 '멈추지 않음' 을 반환)
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first is None:
+            self.first = time.perf_counter()
+        return input_ids.new_zeros((input_ids.shape[0],)).bool()
+
+    def record(self):
+        end = time.perf_counter()
+        first = self.first or end
+        record("prefill", (first - self.start) * 1000)
+        record("decode", (end - first) * 1000)
+
+
+# ---------------------- FastAPI 연결 ------------------------
+def _resolved_signature(endpoint: Callable) -> inspect.Signature:
+    """
+    래퍼가 FastAPI 에 원래 엔드포인트의 시그니처를 보이도록 합니다.
+    (`from __future__ import annotations` 의 문자열 주석은 원래 모듈 기준으로 미리 해석)
+    """
+    signature = inspect.signature(endpoint)
+    try:
+        hints = typing.get_type_hints(endpoint)
+    except Exception:
+        return signature
+    params = [p.replace(annotation=hints.get(p.name, p.annotation)) for p in signature.parameters.values()]
+    return signature.replace(parameters=params, return_annotation=hints.get("return", signature.return_annotation))
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    """엔드포인트 시작/끝 시각을 남겨 parse / handler / serialize 를 나눕니다."""
+
+    def _enter() -> Optional[RequestTimings]:
+        timings = _current.get()
+        if timings is not None:
+            timings.handler_start = time.perf_counter()
+            timings.add("parse", timings.since_start_ms(timings.handler_start))
+        return timings
+
+    def _exit(timings: Optional[RequestTimings]):
+        if timings is not None:
+            timings.handler_end = time.perf_counter()
+            timings.add("handler", (timings.handler_end - timings.handler_start) * 1000)
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            timings = _enter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _exit(timings)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            timings = _enter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _exit(timings)
+
+    wrapper.__signature__ = _resolved_signature(endpoint)
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+
+class ServerTimingMiddleware:
+    """순수 ASGI 미들웨어: 요청마다 RequestTimings 를 만들고 응답 시작 시 헤더를 붙입니다."""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                now = time.perf_counter()
+                if timings.handler_end is not None:
+                    timings.add("serialize", (now - timings.handler_end) * 1000)
+                if SERVER_TIMING_HEADER:
+                    MutableHeaders(scope=message).append("Server-Timing", timings.header(timings.since_start_ms(now)))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            self._log(scope, status, timings)
+
+    def _log(self, scope, status: int, timings: RequestTimings):
+        if not SERVER_TIMING_LOG or scope["path"] in SERVER_TIMING_SKIP:
+            return
+        total_ms = timings.since_start_ms()
+        if total_ms < SERVER_TIMING_LOG_MIN_MS:
+            return
+        log.info(json.dumps({
+            "service": self.service,
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status,
+            "total_ms": round(total_ms, 2),
+            "stages": {name: round(ms, 2) for name, ms in timings.stages.items()},
+        }, ensure_ascii=False))
+
+
+def install_server_timing(app: FastAPI, service: str):
+    """
+    앱 생성 직후(라우트 등록 전) 호출합니다. 이후 등록되는 라우트는 parse / handler / serialize 가
+    자동으로 측정되고, 관리자용 /debug/profile (stack_profiler) 이 추가됩니다.
+    """
+    from .stack_profiler import register_profile_route
+
+    app.router.route_class = TimedRoute
+    app.add_middleware(ServerTimingMiddleware, service=service)
+    register_profile_route(app)
+    if not log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        log.addHandler(handler)
+        log.setLevel(logging.INFO)
+        log.propagate = False
@@ -0,0 +1,122 @@
+# MeQuest/common/mequest_common/stack_profiler.py
+# ------------------------------------------------------------
+# 실행 중인 프로세스용 샘플링 프로파일러 (관리자 전용 /debug/profile)
+#
+# cProfile 은 호출 스레드만 보고 모든 함수 호출에 훅을 걸어 운영 부하에서 쓰기 어렵습니다.
+# 대신 별도 스레드가 interval 마다 sys._current_frames() 로 모든 스레드의 스택을 읽어
+# 같은 스택의 샘플 수를 셉니다. (대상 코드는 계측하지 않으므로 오버헤드 = 샘플링 스레드 비용)
+# - 출력: collapsed stack ("thread;file:func;file:func 42") → flamegraph.pl / speedscope / inferno 입력
+#         format=top 이면 self 샘플 기준 상위 함수 JSON
+# - 안전장치: ADMIN_TOKEN 미설정 시 비활성(404), X-Admin-Token 헤더 검사, 동시에 1개만 실행(409),
+#            seconds ≤ PROFILE_MAX_SECONDS, interval ≥ 1ms
+# - idle=false(기본) 이면 select / lock / queue 대기에서 멈춰 있는 스택은 제외합니다.
+# Run:
+#   curl -H "X-Admin-Token: $ADMIN_TOKEN" "http://localhost:8001/debug/profile?seconds=10" > out.folded
+#   flamegraph.pl out.folded > out.svg
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# 스택 맨 끝(leaf)이 이 파일들의 함수면 대기 중인 스레드로 봅니다.
+_IDLE_FILES = ("selectors.py", "threading.py", "queue.py", "socket.py", "ssl.py")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":").replace(" ", "_")
+
+
+class StackSampler:
+    """interval 마다 전체 스레드 스택을 읽어 collapsed stack 별 샘플 수를 셉니다."""
+
+    def __init__(self, interval_s: float = 0.01, include_idle: bool = False):
+        self.interval_s = max(interval_s, 0.001)
+        self.include_idle = include_idle
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def run(self, seconds: float) -> "StackSampler":
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = self._stack(frame)
+                if stack is None:
+                    continue
+                self.stacks[(names.get(ident, f"thread-{ident}"),) + stack] += 1
+            self.samples += 1
+            time.sleep(self.interval_s)
+        return self
+
+    def _stack(self, frame) -> Optional[Tuple[str, ...]]:
+        if not self.include_idle and os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+            return None
+        labels: List[str] = []
+        while frame is not None:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        return tuple(reversed(labels))
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = 30) -> List[Dict[str, object]]:
+        self_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] += count
+        total = sum(self_counts.values()) or 1
+        return [
+            {"function": name, "samples": count, "share": round(count / total, 4)}
+            for name, count in self_counts.most_common(limit)
+        ]
+
+
+_running = threading.Lock()
+
+
+def register_profile_route(app: FastAPI):
+    @app.get("/debug/profile", include_in_schema=False)
+    async def debug_profile(
+        seconds: float = Query(10.0, gt=0),
+        interval_ms: float = Query(10.0, ge=1.0),
+        idle: bool = False,
+        format: str = Query("collapsed", pattern="^(collapsed|top)$"),
+        x_admin_token: str = Header(""),
+    ):
+        if not ADMIN_TOKEN:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+            raise HTTPException(status_code=403, detail="admin token required")
+        if seconds > PROFILE_MAX_SECONDS:
+            raise HTTPException(status_code=422, detail=f"seconds must be <= {PROFILE_MAX_SECONDS}")
+        if not _running.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="a profile is already running")
+        try:
+            sampler = StackSampler(interval_ms / 1000, include_idle=idle)
+            # 샘플링은 별도 스레드에서 하므로 이벤트 루프는 그동안 평소처럼 요청을 처리합니다.
+            await asyncio.to_thread(sampler.run, seconds)
+        finally:
+            _running.release()
+        if format == "top":
+            return {"seconds": seconds, "samples": sampler.samples, "top": sampler.top()}
+        return PlainTextResponse(sampler.collapsed())
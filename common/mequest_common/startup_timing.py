@@ -0,0 +1,62 @@
+# MeQuest/common/mequest_common/startup_timing.py
+# ------------------------------------------------------------
+# 서비스 시작 단계별 소요 시간 (cold start 분석용)
+#
+# 재시작에 몇 분씩 걸릴 때 import / 토크나이저 / 가중치 로드 / 양자화 / 캐시 저장 /
+# prefix 캐시 / draft / 스케줄러 중 어디서 시간이 드는지 남깁니다.
+# - STARTUP 은 이 모듈이 처음 import 되는 시점부터 잽니다. (서비스 파일 맨 위에서 import)
+# - STARTUP.mark("import")      : 이전 mark 이후 경과 시간을 단계로 기록
+# - with STARTUP.phase("...")   : 블록 실행 시간을 단계로 기록
+# - STARTUP.note(key, value)    : 체크포인트 캐시 적중 여부 등 부가 정보
+# - STARTUP.done()              : 요약 한 줄 출력 (이후 /health 의 "startup" 으로 조회)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._last = self.start
+        self.phases: Dict[str, float] = {}     # 단계 → ms (같은 이름은 누적)
+        self.notes: Dict[str, Any] = {}
+        self.ready_ms: Optional[float] = None
+
+    def add(self, name: str, ms: float):
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    def mark(self, name: str):
+        now = time.perf_counter()
+        self.add(name, (now - self._last) * 1000)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._last = time.perf_counter()
+            self.add(name, (self._last - start) * 1000)
+
+    def note(self, key: str, value: Any):
+        self.notes[key] = value
+
+    def done(self, service: str = ""):
+        self.ready_ms = (time.perf_counter() - self.start) * 1000
+        parts = ", ".join(f"{name}={ms / 1000:.2f}s" for name, ms in self.phases.items())
+        print(f"⏱️ {service or 'service'} ready in {self.ready_ms / 1000:.2f}s ({parts})")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready_ms": round(self.ready_ms, 1) if self.ready_ms is not None else None,
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases.items()},
+            **self.notes,
+        }
+
+
+STARTUP = StartupTimer()